@@ -1,11 +1,18 @@
 
-__all__ = ['netCDF4', 'plt', 'shapefile', 'xarray', 'matplotlib', 'easy_mpl', 'fiona', 'plt_Axes']
+import threading
+
+__all__ = ['netCDF4', 'plt', 'shapefile', 'xarray', 'matplotlib', 'easy_mpl', 'fiona', 'plt_Axes', 'cKDTree',
+           'nc_lock']
 
 try:
     import netCDF4
 except (ImportError, ModuleNotFoundError):
     netCDF4 = None
 
+# the netcdf-c library is not thread safe, so all the threads which read
+# netCDF files using netCDF4 hold this lock while calling it
+nc_lock = threading.Lock()
+
 try:
     import matplotlib.pyplot as plt
     import matplotlib
@@ -45,4 +52,10 @@ except (ModuleNotFoundError, OSError):
 try:
     import easy_mpl
 except (ModuleNotFoundError, ImportError) as e:
-    easy_mpl = None
\ No newline at end of file
+    easy_mpl = None
+
+
+try:
+    from scipy.spatial import cKDTree
+except (ModuleNotFoundError, ImportError):
+    cKDTree = None
@@ -275,10 +275,7 @@ class Datasets(object):
     def path(self, x):
         if x is None:
             # path is not given dataset is not downloaded yet
-            if self.__class__.__name__.startswith('CAMELS'):
-                x = os.path.join(self.camels_dir, self.__class__.__name__)
-            else:
-                x = os.path.join(self.base_ds_dir, self.__class__.__name__)
+            x = self._dataset_path(x)
 
             if not os.path.exists(x):
                 os.makedirs(x)
@@ -287,10 +284,18 @@ class Datasets(object):
             if not os.path.exists(x) and self.verbosity>0:
                 pass  # todo : why this check?
                 # print(f"The path {x} does not exist. Creating the directory.")
-            x = os.path.join(x, self.__class__.__name__)
+            x = self._dataset_path(x)
         # sanity_check(self.name, x)
         self._path = x
 
+    def _dataset_path(self, path: str = None) -> str:
+        """directory of the dataset inside ``path`` or inside the default directory if ``path`` is None"""
+        if path is not None:
+            return os.path.join(path, self.__class__.__name__)
+        if self.__class__.__name__.startswith('CAMELS'):
+            return os.path.join(self.camels_dir, self.__class__.__name__)
+        return os.path.join(self.base_ds_dir, self.__class__.__name__)
+
     def _download(self, overwrite=False, **kwargs):
         """
         Downloads the dataset. If already downloaded, then
@@ -1,7 +1,6 @@
 
 from typing import List, Tuple
 
-import math
 import numpy as np
 
 
@@ -138,45 +137,62 @@ def calc_centroid(geometry)->Tuple[float, float]:
 
 
 def utm_to_lat_lon(easting, northing, zone:int):
+    """
+    Converts UTM coordinates (northern hemisphere, WGS84) to latitude/longitude.
+    The ``easting`` and ``northing`` can be scalars or arrays of same shape,
+    in which case all the points are converted in one call.
+
+    Returns:
+        tuple: (lat, lon) in degrees with the same shape as the inputs.
+    """
     # Constants
     a = 6378137.0  # WGS 84 major axis
     # Eccentricity : how much the ellipsoid deviates from being a perfect sphere
     e = 0.081819190842622  
-    x = easting - 500000  # Correct for 500,000 meter offset
-    y = northing
+    x = np.asarray(easting, dtype=np.float64) - 500000  # Correct for 500,000 meter offset
+    y = np.asarray(northing, dtype=np.float64)
     # Scale factor, coefficient that scales the metric units in the projection to real-world distances
     k0 = 0.9996  
     
     # Calculate the Meridian Arc
     m = y / k0
-    mu = m / (a * (1 - math.pow(e, 2) / 4 - 3 * math.pow(e, 4) / 64 - 5 * math.pow(e, 6) / 256))
+    mu = m / (a * (1 - e ** 2 / 4 - 3 * e ** 4 / 64 - 5 * e ** 6 / 256))
     
     # Calculate Footprint Latitude
-    e1 = (1 - math.sqrt(1 - e ** 2)) / (1 + math.sqrt(1 - e ** 2))
-    phi1 = mu + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * math.sin(2 * mu)
-    phi1 += (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * math.sin(4 * mu)
-    phi1 += (151 * e1 ** 3 / 96) * math.sin(6 * mu)
-    phi1 += (1097 * e1 ** 4 / 512) * math.sin(8 * mu)
+    e1 = (1 - np.sqrt(1 - e ** 2)) / (1 + np.sqrt(1 - e ** 2))
+    phi1 = mu + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * np.sin(2 * mu)
+    phi1 += (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * np.sin(4 * mu)
+    phi1 += (151 * e1 ** 3 / 96) * np.sin(6 * mu)
+    phi1 += (1097 * e1 ** 4 / 512) * np.sin(8 * mu)
     
     # Latitude and Longitude
-    n1 = a / math.sqrt(1 - e ** 2 * math.sin(phi1) ** 2)
-    t1 = math.tan(phi1) ** 2
-    c1 = e ** 2 / (1 - e ** 2) * math.cos(phi1) ** 2
-    r1 = a * (1 - e ** 2) / math.pow(1 - e ** 2 * math.sin(phi1) ** 2, 1.5)
+    sin_phi1 = np.sin(phi1)
+    cos_phi1 = np.cos(phi1)
+    tan_phi1 = np.tan(phi1)
+    n1 = a / np.sqrt(1 - e ** 2 * sin_phi1 ** 2)
+    t1 = tan_phi1 ** 2
+    c1 = e ** 2 / (1 - e ** 2) * cos_phi1 ** 2
+    r1 = a * (1 - e ** 2) / np.power(1 - e ** 2 * sin_phi1 ** 2, 1.5)
     d = x / (n1 * k0)
     
-    lat = phi1 - (n1 * math.tan(phi1) / r1) * (d ** 2 / 2 - (5 + 3 * t1 + 10 * c1 - 4 * c1 ** 2 - 9 * e ** 2) * d ** 4 / 24)
+    lat = phi1 - (n1 * tan_phi1 / r1) * (d ** 2 / 2 - (5 + 3 * t1 + 10 * c1 - 4 * c1 ** 2 - 9 * e ** 2) * d ** 4 / 24)
     lat += (61 + 90 * t1 + 298 * c1 + 45 * t1 ** 2 - 3 * c1 ** 2 - 252 * e ** 2) * d ** 6 / 720
-    lat = lat * 180 / math.pi  # Convert to degrees
+    lat = np.rad2deg(lat)  # Convert to degrees
     
-    lon = (d - (1 + 2 * t1 + c1) * d ** 3 / 6 + (5 - 2 * c1 + 28 * t1 - 3 * c1 ** 2 + 8 * e ** 2 + 24 * t1 ** 2) * d ** 5 / 120) / math.cos(phi1)
-    lon = lon * 180 / math.pi + (zone * 6 - 183)  # Convert to degrees
+    lon = (d - (1 + 2 * t1 + c1) * d ** 3 / 6 + (5 - 2 * c1 + 28 * t1 - 3 * c1 ** 2 + 8 * e ** 2 + 24 * t1 ** 2) * d ** 5 / 120) / cos_phi1
+    lon = np.rad2deg(lon) + (zone * 6 - 183)  # Convert to degrees
     
     return lat, lon
 
 
 def laea_to_wgs84(x, y, lon_0, lat_0, false_easting, false_northing):
-    # converts from Lambert Azimuthal Equal Area (LAEA) to WGS84
+    """
+    converts from Lambert Azimuthal Equal Area (LAEA) to WGS84. ``x`` and ``y``
+    can be scalars, arrays or :obj:`pandas.Series`. The output has the same type.
+
+    Returns:
+        tuple: (lat, lon) in degrees.
+    """
 
     R = 6378137.0  # Radius of the Earth in meters (WGS84)
     lat_0 = np.deg2rad(lat_0)  # Convert origin latitude to radians
@@ -196,7 +212,12 @@ def laea_to_wgs84(x, y, lon_0, lat_0, false_easting, false_northing):
     return (np.rad2deg(lat), np.rad2deg(lon))
 
 
-def lcc_to_wgs84(x, y, lon_0, lat_0, lat_1, lat_2, false_easting, false_northing):
+def lcc_to_wgs84(
+        x, y, 
+        lon_0, lat_0, lat_1, lat_2, 
+        false_easting, false_northing,
+        iterations:int = 6,
+        ):
     """
     Converts coordinates from a Lambert Conformal Conic (LCC) projection (EPSG:3057)
     to WGS84 (latitude/longitude).
@@ -210,6 +231,9 @@ def lcc_to_wgs84(x, y, lon_0, lat_0, lat_1, lat_2, false_easting, false_northing
         lat_2 (float): Second standard parallel in degrees.
         false_easting (float): False easting value.
         false_northing (float): False northing value.
+        iterations (int): Number of fixed-point iterations used to solve for the
+            latitude. The same number of iterations is applied to all points so
+            that the whole array is solved in one go.
 
     Returns:
         Tuple[np.ndarray, np.ndarray]: A tuple containing latitude and longitude arrays.
@@ -221,6 +245,9 @@ def lcc_to_wgs84(x, y, lon_0, lat_0, lat_1, lat_2, false_easting, false_northing
     e2 = 2 * f - f**2
     e = np.sqrt(e2)
 
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
     # Convert degrees to radians
     lon_0_rad = np.deg2rad(lon_0)
     lat_0_rad = np.deg2rad(lat_0)
@@ -249,20 +276,174 @@ def lcc_to_wgs84(x, y, lon_0, lat_0, lat_1, lat_2, false_easting, false_northing
     rho_prime = np.sqrt(x_adj**2 + y_adj**2)
     
     # Handle case where rho_prime is zero
-    rho_prime[rho_prime == 0] = 1e-10
+    rho_prime = np.where(rho_prime == 0, 1e-10, rho_prime)
 
     t_prime = (rho_prime / (a * F))**(1/n)
 
-    # Iteratively solve for latitude
+    # solve for latitude with a fixed number of iterations for all points at once
+    # the iteration converges quadratically so 6 iterations are more than enough
     phi = np.pi/2 - 2 * np.arctan(t_prime)
-    for _ in range(5): # 5 iterations are generally sufficient
+    for _ in range(iterations):
         sin_phi = np.sin(phi)
-        phi_new = np.pi/2 - 2 * np.arctan(t_prime * ((1 - e*sin_phi)/(1 + e*sin_phi))**(e/2))
-        if np.all(np.abs(phi_new - phi) < 1e-10):
-            break
-        phi = phi_new
+        phi = np.pi/2 - 2 * np.arctan(t_prime * ((1 - e*sin_phi)/(1 + e*sin_phi))**(e/2))
 
     theta = np.arctan2(x_adj, y_adj)
     lon = theta / n + lon_0_rad
 
     return np.rad2deg(phi), np.rad2deg(lon)
+
+
+def transform_geometry(geometry, func):
+    """
+    Reprojects all the rings of a Polygon or MultiPolygon geometry in a single call.
+
+    All the vertices of the geometry are stacked into one array, ``func``
+    is called once on this array and the result is split back into the
+    original rings.
+
+    Args:
+        geometry: A fiona.Geometry object (Polygon or MultiPolygon).
+        func: A function which takes ``x`` and ``y`` arrays of projected 
+            coordinates and returns a tuple of ``(lat, lon)`` arrays.
+
+    Returns:
+        fiona.Geometry: A geometry of the same type with (lon, lat) coordinates.
+    """
+    if geometry.type == 'Polygon':
+        polygons = [geometry.coordinates]
+    elif geometry.type == 'MultiPolygon':
+        polygons = geometry.coordinates
+    else:
+        raise ValueError(f"Unsupported geometry type {geometry.type} for transformation.")
+
+    rings = [np.asarray(ring, dtype=np.float64) for polygon in polygons for ring in polygon]
+    lengths = [len(ring) for ring in rings]
+
+    xy = np.concatenate([ring[:, :2] for ring in rings], axis=0)
+    lat, lon = func(xy[:, 0], xy[:, 1])
+    lonlat = np.column_stack([lon, lat])
+
+    new_rings = []
+    for ring, ring_lonlat in zip(rings, np.split(lonlat, np.cumsum(lengths)[:-1])):
+        if ring.shape[1] > 2:  # keep the z coordinate if any
+            ring_lonlat = np.column_stack([ring_lonlat, ring[:, 2:]])
+        new_rings.append([tuple(point) for point in ring_lonlat.tolist()])
+
+    new_polygons = []
+    idx = 0
+    for polygon in polygons:
+        new_polygons.append(new_rings[idx: idx + len(polygon)])
+        idx += len(polygon)
+
+    coordinates = new_polygons[0] if geometry.type == 'Polygon' else new_polygons
+
+    return type(geometry)(type=geometry.type, coordinates=coordinates)
+
+
+def points_in_rings(
+        px:np.ndarray, 
+        py:np.ndarray, 
+        xy:np.ndarray, 
+        edge_valid:np.ndarray
+        )->np.ndarray:
+    """
+    Vectorized crossing-number (even-odd) point in polygon test of many points
+    against all the rings of one catchment. Since the even-odd rule is used,
+    holes and disjoint parts of MultiPolygons are handled without knowing
+    which ring is exterior and which is interior.
+
+    Args:
+        px (np.ndarray): x coordinates (longitude) of points, shape (m,).
+        py (np.ndarray): y coordinates (latitude) of points, shape (m,).
+        xy (np.ndarray): vertices of all closed rings stacked together, shape (n, 2).
+        edge_valid (np.ndarray): boolean array of shape (n,) which is True
+            when vertex k and k+1 belong to the same ring i.e. form an edge.
+
+    Returns:
+        np.ndarray: boolean array of shape (m,) which is True for points inside.
+    """
+    px = np.asarray(px, dtype=np.float64).reshape(-1, 1)
+    py = np.asarray(py, dtype=np.float64).reshape(-1, 1)
+
+    start = np.nonzero(edge_valid[:-1])[0]
+    x1, y1 = xy[start, 0], xy[start, 1]
+    x2, y2 = xy[start + 1, 0], xy[start + 1, 1]
+
+    # edges which cross the horizontal line through the point
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_int = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = np.count_nonzero(crosses & (px < x_int), axis=1)
+
+    return (crossings % 2) == 1
+
+
+def simplify_rings(
+        xy:np.ndarray,
+        ring_offsets:np.ndarray,
+        tolerance:float
+        )->Tuple[np.ndarray, np.ndarray]:
+    """
+    Douglas-Peucker simplification of many closed rings at once. Instead of
+    recursing on each ring, all the segments of all the rings which still need
+    to be split are processed together in one vectorized step, so the number of
+    python iterations is only the depth of the recursion.
+
+    Args:
+        xy (np.ndarray): vertices of all rings stacked together, shape (n, 2).
+        ring_offsets (np.ndarray): start (and end) of each ring in ``xy``.
+        tolerance (float): maximum allowed distance (in units of ``xy``) of a 
+            removed vertex from the simplified ring.
+
+    Returns:
+        tuple: simplified ``xy`` and the corresponding ``ring_offsets``. Every
+            ring keeps at least 4 vertices so that it remains a closed polygon.
+    """
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    keep[ring_offsets[:-1]] = True
+    keep[ring_offsets[1:] - 1] = True
+
+    starts = ring_offsets[:-1].copy()
+    ends = ring_offsets[1:] - 1
+
+    while len(starts):
+        inner = ends - starts - 1
+        starts, ends, inner = starts[inner > 0], ends[inner > 0], inner[inner > 0]
+        if len(starts) == 0:
+            break
+
+        # indices of all interior vertices of all segments
+        seg = np.repeat(np.arange(len(starts)), inner)
+        seg_begin = np.concatenate([[0], np.cumsum(inner)[:-1]])
+        idx = np.repeat(starts + 1, inner) + np.arange(len(seg)) - np.repeat(seg_begin, inner)
+
+        a, b, p = xy[starts[seg]], xy[ends[seg]], xy[idx]
+        ab = b - a
+        ab_len = np.hypot(ab[:, 0], ab[:, 1])
+        ap = p - a
+        cross = np.abs(ab[:, 0] * ap[:, 1] - ab[:, 1] * ap[:, 0])
+        # for closed rings start and end are same so use the distance from start
+        dist = np.where(ab_len > 0, cross / np.where(ab_len > 0, ab_len, 1.0), np.hypot(ap[:, 0], ap[:, 1]))
+
+        # farthest vertex of each segment
+        order = np.lexsort((-dist, seg))
+        first = order[seg_begin]
+        max_dist, max_idx = dist[first], idx[first]
+
+        split = max_dist > tolerance
+        keep[max_idx[split]] = True
+
+        starts, ends = (np.concatenate([starts[split], max_idx[split]]),
+                        np.concatenate([max_idx[split], ends[split]]))
+
+    # make sure that each ring remains a polygon
+    kept = np.add.reduceat(keep, ring_offsets[:-1]) if n else np.array([], dtype=np.int64)
+    for r in np.nonzero(kept < 4)[0]:
+        st, en = ring_offsets[r], ring_offsets[r + 1]
+        length = en - st
+        keep[st + np.array([0, length // 3, (2 * length) // 3, length - 1])] = True
+
+    new_offsets = np.concatenate([[0], np.cumsum(np.add.reduceat(keep, ring_offsets[:-1]))]) if n else ring_offsets
+    return xy[keep], new_offsets.astype(np.int64)
@@ -0,0 +1,365 @@
+"""
+HTTP utilities for datasets which are downloaded as many small requests
+e.g. one request per site.
+"""
+
+import io
+import os
+import re
+import json
+import time
+import threading
+import concurrent.futures as cf
+from typing import Callable, Dict, List, Tuple, Union
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# responses with these status codes are retried
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# responses with these status codes are remembered by UrlCache
+MISSING_STATUS = (404, 410)
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket which allows ``rate`` acquisitions per second
+    on average and bursts of up to ``capacity`` acquisitions.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """waits until ``tokens`` are available and takes them. At most
+        ``capacity`` tokens can be taken at once."""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedSession(requests.Session):
+    """
+    A :obj:`requests.Session` whose connections are kept alive and shared by
+    threads, whose requests are rate limited with a token bucket and which
+    retries the requests which fail due to connection errors, timeouts or the
+    status codes in ``RETRY_STATUS`` with exponential backoff.
+
+    Parameters
+    ----------
+    rate : float
+        maximum number of requests per second. If None, the requests are not
+        rate limited.
+    retries : int
+        number of times a request is retried
+    backoff : float
+        the wait before n-th retry is ``backoff * 2**n`` seconds unless the
+        server sends a ``Retry-After`` header
+    pool_size : int
+        number of connections kept alive for each host. It should be at least
+        equal to the number of threads using the session.
+    timeout : float
+        default timeout of requests in seconds
+    """
+    def __init__(
+            self,
+            rate: float = None,
+            retries: int = 3,
+            backoff: float = 0.5,
+            pool_size: int = 10,
+            timeout: float = 60,
+    ):
+        super().__init__()
+        self.bucket = None if rate is None else TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                wait = _retry_after(response, self.backoff * 2 ** attempt)
+                response.close()
+                time.sleep(wait)
+                continue
+
+            return response
+
+
+def _retry_after(response: requests.Response, default: float) -> float:
+    value = response.headers.get('Retry-After')
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class UrlCache(object):
+    """
+    Remembers, for each key such as a station, which of its candidate urls
+    was found and which are known to be missing, so that later calls of
+    :py:func:`first_available` do not request the missing urls again.
+    The cache is saved as json file.
+    """
+    def __init__(self, fpath: Union[str, os.PathLike]):
+        self.fpath = fpath
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(fpath):
+            with open(fpath) as f:
+                self.entries = json.load(f)
+
+    def found(self, key: str) -> Union[str, None]:
+        return self.entries.get(key, {}).get('found')
+
+    def missing(self, key: str) -> List[str]:
+        return self.entries.get(key, {}).get('missing', [])
+
+    def record(self, key: str, found: str = None, missing: List[str] = ()):
+        with self.lock:
+            entry = self.entries.setdefault(key, {'found': None, 'missing': []})
+            if found is not None:
+                entry['found'] = found
+            entry['missing'] = sorted(set(entry['missing']) | set(missing))
+        return
+
+    def save(self):
+        with self.lock:
+            with open(self.fpath + '.part', 'w') as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(self.fpath + '.part', self.fpath)
+        return
+
+
+def first_available(
+        urls: List[str],
+        session: requests.Session,
+        key: str = None,
+        cache: UrlCache = None,
+        workers: int = 3,
+) -> Tuple[Union[str, None], Union[requests.Response, None]]:
+    """
+    Requests the candidate urls concurrently and returns the first url in
+    the order of ``urls`` which responds with success together with its streamed
+    response, so a url which comes earlier is preferred even if a later one
+    responds faster. Once a url responds with success, the requests of the urls
+    after it which have not started are cancelled and their responses are closed
+    without reading their body. If ``cache`` is given, the url found earlier
+    for ``key`` is tried alone first and the urls known to be missing are not
+    requested.
+
+    Returns
+    -------
+    tuple
+        the url and the response, or None and None if no url is available.
+    """
+    if cache is not None and key is not None:
+        url = cache.found(key)
+        if url is not None:
+            response = session.get(url, stream=True)
+            if response.ok:
+                return url, response
+            response.close()
+
+        missing = set(cache.missing(key))
+        urls = [url for url in urls if url not in missing]
+
+    if not urls:
+        return None, None
+
+    # index of the earliest url which has responded with success so far. It is
+    # updated by the worker as soon as its request succeeds, so that the same
+    # worker does not start the request of a later url meanwhile.
+    best = len(urls)
+    lock = threading.Lock()
+
+    def request(idx):
+        nonlocal best
+        if idx > best:
+            return None
+        resp = session.get(urls[idx], stream=True)
+        if resp.ok:
+            with lock:
+                best = min(best, idx)
+        return resp
+
+    winner, response, missing = None, None, []
+    executor = cf.ThreadPoolExecutor(min(workers, len(urls)))
+    futures = [executor.submit(request, idx) for idx in range(len(urls))]
+    try:
+        for future in cf.as_completed(futures):
+            if future.cancelled():
+                continue
+            idx = futures.index(future)
+            try:
+                resp = future.result()
+            except requests.RequestException:
+                continue
+            if resp is None:
+                continue
+
+            if resp.ok and (winner is None or idx < winner):
+                if response is not None:
+                    response.close()
+                winner, response = idx, resp
+                for other in futures[idx + 1:]:
+                    other.cancel()
+            else:
+                if resp.status_code in MISSING_STATUS:
+                    missing.append(urls[idx])
+                resp.close()
+
+            # all the urls before the winner have failed
+            if winner is not None and all(other.done() for other in futures[:winner]):
+                break
+    finally:
+        executor.shutdown(wait=True)
+
+    if winner is not None:
+        # close the responses of later urls which were still being requested
+        for future in futures[winner + 1:]:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                resp = future.result()
+                if resp is not None:
+                    resp.close()
+        winner = urls[winner]
+
+    if cache is not None and key is not None:
+        cache.record(key, found=winner, missing=missing)
+
+    return winner, response
+
+
+def response_body(response: requests.Response, url: str) -> Tuple[io.IOBase, str]:
+    """
+    returns the body of a streamed response as a file-like object for
+    pandas readers together with its compression. zip archives need random
+    access, so their bytes are buffered, other bodies are read from the
+    connection while parsing.
+    """
+    if url.endswith('.zip'):
+        return io.BytesIO(response.content), 'zip'
+
+    response.raw.decode_content = True
+    return response.raw, 'infer'
+
+
+def download_many(
+        keys: List[str],
+        func: Callable,
+        cache_dir: Union[str, os.PathLike] = None,
+        session: requests.Session = None,
+        workers: int = 8,
+        verbosity: int = 1,
+) -> Tuple[Dict[str, object], Dict[str, Exception]]:
+    """
+    Calls ``func(key, session)`` for each key using a pool of threads which
+    share one ``session``. The result of each key is saved in ``cache_dir``
+    as soon as it is downloaded, so that the keys whose results are already
+    in ``cache_dir`` are not downloaded again when this function is called again.
+
+    Parameters
+    ----------
+    keys : list
+        for example site ids
+    func : callable
+        function which downloads the data of one key. It must accept the key
+        and the session and return a :obj:`pandas.DataFrame` or :obj:`pandas.Series`
+    cache_dir : str
+        directory to save the result of each key. If None, results are not cached.
+    session : requests.Session
+        If None, a :obj:`RateLimitedSession` is used.
+    workers : int
+        number of threads
+    verbosity : int
+
+    Returns
+    -------
+    tuple
+        a dictionary of results and a dictionary of exceptions of those keys
+        which could not be downloaded.
+    """
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    if session is None:
+        session = RateLimitedSession(pool_size=workers)
+
+    results, errors = {}, {}
+    todo = []
+    for key in keys:
+        fpath = _cache_fpath(cache_dir, key)
+        if fpath is not None and os.path.exists(fpath):
+            results[key] = pd.read_pickle(fpath)
+        else:
+            todo.append(key)
+
+    if verbosity and len(results):
+        print(f"{len(results)} of {len(keys)} are already downloaded")
+
+    def download(key):
+        result = func(key, session)
+        fpath = _cache_fpath(cache_dir, key)
+        if fpath is not None:
+            # an interrupted write does not leave a partial result
+            pd.to_pickle(result, fpath + '.part')
+            os.replace(fpath + '.part', fpath)
+        return result
+
+    start = time.time()
+    with cf.ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(download, key): key for key in todo}
+        for idx, future in enumerate(cf.as_completed(futures)):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors[key] = e
+
+            if verbosity > 1 and idx % 100 == 0:
+                print(f"downloaded {idx + 1}/{len(todo)} in {time.time() - start:.1f} seconds")
+
+    if verbosity and todo:
+        print(f"downloaded {len(todo) - len(errors)}/{len(todo)} in {time.time() - start:.1f} seconds "
+              f"using {workers} threads")
+
+    # in same order as keys
+    results = {key: results[key] for key in keys if key in results}
+    return results, errors
+
+
+def _cache_fpath(cache_dir, key) -> Union[str, None]:
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', str(key)) + '.pkl')
@@ -0,0 +1,588 @@
+
+import os
+import concurrent.futures as cf
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from ._backend import cKDTree, fiona
+from ._geom_utils import _make_boundary_2d, points_in_rings, simplify_rings
+
+
+EARTH_RADIUS_KM = 6371.0088  # mean radius of the earth
+
+# number of query points to process at once when scipy is not available
+_CHUNK = 256
+
+# tolerance (in degrees) of Douglas-Peucker simplification for each level of detail
+DETAIL_TOLERANCES = {
+    'medium': 0.001,  # ~100 m
+    'low': 0.01,  # ~1 km
+}
+
+
+def lat_lon_to_xyz(lat, lon) -> np.ndarray:
+    """
+    converts latitude and longitude (in degrees) to cartesian coordinates
+    on a unit sphere. The returned array has shape (n, 3).
+    """
+    lat = np.deg2rad(np.asarray(lat, dtype=np.float64)).reshape(-1)
+    lon = np.deg2rad(np.asarray(lon, dtype=np.float64)).reshape(-1)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord:np.ndarray) -> np.ndarray:
+    """converts chord length on unit sphere to great-circle distance in km"""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+def km_to_chord(km:Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """converts great-circle distance in km to chord length on unit sphere"""
+    angle = np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi)
+    return 2.0 * np.sin(angle / 2.0)
+
+
+class StationIndex(object):
+    """
+    Spatial index over station coordinates for nearest, radius and bounding
+    box queries. The coordinates are converted to cartesian coordinates on
+    a unit sphere so that the distances are correct everywhere on the globe
+    (including near poles and across the antimeridian). If :obj:`scipy` is
+    installed, a KD-tree is used, otherwise the queries are answered by
+    vectorized (chunked) computations with numpy.
+
+    All the query methods accept either scalar or array of latitudes/longitudes.
+    The results are always returned per query point.
+
+    Examples
+    --------
+    >>> idx = StationIndex(['a', 'b', 'c'], lat=[50.0, 51.0, 52.0], lon=[10.0, 10.5, 11.0])
+    >>> dist, pos = idx.nearest(50.2, 10.1, k=2)
+    >>> idx.ids[pos[0]]
+    array(['a', 'b'], dtype=object)
+    """
+
+    def __init__(
+            self,
+            ids:List[str],
+            lat:np.ndarray,
+            lon:np.ndarray,
+    ):
+        ids = np.asarray(ids, dtype=object).reshape(-1)
+        lat = np.asarray(lat, dtype=np.float64).reshape(-1)
+        lon = np.asarray(lon, dtype=np.float64).reshape(-1)
+        assert len(ids) == len(lat) == len(lon), f"{len(ids)}, {len(lat)}, {len(lon)}"
+
+        # stations without coordinates can not be indexed
+        valid = np.isfinite(lat) & np.isfinite(lon)
+
+        self.ids = ids[valid]
+        self.lat = lat[valid]
+        self.lon = lon[valid]
+        self.xyz = lat_lon_to_xyz(self.lat, self.lon)
+
+        self._tree = None if cKDTree is None else cKDTree(self.xyz)
+
+        # stations sorted by latitude for bounding box queries
+        self._lat_order = np.argsort(self.lat, kind='stable')
+        self._sorted_lat = self.lat[self._lat_order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(
+            self,
+            lat,
+            lon,
+            k:int = 1
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        finds ``k`` nearest stations of each query point.
+
+        Returns
+        -------
+        tuple
+            A tuple of distances (km) and positions (of stations in ``ids``),
+            both of shape (number of query points, k) and sorted by distance.
+        """
+        k = min(int(k), len(self))
+        assert k > 0, f"k must be a positive integer and index must not be empty"
+
+        qxyz = lat_lon_to_xyz(lat, lon)
+
+        if self._tree is not None:
+            chord, pos = self._tree.query(qxyz, k=k)
+            chord, pos = chord.reshape(len(qxyz), k), pos.reshape(len(qxyz), k)
+        else:
+            chord = np.empty((len(qxyz), k), dtype=np.float64)
+            pos = np.empty((len(qxyz), k), dtype=np.int64)
+            for st in range(0, len(qxyz), _CHUNK):
+                d2 = self._chord2(qxyz[st:st+_CHUNK])
+                part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+                part_d2 = np.take_along_axis(d2, part, axis=1)
+                order = np.argsort(part_d2, axis=1, kind='stable')
+                pos[st:st+_CHUNK] = np.take_along_axis(part, order, axis=1)
+                chord[st:st+_CHUNK] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+
+        return chord_to_km(chord), pos
+
+    def within(
+            self,
+            lat,
+            lon,
+            radius_km:float
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        finds all the stations within ``radius_km`` of each query point.
+
+        Returns
+        -------
+        tuple
+            A tuple of two lists with one array per query point. The first list
+            contains distances (km) and the second contains the positions of
+            stations in ``ids``. Each array is sorted by distance.
+        """
+        qxyz = lat_lon_to_xyz(lat, lon)
+        radius = km_to_chord(radius_km)
+
+        if self._tree is not None:
+            candidates = self._tree.query_ball_point(qxyz, r=radius)
+            candidates = [np.asarray(c, dtype=np.int64) for c in candidates]
+        else:
+            candidates = []
+            for st in range(0, len(qxyz), _CHUNK):
+                d2 = self._chord2(qxyz[st:st+_CHUNK])
+                candidates.extend(np.nonzero(row <= radius**2)[0] for row in d2)
+
+        distances, positions = [], []
+        for q, pos in zip(qxyz, candidates):
+            chord = np.sqrt(np.maximum(((self.xyz[pos] - q) ** 2).sum(axis=1), 0.0))
+            order = np.argsort(chord, kind='stable')
+            distances.append(chord_to_km(chord[order]))
+            positions.append(pos[order])
+
+        return distances, positions
+
+    def in_bbox(
+            self,
+            lat_min,
+            lat_max,
+            lon_min,
+            lon_max
+    ) -> List[np.ndarray]:
+        """
+        finds all the stations inside one or more bounding boxes. If ``lon_min``
+        is larger than ``lon_max``, the box is considered to cross the antimeridian.
+
+        Returns
+        -------
+        list
+            A list with one array (of positions of stations in ``ids``) per box.
+        """
+        lat_min, lat_max, lon_min, lon_max = [
+            np.asarray(a, dtype=np.float64).reshape(-1) for a in (lat_min, lat_max, lon_min, lon_max)]
+
+        lo = np.searchsorted(self._sorted_lat, lat_min, side='left')
+        hi = np.searchsorted(self._sorted_lat, lat_max, side='right')
+
+        positions = []
+        for i in range(len(lo)):
+            pos = self._lat_order[lo[i]:hi[i]]
+            lon = self.lon[pos]
+            if lon_min[i] <= lon_max[i]:
+                mask = (lon >= lon_min[i]) & (lon <= lon_max[i])
+            else:
+                mask = (lon >= lon_min[i]) | (lon <= lon_max[i])
+            positions.append(np.sort(pos[mask]))
+
+        return positions
+
+    def _chord2(self, qxyz:np.ndarray) -> np.ndarray:
+        """squared chord distance between query points and all stations"""
+        return np.maximum(2.0 - 2.0 * (qxyz @ self.xyz.T), 0.0)
+
+
+class BoundaryStore(object):
+    """
+    Catchment boundaries of a dataset stored as flat numpy arrays. The vertices
+    of all the rings of all the catchments are stacked in one ``(n, 2)`` array 
+    of (long, lat) and ``ring_offsets``/``catch_offsets`` tell where each ring
+    and each catchment starts. The store is saved as a single .npz file so that
+    the boundary file (shapefile etc.) has to be read only once.
+
+    Attributes
+    ----------
+    - ids : ids of catchments
+    - xy : vertices of all rings, shape (n, 2)
+    - ring_offsets : start (and end) of each ring in ``xy``, shape (rings + 1,)
+    - catch_offsets : start (and end) of rings of each catchment in ``ring_offsets``,
+        shape (catchments + 1,)
+    - bbox : bounding box (xmin, ymin, xmax, ymax) of each catchment
+    - area : planar area of each catchment in squared degrees
+    - levels : simplified rings for each level of detail other than ``full``
+        as a dictionary of ``{detail: (xy, ring_offsets)}``. The number and
+        order of rings is same as of full resolution rings.
+    - exterior : whether each ring is the exterior ring of a polygon or a hole
+        in the preceding exterior ring, shape (rings,)
+    """
+
+    def __init__(
+            self,
+            ids:List[str],
+            xy:np.ndarray,
+            ring_offsets:np.ndarray,
+            catch_offsets:np.ndarray,
+            levels:Dict[str, Tuple[np.ndarray, np.ndarray]] = None,
+            exterior:np.ndarray = None,
+    ):
+        self.ids = np.asarray(ids, dtype=object)
+        self.xy = np.asarray(xy, dtype=np.float64)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.catch_offsets = np.asarray(catch_offsets, dtype=np.int64)
+        assert len(self.catch_offsets) == len(self.ids) + 1
+
+        self.levels = levels or {}
+
+        if exterior is None:
+            exterior = np.ones(len(self.ring_offsets) - 1, dtype=bool)
+        self.exterior = np.asarray(exterior, dtype=bool)
+
+        self._positions = {stn: i for i, stn in enumerate(self.ids)}
+
+        # vertex k and k+1 form an edge only if both belong to same ring
+        self.edge_valid = np.ones(len(self.xy), dtype=bool)
+        self.edge_valid[self.ring_offsets[1:] - 1] = False
+
+        vstart = self.ring_offsets[self.catch_offsets[:-1]]
+        x, y = self.xy[:, 0], self.xy[:, 1]
+        self.bbox = np.column_stack([
+            np.minimum.reduceat(x, vstart), np.minimum.reduceat(y, vstart),
+            np.maximum.reduceat(x, vstart), np.maximum.reduceat(y, vstart),
+        ]) if len(self.ids) else np.empty((0, 4))
+
+        self.area = self._area()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, catchment_id):
+        return catchment_id in self._positions
+
+    def position(self, catchment_id:str) -> int:
+        return self._positions[catchment_id]
+
+    def vertex_range(self, i:int) -> Tuple[int, int]:
+        """start and end of vertices of ith catchment in ``xy``"""
+        return (self.ring_offsets[self.catch_offsets[i]],
+                self.ring_offsets[self.catch_offsets[i + 1]])
+
+    def rings(self, catchment_id:str, detail:str = 'full') -> List[np.ndarray]:
+        """returns the rings of a catchment as list of (n, 2) arrays"""
+        xy, ring_offsets = self._level(detail)
+        i = self.position(catchment_id)
+        offsets = ring_offsets[self.catch_offsets[i]: self.catch_offsets[i + 1] + 1]
+        return [xy[st:en] for st, en in zip(offsets[:-1], offsets[1:])]
+
+    def geometry(self, catchment_id:str, detail:str = 'full'):
+        """
+        returns the boundary of a catchment as fiona.Geometry. It is a Polygon
+        if the catchment has only one exterior ring and MultiPolygon otherwise.
+        """
+        if fiona is None:
+            raise ModuleNotFoundError("fiona module is not installed. Please install it to use boundary file")
+
+        polygons = []
+        i = self.position(catchment_id)
+        rings = self.rings(catchment_id, detail=detail)
+        for exterior, ring in zip(self.exterior[self.catch_offsets[i]: self.catch_offsets[i + 1]], rings):
+            ring = list(map(tuple, ring.tolist()))
+            if exterior or not polygons:
+                polygons.append([ring])
+            else:
+                polygons[-1].append(ring)
+
+        if len(polygons) == 1:
+            return fiona.Geometry(type='Polygon', coordinates=polygons[0])
+        return fiona.Geometry(type='MultiPolygon', coordinates=polygons)
+
+    def subset(self, catchment_ids:List[str], new_ids:List[str] = None) -> "BoundaryStore":
+        """
+        returns a new store with only the given catchments. The catchments can be
+        given new ids using ``new_ids``. This does not read anything from disk.
+        """
+        positions = np.array([self.position(stn) for stn in catchment_ids], dtype=np.int64)
+        ring_idx, catch_offsets = _take_ranges(self.catch_offsets, positions)
+
+        xy, ring_offsets = _take_rings(self.xy, self.ring_offsets, ring_idx)
+        levels = {detail: _take_rings(lxy, loffsets, ring_idx)
+                  for detail, (lxy, loffsets) in self.levels.items()}
+
+        return self.__class__(
+            catchment_ids if new_ids is None else new_ids,
+            xy,
+            ring_offsets,
+            catch_offsets,
+            levels=levels,
+            exterior=self.exterior[ring_idx])
+
+    def add_detail_levels(self, tolerances:Dict[str, float] = None):
+        """
+        simplifies the rings of all catchments for each level of detail. The
+        levels which already exist are not computed again.
+        """
+        tolerances = tolerances or DETAIL_TOLERANCES
+        for detail, tolerance in tolerances.items():
+            if detail not in self.levels:
+                self.levels[detail] = simplify_rings(self.xy, self.ring_offsets, tolerance)
+        return
+
+    def _level(self, detail:str) -> Tuple[np.ndarray, np.ndarray]:
+        if detail == 'full':
+            return self.xy, self.ring_offsets
+        if detail not in self.levels:
+            raise ValueError(f"detail must be one of {['full'] + list(self.levels.keys())} but is {detail}")
+        return self.levels[detail]
+
+    def contains(self, i:int, x:np.ndarray, y:np.ndarray) -> np.ndarray:
+        """exact test whether the points (x, y) lie inside the ith catchment"""
+        st, en = self.vertex_range(i)
+        return points_in_rings(x, y, self.xy[st:en], self.edge_valid[st:en])
+
+    def _area(self) -> np.ndarray:
+        """
+        area of each catchment using shoelace formula. Rings of holes have
+        opposite orientation to exterior rings so their area gets subtracted.
+        """
+        x, y = self.xy[:, 0], self.xy[:, 1]
+        cross = np.zeros(len(self.xy))
+        k = np.nonzero(self.edge_valid[:-1])[0]
+        cross[k] = x[k] * y[k + 1] - x[k + 1] * y[k]
+        csum = np.concatenate([[0.0], np.cumsum(cross)])
+        vstart = self.ring_offsets[self.catch_offsets]
+        return np.abs(np.diff(csum[vstart])) / 2.0
+
+    @classmethod
+    def from_rings(
+            cls,
+            ids:List[str],
+            catchment_rings:Iterable[Tuple[List[np.ndarray], List[bool]]]
+    ) -> "BoundaryStore":
+        """
+        builds the store from an iterable which yields ``(rings, exterior)`` of 
+        each catchment. The iterable is consumed only once so rings can be
+        streamed into the store e.g. from the workers which read the files.
+        """
+        rings, exterior, ring_offsets, catch_offsets = [], [], [0], [0]
+        for catch_rings, catch_exterior in catchment_rings:
+            for ring in catch_rings:
+                rings.append(ring)
+                ring_offsets.append(ring_offsets[-1] + len(ring))
+            exterior.extend(catch_exterior)
+            catch_offsets.append(len(rings))
+
+        xy = np.concatenate(rings) if rings else np.empty((0, 2))
+        return cls(ids, xy, np.array(ring_offsets), np.array(catch_offsets),
+                   exterior=np.array(exterior, dtype=bool))
+
+    @classmethod
+    def from_geometries(cls, ids:List[str], geometries:list) -> "BoundaryStore":
+        """builds the store from fiona.Geometry objects (Polygon or MultiPolygon)"""
+        return cls.from_rings(ids, map(geometry_rings, geometries))
+
+    @classmethod
+    def from_shapefiles(
+            cls,
+            shp_files:List[Union[str, os.PathLike]],
+            ids:List[str] = None,
+            processes:int = None,
+    ) -> "BoundaryStore":
+        """
+        builds the store from shapefiles where each shapefile contains the boundary
+        of one catchment. The shapefiles are read in parallel using ``processes`` 
+        and the rings are written into the store as they are read so the features 
+        are never held in memory as python objects. By default the name of the 
+        shapefile (without extension) is used as id of the catchment.
+        """
+        if ids is None:
+            ids = [os.path.splitext(os.path.basename(fpath))[0] for fpath in shp_files]
+        assert len(ids) == len(shp_files)
+
+        if not processes or processes == 1:
+            return cls.from_rings(ids, map(read_shapefile_rings, shp_files))
+
+        chunksize = max(1, len(shp_files) // (processes * 8))
+        with cf.ProcessPoolExecutor(processes) as executor:
+            return cls.from_rings(
+                ids, executor.map(read_shapefile_rings, shp_files, chunksize=chunksize))
+
+    def save(self, fpath:Union[str, os.PathLike]):
+        levels = {}
+        for detail, (xy, ring_offsets) in self.levels.items():
+            levels[f"xy_{detail}"] = xy
+            levels[f"ring_offsets_{detail}"] = ring_offsets
+
+        np.savez(
+            fpath,
+            ids=self.ids.astype(str),
+            xy=self.xy,
+            ring_offsets=self.ring_offsets,
+            catch_offsets=self.catch_offsets,
+            exterior=self.exterior,
+            **levels
+        )
+        return
+
+    @classmethod
+    def load(cls, fpath:Union[str, os.PathLike]) -> "BoundaryStore":
+        with np.load(fpath) as data:
+            levels = {key[len("xy_"):]: (data[key], data[f"ring_offsets_{key[len('xy_'):]}"]) 
+                      for key in data.files if key.startswith("xy_")}
+            return cls(
+                data['ids'].tolist(),
+                data['xy'],
+                data['ring_offsets'],
+                data['catch_offsets'],
+                levels=levels,
+                exterior=data['exterior'] if 'exterior' in data.files else None)
+
+
+def geometry_rings(geometry) -> Tuple[List[np.ndarray], List[bool]]:
+    """
+    closed rings of a Polygon/MultiPolygon geometry and whether each ring is
+    an exterior ring (True) or a hole (False)
+    """
+    polygons = geometry.coordinates if geometry.type == 'MultiPolygon' else [geometry.coordinates]
+    exterior = [k == 0 for polygon in polygons for k in range(len(polygon))]
+
+    rings = []
+    for ring in _make_boundary_2d(geometry):
+        ring = np.asarray(ring, dtype=np.float64)
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        rings.append(ring)
+    return rings, exterior
+
+
+def read_shapefile_rings(fpath:Union[str, os.PathLike]) -> Tuple[List[np.ndarray], List[bool]]:
+    """rings of all the features in a shapefile (see :func:`geometry_rings`)"""
+    rings, exterior = [], []
+    with fiona.open(fpath, 'r') as src:
+        for feature in src:
+            feature_rings, feature_exterior = geometry_rings(feature['geometry'])
+            rings.extend(feature_rings)
+            exterior.extend(feature_exterior)
+    return rings, exterior
+
+
+def _take_ranges(offsets:np.ndarray, idx:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    indices of the elements in ranges ``offsets[idx]:offsets[idx + 1]`` and the
+    offsets of these ranges after they are concatenated
+    """
+    lengths = offsets[idx + 1] - offsets[idx]
+    new_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    take = np.repeat(offsets[idx] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return take, new_offsets
+
+
+def _take_rings(xy:np.ndarray, ring_offsets:np.ndarray, ring_idx:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    take, new_offsets = _take_ranges(ring_offsets, ring_idx)
+    return xy[take], new_offsets
+
+
+class BBoxTree(object):
+    """
+    Static packed R-tree over bounding boxes built with sort-tile-recursive 
+    (STR) packing. Boxes are grouped in nodes of ``node_size`` boxes which are
+    close to each other, so that a query has to check the boxes of only those
+    nodes whose bounding box contains the point.
+    """
+
+    def __init__(self, bbox:np.ndarray, node_size:int = 16):
+        bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        self.node_size = node_size
+        n = len(bbox)
+
+        cx = (bbox[:, 0] + bbox[:, 2]) / 2.0
+        cy = (bbox[:, 1] + bbox[:, 3]) / 2.0
+
+        n_nodes = max(int(np.ceil(n / node_size)), 1)
+        slice_size = int(np.ceil(np.sqrt(n_nodes))) * node_size
+
+        order_x = np.argsort(cx, kind='stable')
+        order = [s[np.argsort(cy[s], kind='stable')] for s in 
+                 (order_x[st:st + slice_size] for st in range(0, n, slice_size))]
+
+        self.order = np.concatenate(order) if order else np.array([], dtype=np.int64)
+        self.leaf_bbox = bbox[self.order]
+
+        starts = np.arange(0, n, node_size)
+        if n:
+            self.node_bbox = np.column_stack([
+                np.minimum.reduceat(self.leaf_bbox[:, 0], starts),
+                np.minimum.reduceat(self.leaf_bbox[:, 1], starts),
+                np.maximum.reduceat(self.leaf_bbox[:, 2], starts),
+                np.maximum.reduceat(self.leaf_bbox[:, 3], starts),
+            ])
+        else:
+            self.node_bbox = np.empty((0, 4))
+
+    def query(self, x, y) -> List[np.ndarray]:
+        """
+        returns the positions of boxes which contain the point, for each point
+        """
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
+        n = len(self.order)
+        nb = self.node_bbox
+
+        result = []
+        for st in range(0, len(x), _CHUNK):
+            xc, yc = x[st:st+_CHUNK, None], y[st:st+_CHUNK, None]
+            hits = (nb[:, 0] <= xc) & (nb[:, 2] >= xc) & (nb[:, 1] <= yc) & (nb[:, 3] >= yc)
+            for i, nodes in enumerate(hits):
+                nodes = np.nonzero(nodes)[0]
+                leaves = (nodes[:, None] * self.node_size + np.arange(self.node_size)).reshape(-1)
+                leaves = leaves[leaves < n]
+                lb = self.leaf_bbox[leaves]
+                xi, yi = xc[i, 0], yc[i, 0]
+                inside = (lb[:, 0] <= xi) & (lb[:, 2] >= xi) & (lb[:, 1] <= yi) & (lb[:, 3] >= yi)
+                result.append(self.order[leaves[inside]])
+        return result
+
+
+class CatchmentIndex(object):
+    """
+    Finds the catchments which contain a point. The candidates are pruned
+    with a :py:class:`BBoxTree` over bounding boxes of catchments and the 
+    candidates are then tested exactly with crossing number point in polygon test.
+    """
+
+    def __init__(self, store:BoundaryStore):
+        self.store = store
+        self.tree = BBoxTree(store.bbox)
+
+    def containing(self, lat, lon) -> List[np.ndarray]:
+        """
+        returns positions (in ``store.ids``) of catchments containing each point
+        sorted by area so that the smallest (innermost) catchment comes first.
+        """
+        lat = np.asarray(lat, dtype=np.float64).reshape(-1)
+        lon = np.asarray(lon, dtype=np.float64).reshape(-1)
+
+        candidates = self.tree.query(lon, lat)
+
+        # group the points by candidate catchment so that each catchment's
+        # rings are tested against all its candidate points in one call
+        pnt = np.repeat(np.arange(len(lat)), [len(c) for c in candidates])
+        cand = np.concatenate(candidates).astype(np.int64) if candidates else np.array([], dtype=np.int64)
+        found = np.zeros(len(cand), dtype=bool)
+        for c in np.unique(cand):
+            mask = cand == c
+            found[mask] = self.store.contains(c, lon[pnt[mask]], lat[pnt[mask]])
+
+        result = [[] for _ in range(len(lat))]
+        for p, c in zip(pnt[found], cand[found]):
+            result[p].append(c)
+        return [np.array(sorted(r, key=lambda c: self.store.area[c]), dtype=np.int64) for r in result]
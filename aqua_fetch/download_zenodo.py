@@ -7,11 +7,20 @@ import json
 import signal
 import time
 import hashlib
+import threading
+import concurrent.futures as cf
 from contextlib import contextmanager
 
 import requests
 
-from .utils import download
+from ._http import RateLimitedSession, TokenBucket
+
+DOI_URL = 'https://doi.org/'
+ZENODO_API = 'https://zenodo.org/api/records/'
+SANDBOX_API = 'https://sandbox.zenodo.org/api/records/'
+
+# size of the chunks in which a file is written. abort_signal is checked after each chunk
+CHUNK_SIZE = 2 ** 16
 
 abort_signal = False
 abort_counter = 0
@@ -64,6 +73,124 @@ def check_hash(filename, checksum):
     return value, digest
 
 
+class _Stopped(Exception):
+    """raised in a worker when the download is aborted"""
+
+
+class _Progress(object):
+    """
+    Thread safe reporter of the bytes downloaded by all workers and of
+    their combined throughput. It prints at most once every ``interval`` seconds.
+    """
+    def __init__(self, total: int, verbosity: int = 1, interval: float = 5.0):
+        self.total = total
+        self.verbosity = verbosity
+        self.interval = interval
+        self.done = 0
+        self.start = self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, nbytes: int):
+        with self.lock:
+            self.done += nbytes
+            now = time.monotonic()
+            if self.verbosity and now - self.last >= self.interval:
+                self.last = now
+                print(self.report())
+        return
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        return (f"downloaded {self.done / 2 ** 20:.1f}/{self.total / 2 ** 20:.1f} MB "
+                f"at {self.done / 2 ** 20 / elapsed:.2f} MB/s")
+
+
+def _stream_to_file(session, link, fpath, timeout, progress, stop, bucket=None):
+    """downloads ``link`` to ``fpath`` through a .part file, so that an
+    aborted or failed download does not leave an incomplete file at ``fpath``"""
+    chunk_size = CHUNK_SIZE if bucket is None else max(min(CHUNK_SIZE, int(bucket.capacity)), 1)
+    written = 0
+    try:
+        with session.get(link, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            with open(fpath + '.part', 'wb') as fp:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if abort_signal or stop.is_set():
+                        raise _Stopped
+                    if bucket is not None:
+                        bucket.acquire(len(chunk))
+                    fp.write(chunk)
+                    written += len(chunk)
+                    progress.update(len(chunk))
+        os.replace(fpath + '.part', fpath)
+    except BaseException:
+        # bytes of a failed attempt are downloaded again
+        progress.update(-written)
+        if os.path.exists(fpath + '.part'):
+            os.remove(fpath + '.part')
+        raise
+    return
+
+
+def _download_file(
+        session,
+        f: dict,
+        outdir: str,
+        progress: _Progress,
+        stop: threading.Event,
+        bucket: TokenBucket = None,
+        timeout: float = 15,
+        retry: int = 0,
+        pause: float = 0.5,
+        keep: bool = False,
+        tolerate_error: bool = False,
+        verbosity: int = 1,
+) -> bool:
+    """downloads one file of a record and verifies its checksum. Returns False
+    if the download was aborted or the file is ignored due to errors. Raises
+    ValueError if the checksum is incorrect and errors are not tolerated."""
+    link = f['links']['self']
+    fname = f['key']
+    checksum = f['checksum']
+    fpath = os.path.join(outdir, fname)
+
+    if verbosity: print(f'Link: {link}   size: {f["size"] / 2 ** 20:.1f} MB')
+
+    for _ in range(retry + 1):
+        if abort_signal or stop.is_set():
+            return False
+        try:
+            _stream_to_file(session, link, fpath, timeout, progress, stop, bucket)
+        except _Stopped:
+            return False
+        except Exception as e:
+            print(f'  Download error for {fname}: {e}')
+            time.sleep(pause)
+        else:
+            break
+    else:
+        print('  Too many errors.')
+        if not tolerate_error:
+            raise Exception('Download is aborted. Too  many errors')
+        print(f'  Ignoring {fname} and downloading the next file.')
+        return False
+
+    h1, h2 = check_hash(fpath, checksum)
+    if h1 == h2:
+        if verbosity: print(f'{fname}: checksum is correct. ({h1})')
+    else:
+        print(f'{fname}: checksum is INCORRECT!({h1} got:{h2})')
+        if not keep:
+            print('  File is deleted.')
+            os.remove(fpath)
+        else:
+            print('  File is NOT deleted!')
+        if not tolerate_error:
+            raise ValueError(f'checksum of {fname} is incorrect')
+        return False
+    return True
+
+
 def download_from_zenodo(
         outdir,
         doi,
@@ -90,6 +217,9 @@ def download_from_zenodo(
         timeout: int, Connection time-out. Default: 15 [sec].
         pause: float, Seconds to wait before retry attempt, e.g. 0.5
         retry: int, Number of times to Retry on error.
+        workers: int, Number of files downloaded concurrently. Default: 4
+        max_rate: float, Maximum combined download speed of all files in
+            bytes per second. Default: None i.e. not limited.
     """
 
     # if outdir is file raise error
@@ -106,15 +236,20 @@ def download_from_zenodo(
     sandbox = kwargs.get('sandbox', False)
     pause = kwargs.get('pause', 0.5)
     retry = kwargs.get('retry', 0)
+    workers = kwargs.get('workers', 4)
+    max_rate = kwargs.get('max_rate', None)
 
     if include is not None and files_to_check is not None:
         raise ValueError("either include or files_to_check is to be given, not both")
 
+    # the workers do not depend upon the working directory
+    outdir = os.path.abspath(os.path.expanduser(outdir))
+
     with cd(outdir):
 
         url = doi
         if not url.startswith('http'):
-            url = 'https://doi.org/' + url
+            url = DOI_URL + url
         try:
             r = requests.get(url, timeout=timeout)
         except requests.exceptions.ConnectTimeout:
@@ -127,9 +262,9 @@ def download_from_zenodo(
         recordID = r.url.split('/')[-1]
 
         if not sandbox:
-            url = 'https://zenodo.org/api/records/'
+            url = ZENODO_API
         else:
-            url = 'https://sandbox.zenodo.org/api/records/'
+            url = SANDBOX_API
 
         try:
             r = requests.get(url + recordID, timeout=timeout)
@@ -189,54 +324,79 @@ def download_from_zenodo(
                 if verbosity: print('DOI: ' + js['metadata']['doi'])
                 if verbosity: print('Total size: {:.1f} MB'.format(total_size / 2 ** 20))
 
+                todo = []
                 for f in files:
-                    if abort_signal:
-                        if verbosity: print('Download aborted with CTRL+C.')
-                        if verbosity: print('Already successfully downloaded files are kept.')
-                        break
-                    link = f['links']['self']
-                    size = f['size'] / 2 ** 20
-                    if verbosity: print()
-                    if verbosity: print(f'Link: {link}   size: {size:.1f} MB')
-                    fname = f['key']
-                    checksum = f['checksum']
-
-                    remote_hash, local_hash = check_hash(fname, checksum)
-
+                    remote_hash, local_hash = check_hash(f['key'], f['checksum'])
                     if remote_hash == local_hash and cont:
-                        print(f'{fname} is already downloaded correctly.')
+                        print(f"{f['key']} is already downloaded correctly.")
                         continue
+                    todo.append(f)
 
-                    for _ in range(retry + 1):
-                        try:
-                            filename = download(link, outdir=outdir, fname=fname, verbosity=verbosity)
-                        except Exception as e:
-                            print('  Download error.')
-                            time.sleep(pause)
-                        else:
-                            break
-                    else:
-                        print('  Too many errors.')
-                        if not tolerate_error:
-                            raise Exception('Download is aborted. Too  many errors')
-                        print(f'  Ignoring {filename} and downloading the next file.')
-                        continue
+                completed = _download_files(todo, outdir, workers, max_rate, timeout, retry,
+                                            pause, keep, tolerate_error, verbosity)
 
-                    h1, h2 = check_hash(filename, checksum)
-                    if h1 == h2:
-                        if verbosity: print(f'Checksum is correct. ({h1})')
-                    else:
-                        print(f'Checksum is INCORRECT!({h1} got:{h2})')
-                        if not keep:
-                            print('  File is deleted.')
-                            os.remove(filename)
-                        else:
-                            print('  File is NOT deleted!')
-                        if not tolerate_error:
-                            sys.exit(1)
-                else:
+                if abort_signal:
+                    if verbosity: print('Download aborted with CTRL+C.')
+                    if verbosity: print('Already successfully downloaded files are kept.')
+                elif completed:
                     if verbosity: print('All files have been downloaded.')
         else:
             raise Exception('Record could not get accessed.')
     
-    return
\ No newline at end of file
+    return
+
+def _download_files(
+        files: list,
+        outdir: str,
+        workers: int = 4,
+        max_rate: float = None,
+        timeout: float = 15,
+        retry: int = 0,
+        pause: float = 0.5,
+        keep: bool = False,
+        tolerate_error: bool = False,
+        verbosity: int = 1,
+) -> bool:
+    """
+    Downloads the files of a record using ``workers`` threads which share one
+    session, a progress reporter and, if ``max_rate`` is given, a bandwidth
+    budget in bytes per second. If a file fails, or CTRL+C is pressed, the
+    remaining files are not downloaded and the running downloads are stopped.
+    Returns True if all the files were downloaded correctly.
+    """
+    if not files:
+        return True
+
+    workers = max(min(workers, len(files)), 1)
+    progress = _Progress(sum(f['size'] for f in files), verbosity)
+    bucket = None if max_rate is None else TokenBucket(max_rate)
+    stop = threading.Event()
+
+    # retries are done per file by _download_file
+    session = RateLimitedSession(retries=0, pool_size=workers, timeout=timeout)
+    executor = cf.ThreadPoolExecutor(workers)
+    futures = [executor.submit(_download_file, session, f, outdir, progress, stop, bucket,
+                               timeout, retry, pause, keep, tolerate_error, verbosity)
+               for f in files]
+    completed = True
+    try:
+        for future in cf.as_completed(futures):
+            if future.cancelled():
+                continue
+            completed = future.result() and completed
+    except Exception as e:
+        # the remaining files are not downloaded
+        stop.set()
+        print(f'Stopping the remaining downloads due to error: {e}')
+        raise
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        session.close()
+
+    if verbosity: print(progress.report())
+    return completed
@@ -6,10 +6,15 @@ Rainfall Runoff datasets
 # https://springernature.figshare.com/articles/dataset/ExtendinG_SUb-DAily_River_Discharge_data_over_INdia_GUARDIAN_/27004282
 
 import os
+import warnings
+import concurrent.futures as cf
 from typing import Dict, Union, List
 
+import numpy as np
 import pandas as pd
 from .._backend import plt, plt_Axes
+from .._backend import xarray as xr
+from ..utils import get_cpus
 
 from .utils import _RainfallRunoff
 from ._camels import CAMELS_AUS
@@ -63,6 +68,10 @@ from .mtropics import MtropicsVietnam
 from ._misc import DraixBleone
 from ._misc import JialingRiverChina
 
+from ._catalog import StationCatalog
+from ._catalog import catalog
+from ._catalog import catalog_name
+
 
 DATASETS = {
     "camels": _RainfallRunoff,
@@ -201,6 +210,7 @@ class RainfallRunoff(object):
             processes: int = None,
             remove_zip: bool = True,
             verbosity: int = 1,
+            add_to_catalog: bool = False,
             **kwargs
     ):
         """
@@ -270,6 +280,11 @@ class RainfallRunoff(object):
             require netCDF4 package as well as :obj:`xarray`.
         verbosity : int
             0: no message will be printed
+        add_to_catalog : bool (default=False)
+            whether to add the stations of the dataset to the station catalog
+            (:obj:`aqua_fetch.rr.catalog`) if they are not already there. This
+            does not compute the availability of streamflow, for which use
+            ``catalog.add(dataset.dataset)``.
         kwargs :
             additional keyword arguments for the underlying dataset class
             For example ``version`` for :py:class:`aqua_fetch.rr.CAMELS_AUS` or ``timestep`` for
@@ -289,6 +304,21 @@ class RainfallRunoff(object):
             **kwargs
         )
 
+        if add_to_catalog:
+            self._add_to_catalog()
+
+    def _add_to_catalog(self, stn_catalog: StationCatalog = None):
+        """adds the stations to the station catalog if they are not already there"""
+        stn_catalog = catalog if stn_catalog is None else stn_catalog
+        if not isinstance(self.dataset, _RainfallRunoff) or catalog_name(self.dataset) in stn_catalog:
+            return
+        try:
+            stn_catalog.add(self.dataset, availability=False)
+        except Exception as e:
+            # the catalog is optional, construction of the dataset must not fail
+            if self.verbosity: warnings.warn(f"could not add {self.name} to station catalog: {e}")
+        return
+
     def __str__(self):
         return f"{self.name} with {len(self.stations())} stations, {self.num_dynamic()} dynamic and {self.num_static()} static features"
 
@@ -517,6 +547,155 @@ class RainfallRunoff(object):
         """
         return self.dataset.fetch(stations, dynamic_features, static_features, st, en, as_dataframe, **kwargs)
 
+    @classmethod
+    def many(
+            cls,
+            datasets: List[str],
+            dynamic_features: Union[List[str], str, None] = None,
+            stations: Union[str, Dict[str, List[str]]] = "all",
+            st: Union[None, str] = None,
+            en: Union[None, str] = None,
+            dedupe: bool = True,
+            preference: List[str] = None,
+            path: Union[str, os.PathLike] = None,
+            processes: int = None,
+            chunk_size: int = 50,
+            verbosity: int = 1,
+            **kwargs
+    ) -> "DataArray":
+        """
+        Fetches the same (standardized) dynamic features from more than one
+        datasets concurrently and aligns them to a common time axis. The datasets
+        are constructed and the stations are read (in chunks of ``chunk_size``)
+        using a single pool of ``processes`` threads. All the datasets must have
+        the same timestep.
+
+        parameters
+        ----------
+        datasets : list
+            names of datasets e.g. ``['CAMELS_DE', 'CAMELS_CH', 'CAMELS_FR']``
+        dynamic_features : str/list
+            dynamic features to fetch e.g. ``['q_cms_obs', 'pcp_mm']``. By default,
+            the features which are available in all the datasets are fetched.
+        stations : str/dict
+            ``all`` or stations of each dataset as ``{dataset: [stations]}``
+        st :
+            starting date of data to be returned.
+        en :
+            end date of data to be returned.
+        dedupe : bool (default=True)
+            if True, each physical gauge, which may be present in more than one
+            datasets, is read only once from the most preferred dataset. The
+            duplicate gauges are found using :meth:`aqua_fetch.rr.StationCatalog.gauge_groups`
+            of a catalog of ``datasets`` which is kept in memory. The station catalog
+            on disk is used, and updated, only if ``add_to_catalog=True`` is given.
+        preference : list
+            names of datasets in order of preference for ``dedupe``. By default,
+            the order of ``datasets`` is used.
+        path : str
+            path to directory inside which the datasets are located/downloaded.
+        processes : int
+            number of threads in the pool. By default, number of cpus are used.
+        chunk_size : int
+            number of stations of a dataset which are read by one task
+        verbosity : int
+        kwargs :
+            any keyword arguments for :py:class:`RainfallRunoff`
+
+        Returns
+        -------
+        xr.DataArray
+            an array with ``station``, ``time`` and ``dynamic_features`` as
+            dimensions. The ``station`` dimension has ``dataset`` (dataset of origin)
+            and ``station_id`` (id of station in that dataset) as coordinates.
+            The values are NaN where a station has no data.
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> data = RainfallRunoff.many(['CAMELS_DE', 'CAMELS_CH', 'CAMELS_FR'],
+        ...     dynamic_features=['q_cms_obs', 'pcp_mm'], st='2000-01-01', en='2010-12-31')
+        >>> data.dims
+        ('station', 'time', 'dynamic_features')
+        ... # data of stations from CAMELS_CH
+        >>> data.sel(station=data.dataset == 'CAMELS_CH')
+        """
+        if xr is None:
+            raise ModuleNotFoundError("xarray module is not installed. Please install it to use many")
+
+        processes = processes or get_cpus()
+
+        # the catalog is updated serially after the datasets are constructed
+        add_to_catalog = kwargs.pop('add_to_catalog', False)
+
+        with cf.ThreadPoolExecutor(processes) as executor:
+
+            futures = {ds: executor.submit(cls, ds, path=path, verbosity=verbosity,
+                                           add_to_catalog=False, **kwargs) for ds in datasets}
+            instances = {ds: future.result() for ds, future in futures.items()}
+
+            if add_to_catalog:
+                for instance in instances.values():
+                    instance._add_to_catalog()
+
+            if dynamic_features is None:
+                dynamic_features = [f for f in instances[datasets[0]].dynamic_features 
+                                    if all(f in instance.dynamic_features for instance in instances.values())]
+                if len(dynamic_features) == 0:
+                    raise ValueError(f"{datasets} have no dynamic feature in common")
+            elif isinstance(dynamic_features, str):
+                dynamic_features = [dynamic_features]
+
+            if stations == "all":
+                stations = {ds: instance.stations() for ds, instance in instances.items()}
+
+            if dedupe:
+                stations = _dedupe(instances, stations, preference, add_to_catalog)
+
+            futures = []
+            for ds, stns in stations.items():
+                for i in range(0, len(stns), chunk_size):
+                    chunk = stns[i: i + chunk_size]
+                    futures.append((ds, chunk, executor.submit(
+                        _fetch_chunk, instances[ds], chunk, dynamic_features, st, en)))
+
+            chunks = [(ds, chunk) + future.result() for ds, chunk, future in futures]
+
+        # time axes of datasets with different timesteps can not be aligned
+        steps = {}
+        for ds, _, index, _ in chunks:
+            if len(index) > 1:
+                step = pd.Timedelta(np.diff(index.values).min())
+                steps[ds] = min(steps.get(ds, step), step)
+        if len(set(steps.values())) > 1:
+            raise ValueError(f"datasets have different timesteps {steps}")
+
+        time = pd.DatetimeIndex([])
+        for _, _, index, _ in chunks:
+            time = time.union(index)
+
+        num_stations = sum(len(stns) for _, stns, _, _ in chunks)
+        data = np.full((num_stations, len(time), len(dynamic_features)), np.nan, dtype=np.float32)
+
+        origin, station_ids, i = [], [], 0
+        for ds, stns, index, values in chunks:
+            data[i: i + len(stns), time.get_indexer(index)] = values
+            origin += [ds] * len(stns)
+            station_ids += list(stns)
+            i += len(stns)
+
+        return xr.DataArray(
+            data,
+            dims=('station', 'time', 'dynamic_features'),
+            coords={
+                'station': [f"{ds}_{stn}" for ds, stn in zip(origin, station_ids)],
+                'time': time,
+                'dynamic_features': dynamic_features,
+                'dataset': ('station', origin),
+                'station_id': ('station', station_ids),
+            },
+        )
+
     def fetch_stations_features(
             self,
             stations: Union[str, List[str]],
@@ -800,6 +979,172 @@ class RainfallRunoff(object):
         """
         return self.dataset.stn_coords(stations)
 
+    def nearest_stations(
+            self,
+            lat: Union[float, List[float]],
+            lon: Union[float, List[float]],
+            k: int = 1,
+    ) -> pd.DataFrame:
+        """
+        finds ``k`` nearest stations to a point or to each of many points.
+        The spatial index is built from :meth:`stn_coords` only once and then
+        cached for the dataset.
+
+        Parameters
+        ----------
+        lat : float/array
+            latitude of query point(s) in degrees
+        lon : float/array
+            longitude of query point(s) in degrees
+        k : int (default=1)
+            number of nearest stations to find for each point
+
+        Returns
+        -------
+        pd.DataFrame
+            :obj:`pandas.DataFrame` with ``lat``, ``long`` and ``distance_km`` columns
+            sorted by distance and station ids as index. If ``lat`` and ``lon`` are 
+            arrays, then the index is a :obj:`pandas.MultiIndex` with ``query`` and 
+            ``station`` as levels.
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> dataset = RainfallRunoff('CAMELS_CH')
+        >>> dataset.nearest_stations(46.9, 7.4, k=5)
+        ... # 3 nearest stations to each of the two points
+        >>> dataset.nearest_stations([46.9, 47.3], [7.4, 8.5], k=3)
+        """
+        return self.dataset.nearest_stations(lat, lon, k=k)
+
+    def stations_within(
+            self,
+            lat: Union[float, List[float]],
+            lon: Union[float, List[float]],
+            radius_km: float,
+    ) -> pd.DataFrame:
+        """
+        finds all stations within ``radius_km`` of a point or of each of many points.
+
+        Parameters
+        ----------
+        lat : float/array
+            latitude of query point(s) in degrees
+        lon : float/array
+            longitude of query point(s) in degrees
+        radius_km : float
+            search radius in kilometers
+
+        Returns
+        -------
+        pd.DataFrame
+            :obj:`pandas.DataFrame` with ``lat``, ``long`` and ``distance_km`` columns
+            sorted by distance and station ids as index. If ``lat`` and ``lon`` are 
+            arrays, then the index is a :obj:`pandas.MultiIndex` with ``query`` and 
+            ``station`` as levels.
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> dataset = RainfallRunoff('CAMELS_CH')
+        >>> dataset.stations_within(46.9, 7.4, radius_km=50)
+        """
+        return self.dataset.stations_within(lat, lon, radius_km=radius_km)
+
+    def stations_in_bbox(
+            self,
+            lat_min: Union[float, List[float]],
+            lat_max: Union[float, List[float]],
+            lon_min: Union[float, List[float]],
+            lon_max: Union[float, List[float]],
+    ) -> pd.DataFrame:
+        """
+        finds all stations inside a bounding box or inside each of many bounding boxes.
+
+        Parameters
+        ----------
+        lat_min : float/array
+            southern edge of box(es) in degrees
+        lat_max : float/array
+            northern edge of box(es) in degrees
+        lon_min : float/array
+            western edge of box(es) in degrees
+        lon_max : float/array
+            eastern edge of box(es) in degrees. If ``lon_min`` is larger than
+            ``lon_max``, the box crosses the antimeridian.
+
+        Returns
+        -------
+        pd.DataFrame
+            :obj:`pandas.DataFrame` with ``lat`` and ``long`` columns and station ids
+            as index.
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> dataset = RainfallRunoff('CAMELS_CH')
+        >>> dataset.stations_in_bbox(46.5, 47.0, 7.0, 8.0)
+        """
+        return self.dataset.stations_in_bbox(lat_min, lat_max, lon_min, lon_max)
+
+    def catchments_containing(
+            self,
+            lat: float,
+            lon: float,
+    ) -> List[str]:
+        """
+        finds the catchments which contain a point e.g. a water quality sampling
+        site or a reservoir. Nested catchments are all returned.
+
+        Parameters
+        ----------
+        lat : float
+            latitude of the point in degrees
+        lon : float
+            longitude of the point in degrees
+
+        Returns
+        -------
+        list
+            ids of catchments containing the point, ordered by area so that
+            the smallest catchment comes first.
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> dataset = RainfallRunoff('CAMELS_CH')
+        >>> dataset.catchments_containing(46.9, 7.4)
+        """
+        return self.dataset.catchments_containing(lat, lon)
+
+    def catchments_containing_points(
+            self,
+            lat: List[float],
+            lon: List[float],
+    ) -> List[List[str]]:
+        """
+        batch version of :meth:`catchments_containing` for many points.
+
+        Parameters
+        ----------
+        lat : array
+            latitudes of points in degrees
+        lon : array
+            longitudes of points in degrees
+
+        Returns
+        -------
+        list
+            a list with one list of catchment ids (ordered by area) for each point
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> dataset = RainfallRunoff('CAMELS_CH')
+        >>> dataset.catchments_containing_points([46.9, 47.3], [7.4, 8.5])
+        """
+        return self.dataset.catchments_containing_points(lat, lon)
+
     def get_boundary(
             self,
             station: str,
@@ -829,6 +1174,7 @@ class RainfallRunoff(object):
             self,
             station: str,
             show_outlet:bool = False,
+            detail: str = 'full',
             ax: plt_Axes = None,
             show: bool = True,
             **kwargs
@@ -842,6 +1188,9 @@ class RainfallRunoff(object):
             name/id of station. For names of stations, see :meth:`stations`
         show_outlet : bool, optional (default=False)
             if True, then outlet of the catchment will be plotted as a red dot
+        detail : str, optional (default='full')
+            level of detail of the boundary. It can be ``full``, ``medium``
+            or ``low``.
         ax : plt.Axes
             matplotlib axes to draw the plot. If not given, then
             new axes will be created.
@@ -866,10 +1215,53 @@ class RainfallRunoff(object):
         return self.dataset.plot_catchment(
             station,
             show_outlet=show_outlet,
+            detail=detail,
             ax=ax, 
             show=show,
             **kwargs)
 
+    def plot_catchments(
+            self,
+            stations: Union[str, List[str]] = 'all',
+            detail: str = 'low',
+            ax: plt_Axes = None,
+            show: bool = True,
+            **kwargs
+    ) -> plt_Axes:
+        """
+        plots boundaries of many catchments at once as a single LineCollection
+
+        Parameters
+        ----------
+        stations : str/list (default='all')
+            names/ids of catchments to plot. For names of stations, see :meth:`stations`
+        detail : str, optional (default='low')
+            level of detail of the boundaries. It can be ``full``, ``medium`` or ``low``.
+        ax : plt.Axes
+            matplotlib axes to draw the plot. If not given, then
+            new axes will be created.
+        show : bool
+        **kwargs
+            any keyword arguments for :obj:`matplotlib.collections.LineCollection`
+
+        Returns
+        -------
+        plt.Axes
+
+        Examples
+        --------
+        >>> from aqua_fetch import RainfallRunoff
+        >>> dataset = RainfallRunoff('CAMELS_AUS')
+        >>> dataset.plot_catchments()
+        >>> dataset.plot_catchments(detail='medium', color='k')
+        """
+        return self.dataset.plot_catchments(
+            stations,
+            detail=detail,
+            ax=ax,
+            show=show,
+            **kwargs)
+
     def stations(self) -> List[str]:
         """
         Names/ids of stations/catchment/basins/gauges or whatever that would
@@ -909,3 +1301,47 @@ class RainfallRunoff(object):
         >>> dataset.end()
         """
         return self.dataset.end
+
+
+def _dedupe(
+        instances: Dict[str, RainfallRunoff],
+        stations: Dict[str, List[str]],
+        preference: List[str] = None,
+        add_to_catalog: bool = False,
+) -> Dict[str, List[str]]:
+    """
+    removes the duplicate gauges from the stations of datasets using the station
+    catalog if ``add_to_catalog`` is True and otherwise using a catalog of the
+    instances which is only kept in memory
+    """
+    stn_catalog = catalog if add_to_catalog else StationCatalog(persist=False)
+    for instance in instances.values():
+        instance._add_to_catalog(stn_catalog)
+
+    # names of the datasets in catalog include their variant
+    names = {ds: catalog_name(instance.dataset) for ds, instance in instances.items()}
+    result = stn_catalog.dedupe({names[ds]: stns for ds, stns in stations.items()},
+                            preference=[names.get(ds, ds) for ds in preference or []])
+    return {ds: result[names[ds]] for ds in stations}
+
+
+def _fetch_chunk(
+        dataset: RainfallRunoff,
+        stations: List[str],
+        dynamic_features: List[str],
+        st,
+        en,
+) -> tuple:
+    """reads dynamic features of some stations of a dataset as a (station, time, feature) array"""
+    _, dyn = dataset.fetch_stations_features(
+        stations, dynamic_features=dynamic_features, st=st, en=en, as_dataframe=True)
+
+    time = pd.DatetimeIndex([])
+    for stn in stations:
+        time = time.union(pd.DatetimeIndex(dyn[stn].index))
+
+    values = np.full((len(stations), len(time), len(dynamic_features)), np.nan, dtype=np.float32)
+    for i, stn in enumerate(stations):
+        df = dyn[stn].reindex(columns=dynamic_features)
+        values[i, time.get_indexer(pd.DatetimeIndex(df.index))] = df.values
+    return time, values
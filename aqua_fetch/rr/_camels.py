@@ -6,7 +6,7 @@ import shutil
 import zipfile
 import warnings
 import concurrent.futures as cf
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Tuple
 
 import numpy as np
 import pandas as pd
@@ -16,7 +16,7 @@ from .._geom_utils import utm_to_lat_lon
 from ..utils import get_cpus, download_and_unzip
 from ..utils import check_attributes, download, unzip
 
-from .._backend import netCDF4, xarray as xr
+from .._backend import netCDF4, nc_lock, xarray as xr
 
 from ._map import (
     observed_streamflow_cms,
@@ -2748,13 +2748,10 @@ class CAMELS_DK(_RainfallRunoff):
 
     def transform_stn_coords(self, df:pd.DataFrame)->pd.DataFrame:
 
-        ct_m = pd.DataFrame(columns=['lat', 'long'], index=df.index)
-        # Test the function using lat, long in c DataFrame
-        for i in range(0, len(df)):
-            lat, lon = utm_to_lat_lon(df.iloc[i, 1], df.iloc[i, 0], 32)
-            ct_m.iloc[i] = [lat, lon]
-        
-        return ct_m
+        # all the stations are converted in one call
+        lat, lon = utm_to_lat_lon(df.iloc[:, 1].values, df.iloc[:, 0].values, 32)
+
+        return pd.DataFrame({'lat': lat, 'long': lon}, index=df.index)
 
     def transform_coords(self, coords):
         """
@@ -4916,10 +4913,23 @@ class CAMELSH(_RainfallRunoff):
                 unzip(self.path, keep_parent_dir=True, verbosity=self.verbosity)
 
         self.__stations = [fname.split('_')[0] for fname in os.listdir(self.h2_path)]
+        self._dynamic_features, self._start, self._end = self.__read_headers()
 
     def stations(self) -> List[str]:
         return self.__stations
 
+    @property
+    def dynamic_features(self) -> List[str]:
+        return self._dynamic_features
+
+    @property
+    def start(self) -> pd.Timestamp:
+        return self._start
+
+    @property
+    def end(self) -> pd.Timestamp:
+        return self._end
+
     @property
     def static_map(self) -> Dict[str, str]:
         return {
@@ -4988,22 +4998,26 @@ class CAMELSH(_RainfallRunoff):
     def timeseries_path(self) -> os.PathLike:
         return os.path.join(self.path, "timeseries", "Data", "CAMELSH", "timeseries")
 
-    def _read_stn_q(self, stn):
+    def _q_fpath(self, stn) -> os.PathLike:
         fpath = os.path.join(self.h2_path, f"{stn}_hourly.nc")
         if not os.path.exists(fpath):
             raise FileNotFoundError(f"q data for station {stn} not found in {self.h2_path}")
-        
-        ds = xr.open_dataset(fpath, engine='netcdf4')
-        return ds
+        return fpath
 
-    def _read_stn_forcing(self, stn):
+    def _forcing_fpath(self, stn) -> os.PathLike:
         fpath = os.path.join(self.nonobs_path, f"{stn}.nc")
         if not os.path.exists(fpath):
             fpath = os.path.join(self.timeseries_path, f"{stn}.nc")
             if not os.path.exists(fpath):
                 raise FileNotFoundError(f"forcing data for station {stn} not found in {self.nonobs_path}")
-        
-        ds = xr.open_dataset(fpath, engine='netcdf4')
+        return fpath
+
+    def _read_stn_q(self, stn):
+        ds = xr.open_dataset(self._q_fpath(stn), engine='netcdf4')
+        return ds
+
+    def _read_stn_forcing(self, stn):
+        ds = xr.open_dataset(self._forcing_fpath(stn), engine='netcdf4')
 
         # todo : what is difference between Streamflow in forcing and streamflow in Hourly2 path?
         ds = ds.drop_vars("Streamflow", errors="ignore")
@@ -5012,14 +5026,136 @@ class CAMELSH(_RainfallRunoff):
         return ds    
     
     def _read_stn_dyn(self, stn:str, nrows=None) -> pd.DataFrame:
-        q = self._read_stn_q(stn)
-        forcing = self._read_stn_forcing(stn)
-        # todo : converting to pandas will make the code extremely slow
-        # conversion should be done after we have fetched data from all stations and if required
-        ds = xr.merge([q, forcing]).to_pandas()
-        
-        ds.rename(columns=self.dyn_map, inplace=True)
-        return ds
+        time_, data = self._read_dynamic_array([stn], self.dynamic_features)
+        return pd.DataFrame(data[0], index=time_, columns=pd.Index(self.dynamic_features, name='dynamic_features'))
+
+    def __read_headers(self) -> Tuple[List[str], pd.Timestamp, pd.Timestamp]:
+        """
+        names of dynamic features, read from the files of first station, and
+        the first and last time steps over the files of all the stations
+        """
+        stn = self.stations()[0]
+        features = []
+        for fpath in [self._q_fpath(stn), self._forcing_fpath(stn)]:
+            with netCDF4.Dataset(fpath) as nc:
+                for name, var in nc.variables.items():
+                    # only time series are dynamic features
+                    if var.ndim == 1 and var.dimensions[0] != name and name != 'Streamflow':
+                        features.append(self.dyn_map.get(name, name))
+
+        spans = self.time_spans()
+        return features, spans['start'].min(), spans['end'].max()
+
+    def time_spans(self) -> pd.DataFrame:
+        """
+        first and last time steps of the files of each station as a dataframe with
+        ``start`` and ``end`` columns. Since the stations cover different periods,
+        the headers of files of all the stations are read once and saved in
+        ``time_spans.csv``.
+        """
+        spans_fpath = os.path.join(self.path, 'time_spans.csv')
+        if os.path.exists(spans_fpath):
+            spans = pd.read_csv(spans_fpath, index_col='station', dtype={'station': str}, parse_dates=['start', 'end'])
+            if set(self.stations()) <= set(spans.index):
+                return spans.loc[self.stations()]
+
+        if self.verbosity:
+            print(f"reading time steps of {len(self.stations())} stations")
+
+        spans = {}
+        for stn in self.stations():
+            steps = [step for fpath in [self._q_fpath(stn), self._forcing_fpath(stn)]
+                     for step in _nc_time_span(fpath)]
+            spans[stn] = (min(steps), max(steps)) if steps else (pd.NaT, pd.NaT)
+
+        spans = pd.DataFrame.from_dict(spans, orient='index', columns=['start', 'end'])
+        spans.index.name = 'station'
+        spans.to_csv(spans_fpath + '.part')
+        os.replace(spans_fpath + '.part', spans_fpath)
+        return spans
+
+    def _read_dynamic_array(
+            self,
+            stations: List[str],
+            dynamic_features: List[str],
+            st=None,
+            en=None
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        reads the dynamic features of stations into an array of shape
+        (stations, time, dynamic_features). The files of stations are read
+        concurrently by a pool of threads. Only the requested variables and the
+        time steps between ``st`` and ``en`` are read from each file and written
+        directly into the array as float32.
+        """
+        st, en = self._check_length(st, en)
+        time_ = pd.date_range(self.start, self.end, freq='h', name='time')
+        time_ = time_[time_.slice_indexer(st, en)]
+
+        inv_map = {v: k for k, v in self.dyn_map.items()}
+        variables = [inv_map.get(f, f) for f in dynamic_features]
+
+        data = np.full((len(stations), len(time_), len(variables)), np.nan, dtype=np.float32)
+
+        def read_stn(i):
+            for fpath in [self._q_fpath(stations[i]), self._forcing_fpath(stations[i])]:
+                _read_nc_into(fpath, variables, time_, data[i])
+            return
+
+        threads = self.processes or min(get_cpus(), 16)
+        start = time.time()
+
+        if threads == 1 or len(stations) == 1:
+            for i in range(len(stations)):
+                read_stn(i)
+        else:
+            with cf.ThreadPoolExecutor(threads) as executor:
+                # list() raises the exception of a thread if any
+                list(executor.map(read_stn, range(len(stations))))
+
+        if self.verbosity > 1:
+            print(f"Read {len(stations)} stations for {len(variables)} dyn features in {time.time() - start:.2f} seconds")
+        return time_, data
+
+    def fetch_stations_features(
+            self,
+            stations: Union[str, List[str]],
+            dynamic_features: Union[str, List[str]] = 'all',
+            static_features: Union[str, List[str]] = None,
+            st: Union[str, pd.Timestamp] = None,
+            en: Union[str, pd.Timestamp] = None,
+            as_dataframe: bool = False,
+            **kwargs
+    ):
+        """
+        Reads features of more than one stations. The dynamic features of all
+        stations are read into one array and converted into
+        :obj:`pandas.DataFrame` only if ``as_dataframe`` is True.
+        See :py:meth:`aqua_fetch.rr.utils._RainfallRunoff.fetch_stations_features`
+        for description of arguments.
+        """
+        if dynamic_features is None:
+            return super().fetch_stations_features(
+                stations, dynamic_features, static_features, st, en, as_dataframe, **kwargs)
+
+        stations = check_attributes(stations, self.stations(), 'stations')
+        features = check_attributes(dynamic_features, self.dynamic_features, 'dynamic_features')
+
+        time_, data = self._read_dynamic_array(stations, features, st, en)
+
+        if as_dataframe or xr is None:
+            columns = pd.Index(features, name='dynamic_features')
+            dynamic = {stn: pd.DataFrame(data[i], index=time_, columns=columns) for i, stn in enumerate(stations)}
+        else:
+            coords = {'time': time_, 'dynamic_features': features}
+            dynamic = xr.Dataset({stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                                  for i, stn in enumerate(stations)})
+
+        static = None
+        if static_features is not None:
+            static = self.fetch_static_features(stations, static_features)
+
+        return static, dynamic
 
     def _static_data(self) -> pd.DataFrame:
         """
@@ -5052,3 +5188,67 @@ class CAMELSH(_RainfallRunoff):
         # rename columns using self.static_map
         df = df.rename(columns=self.static_map)
         return df
+
+
+def _nc_time_span(fpath: os.PathLike) -> List[pd.Timestamp]:
+    """first and last time steps of the file, read without reading the whole time variable"""
+    with nc_lock:
+        with netCDF4.Dataset(fpath) as nc:
+            for name, var in nc.variables.items():
+                if var.ndim == 1 and var.dimensions[0] == name and len(var) > 0:
+                    unit, ref = var.units.split(' since ')
+                    return [pd.Timestamp(ref) + pd.Timedelta(float(var[i]), unit=unit) for i in (0, -1)]
+    return []
+
+
+def _read_nc_into(
+        fpath: os.PathLike,
+        variables: List[str],
+        time_: pd.DatetimeIndex,
+        out: np.ndarray
+):
+    """
+    reads those ``variables`` which exist in the file, between the first and last
+    time steps of ``time_`` into ``out`` whose shape is (time, variables)
+    """
+    if len(time_) == 0:
+        return
+
+    # the calls to netcdf-c are serialized while the decoding and copying of
+    # the data is done concurrently
+    with nc_lock:
+        with netCDF4.Dataset(fpath) as nc:
+            nc.set_auto_mask(False)
+            names = [v for v in variables if v in nc.variables]
+            if not names:
+                return
+
+            tvar = nc.variables[nc.variables[names[0]].dimensions[0]]
+            units, t = tvar.units, tvar[:]
+
+            # position of each time step of file in time_, computed without
+            # decoding to datetimes which is slow for long hourly time series
+            unit, ref = units.split(' since ')
+            step = pd.Timedelta(time_.freq)
+            pos = t * (pd.Timedelta(1, unit=unit) / step) + (pd.Timestamp(ref) - time_[0]) / step
+            pos = np.floor(pos + 1e-6).astype(np.int64)
+            # hyperslab of the file which lies inside time_
+            lo, hi = np.searchsorted(pos, 0), np.searchsorted(pos, len(time_))
+
+            values = {}
+            for name in names:
+                var = nc.variables[name]
+                missing = [getattr(var, attr) for attr in ('_FillValue', 'missing_value') if hasattr(var, attr)]
+                values[name] = (var[lo:hi], missing)
+
+    pos = pos[lo:hi]
+    if len(pos) and pos[-1] - pos[0] == len(pos) - 1:
+        # consecutive time steps are copied as a slice
+        pos = slice(pos[0], pos[-1] + 1)
+
+    for name, (vals, missing) in values.items():
+        vals = vals.astype(np.float32, copy=False)
+        for m in missing:
+            vals[vals == np.float32(m)] = np.nan
+        out[pos, variables.index(name)] = vals
+    return
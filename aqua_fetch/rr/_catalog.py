@@ -0,0 +1,601 @@
+
+__all__ = ["StationCatalog", "catalog", "catalog_name", "match_gauges"]
+
+import os
+import hashlib
+import inspect
+import threading
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .._spatial import StationIndex
+from .utils import _RainfallRunoff
+from ._map import observed_streamflow_cms, observed_streamflow_mm
+
+
+# the catalog is saved in the cache directory of the user i.e. ~/.cache/aqua_fetch
+DEFAULT_CATALOG_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'aqua_fetch')
+
+COLUMNS = ['dataset', 'station', 'lat', 'long', 'area_km2', 'start', 'end', 'availability']
+
+# datasets whose station ids are USGS site numbers
+USGS_ID_DATASETS = ['CAMELS_US', 'CAMELSH', 'USGS']
+
+# attributes which distinguish variants of a dataset in the catalog
+VARIANT_ATTRS = ['timestep', 'data_type']
+
+
+class StationCatalog(object):
+    """
+    A catalog of stations of all the rainfall-runoff datasets which have been
+    initialized locally. It is a single table with one row for each station and
+    ``dataset``, ``station``, ``lat``, ``long``, ``area_km2``, ``start``, ``end``
+    and ``availability`` as columns. The dynamic features of each dataset are
+    also stored. The catalog is built incrementally using :meth:`add` and is
+    saved as a single .npz file so that finding the stations of a region or
+    period does not require constructing any dataset.
+
+    Examples
+    --------
+    >>> from aqua_fetch import CAMELS_CH, CAMELS_DE
+    >>> from aqua_fetch.rr import catalog
+    >>> catalog.add(CAMELS_CH())
+    >>> catalog.add(CAMELS_DE())
+    ... # stations in a bounding box (lat_min, lat_max, lon_min, lon_max)
+    >>> catalog.query(bbox=(46.0, 48.0, 6.0, 10.0))
+    ... # stations with data from 1990 to 2010 and given dynamic features
+    >>> catalog.query(period=('1990-01-01', '2010-12-31'), features=['q_cms_obs', 'pcp_mm'])
+    """
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike] = None,
+            persist: bool = True,
+    ):
+        """
+        Parameters
+        ----------
+        path : str
+            directory where the catalog is saved. By default it is saved in the
+            cache directory of the user i.e. ``~/.cache/aqua_fetch`` or
+            ``$XDG_CACHE_HOME/aqua_fetch``
+        persist : bool (default=True)
+            if False, the catalog is only kept in memory i.e. it is neither
+            read from nor saved to ``path``.
+        """
+        if path is None:
+            path = DEFAULT_CATALOG_DIR
+        self.path = path
+        self.persist = persist
+
+        self._table = None
+        self._features = None
+        self._index = None
+        self._groups = None
+        # the catalog may be updated by more than one thread
+        self._lock = threading.RLock()
+
+    @property
+    def fpath(self) -> os.PathLike:
+        return os.path.join(self.path, "station_catalog.npz")
+
+    @property
+    def groups_fpath(self) -> os.PathLike:
+        return os.path.join(self.path, "gauge_groups.npz")
+
+    @property
+    def table(self) -> pd.DataFrame:
+        """the catalog as :obj:`pandas.DataFrame` with one row for each station"""
+        if self._table is None:
+            self._load()
+        return self._table
+
+    @property
+    def datasets(self) -> List[str]:
+        """names of datasets in the catalog"""
+        if self._features is None:
+            self._load()
+        return list(self._features.keys())
+
+    def features(self, dataset: str) -> List[str]:
+        """dynamic features of a dataset in the catalog"""
+        if self._features is None:
+            self._load()
+        return self._features[dataset]
+
+    def __contains__(self, dataset: str) -> bool:
+        return dataset in self.datasets
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def add(
+            self,
+            dataset: _RainfallRunoff,
+            availability: bool = True,
+            chunk_size: int = 100,
+    ):
+        """
+        adds (or replaces) the stations of a dataset to the catalog and saves it.
+
+        Parameters
+        ----------
+        dataset :
+            an instance of a rainfall-runoff dataset e.g. :py:class:`aqua_fetch.CAMELS_CH`
+        availability : bool (default=True)
+            whether to read the observed streamflow of all stations to find the
+            period (first and last valid value) of each station and the fraction
+            of non-missing values. If False, the ``start`` and ``end`` of the
+            dataset are used as period and availability is NaN.
+        chunk_size : int
+            number of stations whose streamflow is read at once when ``availability``
+            is True.
+        """
+        stations = dataset.stations()
+
+        coords = dataset.stn_coords().reindex(stations)
+
+        try:
+            area = dataset.area().reindex(stations).values
+        except (NotImplementedError, KeyError):
+            area = np.full(len(stations), np.nan)
+
+        st, en = pd.Timestamp(dataset.start), pd.Timestamp(dataset.end)
+        start = np.full(len(stations), st, dtype='datetime64[D]')
+        end = np.full(len(stations), en, dtype='datetime64[D]')
+        avail = np.full(len(stations), np.nan)
+
+        q_name = _q_feature(dataset)
+        if availability and q_name is not None:
+            for i in range(0, len(stations), chunk_size):
+                chunk = stations[i: i + chunk_size]
+                _, dyn = dataset.fetch_stations_features(
+                    chunk, dynamic_features=q_name, as_dataframe=True)
+                for j, stn in enumerate(chunk, start=i):
+                    start[j], end[j], avail[j] = _availability(dyn[stn], start[j], end[j])
+
+        name = catalog_name(dataset)
+        df = pd.DataFrame({
+            'dataset': name,
+            'station': np.array(stations, dtype=str),
+            'lat': coords['lat'].values.astype(np.float64),
+            'long': coords['long'].values.astype(np.float64),
+            'area_km2': np.asarray(area, dtype=np.float64),
+            'start': start,
+            'end': end,
+            'availability': avail,
+        })
+
+        with self._lock:
+            table = self.table
+            table = table[table['dataset'] != name]
+            features = dict(self._features)
+            features[name] = list(dataset.dynamic_features)
+
+            self._table = df if table.empty else pd.concat([table, df], ignore_index=True)
+            self._features = features
+            self._index = None
+            self._groups = None
+            self.save()
+        return
+
+    def remove(self, dataset: str):
+        """removes the stations of a dataset from the catalog and saves it"""
+        with self._lock:
+            table = self.table
+            self._table = table[table['dataset'] != dataset].reset_index(drop=True)
+            self._features.pop(dataset, None)
+            self._index = None
+            self._groups = None
+            self.save()
+        return
+
+    def build(
+            self,
+            path: Union[str, os.PathLike] = None,
+            datasets: List[str] = None,
+            **kwargs
+    ) -> List[str]:
+        """
+        adds all the datasets which are available locally and are not yet in
+        the catalog. Since this constructs each dataset, it is slow but is
+        required only once.
+
+        Parameters
+        ----------
+        path : str
+            directory which contains the datasets. If not given, the default
+            directory of each dataset is searched.
+        datasets : list
+            names of datasets to consider. By default all datasets in
+            :obj:`aqua_fetch.rr.DATASETS` are considered.
+        **kwargs :
+            any keyword arguments for :meth:`add`
+
+        Returns
+        -------
+        list
+            names of datasets which were added
+        """
+        from . import DATASETS
+
+        added = []
+        for name in datasets or DATASETS:
+            cls = DATASETS[name]
+            if name in self or cls is _RainfallRunoff or not issubclass(cls, _RainfallRunoff):
+                continue
+
+            # the directory of the dataset is found without constructing
+            # it because the constructor downloads the missing datasets
+            if not os.path.exists(cls.__new__(cls)._dataset_path(path)):
+                continue
+
+            self.add(cls(path=path, verbosity=0), **kwargs)
+            added.append(name)
+        return added
+
+    def query(
+            self,
+            bbox: Tuple[float, float, float, float] = None,
+            period: Tuple[Union[str, pd.Timestamp], Union[str, pd.Timestamp]] = None,
+            features: Union[str, List[str]] = None,
+            datasets: Union[str, List[str]] = None,
+            min_availability: float = None,
+    ) -> pd.DataFrame:
+        """
+        finds the stations in the catalog which satisfy all the given conditions.
+
+        Parameters
+        ----------
+        bbox : tuple
+            bounding box as ``(lat_min, lat_max, lon_min, lon_max)`` in degrees
+        period : tuple
+            ``(start, end)``. Only the stations whose record covers this period are returned.
+        features : str/list
+            dynamic features which must be available in the dataset
+        datasets : str/list
+            names of datasets to consider
+        min_availability : float
+            minimum fraction of non-missing streamflow values. Stations for which
+            availability is not known are not returned.
+
+        Returns
+        -------
+        pd.DataFrame
+            rows of the catalog which satisfy the conditions
+
+        Examples
+        --------
+        >>> from aqua_fetch.rr import catalog
+        >>> catalog.query(bbox=(46.0, 48.0, 6.0, 10.0), period=('2000-01-01', '2010-12-31'))
+        """
+        table = self.table
+        mask = np.ones(len(table), dtype=bool)
+
+        if bbox is not None:
+            mask[:] = False
+            index = self._station_index()
+            pos = index.in_bbox(*bbox)[0]
+            mask[index.ids[pos].astype(np.int64)] = True
+
+        if period is not None:
+            st, en = pd.Timestamp(period[0]), pd.Timestamp(period[1])
+            mask &= (table['start'].values <= st.to_datetime64()) & (table['end'].values >= en.to_datetime64())
+
+        if features is not None:
+            features = [features] if isinstance(features, str) else features
+            valid = [ds for ds in self.datasets if all(f in self._features[ds] for f in features)]
+            mask &= table['dataset'].isin(valid).values
+
+        if datasets is not None:
+            datasets = [datasets] if isinstance(datasets, str) else datasets
+            mask &= table['dataset'].isin(datasets).values
+
+        if min_availability is not None:
+            mask &= table['availability'].values >= min_availability
+
+        return table.loc[mask].reset_index(drop=True)
+
+    def gauge_groups(
+            self,
+            radius_km: float = 2.0,
+            area_tol: float = 0.1,
+    ) -> pd.Series:
+        """
+        Groups the stations of all the datasets in the catalog which measure the
+        same physical gauge (see :func:`match_gauges`). The groups are computed
+        only once for a given state of the catalog and are saved next to it.
+
+        Parameters
+        ----------
+        radius_km : float
+            maximum distance between two stations of the same gauge
+        area_tol : float
+            maximum relative difference between catchment areas of two stations
+            of the same gauge
+
+        Returns
+        -------
+        pd.Series
+            group of each station. The index is (dataset, station) and the value
+            is a canonical id of the gauge i.e. ``{dataset}_{station}`` of the first
+            station of the group.
+
+        Examples
+        --------
+        >>> from aqua_fetch.rr import catalog
+        >>> groups = catalog.gauge_groups()
+        ... # the gauges which are present in more than one dataset
+        >>> groups[groups.duplicated(keep=False)]
+        """
+        table = self.table
+        key = f"{_table_hash(table)}|{radius_km}|{area_tol}"
+
+        if self._groups is not None and self._groups[0] == key:
+            return self._groups[1]
+
+        groups = None
+        if self.persist and os.path.exists(self.groups_fpath):
+            with np.load(self.groups_fpath) as data:
+                if str(data['key']) == key:
+                    groups = data['groups']
+
+        if groups is None:
+            groups = match_gauges(table, radius_km=radius_km, area_tol=area_tol)
+            if self.persist:
+                with self._lock:
+                    _savez(self.groups_fpath, key=key, groups=groups)
+
+        first = pd.Series(np.arange(len(groups))).groupby(groups).transform('min').values
+        canonical = (table['dataset'].values[first].astype(object) + '_' 
+                     + table['station'].values[first].astype(object))
+        groups = pd.Series(canonical,
+                           index=pd.MultiIndex.from_arrays([table['dataset'], table['station']],
+                                                           names=['dataset', 'station']),
+                           name='gauge')
+        self._groups = (key, groups)
+        return groups
+
+    def dedupe(
+            self,
+            stations: Dict[str, List[str]],
+            preference: List[str] = None,
+            **kwargs
+    ) -> Dict[str, List[str]]:
+        """
+        removes the duplicate stations i.e. those which measure the same physical
+        gauge, from the stations of more than one dataset. Of each gauge, only the
+        station of the most preferred dataset is kept.
+
+        Parameters
+        ----------
+        stations : dict
+            stations of each dataset as ``{dataset: [stations]}`` where dataset
+            is the name of the dataset in the catalog (see :func:`catalog_name`)
+        preference : list
+            names of datasets in order of preference. By default, the order of
+            datasets in ``stations`` is used.
+        **kwargs :
+            any keyword arguments for :meth:`gauge_groups`
+
+        Returns
+        -------
+        dict
+            stations of each dataset without duplicates
+
+        Examples
+        --------
+        >>> from aqua_fetch.rr import catalog
+        >>> stations = {'CAMELS_US': ['01013500', '01022500'], 'USGS': ['01013500', '01030500']}
+        >>> catalog.dedupe(stations)
+        {'CAMELS_US': ['01013500', '01022500'], 'USGS': ['01030500']}
+        """
+        groups = self.gauge_groups(**kwargs)
+
+        preference = list(preference or []) + [ds for ds in stations if ds not in (preference or [])]
+
+        # dataset which was first to have each gauge
+        seen = {}
+        result = {ds: [] for ds in stations}
+        for ds in preference:
+            for stn in stations.get(ds, []):
+                # stations which are not in catalog can not be matched
+                gauge = groups.get((ds, str(stn)), f"{ds}_{stn}")
+                # stations are only removed if a station of another dataset is kept
+                if seen.setdefault(gauge, ds) == ds:
+                    result[ds].append(stn)
+        return result
+
+    def _station_index(self) -> StationIndex:
+        # row numbers are used as ids so that they can be mapped back to the table
+        if self._index is None:
+            table = self.table
+            self._index = StationIndex(np.arange(len(table)), table['lat'].values, table['long'].values)
+        return self._index
+
+    def _load(self):
+        if not self.persist or not os.path.exists(self.fpath):
+            self._table = pd.DataFrame({col: [] for col in COLUMNS})
+            self._features = {}
+            return
+
+        with np.load(self.fpath) as data:
+            self._table = pd.DataFrame({col: data[col] for col in COLUMNS})
+            self._features = {ds: feats.split(',') if feats else []
+                              for ds, feats in zip(data['datasets'].tolist(), data['features'].tolist())}
+        return
+
+    def save(self):
+        if not self.persist:
+            return
+        with self._lock:
+            self._save()
+        return
+
+    def _save(self):
+        table = self.table
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        _savez(
+            self.fpath,
+            dataset=table['dataset'].values.astype(str),
+            station=table['station'].values.astype(str),
+            lat=table['lat'].values.astype(np.float64),
+            long=table['long'].values.astype(np.float64),
+            area_km2=table['area_km2'].values.astype(np.float64),
+            start=table['start'].values.astype('datetime64[D]'),
+            end=table['end'].values.astype('datetime64[D]'),
+            availability=table['availability'].values.astype(np.float64),
+            datasets=np.array(list(self._features.keys()), dtype=str),
+            features=np.array([','.join(feats) for feats in self._features.values()], dtype=str),
+        )
+        return
+
+
+def match_gauges(
+        table: pd.DataFrame,
+        radius_km: float = 2.0,
+        area_tol: float = 0.1,
+) -> np.ndarray:
+    """
+    Finds the stations of different datasets which measure the same physical
+    gauge. Two stations are considered the same gauge if
+
+        - both are from datasets whose ids are USGS site numbers and the ids are same, or
+        - they are within ``radius_km`` of each other and their catchment areas
+          differ by less than ``area_tol`` (relative). If the area of either of
+          them is not known, only the distance is used.
+
+    The matching pairs are merged into groups, closest pairs first, such that
+    a group never contains two stations of the same dataset.
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        a table with ``dataset``, ``station``, ``lat``, ``long`` and ``area_km2``
+        as columns e.g. :obj:`StationCatalog.table`
+    radius_km : float
+        maximum distance between two stations of the same gauge
+    area_tol : float
+        maximum relative difference between catchment areas
+
+    Returns
+    -------
+    np.ndarray
+        group label of each row in ``table``
+    """
+    n = len(table)
+    datasets = table['dataset'].values
+    area = table['area_km2'].values.astype(np.float64)
+
+    parent = np.arange(n)
+    # datasets of the stations in each group, stored at the root of the group
+    members = {i: {datasets[i]} for i in range(n)}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        ri, rj = find(i), find(j)
+        # a group never holds two stations of the same dataset, otherwise a
+        # station lying between two stations of one dataset would join them
+        if ri == rj or members[ri] & members[rj]:
+            return
+        root, other = min(ri, rj), max(ri, rj)
+        parent[other] = root
+        members[root] |= members.pop(other)
+
+    # USGS site numbers
+    is_usgs = table['dataset'].str.match('|'.join(f"{ds}(_|$)" for ds in USGS_ID_DATASETS)).values
+    site = pd.Series(table['station'].values[is_usgs].astype(str)).str.zfill(8).values
+    first = {}
+    for i, s in zip(np.nonzero(is_usgs)[0], site):
+        if s in first:
+            union(first[s], i)
+        else:
+            first[s] = i
+
+    # spatial proximity and agreement of catchment area
+    index = StationIndex(np.arange(n), table['lat'].values, table['long'].values)
+    rows = index.ids.astype(np.int64)
+    distances, positions = index.within(index.lat, index.lon, radius_km)
+    pairs = []
+    for i, dist, pos in zip(rows, distances, positions):
+        for d, j in zip(dist, rows[pos]):
+            if j <= i or datasets[i] == datasets[j]:
+                continue
+            a_i, a_j = area[i], area[j]
+            if np.isfinite(a_i) and np.isfinite(a_j) and abs(a_i - a_j) > area_tol * max(a_i, a_j):
+                continue
+            pairs.append((d, i, j))
+
+    # closest pairs are joined first
+    for _, i, j in sorted(pairs):
+        union(i, j)
+
+    return np.array([find(i) for i in range(n)], dtype=np.int64)
+
+
+def catalog_name(dataset: _RainfallRunoff) -> str:
+    """
+    name of a dataset in the catalog. For the datasets which are available in
+    more than one variant e.g. timesteps of :py:class:`aqua_fetch.LamaHCE`, the
+    variant is appended to the name unless it is the default one, for example
+    ``LamaHCE_H``.
+    """
+    name = dataset.name
+    params = inspect.signature(type(dataset).__init__).parameters
+    for attr in VARIANT_ATTRS:
+        value = getattr(dataset, attr, None)
+        if attr in params and value is not None and value != params[attr].default:
+            name += f"_{value}"
+    return name
+
+
+def _savez(fpath, **arrays):
+    """saves the arrays through a .part file so that an interrupted save
+    does not leave a partial file"""
+    with open(fpath + '.part', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(fpath + '.part', fpath)
+    return
+
+
+def _table_hash(table: pd.DataFrame) -> str:
+    """hash of the stations, their coordinates and areas in the table"""
+    h = hashlib.sha1()
+    for col in ['dataset', 'station']:
+        h.update('\x00'.join(table[col].astype(str)).encode())
+    for col in ['lat', 'long', 'area_km2']:
+        h.update(np.ascontiguousarray(table[col].values, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _q_feature(dataset: _RainfallRunoff) -> Union[str, None]:
+    """name of observed streamflow feature of the dataset"""
+    for q_name in [observed_streamflow_cms(), observed_streamflow_mm()]:
+        if q_name in dataset.dynamic_features:
+            return q_name
+    return None
+
+
+def _availability(q: pd.DataFrame, start, end) -> Tuple[np.datetime64, np.datetime64, float]:
+    """first and last valid date and fraction of non-missing values of streamflow"""
+    q = q.iloc[:, 0] if isinstance(q, pd.DataFrame) else q
+    valid = q.notna().values
+    if not valid.any():
+        return start, end, 0.0
+    idx = np.nonzero(valid)[0]
+    first, last = q.index[idx[0]], q.index[idx[-1]]
+    return (np.datetime64(first, 'D'), np.datetime64(last, 'D'),
+            float(valid[idx[0]: idx[-1] + 1].mean()))
+
+
+catalog = StationCatalog()
@@ -18,7 +18,8 @@ from io import StringIO
 from datetime import datetime
 import concurrent.futures as cf
 from urllib.error import HTTPError
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Tuple
+from multiprocessing import shared_memory
 from concurrent.futures import ProcessPoolExecutor
 
 import requests
@@ -32,6 +33,8 @@ except (ModuleNotFoundError, ImportError):
     ET = None
 
 from .._backend import xarray as xr
+from .._backend import netCDF4
+from .._http import RateLimitedSession, UrlCache, first_available, response_body
 from ..utils import get_cpus
 from ..utils import check_attributes
 from .utils import _RainfallRunoff
@@ -274,52 +277,158 @@ class EStreams(_RainfallRunoff):
     ):
         """
         Returns the meteorological data of one or more stations
-        either as dictionary of dataframes or xarray Dataset
+        either as dictionary of dataframes or xarray Dataset. If ``to_netcdf``
+        is True, the data is read from :py:attr:`meteo_store_fpath` which is
+        built at first call.
         """
         stations = self._get_stations(countries, stations)
-        out = self._metedo_data_all_stations()
 
-        if isinstance(out, dict):
-            return {stn: out[stn] for stn in stations}
+        if not self.to_netcdf:
+            return self._meteo_csvs(stations)
 
-        return out[stations]
+        features = self.dynamic_features
+        time_, data = self._read_meteo(stations, features)
+        coords = {'time': time_, 'dynamic_features': features}
+        return xr.Dataset(
+            {stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+             for i, stn in enumerate(stations)})
 
     def _metedo_data_all_stations(self):
         """
         Returns the meteorological data of all stations
         """
-        nc_path = os.path.join(self.path, 'EStreams', 'meteorology.nc')
-        if self.to_netcdf and os.path.exists(nc_path):
-            if self.verbosity > 1:
-                print(f"Reading from {nc_path}")
-            return xr.open_dataset(nc_path)
+        return self.meteo_data()
 
+    def _meteo_csvs(self, stations: List[str]) -> Dict[str, pd.DataFrame]:
+        """reads the csv files of stations, in parallel if there are many stations"""
         cpus = self.processes or max(get_cpus() - 2, 1)
+
+        if cpus == 1 or len(stations) < cpus:
+            return {stn: self.meteo_data_station(stn) for stn in stations}
+
+        with cf.ProcessPoolExecutor(cpus) as exe:
+            dfs = exe.map(self.meteo_data_station, stations, chunksize=max(len(stations) // (cpus * 4), 1))
+            return dict(zip(stations, dfs))
+
+    @property
+    def meteo_store_fpath(self) -> os.PathLike:
+        """path of netcdf file which contains the meteorological data of all stations"""
+        return os.path.join(self.path, 'EStreams', 'meteorology_stacked.nc')
+
+    def build_meteo_store(self, block_size: int = None):
+        """
+        Converts the meteorological csv files of all stations into a netcdf
+        file :py:attr:`meteo_store_fpath` with a ``data`` variable of shape
+        (station, time, dynamic_features). The worker processes parse the csv
+        files directly into a block of shared memory and only return the position
+        of the station in the block. The main process writes each completed block
+        into the file while the workers fill the next block, so the data of only
+        two blocks is in memory at a time. The number of stations written is
+        saved after each block, so that an interrupted conversion is resumed.
+
+        Parameters
+        ----------
+        block_size : int
+            number of stations in a block. By default it is four times the
+            number of cpus.
+        """
+        fpath = self.meteo_store_fpath
+
+        if _meteo_store_complete(fpath):
+            return
+
         stations = self.stations()
-        meteo_vars = {}
+        features = self.dynamic_features
+        inv_map = {v: k for k, v in self.dyn_map.items()}
+        columns = [inv_map.get(f, f) for f in features]
+        time_ = pd.date_range(self.start, self.end, freq='D')
 
-        if self.verbosity:
-            print(f"Fetching meteorological data of {len(stations)} stations using {cpus} cpus")
+        cpus = self.processes or max(get_cpus() - 2, 1)
+        block_size = block_size or cpus * 4
+
+        if os.path.exists(fpath):
+            nc = netCDF4.Dataset(fpath, 'a')
+            if self.verbosity: print(f"resuming conversion into {fpath} from {nc.stations_done} stations")
+        else:
+            nc = _create_meteo_store(fpath, stations, time_, features)
+            if self.verbosity: print(f"converting meteorological data of {len(stations)} stations using {cpus} cpus")
 
         start = time.time()
-        with cf.ProcessPoolExecutor(cpus) as exe:  # takes ~500 secs with 110 cpus
-            dfs = exe.map(self.meteo_data_station, stations)
 
-        if self.verbosity:
-            print(f"Fetching meteorological data took {time.time() - start:.2f} seconds")
+        shape = (block_size, len(time_), len(features))
+        # two blocks, so that one is filled by workers while the other is being written
+        blocks = [shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4) for _ in range(2)]
 
-        if self.to_netcdf:
-            for stn, df in zip(self.stations(), dfs):
-                meteo_vars[stn] = df
+        def submit(exe, k, b0):
+            fpaths = [os.path.join(self.path2, 'meteorology', f'estreams_meteorology_{stn}.csv')
+                      for stn in stations[b0:b0 + block_size]]
+            return [exe.submit(_meteo_csv_to_block, fp, blocks[k % 2].name, shape, i, columns, str(self.start))
+                    for i, fp in enumerate(fpaths)]
+
+        try:
+            with nc, cf.ProcessPoolExecutor(cpus) as exe:
+                starts = list(range(int(nc.stations_done), len(stations), block_size))
+                pending = {k: submit(exe, k, b0) for k, b0 in enumerate(starts[:2])}
+
+                for k, b0 in enumerate(starts):
+                    futures = pending.pop(k)
+                    for f in futures:
+                        f.result()  # raises the exception of worker if any
+
+                    block = np.ndarray(shape, dtype=np.float32, buffer=blocks[k % 2].buf)
+                    nc.variables['data'][b0:b0 + len(futures)] = block[:len(futures)]
+                    nc.stations_done = b0 + len(futures)
+                    nc.sync()
+                    del block
+
+                    if k + 2 < len(starts):
+                        pending[k + 2] = submit(exe, k + 2, starts[k + 2])
+
+                    if self.verbosity > 1:
+                        print(f"{b0 + len(futures)}/{len(stations)} stations written")
+
+                nc.complete = 1
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
+        return
 
-            encoding = {stn: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for stn in meteo_vars.keys()}
+    def _read_meteo(
+            self,
+            stations: List[str],
+            features: List[str],
+            st=None,
+            en=None
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        reads the meteorological data of stations from :py:attr:`meteo_store_fpath`
+        as array of shape (stations, time, features)
+        """
+        self.build_meteo_store()
+
+        with netCDF4.Dataset(self.meteo_store_fpath) as nc:
+            nc.set_auto_mask(False)
+
+            lut = {stn: i for i, stn in enumerate(nc.variables['station'][:])}
+            pos = np.array([lut[stn] for stn in stations], dtype=int)
+
+            t = nc.variables['time']
+            ref = pd.Timestamp(t.units.split('since')[1].strip())
+            time_ = pd.DatetimeIndex(ref + pd.to_timedelta(t[:], unit='D'), name='time')
+            t0, t1 = time_.slice_indexer(st, en).indices(len(time_))[:2]
 
-            meteo_vars = xr.Dataset(meteo_vars)
+            f_lut = {f: i for i, f in enumerate(nc.variables['dynamic_features'][:])}
+            f_pos = np.array([f_lut[f] for f in features], dtype=int)
 
-            if self.verbosity: print(f"Saving to {nc_path}")
-            meteo_vars.to_netcdf(nc_path, encoding=encoding)
+            # netCDF4 requires sorted indices without duplicates
+            uniq, inverse = np.unique(pos, return_inverse=True)
+            f_uniq, f_inverse = np.unique(f_pos, return_inverse=True)
+            data = nc.variables['data'][uniq, t0:t1, f_uniq]
 
-        return meteo_vars
+        return time_[t0:t1], data[inverse][:, :, f_inverse]
 
     def hydro_clim_sigs(
             self,
@@ -424,19 +533,129 @@ class EStreams(_RainfallRunoff):
 
         features = check_attributes(dynamic_features, self.dynamic_features, 'dynamic_features')
 
-        if len(stations) == 1:
-            if as_dataframe:
-                stn_df = self.fetch_stn_dynamic_features(stations[0], features, st, en)
-                return {stations[0]: stn_df}
-            else:
-                return xr.Dataset({stations[0]: xr.DataArray(self.fetch_stn_dynamic_features(stations[0], features, st, en))})
+        st, en = self._check_length(st, en)
+
+        time_, data = self._meteo_array(stations, features, st, en)
 
         if as_dataframe:
-            data = {stn:self.fetch_stn_dynamic_features(stn, features, st, en) for stn in stations}
-            # raise NotImplementedError("as_dataframe=True is not implemented yet")
-            return data
+            columns = pd.Index(features, name='dynamic_features')
+            return {stn: pd.DataFrame(data[i], index=time_, columns=columns) for i, stn in enumerate(stations)}
+
+        coords = {'time': time_, 'dynamic_features': features}
+        return xr.Dataset({stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                           for i, stn in enumerate(stations)})
 
-        return self.meteo_data(stations).sel(dynamic_features=features)
+    def _meteo_array(
+            self,
+            stations: List[str],
+            features: List[str],
+            st=None,
+            en=None
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        meteorological data of stations as array of shape (stations, time, features).
+        It is read as one selection from :py:attr:`meteo_store_fpath` if ``to_netcdf``
+        is True, otherwise from the csv files of stations.
+        """
+        if self.to_netcdf:
+            return self._read_meteo(stations, features, st, en)
+
+        time_ = pd.date_range(self.start, self.end, freq='D', name='time')
+        time_ = time_[time_.slice_indexer(st, en)]
+
+        dfs = self._meteo_csvs(list(dict.fromkeys(stations)))
+
+        data = np.full((len(stations), len(time_), len(features)), np.nan, dtype=np.float32)
+        for i, stn in enumerate(stations):
+            data[i] = dfs[stn].reindex(index=time_, columns=features).to_numpy(dtype=np.float32, na_value=np.nan)
+        return time_, data
+
+
+def _meteo_store_complete(fpath: os.PathLike) -> bool:
+    if not os.path.exists(fpath):
+        return False
+    with netCDF4.Dataset(fpath, 'r') as nc:
+        return bool(getattr(nc, 'complete', 0))
+
+
+def _create_meteo_store(
+        fpath: os.PathLike,
+        stations: List[str],
+        time_: pd.DatetimeIndex,
+        features: List[str]
+):
+    """creates the netcdf file for meteorological data. The data is chunked
+    so that one chunk contains the complete time series of one station."""
+    nc = netCDF4.Dataset(fpath, 'w')
+    nc.createDimension('station', len(stations))
+    nc.createDimension('time', len(time_))
+    nc.createDimension('dynamic_features', len(features))
+
+    stn = nc.createVariable('station', str, ('station',))
+    stn[:] = np.array(stations, dtype=object)
+
+    t = nc.createVariable('time', 'i4', ('time',))
+    t.units = f"days since {time_[0].strftime('%Y-%m-%d')}"
+    t[:] = np.arange(len(time_))
+
+    f = nc.createVariable('dynamic_features', str, ('dynamic_features',))
+    f[:] = np.array(features, dtype=object)
+
+    nc.createVariable(
+        'data', 'f4', ('station', 'time', 'dynamic_features'), zlib=True, complevel=3,
+        fill_value=np.nan, chunksizes=(1, len(time_), len(features)))
+
+    nc.stations_done = 0
+    nc.complete = 0
+    nc.sync()
+    return nc
+
+
+# shared memory blocks attached by a worker process
+_BLOCKS = {}
+
+
+def _last_csv_line(fpath: os.PathLike, block_size: int = 4096) -> str:
+    """reads the last line of a text file without reading the whole file"""
+    with open(fpath, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b''
+        while end > 0:
+            start = max(end - block_size, 0)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            lines = data.rstrip(b'\r\n').splitlines()
+            if len(lines) > 1 or start == 0:
+                return lines[-1].decode() if lines else ''
+    return ''
+
+
+def _meteo_csv_to_block(
+        fpath: os.PathLike,
+        name: str,
+        shape: tuple,
+        i: int,
+        columns: List[str],
+        start: str
+) -> int:
+    """parses the meteorological csv file of a station into ``i`` th row of
+    the shared memory block ``name``"""
+    if name not in _BLOCKS:
+        if len(_BLOCKS) == 2:
+            # the oldest block belongs to a previous conversion
+            _BLOCKS.pop(next(iter(_BLOCKS))).close()
+        _BLOCKS[name] = shared_memory.SharedMemory(name=name)
+    block = np.ndarray(shape, dtype=np.float32, buffer=_BLOCKS[name].buf)
+
+    df = pd.read_csv(fpath, usecols=['date'] + columns, index_col='date', parse_dates=True)
+
+    pos = (df.index - pd.Timestamp(start)).days.to_numpy()
+    valid = (pos >= 0) & (pos < shape[1])
+
+    block[i] = np.nan
+    block[i, pos[valid]] = df[columns].to_numpy(dtype=np.float32, na_value=np.nan)[valid]
+    return i
 
 
 class _EStreams(_RainfallRunoff):
@@ -526,6 +745,86 @@ class _EStreams(_RainfallRunoff):
         """
         return {k:v for v,k in self.md['gauge_id'].to_dict().items()}
 
+    # function which downloads the discharge of all stations between two
+    # time steps. Only those countries which define it can be updated.
+    _download_q = None
+
+    @property
+    def q_csv_fpath(self) -> os.PathLike:
+        """path of csv file which contains the discharge of all stations"""
+        return os.path.join(self.path, 'daily_q.csv')
+
+    @property
+    def _q_step(self) -> pd.Timedelta:
+        return pd.Timedelta(days=1)
+
+    def update(self, en=None) -> dict:
+        """
+        Appends the discharge observed after the last row of :py:attr:`q_csv_fpath`
+        as new rows at the end of this file. Only the interval after the last row
+        is requested and the existing rows are not rewritten. The update is
+        recorded in :py:attr:`update_manifest_fpath`.
+
+        Parameters
+        ----------
+        en : str
+            last time step to request. By default it is yesterday.
+
+        Returns
+        -------
+        dict
+            the entry of this update in the manifest
+
+        Examples
+        --------
+        >>> from aqua_fetch import Finland
+        >>> dataset = Finland()
+        >>> dataset.update()
+        >>> dataset.update_history()
+        """
+        if self._download_q is None:
+            return super().update(en)
+
+        fpath = self.q_csv_fpath
+        if not os.path.exists(fpath):
+            self.get_q()
+
+        # first column is the index
+        stations = pd.read_csv(fpath, nrows=0).columns[1:]
+        st = pd.Timestamp(_last_csv_line(fpath).split(',', 1)[0]) + self._q_step
+        en = pd.Timestamp.today().normalize() - pd.Timedelta(days=1) if en is None else pd.Timestamp(en)
+
+        if st > en:
+            return self._record_update(start=str(st), end=str(en), stations=0, updated=0, rows=0)
+
+        if self.verbosity:
+            print(f"Requesting discharge of {len(stations)} stations from {st} to {en}")
+
+        new = self._download_q(st, en)
+        new.index = pd.to_datetime(new.index)
+        new = new.loc[(new.index >= st) & (new.index <= en)].sort_index()
+        new = new.loc[~new.index.duplicated(keep='last')]
+
+        # stations which are not in the file can not be added without rewriting it
+        # and rows without any data are requested again by next update
+        new = new.reindex(columns=stations).astype('float32').dropna(how='all')
+
+        with open(fpath, 'a') as f:
+            new.to_csv(f, header=False)
+
+        return self._record_update(
+            start=str(st), end=str(en), stations=len(stations),
+            updated=int(new.notna().any().sum()), rows=int(new.notna().sum().sum()))
+
+    def _map(self, func, *iterables) -> list:
+        """calls func for each item of iterables using self.processes"""
+        cpus = self.processes or max(get_cpus() - 2, 1)
+        if cpus == 1:
+            return list(map(func, *iterables))
+
+        with cf.ProcessPoolExecutor(cpus) as executor:
+            return list(executor.map(func, *iterables))
+
     def _fetch_dynamic_features(
             self,
             stations: list,
@@ -534,52 +833,43 @@ class _EStreams(_RainfallRunoff):
             en=None,
             as_dataframe=False,
     ):
-        """Fetches dynamic features of station."""
+        """
+        Fetches dynamic features of stations. The meteorological data is read
+        as one selection from EStreams and the streamflow of all stations is
+        gathered from the output of ``get_q`` in one step.
+        """
         st, en = self._check_length(st, en)
         features = check_attributes(dynamic_features, self.dynamic_features.copy(), 'dynamic_features')
 
-        daily_q = None
+        time_ = pd.date_range(st, en, freq='D', name='time')
+        data = np.full((len(stations), len(time_), len(features)), np.nan, dtype=np.float32)
 
-        if observed_streamflow_cms() in features:
-            daily_q = self.get_q(as_dataframe)
-            if isinstance(daily_q, xr.Dataset):
-                daily_q = daily_q.sel(time=slice(st, en))[stations]
-            else:
-                daily_q = daily_q.loc[st:en, stations]
-
-            features.remove(observed_streamflow_cms())
-
-        if len(features) == 0:
-            if isinstance(daily_q, pd.DataFrame):  # as_dataframe is True so 
-                daily_q = {stn:pd.DataFrame(daily_q[stn].rename(observed_streamflow_cms())) for stn in daily_q.columns}
-            return daily_q
+        meteo = [f for f in features if f != observed_streamflow_cms()]
+        if meteo:
+            t, values = self.estreams._meteo_array(stations, meteo, st, en)
+            data[:, time_.get_indexer(t)[:, None], [features.index(f) for f in meteo]] = values
 
-        # stations_ = [f"{stn}_{self.agency_name}" for stn in stations]
-        data = self.estreams.fetch_dynamic_features(stations, features, st, en, as_dataframe)
+        if observed_streamflow_cms() in features:
+            daily_q = self.get_q(as_dataframe=True)
+            if not daily_q.index.is_unique:
+                daily_q = daily_q.loc[~daily_q.index.duplicated()]
 
-        if daily_q is not None:
-            if isinstance(daily_q, xr.Dataset):
-                assert isinstance(data, xr.Dataset), "xarray dataset not supported"
-                data = data.rename({stn: stn.split('_')[0] for stn in data.data_vars})
+            # positions of time steps and stations in daily_q, -1 for missing ones
+            rows = daily_q.index.get_indexer(time_)
+            cols = daily_q.columns.get_indexer(stations)
 
-                # first create a new dimension in daily_q named dynamic_features
-                daily_q = daily_q.expand_dims({'dynamic_features': [observed_streamflow_cms()]})
-                data = xr.concat([data, daily_q], dim='dynamic_features').sel(time=slice(st, en))
-            else:
-                assert isinstance(data, dict)
-                data = {stn.split('_')[0]: stn_data for stn, stn_data in data.items()}
+            q = daily_q.to_numpy(dtype=np.float32, na_value=np.nan)[np.ix_(rows, cols)].T
+            q[:, rows < 0] = np.nan
+            q[cols < 0] = np.nan
+            data[:, :, features.index(observed_streamflow_cms())] = q
 
-                for stn,meteo_df in data.items():
-                    stn_df = pd.concat([meteo_df, daily_q[stn].rename(observed_streamflow_cms())], axis=1)
-                    data[stn] = stn_df
-        else:
-            if isinstance(data, xr.Dataset):
-                data = data.rename({stn: stn.split('_')[0] for stn in data.data_vars})
-            else:
-                assert isinstance(data, dict)
-                data = {stn.split('_')[0]: stn_data for stn, stn_data in data.items()}
+        if as_dataframe:
+            columns = pd.Index(features, name='dynamic_features')
+            return {stn: pd.DataFrame(data[i], index=time_, columns=columns) for i, stn in enumerate(stations)}
 
-        return data
+        coords = {'time': time_, 'dynamic_features': features}
+        return xr.Dataset({stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                           for i, stn in enumerate(stations)})
 
     def _fetch_static_features(
             self,
@@ -835,41 +1125,47 @@ class Finland(_EStreams):
         
         return xr.Dataset({stn: xr.DataArray(data.loc[:, stn]) for stn in data.columns})
 
+    def _download_q(self, st:pd.Timestamp, en:pd.Timestamp) -> pd.DataFrame:
+        """
+        downloads the yearly files of the years between st and en and the
+        file of current situation if en is in the current year.
+        """
+        stations = self.stations()
+        karte = self.basin_id_gauge_id_map()
+        this_year = pd.Timestamp.today().year
+        years = [yr for yr in range(st.year, en.year + 1) if yr < this_year]
+
+        stns = [stn for stn in stations for _ in years]
+        parts = self._map(download_daily_stn_yr, [karte[stn] for stn in stns], stns, years * len(stations))
+        parts = [df[stn].astype('float32') for df, stn in zip(parts, stns)]
+
+        if en.year >= this_year:
+            parts += self._map(download_current_stn, [karte[stn] for stn in stations], stations)
+            stns += stations
+
+        q = {}
+        for stn, ts in zip(stns, parts):
+            q.setdefault(stn, []).append(ts)
+        q = {stn: pd.concat(ts) for stn, ts in q.items()}
+        q = {stn: ts.loc[~ts.index.duplicated(keep='last')] for stn, ts in q.items()}
+        return pd.DataFrame(q)
+
     def download_2024(self):
 
         if self.verbosity: 
             print("Downloading 2024 year data")
 
         dfs = []
-        failures = 0
         for idx, bsn_id in enumerate(self.stations()):
 
             gauge_id = self.basin_id_gauge_id_map()[bsn_id]
 
-            url = f"https://wwwi3.ymparisto.fi/i3/tilanne/ENG/discharge/image/bigimage/Q{gauge_id}.txt"
-
-            try:
-                df = pd.read_csv(url, 
-                                #delim_whitespace=True,
-                                sep='\s+',
-                                skiprows=10, 
-                                encoding="ISO-8859-1",
-                                decimal=',',
-                                names=['date', bsn_id, 'avg', 'min', 'max'],
-                                index_col='date',
-                                parse_dates=True,
-                                dayfirst=True,
-                                na_values=['-']
-                                )
-            except HTTPError:
-                failures += 1
-                warnings.warn(f" {idx} Failed to download {bsn_id} {failures}", UserWarning)
-                df = pd.DataFrame(columns=['date', bsn_id, 'avg', 'min', 'max'])
+            ts = download_current_stn(gauge_id, bsn_id)
 
             if self.verbosity>2:
-                print(f"{idx}: for {bsn_id} {df.shape}")
+                print(f"{idx}: for {bsn_id} {ts.shape}")
 
-            dfs.append(df[bsn_id].astype('float32'))
+            dfs.append(ts)
 
         df_2024 = pd.concat(dfs, axis=1)
 
@@ -992,6 +1288,33 @@ class Finland(_EStreams):
 
         return dfs
 
+def download_current_stn(
+        gauge_id:str,
+        bsn_id:str,
+        )->pd.Series:
+    """downloads the discharge of current situation which covers the current year"""
+    url = f"https://wwwi3.ymparisto.fi/i3/tilanne/ENG/discharge/image/bigimage/Q{gauge_id}.txt"
+
+    try:
+        df = pd.read_csv(url, 
+                        #delim_whitespace=True,
+                        sep='\s+',
+                        skiprows=10, 
+                        encoding="ISO-8859-1",
+                        decimal=',',
+                        names=['date', bsn_id, 'avg', 'min', 'max'],
+                        index_col='date',
+                        parse_dates=True,
+                        dayfirst=True,
+                        na_values=['-']
+                        )
+    except HTTPError:
+        warnings.warn(f"Failed to download {bsn_id}", UserWarning)
+        df = pd.DataFrame(columns=['date', bsn_id, 'avg', 'min', 'max'])
+
+    return df[bsn_id].astype('float32')
+
+
 def download_daily_stn_yr(
         gauge_id:str,
         bsn_id:str,
@@ -1026,6 +1349,12 @@ def download_daily_stn_yr(
 
 
 
+EPA_URL = "https://epawebapp.epa.ie/Hydronet/output/internet/stations"
+# regional offices of EPA under one of which each station is published
+EPA_REGIONS = ('DUB', 'MON', 'ATH', 'COR', 'KIK', 'CAS')
+OPW_URL = "https://waterlevel.ie/hydro-data/data/internet/stations/0"
+
+
 class Ireland(_EStreams):
     """
     Data of 464 catchments of Ireland. Out of these 464 catchments, 
@@ -1110,6 +1439,31 @@ class Ireland(_EStreams):
         stns = md.loc[(md['gauge_country']=='IE') & (md['gauge_provider']=='IE_OPW')]['gauge_id']
         return stns.tolist()
     
+    @property
+    def q_csv_fpath(self) -> os.PathLike:
+        fname = 'daily_q.csv' if self.timestep in ["D", 'daily'] else 'hourly_q.csv'
+        return os.path.join(self.path, fname)
+
+    @property
+    def _q_step(self) -> pd.Timedelta:
+        return pd.Timedelta(days=1) if self.timestep in ["D", 'daily'] else pd.Timedelta(hours=1)
+
+    def _download_q(self, st:pd.Timestamp, en:pd.Timestamp) -> pd.DataFrame:
+        """
+        EPA and OPW only provide the complete record of each station, so these
+        are downloaded and the rows between st and en are kept by :py:meth:`update`.
+        """
+        epa = self._download_stations(_download_epa_stn_data, self.epa_stations, "EPA")
+        epa_df = pd.concat([val[0] for val in epa], axis=1).astype('float32')
+        if self.timestep in ["D", 'daily']:
+            epa_df.index = epa_df.index.normalize()
+
+        opw = self._download_stations(_download_opw_stn_data, self.opw_stations, "OPW")
+        opw_df = pd.concat([df for df in opw if len(df) > 0], axis=1).astype('float32')
+
+        data = pd.concat([epa_df, opw_df], axis=1)
+        return data.rename(columns=self.gauge_id_basin_id_map())
+
     def is_opw_station(self, stn)->bool:
         return stn in self.opw_stations
 
@@ -1200,30 +1554,20 @@ class Ireland(_EStreams):
 
         print("Downloading EPA data Sequentially")
 
-        epa_failiures = 0
-        epa_dfs = []
-
-        for idx, stn in enumerate(self.epa_stations):
-
-            fpath = os.path.join(self.path, "EPA", folder, f"{stn}.csv")
-
-            print(f"{idx}/{len(self.epa_stations)} Downloading {stn}")
-
-            df, epa_failiures = _download_epa_stn_data(fpath, self.timestep)
-
-            epa_dfs.append(df) 
+        epa_dfs = self._download_stations(_download_epa_stn_data, self.epa_stations, "EPA", threads=1)
+        epa_failiures = sum(val[1] for val in epa_dfs)
 
         print(f'total epa failiures: {epa_failiures}')
         print(f'total epa dfs: {len(epa_dfs)}')
 
-        df = pd.concat(epa_dfs, axis=1).astype('float32')
+        df = pd.concat([val[0] for val in epa_dfs], axis=1).astype('float32')
 
         if self.verbosity>1: print(f"Downloaded total epa dfs: {len(epa_dfs)} saving to {all_epa_data_file}")
         df.to_csv(all_epa_data_file)
         return df
 
     def download_epa_data_parallel(self, cpus=None):
-
+        """downloads the EPA stations using ``cpus`` threads which share one session"""
         if cpus is None:
             cpus = self.processes or max(get_cpus() - 2, 1)
 
@@ -1235,13 +1579,9 @@ class Ireland(_EStreams):
             print(f"{all_epa_data_file} already exists")  
             return df
 
-        timesteps = [self.timestep] * len(self.epa_stations)
-        fpaths = [os.path.join(self.path, "EPA", folder, f"{stn}.csv") for stn in self.epa_stations]
-
-        print(f"Downloading {len(fpaths)} EPA stations using {cpus} cpus at {os.path.join(self.path, 'EPA', folder)}")
+        print(f"Downloading {len(self.epa_stations)} EPA stations using {cpus} threads at {os.path.join(self.path, 'EPA', folder)}")
 
-        with ProcessPoolExecutor(cpus) as executor:
-            epa_dfs = list(executor.map(_download_epa_stn_data, fpaths, timesteps))
+        epa_dfs = self._download_stations(_download_epa_stn_data, self.epa_stations, "EPA", threads=cpus)
 
         df = pd.concat([val[0] for val in epa_dfs], axis=1).astype('float32')
 
@@ -1256,6 +1596,9 @@ class Ireland(_EStreams):
         return df
     
     def download_opw_data_parallel(self, cpus=None):
+        """downloads the OPW stations using ``cpus`` threads which share one session"""
+        if cpus is None:
+            cpus = self.processes or max(get_cpus() - 2, 1)
 
         folder = {'D': 'daily', 'H': 'hourly'}[self.timestep]
 
@@ -1265,16 +1608,12 @@ class Ireland(_EStreams):
             print(f"{all_opw_data_file} already exists")  
             return df
 
-        fpaths = [os.path.join(self.path, "OPW", folder, f"{stn}.csv") for stn in self.opw_stations]
-
         if self.verbosity:
-            print(f"Downloading {len(fpaths)} OPW stations using {cpus} cpus at {os.path.join(self.path, 'OPW', folder)}")
+            print(f"Downloading {len(self.opw_stations)} OPW stations using {cpus} threads at {os.path.join(self.path, 'OPW', folder)}")
 
-        with ProcessPoolExecutor(cpus) as executor:
-            opw_dfs = list(executor.map(_download_opw_stn_data, fpaths, [self.timestep]*len(self.opw_stations)))
+        opw_dfs = self._download_stations(_download_opw_stn_data, self.opw_stations, "OPW", threads=cpus)
 
-        opw_df = [df for df in opw_dfs]
-        opw_df = pd.concat(opw_df, axis=1).astype('float32')
+        opw_df = pd.concat(opw_dfs, axis=1).astype('float32')
 
         if self.timestep in ("D", "daily"):
             opw_df.index = opw_df.index.tz_localize(None)
@@ -1309,19 +1648,8 @@ class Ireland(_EStreams):
 
         if self.verbosity: print("Downloading OPW data")
 
-        failiures = 0
-        opw_dfs = []
-        for idx, stn in enumerate(self.opw_stations):
-
-            fpath = os.path.join(self.path, "OPW", folder, f"{stn}.csv")
-
-            print(f"{idx}/{len(self.opw_stations)} Downloading {stn}")
-
-            df = _download_opw_stn_data(fpath, self.timestep)
- 
-            opw_dfs.append(df)
-            if len(df)==0:
-                failiures += 1
+        opw_dfs = self._download_stations(_download_opw_stn_data, self.opw_stations, "OPW", threads=1)
+        failiures = sum(len(df)==0 for df in opw_dfs)
 
         if self.verbosity:
             print(f"total failiures: {failiures}")
@@ -1339,64 +1667,70 @@ class Ireland(_EStreams):
 
         return opw_df
 
+    @property
+    def url_cache_fpath(self) -> os.PathLike:
+        """path of json file which remembers the url found for each station
+        and those which are known to be missing"""
+        return os.path.join(self.path, 'url_cache.json')
 
-def _download_epa_stn_data(fpath, timestep="D")->pd.Series:
+    def _download_stations(
+            self,
+            func,
+            stations:List[str],
+            agency:str,
+            threads:int = None,
+    ) -> list:
+        """
+        calls func for each station using a pool of threads. The threads share
+        the keep-alive connections of one session and the cache of urls.
+        """
+        threads = threads or self.processes or max(get_cpus() - 2, 1)
+        folder = {'D': 'daily', 'H': 'hourly'}[self.timestep]
+        fpaths = [os.path.join(self.path, agency, folder, f"{stn}.csv") for stn in stations]
+
+        cache = UrlCache(self.url_cache_fpath)
+        # each station may race all of its candidate urls
+        with RateLimitedSession(pool_size=threads * len(EPA_REGIONS)) as session:
+            with cf.ThreadPoolExecutor(threads) as executor:
+                results = list(executor.map(lambda fpath: func(fpath, self.timestep, session, cache), fpaths))
+
+        cache.save()
+        return results
+
+
+def _download_epa_stn_data(
+        fpath,
+        timestep="D",
+        session:requests.Session = None,
+        cache:UrlCache = None,
+)->Tuple[pd.Series, int]:
+    """
+    The station is published under one of the regional offices of EPA.
+    Instead of trying the offices one after the other, their urls are
+    requested concurrently and the first one which is found is read.
+    """
     stn = os.path.basename(fpath).split('.')[0]
     if timestep in ("D", 'daily'):
         fname = "daymean.zip"
     else:
         fname = "15min.zip"
 
-    epa_failiures = 0
+    urls = [f"{EPA_URL}/{region}/{stn}/Q/complete_{fname}" for region in EPA_REGIONS]
 
-    url = f"https://epawebapp.epa.ie/Hydronet/output/internet/stations/DUB/{stn}/Q/complete_{fname}"
-    url2 = f"https://epawebapp.epa.ie/Hydronet/output/internet/stations/MON/{stn}/Q/complete_{fname}"
-    url3 = f"https://epawebapp.epa.ie/Hydronet/output/internet/stations/ATH/{stn}/Q/complete_{fname}"
-    url4 = f"https://epawebapp.epa.ie/Hydronet/output/internet/stations/COR/{stn}/Q/complete_{fname}"
-    url5 = f"https://epawebapp.epa.ie/Hydronet/output/internet/stations/KIK/{stn}/Q/complete_{fname}"
-    url6 = f"https://epawebapp.epa.ie/Hydronet/output/internet/stations/CAS/{stn}/Q/complete_{fname}"
+    url, response = first_available(urls, session or requests.Session(), key=stn, cache=cache)
 
-    try:
-        df = pd.read_csv(url, 
+    if response is None:
+        print(f"Failed to download {stn}")
+        return pd.Series(name=stn, index=pd.DatetimeIndex([]), dtype='float32'), 1
+
+    with response:
+        body, compression = response_body(response, url)
+        df = pd.read_csv(body, 
+                    compression=compression,
                     comment='#', 
                     sep=';',
                     names=["timestamp", stn, "qflag"]
                     )
-    except HTTPError:
-        try:
-            df = pd.read_csv(url2, 
-            comment='#', 
-            sep=';',
-            names=["timestamp", stn, "qflag"])
-        except HTTPError:
-            try:
-                df = pd.read_csv(url3, 
-                comment='#', 
-                sep=';',
-                names=["timestamp", stn, "qflag"])
-            except HTTPError:
-                try:
-                    df = pd.read_csv(url4, 
-                    comment='#', 
-                    sep=';',
-                    names=["timestamp", stn, "qflag"])
-                except HTTPError:
-                    try:
-                        df = pd.read_csv(url5, 
-                        comment='#', 
-                        sep=';',
-                        names=["timestamp", stn, "qflag"])
-                    except HTTPError:
-                        try:
-                            df = pd.read_csv(url6, 
-                            comment='#', 
-                            sep=';',
-                            names=["timestamp", stn, "qflag"])
-                        except HTTPError:
-                            print(f"Failed to download {stn}")
-                            epa_failiures += 1
-                            pass
-
 
     df.index = pd.to_datetime(df.pop('timestamp'))
 
@@ -1406,12 +1740,17 @@ def _download_epa_stn_data(fpath, timestep="D")->pd.Series:
     df = df.loc[~df['qflag'].isin(['Unchecked'])]
     
     if timestep == "D":
-        return df[stn], epa_failiures
+        return df[stn], 0
 
-    return df[stn].resample(timestep).mean(), epa_failiures
+    return df[stn].resample(timestep).mean(), 0
 
 
-def _download_opw_stn_data(fpath, timestep="D")->pd.Series:
+def _download_opw_stn_data(
+        fpath,
+        timestep="D",
+        session:requests.Session = None,
+        cache:UrlCache = None,
+)->pd.Series:
     stn = os.path.basename(fpath).split('.')[0]
     # we don't/can't download daily data 
     if timestep == "daily":
@@ -1423,17 +1762,22 @@ def _download_opw_stn_data(fpath, timestep="D")->pd.Series:
     else:
         raise ValueError(f"timestep should be either 'D' or 'H' but it is {timestep}")
 
-    url = f"https://waterlevel.ie/hydro-data/data/internet/stations/0/{stn}/Q/Discharge_complete.zip"
+    url = f"{OPW_URL}/{stn}/Q/Discharge_complete.zip"
 
-    try:
-        df = pd.read_csv(url,
-                        comment='#',
-                        sep=';',
-                        names=["timestamp", stn, "q_code"]
-                        )
-    except HTTPError:
+    url, response = first_available([url], session or requests.Session(), key=stn, cache=cache)
+
+    if response is None:
         warnings.warn(f"Failed to download {stn}", UserWarning)
-        df = pd.Series(name=stn)
+        df = pd.DataFrame(columns=["timestamp", stn, "q_code"])
+    else:
+        with response:
+            body, compression = response_body(response, url)
+            df = pd.read_csv(body,
+                            compression=compression,
+                            comment='#',
+                            sep=';',
+                            names=["timestamp", stn, "q_code"]
+                            )
 
     df.index = pd.to_datetime(df.pop('timestamp'))
     df.index = df.index.tz_localize(None)  
@@ -1446,12 +1790,17 @@ def _download_opw_stn_data(fpath, timestep="D")->pd.Series:
     # get rows where q_code is not 96 or 254
     df = df.loc[~df['q_code'].isin([96, 254])]
     
-    stn_data = df[stn]
+    stn_data = df[stn].astype('float32')
     #stn_data = stn_data.resample(timestep).apply(lambda subdata: tw_resampler(subdata, stn_data.sort_index(), timestep))    
     stn_data = stn_data.resample(timestep).mean()
     return stn_data
 
 
+ISPRA_URL = "http://hydroserver.ddns.net/italia"
+# namespace of WaterML 1.1 documents returned by ISPRA
+WATERML = '{http://www.cuahsi.org/waterML/1.1/}'
+
+
 class Italy(_EStreams):
     """
     Data of 294 catchments of Italy. 
@@ -1560,59 +1909,145 @@ class Italy(_EStreams):
         
         return xr.Dataset({stn: xr.DataArray(data.loc[:, stn]) for stn in data.columns})
 
+    def _download_q(self, st:pd.Timestamp, en:pd.Timestamp) -> pd.DataFrame:
+        """requests the discharge between st and en from ISPRA"""
+        return self._download_ispra(f"{st:%Y-%m-%d}", f"{en:%Y-%m-%d}")
+
     def download_ispra_data(self):      
 
         if self.verbosity > 1:
             print("Downloading ISPRA data")
 
-        dfs = []
-
-        for idx, station in enumerate(self.ispra_stations_gauge_ids()):
-
-            initial = station.split(":")[0]
-            response = requests.get(
-                f"http://hydroserver.ddns.net/italia/{initial}/index.php/default/services/cuahsi_1_1.asmx/GetValuesObject?authToken=&location={station}&variable={initial}:Discharge&startDate=1900-01-01&endDate=2020-12-31")
-            root = ET.fromstring(response.content)
+        return self._download_ispra()
 
-            namespace = {'ns': 'http://www.cuahsi.org/waterML/1.1/'}
-            # Extract the time series data
-            timeseries = []
-            for value in root.findall('.//ns:value', namespace):
-                date_time = value.attrib['dateTime']
-                data_value = value.text
-                timeseries.append({'dateTime': date_time, 'value': data_value})
+    def _download_ispra(
+            self,
+            start:str = "1900-01-01",
+            end:str = "2020-12-31",
+            threads:int = None,
+    ) -> pd.DataFrame:
+        """
+        downloads the stations using a pool of threads which share the
+        keep-alive connections of one session. Each response is parsed while
+        it arrives and the series of all stations are written into one array.
+        """
+        stations = self.ispra_stations_gauge_ids()
+        threads = threads or self.processes or max(get_cpus() - 2, 1)
 
-            df = pd.DataFrame(timeseries)
+        with RateLimitedSession(pool_size=threads) as session:
+            with cf.ThreadPoolExecutor(threads) as executor:
+                series = list(executor.map(
+                    lambda stn: _download_ispra_arrays(stn, start, end, session), stations))
 
-            df.index = pd.to_datetime(df.pop('dateTime'))
-            df.columns = [station]
-            print(idx, station, df.shape)
+        if self.verbosity > 1:
+            for stn, (t, _) in zip(stations, series):
+                print(stn, len(t))
+
+        failures = [stn for stn, (t, _) in zip(stations, series) if len(t) == 0]
+        if len(failures) > 0:
+            self.ispra_failures = failures
+            warnings.warn(f"Failed to download {len(failures)} ISPRA stations")
+
+        time_ = np.unique(np.concatenate([t for t, _ in series] + [np.empty(0, dtype='datetime64[s]')]))
+        data = np.full((len(time_), len(stations)), np.nan, dtype=np.float32)
+        for idx, (t, values) in enumerate(series):
+            data[np.searchsorted(time_, t), idx] = values
+
+        return pd.DataFrame(data, index=pd.DatetimeIndex(time_.astype('datetime64[ns]')), columns=stations)
+
+
+def download_ispra_stn(
+        station:str,
+        start:str = "1900-01-01",
+        end:str = "2020-12-31",
+        session:requests.Session = None,
+        )->pd.Series:
+    """returns the discharge of an ISPRA station between start and end"""
+    t, values = _download_ispra_arrays(station, start, end, session)
+    return pd.Series(values, index=pd.DatetimeIndex(t.astype('datetime64[ns]')), name=station)
+
+
+def _download_ispra_arrays(
+        station:str,
+        start:str,
+        end:str,
+        session:requests.Session = None,
+        )->Tuple[np.ndarray, np.ndarray]:
+    initial = station.split(":")[0]
+    url = (f"{ISPRA_URL}/{initial}/index.php/default/services/cuahsi_1_1.asmx/GetValuesObject?"
+           f"authToken=&location={station}&variable={initial}:Discharge&startDate={start}&endDate={end}")
 
-            dfs.append(df)    
+    try:
+        with (session or requests).get(url, stream=True) as response:
+            response.raise_for_status()
+            body, _ = response_body(response, url)
+            t, values = parse_waterml_values(body)
+    except (requests.RequestException, ET.ParseError):
+        warnings.warn(f"Failed to download {station}", UserWarning)
+        return np.empty(0, dtype='datetime64[s]'), np.empty(0, dtype=np.float32)
 
-        df = pd.concat(dfs, axis=1)
+    # a station may have duplicated time steps
+    t, idx = np.unique(t[::-1], return_index=True)
+    return t, values[::-1][idx]
 
-        return df
 
+def parse_waterml_values(source, capacity:int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parses the ``value`` elements of a WaterML 1.1 document incrementally.
+    Every element is removed from the tree as soon as it has been read, so the
+    memory does not grow with the length of the series except for the two
+    output arrays.
 
-def download_ispra_stn(station):
-    initial = station.split(":")[0]
-    response = requests.get(
-        f"http://hydroserver.ddns.net/italia/{initial}/index.php/default/services/cuahsi_1_1.asmx/GetValuesObject?authToken=&location={station}&variable={initial}:Discharge&startDate=1900-01-01&endDate=2020-12-31")
-    root = ET.fromstring(response.content)
+    Parameters
+    ----------
+    source :
+        file path or file-like object from which the document is read
+    capacity : int
+        initial length of the output arrays. They are doubled when full.
 
-    namespace = {'ns': 'http://www.cuahsi.org/waterML/1.1/'}
-    # Extract the time series data
-    timeseries = []
-    for value in root.findall('.//ns:value', namespace):
-        date_time = value.attrib['dateTime']
-        data_value = value.text
-        timeseries.append({'dateTime': date_time, 'value': data_value})
+    Returns
+    -------
+    tuple
+        the time steps as datetime64[s] array and the values as float32 array
+        in which the values equal to ``noDataValue`` are NaN.
+    """
+    t = np.empty(capacity, dtype='datetime64[s]')
+    values = np.empty(capacity, dtype=np.float32)
+    n = 0
+    nodata = None
+
+    # elements which are open at the current position of the parser
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag == WATERML + 'value':
+            if n == len(t):
+                t = np.concatenate([t, np.empty_like(t)])
+                values = np.concatenate([values, np.empty_like(values)])
+
+            # the offset from UTC, if present, is ignored
+            t[n] = np.datetime64(elem.attrib['dateTime'][:19])
+            try:
+                values[n] = float(elem.text)
+            except (TypeError, ValueError):
+                values[n] = np.nan
+            n += 1
+        elif elem.tag == WATERML + 'noDataValue':
+            nodata = float(elem.text)
+        else:
+            continue
 
-    df = pd.DataFrame(timeseries)
+        if stack:
+            stack[-1].remove(elem)
 
-    df.index = pd.to_datetime(df.pop('dateTime'))
-    df.columns = [station]
+    t, values = t[:n], values[:n]
+    if nodata is not None:
+        values[values == np.float32(nodata)] = np.nan
+    return t, values
 
 
 # todo: why concatenating the 1077 stations in prior to 2023 and 833 
@@ -1734,6 +2169,23 @@ class Poland(_EStreams):
         
         return xr.Dataset({stn: xr.DataArray(data.loc[:, stn]) for stn in data.columns})
 
+    def _download_q(self, st:pd.Timestamp, en:pd.Timestamp) -> pd.DataFrame:
+        """
+        downloads the monthly files of the months between st and en until 2022
+        and the yearly files after it.
+        """
+        months = [m for m in pd.period_range(st, en, freq='M') if m.year <= 2022]
+        dfs = self._map(download_single_file, [m.year for m in months], [str(m.month).zfill(2) for m in months])
+
+        for year in range(max(st.year, 2023), en.year + 1):
+            try:
+                dfs.append(download_data_2023(year))
+            except HTTPError:
+                # the file of a year is published after the year ends
+                if self.verbosity: print(f"data of {year} is not available yet")
+
+        return pd.concat(dfs, axis=0) if dfs else pd.DataFrame()
+
     def _make_csv(self):
 
         years = []
@@ -18,10 +18,11 @@ import numpy as np
 import pandas as pd
 
 from .._backend import xarray as xr
+from .._backend import netCDF4, nc_lock
 
 from ..utils import get_cpus
 from ..utils import check_attributes
-from ..utils import merge_shapefiles_fiona
+from .._spatial import BoundaryStore
 from .utils import _RainfallRunoff
 
 from ._map import (
@@ -68,6 +69,20 @@ METEO_MAP = {
     'USGS': 'Meteorology_PartIII_China_CHP_RID_USGS/Meteorology_China_CHP_RID_USGS',
 }
 
+# boundary stores which are already loaded, so that the datasets based upon 
+# GSHA (Japan, Thailand etc.) share the same store
+_BOUNDARY_STORES: Dict[str, BoundaryStore] = {}
+
+# groups of the netcdf store and the names of their (time, variable) dimensions
+STORE_GROUPS = {
+    'meteo': ('time', 'features'),
+    'storage': ('time', 'features'),
+    'lai': ('time', 'features'),
+    'landcover': ('years', 'lc_variables'),
+    'reservoir': ('years', 'reservoir_variables'),
+    'streamflow_indices': ('years', 'streamflow_indices'),
+}
+
 
 class GSHA(_RainfallRunoff):
     """
@@ -157,7 +172,8 @@ class GSHA(_RainfallRunoff):
 
     @property
     def boundary_file(self) -> os.PathLike:
-        return os.path.join(self.path, "boundaries.shp")
+        # boundaries of all agencies are kept in the boundary store
+        return self.boundary_store_fpath
 
     @property
     def boundary_id_map(self) -> str:
@@ -243,12 +259,14 @@ class GSHA(_RainfallRunoff):
         }
 
     def __daily_dynamic_features(self):
-        return pd.concat(
-            [self.meteo_vars_stn('1001_arcticnet'),
-             self.storage_vars_stn('1001_arcticnet'),
-             ],
-            axis=1
-        ).columns.tolist() + ['lai']
+        # remember which features are stored in which group of files so that
+        # only the required groups are read
+        self._group_features = {
+            'meteo': self.meteo_vars_stn('1001_arcticnet').columns.tolist(),
+            'storage': self.storage_vars_stn('1001_arcticnet').columns.tolist(),
+            'lai': ['lai'],
+        }
+        return self._group_features['meteo'] + self._group_features['storage'] + ['lai']
 
     def __yearly_dynamic_features(self):
         return pd.concat(
@@ -297,16 +315,82 @@ class GSHA(_RainfallRunoff):
         return self.wsAll[self.wsAll['agency'] == agency].index.tolist()
 
     def _maybe_merge_shapefiles(self):
+        """
+        writes the boundaries from the shapefiles of all agencies into the boundary
+        store. The shapefiles, one for each station, are read in parallel and the
+        name of each shapefile i.e. ``{catch_id}_{agency_name}`` is used as id.
+        """
+        if os.path.exists(self.boundary_store_fpath) and not self.overwrite:
+            return
 
         shp_path = os.path.join(self.path, 'WatershedPolygons', 'WatershedPolygons')
-        out_shapefile = os.path.join(self.path, 'boundaries.shp')
+        if not os.path.exists(shp_path):
+            raise FileNotFoundError(
+                f"Neither the boundary store {self.boundary_store_fpath} nor the shapefiles in {shp_path} exist")
+
+        shp_files = sorted([os.path.join(shp_path, filename) for filename in os.listdir(shp_path) if
+                     filename.endswith('.shp')])
+
+        cpus = self.processes or max(get_cpus() - 2, 1)
+
+        start = time.time()
+        if self.verbosity: 
+            print(f"Writing {len(shp_files)} shapefiles into {self.boundary_store_fpath} using {cpus} cpus")
+
+        store = BoundaryStore.from_shapefiles(shp_files, processes=cpus)
+        store.add_detail_levels()
+        store.save(self.boundary_store_fpath)
+
+        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
 
-        if not os.path.exists(out_shapefile):
-            shp_files = [os.path.join(shp_path, filename) for filename in os.listdir(shp_path) if
-                         filename.endswith('.shp')]
-            merge_shapefiles_fiona(shp_files, out_shapefile)
+        self._bndry_store = _BOUNDARY_STORES[self.boundary_store_fpath] = store
         return
 
+    def boundary_store(self) -> BoundaryStore:
+        """
+        Boundaries of catchments of all agencies as :py:class:`BoundaryStore`.
+        The store is loaded only once and is shared with the datasets based upon
+        GSHA.
+        """
+        if self._bndry_store is None:
+            fpath = self.boundary_store_fpath
+            if fpath not in _BOUNDARY_STORES:
+                if os.path.exists(fpath) and not self.overwrite:
+                    _BOUNDARY_STORES[fpath] = super(GSHA, self).boundary_store()
+                else:
+                    # the store is never built from get_boundary, which itself reads the store
+                    self._maybe_merge_shapefiles()
+            self._bndry_store = _BOUNDARY_STORES[fpath]
+        return self._bndry_store
+
+    def get_boundary(
+            self,
+            catchment_id: str,
+    ):
+        """
+        returns boundary of a catchment
+
+        Parameters
+        ----------
+        catchment_id : str
+            name/id of catchment i.e. ``{catch_id}_{agency_name}``
+
+        Returns
+        -------
+        geometry : fiona.Geometry
+
+        Examples
+        --------
+        >>> from aqua_fetch import GSHA
+        >>> dataset = GSHA()
+        >>> dataset.get_boundary('1001_arcticnet')
+        """
+        assert isinstance(catchment_id, str), f"catchment_id must be string but is of type {type(catchment_id)}"
+
+        geometry = self.boundary_store().geometry(catchment_id)
+
+        return self.transform_coords(geometry)
+
     def _get_stations(
             self,
             stations: Union[str, List[str]] = "all",
@@ -431,58 +515,19 @@ class GSHA(_RainfallRunoff):
     def lc_variables(
             self,
             stations: List[str] = "all",
-            agency: List[str] = "all"
+            agency: List[str] = "all",
+            st=None,
+            en=None,
     ):
         """
         Landcover variables for one or more than one station either
         as :obj:`xarray.Dataset` or dictionary. The data has yearly timestep.
         """
-        stations = self._get_stations(stations, agency)
-
-        lc_vars = self.lc_vars_all_stns()
-        if isinstance(lc_vars, xr.Dataset):
-            return lc_vars[stations]
-        else:
-            return {stn: lc_vars[stn] for stn in stations}
-
-    def lc_vars_all_stns(
-            self
-    ):
-        nc_path = os.path.join(self.path, 'lc_variables.nc')
-
-        if self.to_netcdf and os.path.exists(nc_path):
-            if self.verbosity: print(f"Reading from pre-existing {nc_path}")
-            return xr.open_dataset(nc_path)
-
-        cpus = self.processes or max(get_cpus() - 2, 1)
-
-        start = time.time()
-
-        stations = self.stations()
-        paths = [self.path for _ in range(len(stations))]
-
-        if self.verbosity: print(f"Reading landcover variables for {len(stations)} stations using {cpus} cpus")
-
-        with cf.ProcessPoolExecutor(cpus) as executor:
-
-            results = executor.map(
-                lc_variable_stn,
-                paths,
-                stations,
-            )
-
-        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
-
-        if self.to_netcdf:
+        return self._fetch_group('landcover', stations, agency, st, en)
 
-            encoding = {var: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for var in stations()}
-
-            ds = xr.Dataset({stn: xr.DataArray(val) for stn, val in zip(stations, results)})
-            if self.verbosity: print(f"Saving to {nc_path}")
-            ds.to_netcdf(nc_path, encoding=encoding)
-        else:
-            ds = {stn: df for stn, df in zip(stations, results)}
-        return ds
+    def lc_vars_all_stns(self):
+        """Landcover variables of all stations"""
+        return self.lc_variables()
 
     def reservoir_variables_stn(self, stn: str) -> pd.DataFrame:
         """
@@ -502,58 +547,19 @@ class GSHA(_RainfallRunoff):
     def reservoir_variables(
             self,
             stations: List[str] = "all",
-            agency: List[str] = "all"
+            agency: List[str] = "all",
+            st=None,
+            en=None,
     ):
         """
         Reservoir variables for one or more than one station either
         as :obj:`xarray.Dataset` or dictionary. The data has yearly timestep.
         """
-        stations = self._get_stations(stations, agency)
-
-        lc_vars = self.reservoir_vars_all_stns()
-        if isinstance(lc_vars, xr.Dataset):
-            return lc_vars[stations]
-        else:
-            return {stn: lc_vars[stn] for stn in stations}
-
-    def reservoir_vars_all_stns(
-            self
-    ):
-        nc_path = os.path.join(self.path, 'reservoir_variables.nc')
-
-        if self.to_netcdf and os.path.exists(nc_path):
-            if self.verbosity: print(f"Reading from pre-existing {nc_path}")
-            return xr.open_dataset(nc_path)
-
-        cpus = self.processes or max(get_cpus() - 2, 1)
-
-        start = time.time()
-
-        stations = self.stations()
-        paths = [self.path for _ in range(len(stations))]
-
-        if self.verbosity: print(f"Reading reservoir variables for {len(stations)} stations using {cpus} cpus")
-
-        with cf.ProcessPoolExecutor(cpus) as executor:
-
-            results = executor.map(
-                reservoir_vars_stn,
-                paths,
-                stations,
-            )
-
-        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
-
-        if self.to_netcdf:
-
-            encoding = {var: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for var in stations}
+        return self._fetch_group('reservoir', stations, agency, st, en)
 
-            ds = xr.Dataset({stn: xr.DataArray(val) for stn, val in zip(stations, results)})
-            self.print(f"Saving to {nc_path}")
-            ds.to_netcdf(nc_path, encoding=encoding)
-        else:
-            ds = {stn: df for stn, df in zip(stations, results)}
-        return ds
+    def reservoir_vars_all_stns(self):
+        """Reservoir variables of all stations"""
+        return self.reservoir_variables()
 
     def streamflow_indices_stn(self, stn: str) -> pd.DataFrame:
         """
@@ -569,59 +575,21 @@ class GSHA(_RainfallRunoff):
     def streamflow_indices(
             self,
             stations: List[str] = "all",
-            agency: List[str] = "all"
+            agency: List[str] = "all",
+            st=None,
+            en=None,
     ):
         """
-        Landcover variables for one or more than one station either
+        Streamflow indices for one or more than one station either
         as :obj:`xarray.Dataset` or dictionary. The data has yearly timestep.
+        The ``AMF occurrence date`` is not numeric and is therefore not
+        included in the netcdf store.
         """
-        stations = self._get_stations(stations, agency)
+        return self._fetch_group('streamflow_indices', stations, agency, st, en)
 
-        lc_vars = self.streamflow_indices_all_stations()
-        if isinstance(lc_vars, xr.Dataset):
-            return lc_vars[stations]
-        else:
-            return {stn: lc_vars[stn] for stn in stations}
-
-    def streamflow_indices_all_stations(
-            self
-    ):
-        nc_path = os.path.join(self.path, 'streamflow_indices.nc')
-
-        if self.to_netcdf and os.path.exists(nc_path):
-            if self.verbosity: print(f"Reading from pre-existing {nc_path}")
-            return xr.open_dataset(nc_path)
-
-        cpus = self.processes or max(get_cpus() - 2, 1)
-
-        start = time.time()
-
-        stations = self.stations()
-        paths = [self.path for _ in range(len(stations))]
-
-        if self.verbosity: print(f"Reading streamflow indices for {len(stations)} stations using {cpus} cpus")
-        # takes ~20 seconds with 110 cpus
-        with cf.ProcessPoolExecutor(cpus) as executor:
-
-            results = executor.map(
-                streamflow_indices_stn,
-                paths,
-                stations,
-            )
-
-        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
-
-        if self.to_netcdf:
-
-            encoding = {var: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for var in stations()}
-
-            ds = xr.Dataset({str(stn): xr.DataArray(df) for stn, df in zip(stations, results)})
-            if self.verbosity: print(f"Saving to {nc_path}")
-            ds.to_netcdf(nc_path, encoding=encoding)
-        else:
-            ds = {stn: df for stn, df in zip(stations, results)}
-
-        return ds
+    def streamflow_indices_all_stations(self):
+        """Streamflow indices of all stations"""
+        return self.streamflow_indices()
 
     def lai_stn(self, stn: str) -> pd.Series:
         """
@@ -639,63 +607,19 @@ class GSHA(_RainfallRunoff):
     def fetch_lai(
             self,
             stations: List[str] = "all",
-            agency: List[str] = "all"
+            agency: List[str] = "all",
+            st=None,
+            en=None,
     ):
         """
         Leaf Area Index timeseries for one or more than one station either
         as :obj:`xarray.Dataset` or :obj:`pandas.DataFrame`. The data has daily timestep.
         """
-        stations = self._get_stations(stations, agency)
-
-        lai = self.lai_all_stns()
-        return lai[stations]
-
-    def lai_all_stns(
-            self
-    ):
-        if self.to_netcdf:
-            nc_path = os.path.join(self.path, 'lai.nc')
-            if os.path.exists(nc_path):
-                if self.verbosity: print(f"Reading from pre-existing {nc_path}")
-                return xr.open_dataset(nc_path)
-        elif os.path.exists(os.path.join(self.path, 'lai.csv')):
-            if self.verbosity: print(f"Reading from pre-existing {self.path}")
-            return pd.read_csv(os.path.join(self.path, 'lai.csv'), index_col=0)
-
-        cpus = self.processes or max(get_cpus() - 2, 1)
-
-        start = time.time()
-
-        stations = self.stations()
-        paths = [self.path for _ in range(len(stations))]
-
-        if self.verbosity: print(f"Reading lai for {len(stations)} stations using {cpus} cpus")
-
-        with cf.ProcessPoolExecutor(cpus) as executor:
-
-            results = executor.map(
-                lai_stn,
-                paths,
-                stations,
-            )
-
-        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
-
-        if self.to_netcdf:
-
-            encoding = {stn: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for stn in stations}
-
-            nc_path = os.path.join(self.path, 'lai.nc')
-            ds = xr.Dataset({stn: xr.DataArray(val) for stn, val in zip(stations, results)})
-            print(f"Saving to {nc_path}")
-            ds.to_netcdf(nc_path, encoding=encoding)
-        else:
-            ds = pd.concat(results, axis=1)
-            csv_path = os.path.join(self.path, 'lai.csv')
-            if self.verbosity: print(f"Saving to {csv_path}")
-            ds.to_csv(csv_path, index=True)
+        return self._fetch_group('lai', stations, agency, st, en)
 
-        return ds
+    def lai_all_stns(self):
+        """Leaf Area Index of all stations"""
+        return self.fetch_lai()
 
     def meteo_vars(self)->List[str]:
         """
@@ -724,74 +648,20 @@ class GSHA(_RainfallRunoff):
         Meteorological variables from 1979-01-01 to 2022-12-31 for all stations either
         as :obj:`xarray.Dataset` or dictionary. The data has daily timestep.
         """
-        nc_path = os.path.join(self.path, 'meteo_vars.nc')
-
-        if self.to_netcdf and os.path.exists(nc_path):
-            if self.verbosity: print(f"Reading from pre-existing {nc_path}")
-            return xr.open_dataset(nc_path)
-
-        meteo_vars = {}
-        paths = [os.path.join(
-            self.path,
-            METEO_MAP[self.agency_of_stn(stn)],
-            f'{stn}.csv') for stn in self.stations()]
-
-        cpus = self.processes or max(get_cpus() - 2, 1)
-        start = time.time()
-
-        if self.verbosity:
-            print(f"Reading meteorological variables for {len(self.stations())} stations using {cpus} cpus")
-        # takes ~ 1538 seconds with 110 cpus
-        with cf.ProcessPoolExecutor(cpus) as executor:
-            results = executor.map(
-                self._meteo_vars_stn,
-                paths
-            )
-
-        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
-
-        if self.to_netcdf:
-            for stn, df in zip(self.stations(), results):
-                meteo_vars[stn] = df
-
-            encoding = {stn: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for stn in meteo_vars.keys()}
-
-            if self.verbosity>1:
-                print(f"Creating xr.Dataset from {len(meteo_vars)} stations")
-            ds = xr.Dataset(meteo_vars)
-
-            if self.verbosity: print(f"Saving to {nc_path}")
-            ds.to_netcdf(nc_path, encoding=encoding)
-        else:
-
-            ds = {stn: df for stn, df in zip(self.stations(), results)}
-
-        return ds
+        return self.fetch_meteo_vars()
 
     def fetch_meteo_vars(
             self,
             stations: List[str] = "all",
-            agency: List[str] = "all"
+            agency: List[str] = "all",
+            st=None,
+            en=None,
     ):
         """
         Meteorological variables from 1979-01-01 to 2022-12-31 for one or more than one station either
         as :obj:`xarray.Dataset` or dictionary. The data has daily timestep.
         """
-        if agency != "all" and stations != 'all':
-            raise ValueError("Either provide agency or stations not both")
-
-        if agency != "all":
-            agency = check_attributes(agency, self.agencies, 'agency')
-            stations = self.wsAll[self.wsAll['agency'].isin(agency)].index.tolist()
-        else:
-            stations = check_attributes(stations, self.stations(), 'stations')
-
-        meteo_vars = self.meteo_vars_all_stns()
-
-        if isinstance(meteo_vars, xr.Dataset):
-            return meteo_vars[stations]
-        else:
-            return {stn: meteo_vars[stn] for stn in stations}
+        return self._fetch_group('meteo', stations, agency, st, en)
 
     def storage_vars_stn(self, stn: str) -> pd.DataFrame:
         """
@@ -822,70 +692,152 @@ class GSHA(_RainfallRunoff):
         Water storage term variables from 1979-01-01 to 2021-12-31 for all stations either
         as :obj:`xarray.Dataset` or dictionary. The data has daily timestep.
         """
-        nc_path = os.path.join(self.path, 'storage.nc')
-
-        if self.to_netcdf and os.path.exists(nc_path):
-            if self.verbosity: print(f"Reading from pre-existing {nc_path}")
-            return xr.open_dataset(nc_path)
+        return self.fetch_storage_vars()
 
-        storage_vars = {}
-        paths = [os.path.join(
-            self.path,
-            "Storage",
-            "Storage",
-            f'{stn}.csv') for stn in self.stations()]
+    def storage_vars(self)->List[str]:
+        """returns names of storage variables"""
+        return self.storage_vars_stn('1001_arcticnet').columns.tolist()
 
-        cpus = self.processes or max(get_cpus() - 2, 1)
-        start = time.time()
+    def fetch_storage_vars(
+            self,
+            stations: List[str] = "all",
+            agency: List[str] = "all",
+            st=None,
+            en=None,
+    ):
+        """
+        Water storage term variables from 1979-01-01 to 2021-12-31 for one or more than one station either
+        as :obj:`xarray.Dataset` or dictionary. The data has daily timestep.
+        """
+        return self._fetch_group('storage', stations, agency, st, en)
 
-        if self.verbosity: print(f"Reading storage vars for {len(self.stations())} stations using {cpus} cpus")
-        # takes ~ 975 seconds with 110 cpus
-        with cf.ProcessPoolExecutor(cpus) as executor:
-            results = executor.map(
-                self._storage_vars_stn,
-                paths
-            )
+    @property
+    def store_fpath(self) -> os.PathLike:
+        """path of the netcdf file which contains all the variable groups of all stations"""
+        return os.path.join(self.path, 'gsha_store.nc')
 
-        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
+    def build_store(self, batch_size: int = None):
+        """
+        Builds the netcdf file :py:attr:`store_fpath` which contains a group for each
+        family of variables i.e. meteorological, storage, lai, landcover, reservoir
+        and streamflow indices. The files of each station are parsed only once.
+        The stations are processed in batches of ``batch_size`` so that only one
+        batch is in memory at a time. The number of stations written is saved after
+        each batch, so that an interrupted build is resumed. The data is saved as
+        float32 with compression and chunked along time for one variable of one station.
+        The dates and variables of each group are the union of those of all stations.
 
-        if self.to_netcdf:
+        Parameters
+        ----------
+        batch_size : int
+            number of stations to process at a time. By default it is twice the
+            number of cpus.
+        """
+        fpath = self.store_fpath
 
-            encoding = {stn: {'dtype': 'float32', 'zlib': True, 'complevel': 3} for stn in self.stations()}
+        if _store_complete(fpath):
+            return
 
-            for stn, df in zip(self.stations(), results):
-                storage_vars[stn] = df
+        # a handle opened for reading must not outlive the file being rewritten
+        if fpath in _STORES:
+            _STORES.pop(fpath).close()
 
-            ds = xr.Dataset(storage_vars)
+        stations = self.stations()
+        cpus = self.processes or max(get_cpus() - 2, 1)
+        batch_size = batch_size or cpus * 2
 
-            if self.verbosity: print(f"Saving to {nc_path}")
-            ds.to_netcdf(nc_path, encoding=encoding)
+        if os.path.exists(fpath):
+            nc = netCDF4.Dataset(fpath, 'a')
+            if self.verbosity: print(f"resuming building {fpath} from {nc.stations_done} stations")
         else:
+            nc = _create_store(fpath, stations)
+            if self.verbosity: print(f"building {fpath} for {len(stations)} stations using {cpus} cpus")
 
-            ds = {stn: df for stn, df in zip(self.stations(), results)}
+        start = time.time()
 
-        return ds
+        executor = cf.ProcessPoolExecutor(cpus) if cpus > 1 else None
+        try:
+            with nc:
+                for b0 in range(int(nc.stations_done), len(stations), batch_size):
+                    batch = stations[b0:b0 + batch_size]
 
-    def storage_vars(self)->List[str]:
-        """returns names of storage variables"""
-        return self.storage_vars_stn('1001_arcticnet').columns.tolist()
+                    if executor is None or len(batch) == 1:
+                        results = self._read_stn_dirs(batch)
+                    else:
+                        chunks = [chunk.tolist() for chunk in np.array_split(batch, min(cpus, len(batch)))]
+                        results = [r for chunk in executor.map(self._read_stn_dirs, chunks) for r in chunk]
 
-    def fetch_storage_vars(
-            self,
-            stations: List[str] = "all",
-            agency: List[str] = "all"
-    ):
+                    for group in STORE_GROUPS:
+                        _write_store_group(nc, group, b0, [r[group] for r in results])
+
+                    nc.stations_done = b0 + len(batch)
+                    nc.sync()
+
+                    if self.verbosity > 1:
+                        print(f"{b0 + len(batch)}/{len(stations)} stations written")
+
+                nc.complete = 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if self.verbosity: print(f"Time taken: {time.time() - start:.2f} seconds")
+        return
+
+    def _read_stn_dirs(self, stations: List[str]) -> List[Dict[str, pd.DataFrame]]:
+        """reads all the variable groups of stations. A missing file results in None"""
+        results = []
+        for stn in stations:
+            groups = {}
+            for group in STORE_GROUPS:
+                try:
+                    df = self._read_stn_group(group, stn)
+                except FileNotFoundError:
+                    df = None
+                groups[group] = None if df is None else df.select_dtypes('number')
+            results.append(groups)
+        return results
+
+    def _store(self):
+        """the pooled handle of the store if it has been built and ``to_netcdf`` is True"""
+        if not self.to_netcdf or netCDF4 is None:
+            return None
+
+        fpath = self.store_fpath
+        if fpath not in _STORES:
+            if not _store_complete(fpath):
+                return None
+            _STORES[fpath] = _Store(fpath)
+        return _STORES[fpath]
+
+    def _fetch_group(self, group: str, stations, agency, st, en):
         """
-        Water storage term variables from 1979-01-01 to 2021-12-31 for one or more than one station either
-        as :obj:`xarray.Dataset` or dictionary. The data has daily timestep.
+        reads one group for ``stations`` as :obj:`xarray.Dataset` when ``to_netcdf`` is True,
+        from the store if it has been built (see :meth:`build_store`) or else from the
+        csv files of only ``stations``. Otherwise the csv files are returned as dataframes.
         """
         stations = self._get_stations(stations, agency)
 
-        meteo_vars = self.storage_vars_all_stns()
+        if self.to_netcdf and xr is not None:
+            tdim, fdim = STORE_GROUPS[group]
+            store = self._store()
+            if store is not None:
+                index, data = store.read(group, stations, None, st, en)
+                arrays = {stn: (index, store.features[group], data[i]) for i, stn in enumerate(stations)}
+            else:
+                arrays = dict(zip(stations, self._read_stn_arrays(group, stations, st, en)))
 
-        if isinstance(meteo_vars, xr.Dataset):
-            return meteo_vars[stations]
-        else:
-            return {stn: meteo_vars[stn] for stn in stations}
+            if group == 'lai':
+                return xr.Dataset({stn: xr.DataArray(values[:, 0] if values.shape[1] else np.full(0, np.nan),
+                                                     coords={tdim: index}, dims=(tdim,))
+                                   for stn, (index, _, values) in arrays.items()})
+            return xr.Dataset({stn: xr.DataArray(values, coords={tdim: index, fdim: columns}, dims=(tdim, fdim))
+                               for stn, (index, columns, values) in arrays.items()})
+
+        dfs = {stn: self._read_stn_group(group, stn).loc[st:en] for stn in stations}
+        if group == 'lai':
+            return pd.DataFrame({stn: df['lai'] for stn, df in dfs.items()})
+        return dfs
 
     def fetch_static_features(
             self,
@@ -994,11 +946,10 @@ class GSHA(_RainfallRunoff):
         features = check_attributes(dynamic_features, self.dynamic_features, 'dynamic_features')
         st, en = self._check_length(st, en)
 
+        # only read the files which contain the requested features
         out = pd.concat(
-            [self.meteo_vars_stn(station),
-             self.storage_vars_stn(station),
-             self.lai_stn(station).rename('lai')
-             ],
+            [self._read_stn_group(group, station, group_features)
+             for group, group_features in self._feature_groups(features).items()],
             axis=1
         ).loc[st:en, features]
         out.columns.name = 'dynamic_features'
@@ -1044,44 +995,158 @@ class GSHA(_RainfallRunoff):
         ... dynamic_features=['airtemp_C_mean_era5', 'pcp_mm_mswep'])
         """
 
-        # todo : extremely slow even for two stations
         stations = self._get_stations(stations, agency)
 
         features = check_attributes(dynamic_features, self.dynamic_features, 'dynamic_features')
 
         st, en = self._check_length(st, en)
 
-        if len(stations) == 1:
-            if as_dataframe:
-                stn_df = self.fetch_stn_dynamic_features(stations[0], features, st, en)
-                return {stations[0]: stn_df}
-            else:
-                return xr.Dataset({stations[0]: xr.DataArray(self.fetch_stn_dynamic_features(stations[0], features, st, en))})
+        time, data = self._read_groups(stations, features, st, en)
 
         if as_dataframe:
-            # raise NotImplementedError("as_dataframe=True is not implemented yet for multiple stations")
-            dynamic = {stn:self.fetch_stn_dynamic_features(stn, features, st, en) for stn in stations}
-            return dynamic
-
-        # todo : we should read meteo, storage and lai only when they are required!
-        meteo_vars = self.fetch_meteo_vars(stations)
-        storage_vars = self.fetch_storage_vars(stations)
-        if 'lai' in features:
-            # since lai does not have 'features' dimension, we need to add it
-            lai = self.fetch_lai(stations).expand_dims({'features': ['lai']})
-            ds = xr.concat([meteo_vars, storage_vars, lai], dim='features')
-        else:
-            ds = xr.concat([meteo_vars, storage_vars], dim='features')
+            columns = pd.Index(features, name='dynamic_features')
+            return {stn: pd.DataFrame(data[i], index=time, columns=columns) for i, stn in enumerate(stations)}
+
+        coords = {'time': time, 'dynamic_features': features}
+        return xr.Dataset({stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                           for i, stn in enumerate(stations)})
+
+    def _feature_groups(self, features: List[str]) -> Dict[str, List[str]]:
+        """routes each dynamic feature to the group (meteo, storage or lai) in which it is stored"""
+        groups = {}
+        for group, group_features in self._group_features.items():
+            requested = [f for f in features if f in group_features]
+            if requested:
+                groups[group] = requested
+        return groups
+
+    def _group_fpath(self, group: str, stn: str) -> os.PathLike:
+        """path of the csv file of a station which contains the features of ``group``"""
+        if group == 'meteo':
+            return os.path.join(self.path, METEO_MAP[self.agency_of_stn(stn)], f'{stn}.csv')
+        elif group == 'storage':
+            return os.path.join(self.path, "Storage", "Storage", f'{stn}.csv')
+        return os.path.join(self.path, "LAI", "LAI", f'{stn}.csv')
+
+    def _read_stn_group(self, group: str, stn: str, features: List[str] = None) -> pd.DataFrame:
+        """reads only the requested features of one group of one station from its csv file"""
+        if group == 'lai':
+            return lai_stn(self.path, stn).rename('lai').to_frame()
+        elif group == 'meteo':
+            return self._meteo_vars_stn(self._group_fpath(group, stn), features)
+        elif group == 'storage':
+            return self._storage_vars_stn(self._group_fpath(group, stn), features)
+
+        df = {'landcover': lc_variable_stn,
+              'reservoir': reservoir_vars_stn,
+              'streamflow_indices': streamflow_indices_stn}[group](self.path, stn)
+        return df if features is None else df[features]
+
+    def _read_group(self, group: str, stations: List[str], features: List[str], st, en):
+        """
+        reads ``features`` of ``stations`` from one group and returns the time index
+        and a (stations, time, features) array. If the netcdf store has been built,
+        the selection of stations, features and time is done while reading
+        from the store, otherwise the csv files of stations are read in parallel.
+        """
+        store = self._store()
+        if store is not None:
+            return store.read(group, stations, features, st, en)
+
+        cpus = self.processes or max(get_cpus() - 2, 1)
+        if cpus == 1 or len(stations) < 2:
+            return self._read_stn_chunk(group, stations, features, st, en)
+
+        # each worker reads a chunk of stations so that the dataset is
+        # sent to the worker only once per chunk
+        chunks = [chunk.tolist() for chunk in np.array_split(stations, min(cpus * 4, len(stations)))]
+        n = len(chunks)
+
+        if self.verbosity > 1:
+            print(f"Reading {group} variables of {len(stations)} stations using {cpus} cpus")
+
+        with cf.ProcessPoolExecutor(min(cpus, n)) as executor:
+            results = list(executor.map(
+                self._read_stn_chunk, [group] * n, chunks, [features] * n, [st] * n, [en] * n))
+
+        time = results[0][0]
+        for chunk_time, _ in results[1:]:
+            time = time.union(chunk_time)
 
-        ds = ds.rename({'features': 'dynamic_features'})
-        return ds.sel(time=slice(st, en), dynamic_features=features)
+        data = np.full((len(stations), len(time), len(features)), np.nan, dtype=np.float32)
+        i = 0
+        for chunk_time, values in results:
+            data[i:i + len(values), time.get_indexer(chunk_time)] = values
+            i += len(values)
+        return time, data
 
-    def _meteo_vars_stn(self, fpath) -> pd.DataFrame:
+    def _read_stn_arrays(self, group: str, stations: List[str], st, en) -> list:
+        """
+        reads all the numeric columns of one group of ``stations`` from their csv files
+        as (index, columns, values) of each station. The csv files are read in parallel
+        as in :meth:`_read_group`.
+        """
+        cpus = self.processes or max(get_cpus() - 2, 1)
+        if cpus == 1 or len(stations) < 2:
+            return self._read_stn_arrays_chunk(group, stations, st, en)
+
+        chunks = [chunk.tolist() for chunk in np.array_split(stations, min(cpus * 4, len(stations)))]
+        n = len(chunks)
+
+        if self.verbosity > 1:
+            print(f"Reading {group} variables of {len(stations)} stations using {cpus} cpus")
+
+        with cf.ProcessPoolExecutor(min(cpus, n)) as executor:
+            results = executor.map(self._read_stn_arrays_chunk, [group] * n, chunks, [st] * n, [en] * n)
+            return [arrays for chunk_arrays in results for arrays in chunk_arrays]
+
+    def _read_stn_arrays_chunk(self, group: str, stations: List[str], st, en) -> list:
+        arrays = []
+        for stn in stations:
+            try:
+                df = self._read_stn_group(group, stn).loc[st:en].select_dtypes('number')
+            except FileNotFoundError:
+                # such stations are NaN as in the store
+                df = pd.DataFrame(index=pd.DatetimeIndex([]), dtype=np.float32)
+            arrays.append((df.index, df.columns.tolist(), df.to_numpy(dtype=np.float32)))
+        return arrays
+
+    def _read_stn_chunk(self, group: str, stations: List[str], features: List[str], st, en):
+        """reads ``features`` of ``stations`` from their csv files"""
+        dfs = [self._read_stn_group(group, stn, features).loc[st:en, features] for stn in stations]
+        time = dfs[0].index
+        for df in dfs[1:]:
+            time = time.union(df.index)
+        return time, np.stack([df.reindex(time).to_numpy(dtype=np.float32) for df in dfs])
+
+    def _read_groups(self, stations: List[str], features: List[str], st, en):
+        """
+        reads ``features`` of ``stations`` from only those groups which contain them
+        into a preallocated (stations, time, features) array.
+        """
+        groups = {group: self._read_group(group, stations, group_features, st, en) + (group_features,)
+                  for group, group_features in self._feature_groups(features).items()}
+
+        # the groups cover different periods
+        time = None
+        for group_time, _, _ in groups.values():
+            time = group_time if time is None else time.union(group_time)
+        time.name = 'time'
+
+        data = np.full((len(stations), len(time), len(features)), np.nan, dtype=np.float32)
+        for group_time, values, group_features in groups.values():
+            t_idx = time.get_indexer(group_time)
+            f_idx = [features.index(f) for f in group_features]
+            data[:, t_idx[:, None], f_idx] = values
+
+        return time, data
+
+    def _meteo_vars_stn(self, fpath, features: List[str] = None) -> pd.DataFrame:
 
         if not os.path.exists(fpath):
             raise FileNotFoundError(f"{fpath} not found")
 
-        df = pd.read_csv(fpath, index_col=0)
+        df = pd.read_csv(fpath, index_col=0, usecols=self._usecols(fpath, features))
 
         df.index = pd.to_datetime(df.index)
 
@@ -1092,16 +1157,16 @@ class GSHA(_RainfallRunoff):
 
         for col, func in self.dyn_factors.items():
             if col in df.columns:
-                df[col] = df[col].apply(func)
+                df[col] = func(df[col])
 
         return df.astype(self.fp)
 
-    def _storage_vars_stn(self, fpath) -> pd.DataFrame:
+    def _storage_vars_stn(self, fpath, features: List[str] = None) -> pd.DataFrame:
 
         if not os.path.exists(fpath):
             raise FileNotFoundError(f"{fpath} not found")
 
-        df = pd.read_csv(fpath, index_col=0,
+        df = pd.read_csv(fpath, index_col=0, usecols=self._usecols(fpath, features),
                          dtype={'SWDE': np.float32,
                                 'SML1': np.float32,
                                 'SML2': np.float32,
@@ -1119,10 +1184,19 @@ class GSHA(_RainfallRunoff):
 
         for col, func in self.dyn_factors.items():
             if col in df.columns:
-                df[col] = df[col].apply(func)
+                df[col] = func(df[col])
 
         return df
 
+    def _usecols(self, fpath, features: List[str] = None) -> Union[List[str], None]:
+        """names of the columns in csv file which contain ``features``"""
+        if features is None:
+            return None
+        raw = {v: k for k, v in self.dyn_map.items()}
+        wanted = {raw.get(f, f) for f in features}
+        columns = pd.read_csv(fpath, nrows=0).columns
+        return [columns[0]] + [col for col in columns[1:] if col in wanted]
+
 
 class _GSHA(_RainfallRunoff):
     """
@@ -1155,6 +1229,48 @@ class _GSHA(_RainfallRunoff):
     def boundary_file(self) -> os.PathLike:
         return self.gsha.boundary_file
 
+    def _boundary_id(self, stn: str) -> str:
+        """id of the station in the boundary store of GSHA"""
+        return f"{stn}_{self.agency_name}"
+
+    def boundary_store(self) -> BoundaryStore:
+        """
+        Boundaries of the catchments as :py:class:`BoundaryStore`. These are
+        taken from the boundary store of GSHA which is shared among all the
+        datasets based upon GSHA.
+        """
+        if self._bndry_store is None:
+            store = self.gsha.boundary_store()
+            stations = [stn for stn in self.stations() if self._boundary_id(stn) in store]
+            self._bndry_store = store.subset(
+                [self._boundary_id(stn) for stn in stations], stations)
+        return self._bndry_store
+
+    def get_boundary(
+            self,
+            catchment_id: str,
+    ):
+        """
+        returns boundary of a catchment
+
+        Parameters
+        ----------
+        catchment_id : str
+            name/id of catchment
+
+        Returns
+        -------
+        geometry : fiona.Geometry
+
+        Examples
+        --------
+        >>> from aqua_fetch import Japan
+        >>> dataset = Japan()
+        >>> dataset.get_boundary(dataset.stations()[0])
+        """
+        assert isinstance(catchment_id, str), f"catchment_id must be string but is of type {type(catchment_id)}"
+        return self.gsha.get_boundary(self._boundary_id(catchment_id))
+
     @property
     def start(self) -> pd.Timestamp:
         return pd.Timestamp('1979-01-01')
@@ -1480,6 +1596,143 @@ def lai_stn(ds_path, stn: str) -> pd.Series:
     return df[stn]
 
 
+class _Store(object):
+    """
+    read only handle to the netcdf store of GSHA. The station lookup table,
+    the time index and the variable names of each group are read once
+    when the file is opened.
+    """
+    def __init__(self, fpath: os.PathLike):
+        self.nc = netCDF4.Dataset(fpath, 'r')
+        self.nc.set_auto_mask(False)
+        self.stations = {stn: i for i, stn in enumerate(self.nc.variables['station'][:])}
+
+        # the dates of a group are stored in the order in which they were
+        # found while building, so they are sorted here once
+        self.time, self.order, self.features = {}, {}, {}
+        for group, (tdim, fdim) in STORE_GROUPS.items():
+            if group in self.nc.groups:
+                grp = self.nc.groups[group]
+                index = _decode_time(grp.variables[tdim])
+                order = np.argsort(index.values, kind='stable')
+                self.time[group] = index[order]
+                self.order[group] = None if index.is_monotonic_increasing else order
+                self.features[group] = list(grp.variables[fdim][:])
+
+    def read(self, group: str, stations: List[str], features: List[str], st, en):
+        """returns the time index and (stations, time, features) array of one group"""
+        if group not in self.time:  # none of the stations has this group
+            return pd.DatetimeIndex([], name=STORE_GROUPS[group][0]), np.full(
+                (len(stations), 0, len(features or [])), np.nan, dtype=np.float32)
+
+        index = self.time[group]
+        t0, t1 = index.slice_indexer(st, en).indices(len(index))[:2]
+
+        pos = np.array([self.stations[stn] for stn in stations])
+        features = features or self.features[group]
+        feat = np.array([self.features[group].index(f) for f in features])
+
+        # netCDF4 requires sorted indices
+        uniq, inverse = np.unique(pos, return_inverse=True)
+        f_order = np.argsort(feat)
+        order = self.order[group]
+        with nc_lock:
+            var = self.nc.groups[group].variables['data']
+            if order is None:
+                data = var[uniq.tolist(), t0:t1, feat[f_order].tolist()]
+            else:
+                # the dates are not sorted in the file, so all of them are read
+                data = var[uniq.tolist(), :, feat[f_order].tolist()][:, order[t0:t1]]
+        return index[t0:t1], data[inverse][:, :, np.argsort(f_order)]
+
+    def close(self):
+        self.nc.close()
+
+
+# stores which are already opened, so that the datasets based upon
+# GSHA (Japan, Thailand etc.) share the same handle
+_STORES: Dict[str, _Store] = {}
+
+
+def _store_complete(fpath: os.PathLike) -> bool:
+    if not os.path.exists(fpath):
+        return False
+    with netCDF4.Dataset(fpath, 'r') as nc:
+        return bool(getattr(nc, 'complete', 0))
+
+
+def _create_store(fpath: os.PathLike, stations: List[str]):
+    """creates the netcdf store with only the station dimension. The groups are created
+    when the data of first stations is written"""
+    nc = netCDF4.Dataset(fpath, 'w')
+    nc.createDimension('station', len(stations))
+    stn = nc.createVariable('station', str, ('station',))
+    stn[:] = np.array(stations, dtype=object)
+    nc.stations_done = 0
+    nc.complete = 0
+    nc.sync()
+    return nc
+
+
+def _write_store_group(nc, group: str, b0: int, dfs: List[Union[pd.DataFrame, None]]):
+    """
+    writes the data of a batch of stations, starting at ``b0``, into a group of the store.
+    The stations cover different periods and may have different variables, therefore the
+    time and variable dimensions are unlimited and the dates and variables of the batch
+    which are not yet in the group are appended to them. The dates are therefore not
+    necessarily sorted in the store.
+    """
+    tdim, fdim = STORE_GROUPS[group]
+
+    available = [df for df in dfs if df is not None]
+    if not available:
+        # stations without this group remain NaN
+        return
+
+    if group not in nc.groups:
+        grp = nc.createGroup(group)
+        grp.createDimension(tdim, None)
+        grp.createDimension(fdim, None)
+
+        t = grp.createVariable(tdim, 'i4', (tdim,))
+        t.units = 'days since 1970-01-01'
+
+        grp.createVariable(fdim, str, (fdim,))
+
+        # a chunk contains (a part of) the time series of one variable of one station
+        grp.createVariable(
+            'data', 'f4', ('station', tdim, fdim), zlib=True, complevel=3, fill_value=np.nan,
+            chunksizes=(1, 4096 if tdim == 'time' else 64, 1))
+
+    grp = nc.groups[group]
+    t, f = grp.variables[tdim], grp.variables[fdim]
+    index = _decode_time(t) if len(t) else pd.DatetimeIndex([])
+    columns = list(f[:]) if len(f) else []
+
+    new_index, new_columns = index, columns
+    for df in available:
+        new_index = new_index.append(df.index[~df.index.isin(new_index)])
+        new_columns = new_columns + [col for col in df.columns if col not in new_columns]
+
+    if len(new_index) > len(index):
+        t[len(index):len(new_index)] = (new_index[len(index):] - pd.Timestamp('1970-01-01')).days
+    if len(new_columns) > len(columns):
+        f[len(columns):len(new_columns)] = np.array(new_columns[len(columns):], dtype=object)
+
+    values = np.full((len(dfs), len(new_index), len(new_columns)), np.nan, dtype=np.float32)
+    for i, df in enumerate(dfs):
+        if df is not None:
+            values[i] = df.reindex(index=new_index, columns=new_columns).to_numpy(
+                dtype=np.float32, na_value=np.nan)
+
+    grp.variables['data'][b0:b0 + len(dfs), :len(new_index), :len(new_columns)] = values
+    return
+
+
+def _decode_time(t) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(pd.Timestamp('1970-01-01') + pd.to_timedelta(t[:], unit='D'), name=t.name)
+
+
 # the dates for data to be downloaded 
 START_YEAR = 1979
 END_YEAR = 2024
@@ -2134,6 +2387,10 @@ class Thailand(_GSHA):
     def agency_name(self)->str:
         return 'RID'
 
+    def _boundary_id(self, stn: str) -> str:
+        # '.' in station ids is replaced by '_' in names of shapefiles
+        return f"{stn.replace('.', '_')}_{self.agency_name}"
+
     @property
     def start(self)->pd.Timestamp:
         return pd.Timestamp('1980-01-01')
@@ -7,12 +7,12 @@ import numpy as np
 import pandas as pd
 
 try:
-    from netCDF4 import Dataset
+    from netCDF4 import Dataset, num2date
 except (ModuleNotFoundError, ImportError):
     pass
 
 from .utils import _RainfallRunoff
-from .._backend import xarray as xr
+from .._backend import nc_lock, xarray as xr
 from ..utils import check_attributes, download, unzip
 
 from ._map import (
@@ -389,13 +389,25 @@ class HYSETS(_RainfallRunoff):
 
     def _maybe_to_netcdf(self):
 
-        for src in list(set(list(self.sources.values()))):
+        for src in sorted(set(self.sources.values())):
             fname = f'HYSETS_2023_update_{src}.nc'
-            outpath = os.path.join(self.path, f'HYSETS_2023_update_{src}1.nc')
-            if not os.path.exists(outpath):
-                self.transform(fname)
+            if not self._is_transformed(self._stacked_fpath(src)):
+                xds = self.transform(fname)
+                if xds is not None:
+                    xds.close()
         return
 
+    def _stacked_fpath(self, src: str) -> os.PathLike:
+        """path of the file which contains data of ``src`` as (watershed, time, dynamic_features)"""
+        return os.path.join(self.path, f'HYSETS_2023_update_{src}_stacked.nc')
+
+    @staticmethod
+    def _is_transformed(fpath: os.PathLike) -> bool:
+        if not os.path.exists(fpath):
+            return False
+        with Dataset(fpath, 'r') as nc:
+            return bool(getattr(nc, 'complete', 0))
+
     @property
     def static_features(self)->List[str]:
         df = self._static_data(nrows=2)
@@ -583,51 +595,66 @@ class HYSETS(_RainfallRunoff):
             as_dataframe=False
     ):
         """Fetches dynamic features of station."""
-        # first put all dynamic features in a single Dataset of shape (time, watershed) with dynamic_features as data_vars.
-        # Then converting it to (dynamic_features, time) with watershed as data_vars. This method is faster
-        # for fewer dynamic features but slower for many dynamic features.
-
-        stations_1 = np.subtract(stations, 1).astype(str).tolist()
         st, en = self._check_length(st, en)
         attrs = check_attributes(dynamic_features, self.dynamic_features)
 
-        dyn_map_ = {v:k for k,v in self.dyn_map.items()}
+        time, data = self._dynamic_array(stations, attrs, st, en)
 
-        xds = None
-        features = {}
-        for idx, f in enumerate(attrs):
-            f_ = dyn_map_[f]
-            fpath = os.path.join(self.path, f'HYSETS_2023_update_{self.sources[f_]}1.nc')
-            
-            if xds is None or f_ not in xds.dynamic_features:
-                xds = xr.open_dataset(fpath)
+        coords = {'time': time, 'dynamic_features': attrs}
+        if as_dataframe:
+            return {str(stn): pd.DataFrame(data[i], index=time, columns=pd.Index(attrs, name='dynamic_features'))
+                    for i, stn in enumerate(stations)}
 
-            features[f] = xds.sel(dynamic_features=[f_], time=slice(st, en))[stations_1]
+        return xr.Dataset({str(stn): xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                           for i, stn in enumerate(stations)})
 
-            if self.verbosity>1:
-                print(f"{idx+1}/{len(attrs)} fetched {f}")
+    def _dynamic_array(
+            self,
+            stations: List[int],
+            attrs: List[str],
+            st=None,
+            en=None
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """reads the dynamic features of stations as array of shape (stations, time, features)"""
+        # The data of each source is stored as one (watershed, time, dynamic_features)
+        # variable. Each source file is kept open in a pool and the features of that
+        # source are read for all the stations as one hyperslab which is written
+        # directly into a preallocated output array.
 
-        if self.verbosity>1: print('concatenating along features')
-        xds = xr.concat(list(features.values()), dim='dynamic_features')
+        dyn_map_ = {v:k for k,v in self.dyn_map.items()}
 
-        if self.verbosity>1: print('transposing')
+        # group the features by their source while remembering their position in output
+        src_features = {}
+        for i, f in enumerate(attrs):
+            src_features.setdefault(self.sources[dyn_map_[f]], []).append((i, dyn_map_[f]))
 
-        old_vals = xds.coords["dynamic_features"].values
-        new_vals = [self.dyn_map[val] for val in old_vals]
+        files = {src: _stacked_file(self._stacked_fpath(src)) for src in src_features}
 
-        xds = xds.assign_coords(dynamic_features=new_vals)
+        # time steps of all sources are same but take the union to be safe
+        time = None
+        for sf in files.values():
+            idx = sf.time[sf.time.slice_indexer(st, en)]
+            time = idx if time is None else time.union(idx)
 
-        # we need to add +1 to the names of data_vars
-        old_vars = list(xds.data_vars)
-        new_data_vars = [f"{int(var)+1}" for var in old_vars]
-        data_vars_map = {old_var: new_var for old_var, new_var in zip(old_vars, new_data_vars)}
-        xds = xds.rename(data_vars_map)
+        data = np.full((len(stations), len(time), len(attrs)), np.nan, dtype=np.float32)
 
-        if as_dataframe:
-            stations = np.array(stations).astype(str).tolist()
-            return {stn:xds[stn].to_pandas() for stn in stations}
+        for src, features in src_features.items():
+            out_idx, features = zip(*features)
+            sf = files[src]
+            t0, t1 = sf.time.slice_indexer(st, en).indices(len(sf.time))[:2]
+            values = sf.read(stations, t0, t1, list(features))
 
-        return xds
+            t_idx = time.get_indexer(sf.time[t0:t1])
+            if (t_idx == np.arange(len(time))).all():
+                data[:, :, list(out_idx)] = values
+            else:
+                data[:, t_idx[:, None], list(out_idx)] = values
+
+            if self.verbosity>1:
+                print(f"fetched {len(features)} features from {src}")
+
+        time.name = 'time'
+        return time, data
 
     def _static_data(self, usecols=None, nrows=None):
         """
@@ -645,46 +672,173 @@ class HYSETS(_RainfallRunoff):
     def transform(
             self,
             fname: str,
+            block_size: int = 256,
             ):
+        """
+        converts a ``HYSETS_2023_update_{src}.nc`` file, which has one (watershed, time)
+        variable for each dynamic feature, into a single (watershed, time, dynamic_features)
+        variable named ``data``. The conversion is done block by block i.e. ``block_size``
+        watersheds of one feature are read and written at a time, so the memory
+        requirement is bounded by one block. The number of blocks written is saved in the
+        output file after each block so that an interrupted conversion is resumed
+        instead of being restarted.
+
+        parameters
+        ----------
+        fname : str
+            name of the file to convert e.g. ``HYSETS_2023_update_ERA5.nc``
+        block_size : int
+            number of watersheds to read and write at a time
 
+        Returns
+        -------
+        xr.Dataset
+            the stacked file opened with :obj:`xarray`, or None if xarray is not installed
+        """
+        src_name = fname.split('.')[0].replace('HYSETS_2023_update_', '')
         fpath = os.path.join(self.path, fname)
-        if self.verbosity: print(f'transforming {fname}')
-        ds = xr.open_dataset(fpath)
+        outpath = self._stacked_fpath(src_name)
 
-        ds = ds[[var for var in ds.data_vars if len(ds[var].dims) == 2]]
-        dyn_vars = list(ds.data_vars)  # e.g. ["var1", "var2", ...]
+        if self.verbosity: print(f'transforming {fname} into {outpath}')
 
-        # We'll manually combine them into a new DataArray
-        arr_list = []
-        for idx, var in enumerate(dyn_vars):
+        # a handle opened for reading must not outlive the file being rewritten
+        if outpath in _STACKED_FILES:
+            _STACKED_FILES.pop(outpath).close()
 
-            array = ds[var].values
-            arr_list.append(array)
-            if self.verbosity>1: print(f"{idx+1}/{len(dyn_vars)} Fetched {var} {array.shape}")
+        with Dataset(fpath, 'r') as src:
 
-        if self.verbosity: print('stacking arrays')
-        data = np.stack(arr_list, axis=2)
+            dyn_vars = [var for var, v in src.variables.items()
+                        if v.ndim == 2 and 'time' in v.dimensions and v.dtype.kind in 'fiu']
+            # (watershed, time) or (time, watershed)
+            ws_axis = 1 - src.variables[dyn_vars[0]].dimensions.index('time')
+            num_ws = src.variables[dyn_vars[0]].shape[ws_axis]
+            time = src.variables['time']
+            num_blocks = int(np.ceil(num_ws / block_size))
 
-        data_var_names = [str(i) for i in range(len(data))]
+            if os.path.exists(outpath) and not self.overwrite:
+                dst = Dataset(outpath, 'a')
+                if self.verbosity: print(f'resuming from block {dst.blocks_done}')
+            else:
+                dst = _create_stacked_file(outpath, src, time, dyn_vars, num_ws)
 
-        if self.verbosity: print('creating xarray dataset')
-        xds = xr.Dataset(
-            {name: (["time", "dynamic_features"], data[i, :, :].astype(np.float32)) for i, name in enumerate(data_var_names)},
-            coords={
-                "time": ds.time,  # Replace with actual time coordinates if available
-                "dynamic_features": dyn_vars  # Replace with actual feature names if available
-            }
-        )
+            with dst:
+                for step in range(int(dst.blocks_done), len(dyn_vars) * num_blocks):
+                    f_idx, block = divmod(step, num_blocks)
+                    w0, w1 = block * block_size, min((block + 1) * block_size, num_ws)
 
-        outpath = os.path.join(self.path, f"{fname.split('.')[0]}1.nc")
+                    v = src.variables[dyn_vars[f_idx]]
+                    values = v[w0:w1, :] if ws_axis == 0 else v[:, w0:w1].T
+                    dst.variables['data'][w0:w1, :, f_idx] = np.ma.filled(
+                        np.ma.asarray(values, dtype=np.float32), np.nan)
 
-        if self.verbosity: print(f'saving as {outpath}')
-        xds.to_netcdf(
-            outpath,
-            encoding={var: {"dtype": "float32", 
-                            'zlib': True, 
-                            'complevel': 3, 
-                            'least_significant_digit': 4} for var in xds.data_vars}
-            )
+                    dst.blocks_done = step + 1
+                    dst.sync()
+
+                    if self.verbosity>1 and block == num_blocks - 1:
+                        print(f"{f_idx+1}/{len(dyn_vars)} transformed {dyn_vars[f_idx]}")
+
+                dst.complete = 1
+
+        if xr is None:
+            return None
+        return xr.open_dataset(outpath)
+
+
+class _StackedFile(object):
+    """
+    read only handle to a ``HYSETS_2023_update_{src}_stacked.nc`` file. The
+    Watershed_ID -> index lookup table, the time index and the feature names
+    are read once when the file is opened.
+    """
+    def __init__(self, fpath: os.PathLike):
+        self.fpath = fpath
+        self.nc = Dataset(fpath, 'r')
+        self.nc.set_auto_mask(False)
+        self.data = self.nc.variables['data']
+
+        ws = self.nc.variables['watershed'][:].astype(np.int64)
+        # lookup table indexed by Watershed_ID, -1 for ids not in file
+        self.lut = np.full(ws.max() + 1, -1, dtype=np.int64)
+        self.lut[ws] = np.arange(len(ws))
+
+        t = self.nc.variables['time']
+        self.time = pd.DatetimeIndex(
+            num2date(t[:], t.units, getattr(t, 'calendar', 'standard'),
+                     only_use_cftime_datetimes=False, only_use_python_datetimes=True))
+
+        self.features = {f: i for i, f in enumerate(self.nc.variables['dynamic_features'][:])}
+
+    def index(self, stations) -> np.ndarray:
+        """converts Watershed_IDs into positions along watershed dimension"""
+        ids = np.asarray(stations, dtype=np.int64)
+        pos = np.full(len(ids), -1, dtype=np.int64)
+        valid = (ids >= 0) & (ids < len(self.lut))
+        pos[valid] = self.lut[ids[valid]]
+        if (pos < 0).any():
+            raise KeyError(f"stations {ids[pos < 0].tolist()} not found in {self.fpath}")
+        return pos
+
+    def read(self, stations, t0: int, t1: int, features: List[str]) -> np.ndarray:
+        """
+        returns (stations, time, features) array for time steps ``t0:t1``. The
+        watersheds from the smallest to largest requested index are read as
+        one hyperslab unless the requested stations are sparse.
+        """
+        pos = self.index(stations)
+        f_idx = np.array([self.features[f] for f in features])
+        f_order = np.argsort(f_idx)
+        f_sorted = f_idx[f_order]
+
+        w0, w1 = pos.min(), pos.max() + 1
+        with nc_lock:
+            if (w1 - w0) <= 4 * len(pos):
+                values = self.data[w0:w1, t0:t1, f_sorted.tolist()][pos - w0]
+            else:
+                uniq, inverse = np.unique(pos, return_inverse=True)
+                values = self.data[uniq.tolist(), t0:t1, f_sorted.tolist()][inverse]
+
+        # bring features back in requested order
+        return values[:, :, np.argsort(f_order)]
+
+    def close(self):
+        self.nc.close()
+
+
+_STACKED_FILES: Dict[str, _StackedFile] = {}
+
+
+def _stacked_file(fpath: os.PathLike) -> _StackedFile:
+    """returns the pooled handle of ``fpath`` opening it if necessary"""
+    if fpath not in _STACKED_FILES:
+        _STACKED_FILES[fpath] = _StackedFile(fpath)
+    return _STACKED_FILES[fpath]
+
+
+def _create_stacked_file(outpath, src, time, dyn_vars: List[str], num_ws: int):
+    """creates an empty (watershed, time, dynamic_features) netcdf file"""
+    dst = Dataset(outpath, 'w')
+    dst.createDimension('watershed', num_ws)
+    dst.createDimension('time', len(time))
+    dst.createDimension('dynamic_features', len(dyn_vars))
+
+    ws = dst.createVariable('watershed', 'i4', ('watershed',))
+    ws[:] = np.arange(1, num_ws + 1)  # Watershed_ID starts from 1
+
+    t = dst.createVariable('time', time.dtype, ('time',))
+    t.setncatts({attr: time.getncattr(attr) for attr in time.ncattrs() if attr != '_FillValue'})
+    t[:] = time[:]
+
+    feats = dst.createVariable('dynamic_features', str, ('dynamic_features',))
+    for i, var in enumerate(dyn_vars):
+        feats[i] = var
+
+    # a chunk contains complete time series of one feature for a few watersheds
+    dst.createVariable(
+        'data', 'f4', ('watershed', 'time', 'dynamic_features'),
+        zlib=True, complevel=3, least_significant_digit=4, fill_value=np.nan,
+        chunksizes=(min(16, num_ws), len(time), 1))
 
-        return xds
+    dst.blocks_done = 0
+    dst.complete = 0
+    dst.sync()
+    return dst
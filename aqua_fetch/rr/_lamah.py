@@ -1,5 +1,4 @@
 
-import gc
 import os
 import warnings
 from datetime import datetime
@@ -10,12 +9,12 @@ import numpy as np
 import pandas as pd
 
 from .._backend import xarray as xr
-from .._backend import netCDF4
+from .._backend import netCDF4, nc_lock
 
 from ..utils import get_cpus
 from ..utils import check_attributes, download, unzip
 from .utils import _RainfallRunoff, _handle_dynamic
-from .._geom_utils import laea_to_wgs84, lcc_to_wgs84
+from .._geom_utils import laea_to_wgs84, lcc_to_wgs84, transform_geometry
 
 from ._map import (
     observed_streamflow_cms,
@@ -50,11 +49,8 @@ from ._map import (
 
 SEP = os.sep
 
-# todo : currently when saving .nc files for each variable, we first fetch data for all meteo
-# variables and then save a single variable and extract data for all meteos again. This 
-# is extremely inefficient. We should not make multiple calls to .fetch we saving .ncs
-# todo : try to use mfopen_dataset instead of opening multiple .nc files separately
-# without xarray, LamaHCE seems to be much faster
+# maximum size in bytes of the data of one batch of stations during conversion to netcdf
+BATCH_BYTES = 2 ** 30
 
 class LamaHCE(_RainfallRunoff):
     """
@@ -299,40 +295,91 @@ class LamaHCE(_RainfallRunoff):
                                 "3_shapefiles", "Basins_A.shp")
 
     def _maybe_to_netcdf(self, fdir: str):
-        # since data is very large, saving all the data in one file
-        # consumes a lot of memory, which is impractical for most of the personal
-        # computers! Therefore, saving each feature separately
-
-        # todo: if we are only interested in one dynamic feature say 'o_cms_obs', 
-        # then why do we need to save all the dynamic features in the netcdf file?
+        # All the dynamic features are saved in a single (station, time, dynamic_features)
+        # variable which is chunked so that one chunk contains complete time series of
+        # one feature of one station. Each station file is parsed only once. The stations
+        # are parsed in parallel, in batches, so that only one batch is in memory at a time.
+        # The variable is float64 only if a feature is parsed as float64 and float32 otherwise.
 
         fdir = os.path.join(self.path, fdir)
         if not os.path.exists(fdir):
             os.makedirs(fdir)
 
-        if not self.all_ncs_exist:
-            print(f'converting data to netcdf format for faster io operations')
-
-            for feature in self.dynamic_features:
-
-                # we must specify class level dyn_fname feature
-                dyn_fname = os.path.join(fdir, f"{feature}.nc")
-
-                if not os.path.exists(dyn_fname):
-                    print(f'Saving {feature} as {dyn_fname}')
-                    _, data = self.fetch(static_features=None, dynamic_features=feature)
-
-                    data.to_netcdf(dyn_fname)
-
-                    gc.collect()
+        if self.all_ncs_exist:
+            return
+
+        print(f'converting data to netcdf format for faster io operations')
+
+        stations = self.stations()
+        features = self.dynamic_features
+        cpus = self.processes or max(get_cpus() - 2, 1)
+        # the frames of a station take at most 8 bytes for each time step and feature
+        num_t = len(pd.date_range(self.start, self.end, freq='h' if self.timestep == 'H' else 'D'))
+        batch_size = int(min(max(BATCH_BYTES // (num_t * len(features) * 8), 1), len(stations)))
+
+        fpath = os.path.join(fdir, os.path.basename(self._stacked_fpath))
+        outpath = fpath + '.part'
+        nc = None
+        time = None
+        executor = cf.ProcessPoolExecutor(min(cpus, len(stations))) if cpus > 1 and len(stations) > 1 else None
+        try:
+            for b0 in range(0, len(stations), batch_size):
+                batch = stations[b0:b0 + batch_size]
+
+                if executor is not None and len(batch) > 1:
+                    dfs = list(executor.map(self._read_stn_dyn, batch))
+                else:
+                    dfs = [self._read_stn_dyn(stn) for stn in batch]
+
+                if nc is None:
+                    # the streamflow is reindexed to the period of the dataset and the
+                    # meteorological data covers the same period, so the time steps of
+                    # first batch are those of all the stations. This is checked below.
+                    time = dfs[0].index
+                    for df in dfs[1:]:
+                        time = time.union(df.index)
+                    dtype = np.float64 if any((df[features].dtypes == np.float64).any() for df in dfs) else np.float32
+                    nc = _create_stacked_file(outpath, stations, time, features, dtype)
+
+                for stn, df in zip(batch, dfs):
+                    if not df.index.equals(time) and len(df.index.difference(time)) > 0:
+                        raise ValueError(f"station {stn} has {len(df.index.difference(time))} time steps "
+                                         f"which are not in the time steps of stations {stations[:len(dfs)]}")
+
+                values = np.stack([df.reindex(time)[features].to_numpy(dtype=dtype, na_value=np.nan)
+                                   for df in dfs])
+                nc.variables['data'][b0:b0 + len(batch)] = values
+
+                del dfs, values
+
+                if self.verbosity:
+                    print(f'{min(b0 + batch_size, len(stations))}/{len(stations)} stations converted')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if nc is not None:
+                nc.close()
+
+        # file is renamed only after all the stations are written so that an
+        # interrupted conversion is not mistaken as complete
+        os.replace(outpath, fpath)
         return
 
+    @property
+    def _stacked_fpath(self) -> os.PathLike:
+        """path of the file which contains all dynamic features as (station, time, dynamic_features)"""
+        return os.path.join(self.path, f"{self.data_type}_{self.timestep}", "dynamic_features.nc")
+
     @property
     def dynamic_fnames(self):
         return [f"{feature}.nc" for feature in self.dynamic_features]
 
     @property
     def all_ncs_exist(self):
+        # the data can either be in a single stacked file or, if it was converted by an
+        # older version, in one file for each dynamic feature.
+        if os.path.exists(self._stacked_fpath):
+            return True
         fdir = os.path.join(self.path, f"{self.data_type}_{self.timestep}")
         return all(os.path.exists(os.path.join(fdir, fname_)) for fname_ in self.dynamic_fnames)
 
@@ -384,6 +431,19 @@ class LamaHCE(_RainfallRunoff):
         coord_m.columns = ['lat', 'long']
         return coord_m
 
+    def transform_coords(self, geometry):
+        """
+        transforms all rings of the catchment boundary from EPSG:3035 (LAEA Europe)
+        to EPSG:4326 (WGS84) in a single call
+        """
+        false_easting, false_northing = 4321000.0, 3210000.0
+        lat_0, lon_0 = 52, 10
+
+        return transform_geometry(
+            geometry,
+            lambda x, y: laea_to_wgs84(x, y, lon_0, lat_0, false_easting, false_northing)
+        )
+
     def fetch_stations_features(
             self,
             stations: list,
@@ -463,10 +523,13 @@ class LamaHCE(_RainfallRunoff):
                 # following code will run only once when fetch is called inside init method
                 dynamic = self._read_dynamic(stations, dynamic_features, st=st, en=en)
             else:
-                dynamic = self._make_ds_from_ncs(dynamic_features, stations, st, en)
-
                 if as_dataframe:
-                    dynamic = {stn: dynamic[stn].to_pandas() for stn in dynamic}
+                    time, data = self._read_ncs(dynamic_features, stations, st, en)
+                    columns = pd.Index(dynamic_features, name='dynamic_features')
+                    dynamic = {stn: pd.DataFrame(data[i], index=time, columns=columns)
+                               for i, stn in enumerate(stations)}
+                else:
+                    dynamic = self._make_ds_from_ncs(dynamic_features, stations, st, en)
 
             if static_features is not None:
                 static = self.fetch_static_features(stations, static_features)
@@ -543,25 +606,63 @@ class LamaHCE(_RainfallRunoff):
         return results
 
     def _make_ds_from_ncs(self, dynamic_features, stations, st, en):
-        """makes xarray Dataset by reading multiple .nc files"""
+        """makes xarray Dataset by reading .nc files"""
+        time, data = self._read_ncs(dynamic_features, stations, st, en)
+        coords = {'time': time, 'dynamic_features': dynamic_features}
+        return xr.Dataset({stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                           for i, stn in enumerate(stations)})
+
+    def _read_ncs(self, dynamic_features, stations, st, en):
+        """
+        reads the data of ``stations`` directly into a preallocated
+        (stations, time, dynamic_features) array and returns the time index and the array.
+        """
 
         if self.verbosity>1:
             print(f'fetching data for {len(dynamic_features)} dynamic features for {len(stations)} stations')
 
-        dyns = []
-        for idx, f in enumerate(dynamic_features):
-            dyn_fpath = os.path.join(self.path, f"{self.data_type}_{self.timestep}", f'{f}.nc')
-            dyn = xr.open_dataset(dyn_fpath)  # daataset
-            dyns.append(dyn[stations].sel(time=slice(st, en)))
+        if os.path.exists(self._stacked_fpath):
+            with netCDF4.Dataset(self._stacked_fpath) as nc:
+                nc.set_auto_mask(False)
+                time, t0, t1 = _time_slice(nc.variables['time'], st, en)
+
+                stn_idx = {stn: i for i, stn in enumerate(nc.variables['station'][:])}
+                pos = np.array([stn_idx[stn] for stn in stations])
+                f_idx = {f: i for i, f in enumerate(nc.variables['dynamic_features'][:])}
+                feat = np.array([f_idx[f] for f in dynamic_features])
+
+                # netCDF4 requires sorted indices
+                uniq, inverse = np.unique(pos, return_inverse=True)
+                f_order = np.argsort(feat)
+                data = nc.variables['data'][uniq.tolist(), t0:t1, feat[f_order].tolist()]
+                data = data[inverse][:, :, np.argsort(f_order)]
+            return time, data
+
+        # files with one feature each. The files are read by a pool of threads
+        # which share nc_lock while calling netCDF4
+        fdir = os.path.join(self.path, f"{self.data_type}_{self.timestep}")
+        fpaths = [os.path.join(fdir, f'{f}.nc') for f in dynamic_features]
+
+        with netCDF4.Dataset(fpaths[0]) as nc:
+            time, t0, t1 = _time_slice(nc.variables['time'], st, en)
 
-            if self.verbosity>3:
-                print(f'{idx}: {f} read')
+        data = np.full((len(stations), len(time), len(dynamic_features)), np.nan, dtype=np.float32)
 
-        xds = xr.concat(dyns, dim='dynamic_features')  # dataset todo: taking too much time!
+        cpus = min(self.processes or max(get_cpus() - 2, 1), len(fpaths))
+        with cf.ThreadPoolExecutor(max_workers=cpus) as executor:
+            results = executor.map(_read_feature_nc, fpaths, [stations]*len(fpaths),
+                                   [t0]*len(fpaths), [t1]*len(fpaths))
 
-        if self.verbosity>3:
-            print(f'concatenated')
-        return xds
+            for idx, values in enumerate(results):
+                # same as the concatenation of features with different dtypes
+                if values.dtype == np.float64 and data.dtype == np.float32:
+                    data = data.astype(np.float64)
+                data[:, :, idx] = values
+
+                if self.verbosity>3:
+                    print(f'{idx}: {dynamic_features[idx]} read')
+
+        return time, data
 
     def fetch_static_features(
             self,
@@ -1036,6 +1137,20 @@ class LamaHIce(LamaHCE):
 
         """
 
+        lat, lon = self._lcc_to_wgs84(df['long'].values, df['lat'].values)
+
+        coords_m = pd.DataFrame({'lat': lat, 'long': lon}, index=df.index)
+        return coords_m
+
+    def transform_coords(self, geometry):
+        """
+        transforms all rings of the catchment boundary from EPSG:3057 (Lambert 1993)
+        to EPSG:4326 (WGS84) in a single call
+        """
+        return transform_geometry(geometry, self._lcc_to_wgs84)
+
+    @staticmethod
+    def _lcc_to_wgs84(x, y):
         # following values are from .prj file 
         # Parameters for EPSG:3057
         lon_0 = -19.0        # Central Meridian
@@ -1045,13 +1160,10 @@ class LamaHIce(LamaHCE):
         false_easting = 500000.0
         false_northing = 500000.0
 
-        lat, lon = lcc_to_wgs84(
-        df['long'].values, df['lat'].values, 
-        lon_0, lat_0, lat_1, lat_2, false_easting, 
-        false_northing)
-
-        coords_m = pd.DataFrame({'lat': lat, 'long': lon})
-        return coords_m
+        return lcc_to_wgs84(
+            x, y, 
+            lon_0, lat_0, lat_1, lat_2, false_easting, 
+            false_northing)
 
     def met_fname(self, station):
         ts_folder = {'D': 'daily', 'H': 'hourly'}[self.timestep]
@@ -1493,3 +1605,55 @@ class LamaHIce(LamaHCE):
     @property
     def dynamic_fnames(self):
         return [f"{feature}.nc" for feature in self.dynamic_features]
+
+
+def _create_stacked_file(
+        fpath,
+        stations: List[str],
+        time: pd.DatetimeIndex,
+        features: List[str],
+        dtype=np.float32
+):
+    """creates an empty (station, time, dynamic_features) netcdf file"""
+    nc = netCDF4.Dataset(fpath, 'w')
+    nc.createDimension('station', len(stations))
+    nc.createDimension('time', len(time))
+    nc.createDimension('dynamic_features', len(features))
+
+    stn = nc.createVariable('station', str, ('station',))
+    stn[:] = np.array(stations, dtype=object)
+
+    unit = 'days' if (time.hour == 0).all() else 'hours'
+    t = nc.createVariable('time', 'f8', ('time',))
+    t.units = f"{unit} since {time[0]:%Y-%m-%d %H:%M:%S}"
+    t.calendar = 'proleptic_gregorian'
+    t[:] = (time - time[0]) / pd.Timedelta(1, unit=unit[0])
+
+    f = nc.createVariable('dynamic_features', str, ('dynamic_features',))
+    f[:] = np.array(features, dtype=object)
+
+    # a chunk contains complete time series of one feature of one station
+    nc.createVariable('data', dtype, ('station', 'time', 'dynamic_features'),
+                      fill_value=np.nan, chunksizes=(1, len(time), 1))
+    return nc
+
+
+def _time_slice(t, st, en):
+    """decodes the time variable and returns the time index between st and en and its bounds"""
+    # vectorized decoding of CF time which is much faster than num2date for hourly data
+    unit, ref = t.units.split(' since ')
+    time = pd.DatetimeIndex(pd.Timestamp(ref) + pd.to_timedelta(t[:], unit=unit), name='time')
+    t0, t1 = time.slice_indexer(st, en).indices(len(time))[:2]
+    return time[t0:t1], t0, t1
+
+
+def _read_feature_nc(fpath, stations: List[str], t0: int, t1: int) -> np.ndarray:
+    """
+    reads (stations, time) array from a file which contains one dynamic feature.
+    The array is float64 only if the feature is saved as float64 in the file.
+    """
+    with nc_lock:
+        with netCDF4.Dataset(fpath) as nc:
+            nc.set_auto_mask(False)
+            values = np.stack([nc.variables[stn][t0:t1, 0] for stn in stations])
+    return values if values.dtype == np.float64 else values.astype(np.float32)
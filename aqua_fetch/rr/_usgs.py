@@ -7,14 +7,13 @@ import requests
 from io import StringIO
 from typing import List, Union, Dict, Tuple
 from requests.exceptions import JSONDecodeError
-from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 
 from .utils import _RainfallRunoff
 from .._backend import netCDF4, xarray as xr
-from ..utils import get_cpus
+from .._http import RETRY_STATUS, RateLimitedSession, download_many
 from ..utils import check_attributes
 from ._hysets import HYSETS
 
@@ -34,6 +33,11 @@ DAILY_END = "2024-12-31"
 HOURLY_START = "1910-01-01"
 HOURLY_END = "2024-12-31"
 
+NWIS_URL = "https://waterservices.usgs.gov/nwis"
+# number of concurrent requests and maximum requests per second sent to NWIS
+NWIS_WORKERS = 16
+NWIS_RATE = 10.0
+
 
 class USGS(_RainfallRunoff):
     """
@@ -154,7 +158,7 @@ class USGS(_RainfallRunoff):
         self.hysets_path = self.hysets.path
 
         self._stations = self.__stations()
-        self.metadata = maybe_make_and_get_metadata(self.path, self.stations())
+        self.metadata = maybe_make_and_get_metadata(self.path, self.stations(), verbosity=self.verbosity)
 
         self._static_features = self.__static_features()
     
@@ -177,7 +181,13 @@ class USGS(_RainfallRunoff):
 
     @property
     def end(self)->str:
-        return "20231231"
+        # the last day in discharge file, which grows with each update
+        if netCDF4 is not None and os.path.exists(self.q_fpath):
+            with netCDF4.Dataset(self.q_fpath) as nc:
+                t = nc.variables['time']
+                unit, ref = t.units.split(' since ')
+                return f"{pd.Timestamp(ref) + pd.to_timedelta(t[-1], unit=unit):%Y%m%d}"
+        return pd.Timestamp(DAILY_END).strftime("%Y%m%d")
 
     @property
     def dynamic_features(self)->List[str]:
@@ -376,63 +386,39 @@ class USGS(_RainfallRunoff):
             en=None,
             as_dataframe=False
     ):
-        """Fetches dynamic features of station."""
+        """
+        Fetches dynamic features of stations. The meteorological features are
+        read from HYSETS and the discharge of only the requested stations is read
+        from :py:attr:`q_fpath`. Both are written into one array.
+        """
         st, en = self._check_length(st, en)
         features = check_attributes(dynamic_features, self.dynamic_features.copy(), 'dynamic_features')
 
         if self.verbosity>2:
             print(f"fetching {len(features)} dynamic features for {len(stations)} stations  from {st} to {en}")
 
-        daily_q = None
+        time_ = pd.date_range(st, en, freq='D', name='time')
+        data = np.full((len(stations), len(time_), len(features)), np.nan, dtype=np.float32)
+
+        meteo = [f for f in features if f != observed_streamflow_cms()]
+        if meteo:
+            karte = self.hysets.OfficialID_WatershedID_map
+            t, values = self.hysets._dynamic_array([int(karte[stn]) for stn in stations], meteo, st, en)
+            t_idx = time_.get_indexer(t)
+            data[:, t_idx[t_idx >= 0, None], [features.index(f) for f in meteo]] = values[:, t_idx >= 0]
 
         if observed_streamflow_cms() in features:
-            # todo:  we are reading all file even for one station
-            daily_q = self._q(as_dataframe)
-            if isinstance(daily_q, xr.Dataset):
-                daily_q = daily_q.sel(time=slice(st, en))[stations]
-            else:
-                daily_q = daily_q.loc[st:en, stations]
-            
-            features.remove(observed_streamflow_cms())
-
-        if len(features) == 0:
-            if isinstance(daily_q, pd.DataFrame):
-                daily_q = {stn:pd.DataFrame(daily_q[stn].rename(observed_streamflow_cms())) for stn in daily_q.columns}
-            return daily_q
-
-        karte = self.hysets.OfficialID_WatershedID_map
-        stations_ = [int(karte[stn]) for stn in stations]
-        data = self.hysets._fetch_dynamic_features(stations_, features, st, en, as_dataframe)
-
-        if daily_q is not None:
-            if isinstance(daily_q, xr.Dataset):
-                assert isinstance(data, xr.Dataset), "xarray dataset not supported"
-                # todo : why shoule we not subtract 1
-                karte = {str(int(k)):v for k,v in self.hysets.WatershedID_OfficialID_map.items() if v in stations}
-                data = data.rename(karte)
-
-                # first create a new dimension in daily_q named dynamic_features
-                daily_q = daily_q.expand_dims({'dynamic_features': [observed_streamflow_cms()]})
-                data = xr.concat([data, daily_q], dim='dynamic_features')
-            else:
-                # todo : -1 ?
-                #data.rename(columns={str(int(k)):v for k,v in self.hysets.WatershedID_OfficialID_map.items()}, inplace=True)
-                assert isinstance(data, dict)
-                # rename the keys in data using self.hysets.WatershedID_OfficialID_map
-                data = {self.hysets.WatershedID_OfficialID_map.get(k, k): v for k, v in data.items()}
-
-                for k,meteo_df in data.items():
-                    stn_df = pd.concat([meteo_df, daily_q[k].rename(observed_streamflow_cms())], axis=1)
-                    data[k] = stn_df
-        else:
-            if isinstance(data, xr.Dataset):
-                karte = {str(int(k)):v for k,v in self.hysets.WatershedID_OfficialID_map.items() if v in stations}
-                data = data.rename(karte)
-            else:
-                assert isinstance(data, dict)
-                # rename the keys in data using self.hysets.WatershedID_OfficialID_map
-                data = {self.hysets.WatershedID_OfficialID_map.get(k, k): v for k, v in data.items()}
-        return data
+            t, q = self._read_q(stations, st, en)
+            t_idx = time_.get_indexer(t)
+            data[:, t_idx[t_idx >= 0], features.index(observed_streamflow_cms())] = q[:, t_idx >= 0]
+
+        if as_dataframe:
+            columns = pd.Index(features, name='dynamic_features')
+            return {stn: pd.DataFrame(data[i], index=time_, columns=columns) for i, stn in enumerate(stations)}
+
+        coords = {'time': time_, 'dynamic_features': features}
+        return xr.Dataset({stn: xr.DataArray(data[i], coords=coords, dims=('time', 'dynamic_features'))
+                           for i, stn in enumerate(stations)})
 
     def _fetch_static_features(
             self,
@@ -456,48 +442,198 @@ class USGS(_RainfallRunoff):
         static_feats.remove('Official_ID')
         return static_feats
 
-    def _q(self, as_dataframe:bool=None, read_csv_kwargs:dict=None):
+    @property
+    def q_fpath(self) -> os.PathLike:
+        """
+        path of netcdf file which contains the discharge of all stations as one
+        (station, time) variable. Each chunk of this variable contains the time
+        series of one station, so reading a few stations reads only their chunks.
+        """
+        fname = 'daily_q_stacked.nc' if self.timestep.lower().startswith('d') else 'hourly_q_stacked.nc'
+        return os.path.join(self.path, fname)
 
+    def _q(self, as_dataframe:bool=None, read_csv_kwargs:dict=None):
+        """
+        returns the discharge of all stations either as :obj:`pandas.DataFrame`
+        or :obj:`xarray.Dataset`. Use :py:meth:`_read_q` to read selected stations.
+        """
         if netCDF4 is None:
-            ext = 'csv'
-        else:
-            ext = 'nc'
-        
-        if self.timestep.lower().startswith('d'):
-            fname = f'daily_q.{ext}'
+            fpath = os.path.join(self.path, 'daily_q.csv')
+            if not os.path.exists(fpath):
+                print(f"{fpath} not found. Downloading data storing it in {fpath}")
+                self._make_csv()
+            return pd.read_csv(fpath, index_col=0, **(read_csv_kwargs or {}))
+
+        stations = self._q_stations()
+        time_, q = self._read_q(stations)
+        df = pd.DataFrame(q.T, index=time_, columns=stations)
+        if as_dataframe:
+            return df
+        return xr.Dataset({stn: xr.DataArray(df[stn]) for stn in stations})
+
+    def _maybe_stack_q(self):
+        """makes :py:attr:`q_fpath` either from the daily_q.nc file written by
+        previous versions, which has one variable for each station, or by downloading"""
+        if os.path.exists(self.q_fpath):
+            return
+
+        legacy_fpath = os.path.join(self.path, 'daily_q.nc')
+        if os.path.exists(legacy_fpath):
+            if self.verbosity: print(f"converting {legacy_fpath} to {self.q_fpath}")
+            stack_daily_q(legacy_fpath, self.q_fpath)
         else:
-            fname = f'hourly_q.{ext}'
+            print(f"{self.q_fpath} not found. Downloading data storing it in {self.q_fpath}")
+            self._make_csv()
+        return
 
-        if self.verbosity>1:
-            print(f'reading {fname}')
+    def _q_stations(self) -> List[str]:
+        """names of stations read from the index of :py:attr:`q_fpath`"""
+        self._maybe_stack_q()
+        with netCDF4.Dataset(self.q_fpath) as nc:
+            return list(nc.variables['station'][:])
+
+    def _read_q(
+            self,
+            stations: List[str],
+            st=None,
+            en=None
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """reads the discharge of stations between st and en as array of shape (stations, time)"""
+        if netCDF4 is None:
+            return self._read_q_csv(stations, st, en)
+
+        self._maybe_stack_q()
+
+        with netCDF4.Dataset(self.q_fpath) as nc:
+            nc.set_auto_mask(False)
+
+            lut = {stn: i for i, stn in enumerate(nc.variables['station'][:])}
+            pos = np.array([lut[stn] for stn in stations], dtype=int)
 
-        fpath = os.path.join(self.path, fname)
+            time_ = _decode_time(nc.variables['time'])
+            t0, t1 = time_.slice_indexer(st, en).indices(len(time_))[:2]
 
+            # netCDF4 requires sorted indices without duplicates
+            uniq, inverse = np.unique(pos, return_inverse=True)
+            q = nc.variables['q'][uniq, t0:t1]
+
+        return time_[t0:t1], q[inverse]
+
+    def _read_q_csv(
+            self,
+            stations: List[str],
+            st=None,
+            en=None
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """reads only the columns of ``stations`` from daily_q.csv, which is
+        written instead of :py:attr:`q_fpath` when netCDF4 is not installed"""
+        fpath = os.path.join(self.path, 'daily_q.csv')
         if not os.path.exists(fpath):
             print(f"{fpath} not found. Downloading data storing it in {fpath}")
-            self._make_csv(cpus=None)
+            self._make_csv()
 
-        if ext == 'csv':
-            return pd.read_csv(fpath, index_col=0, **read_csv_kwargs)
-        else:
-            if as_dataframe:
-                return xr.open_dataset(fpath).to_dataframe()
-            return xr.open_dataset(fpath)        
+        index_col = pd.read_csv(fpath, nrows=0).columns[0]
+        wanted = set(stations) | {index_col}
+        df = pd.read_csv(fpath, index_col=0, usecols=lambda col: col in wanted,
+                         parse_dates=True, dtype={stn: np.float32 for stn in stations})
+        df = df.loc[st:en].reindex(columns=stations)
+        return pd.DatetimeIndex(df.index, name='time'), df.to_numpy(dtype=np.float32).T
 
     def __stations(self)->List[str]:
         if self.verbosity>1:
             print('getting stations')
-        dataset = self._q(read_csv_kwargs=dict(nrows=2))
 
-        if isinstance(dataset, xr.Dataset):
-            # get names of all variables
-            return list(dataset.data_vars.keys())
-        else:
-            return dataset.columns.tolist()
+        if netCDF4 is None:
+            return self._q(read_csv_kwargs=dict(nrows=2)).columns.tolist()
+
+        return self._q_stations()
+
+    def update(
+            self,
+            en=None,
+            workers:int = None,
+            ) -> dict:
+        """
+        Appends the daily discharge which is available after the last stored day
+        of each station to :py:attr:`q_fpath`. For each station, only the days
+        after its last stored day are requested from NWIS and only the new part
+        of its row is written, so the existing data is not rewritten.
+        The update is recorded in :py:attr:`update_manifest_fpath`.
+
+        Parameters
+        ----------
+        en : str
+            last day to request. By default it is yesterday.
+        workers : int
+            number of concurrent requests
+
+        Returns
+        -------
+        dict
+            the entry of this update in the manifest
+
+        Examples
+        --------
+        >>> from aqua_fetch import USGS
+        >>> dataset = USGS()
+        >>> dataset.update()
+        >>> dataset.update_history()
+        """
+        if netCDF4 is None:
+            raise ModuleNotFoundError("netCDF4 is required to update the discharge of USGS")
+
+        self._maybe_stack_q()
+
+        en = pd.Timestamp.today().normalize() - pd.Timedelta(days=1) if en is None else pd.Timestamp(en)
+        one_day = pd.Timedelta(days=1)
+
+        with netCDF4.Dataset(self.q_fpath, 'a') as nc:
+            nc.set_auto_mask(False)
+            stations = list(nc.variables['station'][:])
+            time_ = _decode_time(nc.variables['time'])
+            last = _last_positions(nc)
+
+        starts = {stn: time_[pos] + one_day if pos >= 0 else time_[0] for stn, pos in zip(stations, last)}
+        todo = [stn for stn in stations if starts[stn] <= en]
+
+        def download(site, session):
+            return download_daily_record(site, session, start=f"{starts[site]:%Y-%m-%d}", end=f"{en:%Y-%m-%d}")
+
+        if self.verbosity:
+            print(f"Requesting daily discharge of {len(todo)} sites until {en:%Y-%m-%d}")
+
+        workers = workers or NWIS_WORKERS
+        with _nwis_session(workers) as session:
+            data, errors = download_many(todo, download, session=session, workers=workers,
+                                         verbosity=self.verbosity)
+
+        new_time = pd.date_range(time_[0], max(en, time_[-1]), freq='D')
+        lut = {stn: i for i, stn in enumerate(stations)}
+        rows = updated = 0
+
+        with netCDF4.Dataset(self.q_fpath, 'a') as nc:
+            if len(new_time) > len(time_):
+                nc.variables['time'][len(time_):] = (new_time[len(time_):] - new_time[0]).days
+
+            for site, ts in data.items():
+                ts = ts.loc[(ts.index >= starts[site]) & (ts.index <= en)].dropna()
+                if ts.empty:
+                    continue
+
+                # only the part of the row after the last stored day is written
+                t0, t1 = new_time.get_loc(ts.index[0]), new_time.get_loc(ts.index[-1]) + 1
+                nc.variables['q'][lut[site], t0:t1] = ts.reindex(new_time[t0:t1]).to_numpy(dtype=np.float32)
+                nc.variables['last'][lut[site]] = t1 - 1
+                rows += len(ts)
+                updated += 1
+
+        return self._record_update(
+            start=str(min(starts.values(), default=en).date()), end=str(en.date()), stations=len(todo),
+            updated=updated, rows=rows, failed=sorted(errors))
 
     def _make_csv(
             self,
-            cpus:int = None,
+            workers:int = None,
             ):
 
         df = pd.read_csv(
@@ -506,14 +642,11 @@ class USGS(_RainfallRunoff):
 
         sites = df.loc[df['Source']=='USGS']['Official_ID']
 
-        if cpus is None:
-            cpus = max(get_cpus() - 2, 1)
-        
         if not os.path.exists(self.path):
             os.makedirs(self.path)
         
-        make_daily_q(self.path, sites, cpus)
-        print(f"Downloaded daily data and stored in {self.path}/daily_q.nc")
+        make_daily_q(self.path, sites, workers, verbosity=self.verbosity)
+        print(f"Downloaded daily data and stored in {self.q_fpath}")
 
         #make_hourly_q(self.path, sites[9000:10000], cpus=cpus)
         #print(f"Downloaded hourly data and stored in {self.path}/hourly_q.nc")
@@ -522,11 +655,12 @@ class USGS(_RainfallRunoff):
 
 
 def download_metadata(
-        site:str
+        site:str,
+        session:requests.Session = None,
         )->pd.DataFrame:
     
     try:
-        metadata = _download_metadata(site)
+        metadata = _download_metadata(site, session)
     except (ValueError, IndexError):
         print(f"Site: {site} ValueError/IndexError")
         # create dataframe with nan values
@@ -543,11 +677,14 @@ def download_metadata(
 def maybe_make_and_get_metadata(        
         path:str,
         sites:List[str], 
-        cpus:int=None
+        workers:int=None,
+        verbosity:int=1
         )->pd.DataFrame:
-
-    cpus = max(get_cpus()-2, 1) if cpus is None else cpus
-
+    """
+    reads metadata.csv or makes it by downloading the metadata of sites.
+    The metadata of each site is saved in ``metadata_files`` directory as
+    soon as it is downloaded so that an interrupted download can be resumed.
+    """
     fpath = os.path.join(path, 'metadata.csv')
     if os.path.exists(fpath):
         return pd.read_csv(
@@ -555,17 +692,11 @@ def maybe_make_and_get_metadata(
             index_col='site_no',
             dtype={'site_no': str, "dec_lat_va": float, "dec_long_va": float, "drain_area_va": float}) 
 
-    print(f"Downloading metadata for {len(sites)} sites using {cpus} cpus")
-
-    start = time.time()
-    with ProcessPoolExecutor(max_workers=cpus) as executor:
-        data = executor.map(download_metadata, sites)
+    if verbosity: print(f"Downloading metadata for {len(sites)} sites")
 
-    total = round((time.time() - start)/60, 2)
-    print(f"Time taken to download metadata: {total} mins with {cpus} cpus")
-    start = time.time()
+    data = _download_sites(sites, download_metadata, os.path.join(path, 'metadata_files'), workers, verbosity)
 
-    metadata = pd.concat(list(data))
+    metadata = pd.concat(list(data.values()))
 
     # convert drain_area_va from sq miles to sq km
     metadata['drain_area_va'] = metadata['drain_area_va'] * 2.58999
@@ -579,84 +710,175 @@ def maybe_make_and_get_metadata(
 def make_daily_q(
         path:str,
         sites:List[str], 
-        cpus:int,
+        workers:int=None,
         verbosity:int=1
         ):
+    """
+    downloads the daily discharge of sites and saves it in a single file.
+    The discharge of each site is saved in ``daily_files`` directory as soon
+    as it is downloaded so that an interrupted download can be resumed.
+    """
+    if verbosity: print(f"Downloading daily data for {len(sites)} sites")
 
-    if verbosity: print(f"Downloading daily data for {len(sites)} sites using {cpus} cpus")
-
-    daily_files_path = os.path.join(path, 'daily_files')
-    if not os.path.exists(daily_files_path):
-        os.makedirs(daily_files_path)
-
-    start = time.time()
-    with ProcessPoolExecutor(max_workers=cpus) as executor:
-        data = executor.map(download_daily_record, sites)
+    data = _download_sites(sites, download_daily_record, os.path.join(path, 'daily_files'), workers, verbosity)
 
-    total = round((time.time() - start)/60, 2)
-    
-    if verbosity: print(f"Time taken to download data: {total} mins with {cpus} cpus")
     start = time.time()
 
     if netCDF4 is None:
-        save_daily_q_as_csv(path, data)
+        save_daily_q_as_csv(path, data.values())
     else:
-        save_daily_q_as_nc(path, data)
-
+        save_daily_q_as_nc(path, data.values(), verbosity=verbosity)
 
     total = round((time.time() - start)/60, 2)
-    print(f"Time taken: to store {total} mins")
+    if verbosity: print(f"Time taken: to store {total} mins")
     return
 
 
+def _download_sites(
+        sites:List[str],
+        func,
+        cache_dir:str,
+        workers:int=None,
+        verbosity:int=1
+        )->Dict[str, Union[pd.DataFrame, pd.Series]]:
+    """downloads the data of all sites in one process using a pool of threads
+    which share the keep-alive connections of one session."""
+    workers = workers or NWIS_WORKERS
+    with _nwis_session(workers) as session:
+        data, errors = download_many(list(sites), func, cache_dir, session=session,
+                                     workers=workers, verbosity=verbosity)
+
+    if errors:
+        site, error = next(iter(errors.items()))
+        raise RuntimeError(f"Could not download {len(errors)} of {len(sites)} sites e.g. {site}: {error}. "
+                           f"Run again to download only these sites.")
+    return data
+
+
+def _nwis_session(workers:int) -> RateLimitedSession:
+    session = RateLimitedSession(rate=NWIS_RATE, pool_size=workers)
+    session.headers.update({"user-agent": "python-dataretrieval/1.0.11"})
+    return session
+
+
 def save_daily_q_as_csv(path, data):
-    df = pd.DataFrame(data)
+    # one column for each site so that the columns of only some sites can be read
+    df = pd.concat([ts.rename(str(ts.name)) for ts in data], axis=1)
     df.to_csv(os.path.join(path, 'daily_q.csv'), index=True)
     return
 
-def save_daily_q_as_nc(path, data):
-    from netCDF4 import Dataset, date2num
+def save_daily_q_as_nc(path, data, verbosity:int=1):
+    """writes the daily discharge of sites into daily_q_stacked.nc as one
+    (station, time) variable. The sites are written as they arrive"""
+    fpath = os.path.join(path, 'daily_q_stacked.nc')
+    time_ = pd.date_range(start=DAILY_START, end=DAILY_END, freq='D')
+
+    # the file appears at its final path only when complete
+    with _create_q_file(fpath + '.part', time_) as ncfile:
+        for idx, ts in enumerate(data):
+            ncfile.variables['station'][idx] = str(ts.name)
+            # ts may have different index than time dimension, so we need to reindex
+            ncfile.variables['q'][idx, :] = ts.reindex(index=time_).to_numpy(dtype=np.float32)
 
-    ncfile = Dataset(os.path.join(path, 'daily_q.nc'), mode='w', format='NETCDF4')
+            if verbosity > 1 and idx % 100 == 0:
+                print(f"Saved data for {idx} sites in .nc file")
+
+    os.replace(fpath + '.part', fpath)
+    return
 
-    _ = ncfile.createDimension('time', None)  # unlimited dimension
 
-    new_idx = pd.date_range(start=DAILY_START, end=DAILY_END, freq='D')
-    time_var = ncfile.createVariable('time', 'f8', ('time',))
-    time_var.units = 'days since 1820-01-01 00:00:00'
-    time_var.calendar = 'gregorian'
-    time_var[:] = date2num(new_idx.to_pydatetime(), units=time_var.units, calendar=time_var.calendar)
+def stack_daily_q(src: os.PathLike, dst: os.PathLike, block_size: int = 256):
+    """
+    converts the daily_q.nc file, which contains one variable for each station,
+    into ``dst`` with one (station, time) variable.
+    """
+    with netCDF4.Dataset(src) as nc:
+        nc.set_auto_mask(False)
 
-    for idx, ts in enumerate(data):
-        # create a variable for each column
-        col_var = ncfile.createVariable(str(ts.name), 
-                                        datatype='f4', 
-                                        dimensions=('time',),
-                                        complevel=4, 
-                                        compression='zlib',
-                                        shuffle=True,
-                                        least_significant_digit=4,
-                                        )
-        # ts may have different index than new_idx/tim_demension, so we need to reindex
-        new_ts = ts.reindex(index=new_idx)
+        time_ = _decode_time(nc.variables['time'])
 
-        col_var[:] = new_ts.values
-        col_var.units = "cms"
-        col_var.description = "daily discharge"
+        stations = [name for name in nc.variables if name != 'time']
 
-        if idx % 100 == 0:
-            print(f"Saved data for {idx} sites in .nc file")
+        with _create_q_file(dst + '.part', time_) as out:
+            out.variables['station'][:len(stations)] = np.array(stations, dtype=object)
 
-    ncfile.close()
+            for b0 in range(0, len(stations), block_size):
+                block = stations[b0:b0 + block_size]
+                values = np.stack([nc.variables[stn][:] for stn in block]).astype(np.float32)
+                for stn, row in zip(block, values):
+                    fill = getattr(nc.variables[stn], '_FillValue', netCDF4.default_fillvals['f4'])
+                    row[row == np.float32(fill)] = np.nan
+                out.variables['q'][b0:b0 + len(block)] = values
 
+    os.replace(dst + '.part', dst)
     return
 
 
-def _read_json(json):
+def _create_q_file(fpath: os.PathLike, time_: pd.DatetimeIndex):
+    """creates the netcdf file for discharge with unlimited station and time
+    dimensions so that new stations and new days can be appended"""
+    ncfile = netCDF4.Dataset(fpath, mode='w', format='NETCDF4')
+
+    ncfile.createDimension('station', None)
+    ncfile.createDimension('time', None)
+
+    ncfile.createVariable('station', str, ('station',))
+
+    time_var = ncfile.createVariable('time', 'i4', ('time',))
+    time_var.units = f"days since {time_[0].strftime('%Y-%m-%d')}"
+    time_var[:] = (time_ - time_[0]).days
+
+    q = ncfile.createVariable(
+        'q', 'f4', ('station', 'time'),
+        complevel=4,
+        compression='zlib',
+        shuffle=True,
+        least_significant_digit=4,
+        fill_value=np.nan,
+        chunksizes=(1, len(time_)),
+    )
+    q.units = "cms"
+    q.description = "daily discharge"
+    return ncfile
+
+
+def _decode_time(t) -> pd.DatetimeIndex:
+    unit, ref = t.units.split(' since ')
+    return pd.DatetimeIndex(pd.Timestamp(ref) + pd.to_timedelta(t[:], unit=unit), name='time')
+
+
+def _last_positions(nc, block_size: int = 256) -> np.ndarray:
+    """
+    position of last valid value in the time series of each station, -1 for
+    stations without data. These are stored in ``last`` variable so that the
+    time series are scanned only once. ``nc`` must be opened in append mode
+    with auto masking disabled.
     """
-    Following code is taken and modified after dataretrieval.utils
+    if 'last' in nc.variables:
+        return nc.variables['last'][:]
+
+    q = nc.variables['q']
+    num_stations, num_t = q.shape
+    last = np.full(num_stations, -1, dtype=np.int32)
+    for b0 in range(0, num_stations, block_size):
+        b1 = min(b0 + block_size, num_stations)
+        valid = ~np.isnan(q[b0:b1])
+        pos = num_t - 1 - np.argmax(valid[:, ::-1], axis=1)
+        last[b0:b1] = np.where(valid.any(axis=1), pos, -1)
+
+    nc.createVariable('last', 'i4', ('station',), fill_value=-1)[:] = last
+    return last
 
+
+def _read_json(json:dict) -> pd.DataFrame:
+    """
     Reads a NWIS Water Services formatted JSON into a ``pandas.DataFrame``.
+    Following code is modified after dataretrieval.utils
+
+    The records of each time series are walked once and their ``dateTime``,
+    ``value`` and ``qualifiers`` are put in numpy arrays. The time series of
+    a site are aligned on the union of their time steps and the frame of each
+    site is made in one step.
 
     Parameters
     ----------
@@ -666,49 +888,28 @@ def _read_json(json):
     Returns
     -------
     df: ``pandas.DataFrame``
-        Times series data from the NWIS JSON
-    md: :obj:`dataretrieval.utils.Metadata`
-        A custom metadata object
-
+        Times series data from the NWIS JSON with ``site_no`` and ``datetime``
+        columns followed by a value and a qualifier (``_cd``) column for each
+        parameter. The qualifier columns are categorical.
     """
-    merged_df = pd.DataFrame(columns=["site_no", "datetime"])
-
-    site_list = [
-        ts["sourceInfo"]["siteCode"][0]["value"] for ts in json["value"]["timeSeries"]
-    ]
-
-    # create a list of indexes for each change in site no
-    # for example, [0, 21, 22] would be the first and last indeces
-    index_list = [0]
-    index_list.extend(
-        [i + 1 for i, (a, b) in enumerate(zip(site_list[:-1], site_list[1:])) if a != b]
-    )
-    index_list.append(len(site_list))
-
-    for i in range(len(index_list) - 1):
-        start = index_list[i]  # [0]
-        end = index_list[i + 1]  # [21]
-
-        # grab a block containing timeseries 0:21,
-        # which are all from the same site
-        site_block = json["value"]["timeSeries"][start:end]
-        if not site_block:
-            continue
-
-        site_no = site_block[0]["sourceInfo"]["siteCode"][0]["value"]
-        site_df = pd.DataFrame(columns=["datetime"])
-
+    # group the time series by site
+    sites = {}
+    for timeseries in json["value"]["timeSeries"]:
+        site_no = timeseries["sourceInfo"]["siteCode"][0]["value"]
+        sites.setdefault(site_no, []).append(timeseries)
+
+    frames = []
+    for site_no, site_block in sites.items():
+        columns = {}
         for timeseries in site_block:
             param_cd = timeseries["variable"]["variableCode"][0]["value"]
             # check whether min, max, mean record XXX
             option = timeseries["variable"]["options"]["option"][0].get("value")
 
-            # loop through each parameter in timeseries, then concat to the merged_df
             for parameter in timeseries["values"]:
                 col_name = param_cd
                 method = parameter["method"][0]["methodDescription"]
 
-                # if len(timeseries['values']) > 1 and method:
                 if method:
                     # get method, format it, and append to column name
                     method = method.strip("[]()").lower()
@@ -717,63 +918,101 @@ def _read_json(json):
                 if option:
                     col_name = f"{col_name}_{option}"
 
-                record_json = parameter["value"]
-
-                if not record_json:
+                records = parameter["value"]
+                if not records:
                     # no data in record
                     continue
-                # should be able to avoid this by dumping
-                record_json = str(record_json).replace("'", '"')
 
-                # read json, converting all values to float64 and all qualifiers
-                # Lists can't be hashed, thus we cannot df.merge on a list column
-                record_df = pd.read_json(
-                    StringIO(record_json),
-                    orient="records",
-                    dtype={"value": "float64", "qualifiers": "unicode"},
-                    convert_dates=False,
-                )
+                suffix = ""
+                if (col_name, "") in columns:
+                    # same names as given by merging both series on datetime
+                    columns = {(name, "_x" if name == col_name else sfx): val
+                               for (name, sfx), val in columns.items()}
+                    suffix = "_y"
+                columns[(col_name, suffix)] = _decode_records(records)
 
-                record_df["qualifiers"] = (
-                    record_df["qualifiers"].str.strip("[]").str.replace("'", "")
-                )
+        frames.append(_site_frame(site_no, columns))
 
-                record_df.rename(
-                    columns={
-                        "value": col_name,
-                        "dateTime": "datetime",
-                        "qualifiers": col_name + "_cd",
-                    },
-                    inplace=True,
-                )
+    if not frames:
+        return pd.DataFrame(columns=["site_no", "datetime"])
+
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def _decode_records(records: List[dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """
+    decodes the records of one parameter into arrays of time (datetime64[ns] in UTC),
+    values (float64) and qualifier codes along with the qualifier categories
+    """
+    num = len(records)
+    values = np.empty(num, dtype=np.float64)
+    codes = np.empty(num, dtype=np.int16)
+    datetimes = [None] * num
+    categories = {}
+
+    for i, record in enumerate(records):
+        datetimes[i] = record["dateTime"]
+        values[i] = float(record["value"])
+        qualifiers = ", ".join(record["qualifiers"])
+        code = categories.get(qualifiers)
+        if code is None:
+            code = categories[qualifiers] = len(categories)
+        codes[i] = code
+
+    datetimes = pd.to_datetime(datetimes, utc=True).asi8
+    return datetimes, values, codes, list(categories)
+
+
+def _site_frame(site_no: str, columns: Dict[Tuple[str, str], tuple]) -> pd.DataFrame:
+    """
+    makes the frame of a site from the decoded parameters, aligned on the union of
+    their time steps. The keys of ``columns`` are the column name and its suffix.
+    """
+    if not columns:
+        return pd.DataFrame({"site_no": pd.Series(dtype=object), "datetime": pd.Series(dtype='datetime64[ns, UTC]')})
 
-                site_df = site_df.merge(record_df, how="outer", on="datetime")
+    times = [datetimes for datetimes, _, _, _ in columns.values()]
+    union = times[0] if len(times) == 1 else np.unique(np.concatenate(times))
+    if len(times) == 1 and (np.diff(union) <= 0).any():
+        union = np.unique(union)
 
-        # end of site loop
-        site_df["site_no"] = site_no
-        merged_df = pd.concat([merged_df, site_df])
+    data = {"site_no": np.full(len(union), site_no, dtype=object),
+            "datetime": pd.to_datetime(union, utc=True)}
 
-    # convert to datetime, normalizing the timezone to UTC when doing so
-    if "datetime" in merged_df.columns:
-        merged_df["datetime"] = pd.to_datetime(merged_df["datetime"], utc=True)
+    for (col_name, suffix), (datetimes, values, codes, categories) in columns.items():
+        if datetimes is union:
+            col, col_codes = values, codes
+        else:
+            pos = np.searchsorted(union, datetimes)
+            col = np.full(len(union), np.nan, dtype=np.float64)
+            col[pos] = values
+            col_codes = np.full(len(union), -1, dtype=np.int16)
+            col_codes[pos] = codes
+        data[col_name + suffix] = col
+        data[col_name + "_cd" + suffix] = pd.Categorical.from_codes(col_codes, categories=categories)
 
-    return merged_df
+    return pd.DataFrame(data)
 
 
 def download_daily_q_nwis(
         site:str = '14105700', 
         start = '1820-01-01', 
-        end='2024-12-31'
+        end='2024-12-31',
+        session:requests.Session = None,
         )->pd.DataFrame:
 
-    response = requests.get(
-        "https://waterservices.usgs.gov/nwis/dv", 
+    response = (session or requests).get(
+        f"{NWIS_URL}/dv", 
         params={'format': 'json', 'parameterCd': '00060', 'sites': site, 'startDT': start, 'endDT': end, 'multi_index': None}, 
         headers={"user-agent": f"python-dataretrieval/1.0.11"}, verify=True)
 
     if response.status_code in [400, 404, 414]:
         raise ValueError(f"Bad Request, check that your parameters are correct. URL: {response.url}")
 
+    # failed even after retrying, so this site should not be saved as empty
+    if response.status_code in RETRY_STATUS:
+        response.raise_for_status()
+
     try:
         site_data = _read_json(response.json())
     except JSONDecodeError:
@@ -788,20 +1027,12 @@ def download_daily_q_nwis(
 
 def download_daily_record(
         site:str,
+        session:requests.Session = None,
+        start:str = DAILY_START,
+        end:str = DAILY_END,
         )->pd.Series:
 
-    # todo: should we store the data in csv files so that we don't have to download it again?
-    # but using 110 cores for all 12004 sites takes around 5 minutes which is not that bad
-    # given that it has to happen only once!
-    #fpath = os.path.join(path, f"{site}.csv")
-
-    # if os.path.exists(fpath):
-    #     return pd.read_csv(fpath, index_col=0)
-
-    site_data = download_daily_q_nwis(site, 
-                    start="1820-01-01",  # DAILY_START
-                    end="2024-12-31",    # DAILY_END
-                    )
+    site_data = download_daily_q_nwis(site, start=start, end=end, session=session)
     if f'00060_Mean' in site_data.columns:
         # get data for stations which have A in 00060_Mean_cd column
         site_data = site_data[site_data['00060_Mean_cd'].isin(["A", "A, e"])]
@@ -931,12 +1162,15 @@ def _read_rdb(rdb):
     df = format_response(df)
     return df
 
-def _download_metadata(site:str)->pd.DataFrame:
-    response = requests.get(
-        'https://waterservices.usgs.gov/nwis/site', 
+def _download_metadata(site:str, session:requests.Session = None)->pd.DataFrame:
+    response = (session or requests).get(
+        f'{NWIS_URL}/site', 
         params={'sites': site, 'parameterCd': '00060', 'siteOutput': 'Expanded', 'format': 'rdb'}, 
         headers={'user-agent': 'python-dataretrieval/1.0.11'}, 
         verify=True
         )
 
+    if response.status_code in RETRY_STATUS:
+        response.raise_for_status()
+
     return _read_rdb(response.text)
@@ -1,4 +1,5 @@
 import os
+import json
 import time
 import random
 import warnings
@@ -16,6 +17,7 @@ from ..utils import check_attributes, get_cpus
 from .._geom_utils import (
     _make_boundary_2d
 )
+from .._spatial import StationIndex, BoundaryStore, CatchmentIndex, DETAIL_TOLERANCES
 
 from ._map import (
     catchment_area,
@@ -119,6 +121,9 @@ class _RainfallRunoff(Datasets):
 
         self.bndry_id_map = {}
         self.timestep = timestep
+        self._stn_index = None
+        self._bndry_store = None
+        self._catch_index = None
 
         if netCDF4 is None:
             if to_netcdf:
@@ -525,6 +530,47 @@ class _RainfallRunoff(Datasets):
             en = pd.Timestamp(en)
         return st, en
 
+    def update(self, en=None) -> dict:
+        """
+        Appends the observations made after the last stored time step to the
+        downloaded data. Only the missing interval is requested and the existing
+        data is not rewritten. Every update is recorded in :py:attr:`update_manifest_fpath`.
+        This is only possible for datasets which are downloaded from live web services.
+
+        Parameters
+        ----------
+        en : str
+            last time step to request. By default it is yesterday.
+
+        Returns
+        -------
+        dict
+            the entry of this update in the manifest
+        """
+        raise NotImplementedError(f"{self.name} is released as an archive and can not be updated")
+
+    @property
+    def update_manifest_fpath(self) -> os.PathLike:
+        """path of the file which records one json line for every call to :py:meth:`update`"""
+        return os.path.join(self.path, 'update_manifest.jsonl')
+
+    def update_history(self) -> pd.DataFrame:
+        """returns the updates recorded in :py:attr:`update_manifest_fpath`, one row per update"""
+        if not os.path.exists(self.update_manifest_fpath):
+            return pd.DataFrame()
+        return pd.read_json(self.update_manifest_fpath, lines=True, convert_dates=False)
+
+    def _record_update(self, **entry) -> dict:
+        """appends an entry to the manifest"""
+        entry = {'time': pd.Timestamp.now().isoformat(timespec='seconds'), **entry}
+        with open(self.update_manifest_fpath, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+        if self.verbosity:
+            print(f"appended {entry.get('rows', 0)} values of {entry.get('updated', 0)} stations "
+                  f"until {entry.get('end')}")
+        return entry
+
     @property
     def camels_dir(self):
         """Directory where all camels datasets will be saved. This will under
@@ -1097,6 +1143,255 @@ class _RainfallRunoff(Datasets):
         """
         return xyz
 
+    def station_index(self) -> StationIndex:
+        """
+        Spatial index built from coordinates of all stations. The index is 
+        built only once and then cached for this dataset.
+
+        Returns
+        -------
+        StationIndex
+        """
+        if self._stn_index is None:
+            coords = self.stn_coords()
+            self._stn_index = StationIndex(
+                coords.index.tolist(),
+                coords['lat'].values,
+                coords['long'].values)
+        return self._stn_index
+
+    def nearest_stations(
+            self,
+            lat: Union[float, np.ndarray],
+            lon: Union[float, np.ndarray],
+            k: int = 1,
+    ) -> pd.DataFrame:
+        """
+        finds ``k`` nearest stations to a point or to each of many points.
+
+        Parameters
+        ----------
+        lat : float/array
+            latitude of query point(s) in degrees
+        lon : float/array
+            longitude of query point(s) in degrees
+        k : int (default=1)
+            number of nearest stations to find for each point
+
+        Returns
+        -------
+        pd.DataFrame
+            a :obj:`pandas.DataFrame` with ``lat``, ``long`` and ``distance_km`` columns
+            sorted by distance. The index consists of station ids. If ``lat`` and ``lon``
+            are arrays, then the index is a :obj:`pandas.MultiIndex` with ``query``
+            (position of query point) and ``station`` as levels.
+
+        Examples
+        --------
+        >>> from aqua_fetch import CAMELS_CH
+        >>> dataset = CAMELS_CH()
+        >>> dataset.nearest_stations(46.9, 7.4, k=5)
+        ... # 3 nearest stations to each of the two points
+        >>> dataset.nearest_stations([46.9, 47.3], [7.4, 8.5], k=3)
+        """
+        index = self.station_index()
+        distances, positions = index.nearest(lat, lon, k=k)
+        return _station_query_result(index, list(positions), list(distances), np.ndim(lat) > 0)
+
+    def stations_within(
+            self,
+            lat: Union[float, np.ndarray],
+            lon: Union[float, np.ndarray],
+            radius_km: float,
+    ) -> pd.DataFrame:
+        """
+        finds all stations within ``radius_km`` of a point or of each of many points.
+
+        Parameters
+        ----------
+        lat : float/array
+            latitude of query point(s) in degrees
+        lon : float/array
+            longitude of query point(s) in degrees
+        radius_km : float
+            search radius in kilometers
+
+        Returns
+        -------
+        pd.DataFrame
+            a :obj:`pandas.DataFrame` with ``lat``, ``long`` and ``distance_km`` columns
+            sorted by distance. The index consists of station ids. If ``lat`` and ``lon``
+            are arrays, then the index is a :obj:`pandas.MultiIndex` with ``query``
+            (position of query point) and ``station`` as levels.
+
+        Examples
+        --------
+        >>> from aqua_fetch import CAMELS_CH
+        >>> dataset = CAMELS_CH()
+        >>> dataset.stations_within(46.9, 7.4, radius_km=50)
+        """
+        index = self.station_index()
+        distances, positions = index.within(lat, lon, radius_km=radius_km)
+        return _station_query_result(index, positions, distances, np.ndim(lat) > 0)
+
+    def stations_in_bbox(
+            self,
+            lat_min: Union[float, np.ndarray],
+            lat_max: Union[float, np.ndarray],
+            lon_min: Union[float, np.ndarray],
+            lon_max: Union[float, np.ndarray],
+    ) -> pd.DataFrame:
+        """
+        finds all stations inside a bounding box or inside each of many bounding boxes.
+        If ``lon_min`` is larger than ``lon_max``, the box crosses the antimeridian.
+
+        Parameters
+        ----------
+        lat_min : float/array
+            southern edge of box(es) in degrees
+        lat_max : float/array
+            northern edge of box(es) in degrees
+        lon_min : float/array
+            western edge of box(es) in degrees
+        lon_max : float/array
+            eastern edge of box(es) in degrees
+
+        Returns
+        -------
+        pd.DataFrame
+            a :obj:`pandas.DataFrame` with ``lat`` and ``long`` columns whose index 
+            consists of station ids. If arrays are given, then the index is a
+            :obj:`pandas.MultiIndex` with ``query`` (position of box) and ``station`` 
+            as levels.
+
+        Examples
+        --------
+        >>> from aqua_fetch import CAMELS_CH
+        >>> dataset = CAMELS_CH()
+        >>> dataset.stations_in_bbox(46.5, 47.0, 7.0, 8.0)
+        """
+        index = self.station_index()
+        positions = index.in_bbox(lat_min, lat_max, lon_min, lon_max)
+        return _station_query_result(index, positions, None, np.ndim(lat_min) > 0)
+
+    def __getstate__(self):
+        # the boundary store can be large and is not needed by the workers
+        # of process pools to which the bound methods of dataset are sent
+        state = self.__dict__.copy()
+        state['_bndry_store'] = None
+        state['_catch_index'] = None
+        return state
+
+    @property
+    def boundary_store_fpath(self) -> os.PathLike:
+        """path of .npz file which stores boundaries of all catchments as flat arrays"""
+        return os.path.join(self.path, f"{self.name.lower()}_boundaries.npz")
+
+    def boundary_store(self) -> BoundaryStore:
+        """
+        Boundaries of all catchments as :py:class:`BoundaryStore`. The store is
+        created by reading the boundary of each station only once and then saved
+        in the dataset directory. Subsequent calls read the saved .npz file.
+        Simplified boundaries for each level of detail (see ``DETAIL_TOLERANCES``)
+        are also computed once and saved in the same store.
+
+        Returns
+        -------
+        BoundaryStore
+        """
+        if self._bndry_store is not None:
+            return self._bndry_store
+
+        if os.path.exists(self.boundary_store_fpath) and not self.overwrite:
+            self._bndry_store = BoundaryStore.load(self.boundary_store_fpath)
+            if any(detail not in self._bndry_store.levels for detail in DETAIL_TOLERANCES):
+                # store was created without (some) levels of detail
+                self._bndry_store.add_detail_levels()
+                self._bndry_store.save(self.boundary_store_fpath)
+            return self._bndry_store
+
+        if self.verbosity:
+            print(f"creating boundary store at {self.boundary_store_fpath}")
+
+        stations, geometries = [], []
+        for stn in self.stations():
+            try:
+                geometry = self.get_boundary(stn)
+            except KeyError:
+                if self.verbosity > 1:
+                    print(f"boundary of {stn} is not available")
+                continue
+            stations.append(stn)
+            geometries.append(geometry)
+
+        self._bndry_store = BoundaryStore.from_geometries(stations, geometries)
+        self._bndry_store.add_detail_levels()
+        self._bndry_store.save(self.boundary_store_fpath)
+        return self._bndry_store
+
+    def catchments_containing(
+            self,
+            lat: float,
+            lon: float,
+    ) -> List[str]:
+        """
+        finds the catchments which contain a point e.g. a water quality
+        sampling site or a reservoir. Nested catchments are all returned.
+
+        Parameters
+        ----------
+        lat : float
+            latitude of the point in degrees
+        lon : float
+            longitude of the point in degrees
+
+        Returns
+        -------
+        list
+            ids of catchments containing the point, ordered by area so that
+            the smallest (most downstream nested) catchment comes first.
+
+        Examples
+        --------
+        >>> from aqua_fetch import CAMELS_CH
+        >>> dataset = CAMELS_CH()
+        >>> dataset.catchments_containing(46.9, 7.4)
+        """
+        return self.catchments_containing_points([lat], [lon])[0]
+
+    def catchments_containing_points(
+            self,
+            lat: np.ndarray,
+            lon: np.ndarray,
+    ) -> List[List[str]]:
+        """
+        batch version of :meth:`catchments_containing` for many points.
+
+        Parameters
+        ----------
+        lat : array
+            latitudes of points in degrees
+        lon : array
+            longitudes of points in degrees
+
+        Returns
+        -------
+        list
+            a list with one list of catchment ids (ordered by area) for each point
+
+        Examples
+        --------
+        >>> from aqua_fetch import CAMELS_CH
+        >>> dataset = CAMELS_CH()
+        >>> dataset.catchments_containing_points([46.9, 47.3], [7.4, 8.5])
+        """
+        if self._catch_index is None:
+            self._catch_index = CatchmentIndex(self.boundary_store())
+
+        positions = self._catch_index.containing(lat, lon)
+        ids = self._catch_index.store.ids
+        return [ids[pos].tolist() for pos in positions]
+
     def get_boundary(
             self,
             catchment_id: str,
@@ -1122,22 +1417,14 @@ class _RainfallRunoff(Datasets):
 
         assert isinstance(catchment_id, str), f"catchment_id must be string but is of type {type(catchment_id)}"
 
-        # todo : when we repeatedly call get_boundary, we should not create the 
-        # boundary_id_map for all catchments again
-        if self.name in ['Thailand', 'Japan', 'Arcticnet', 'Spain']:
-            bndry_id_map = self.gsha._create_boundary_id_map()
-        elif self.name in ['USGS']:
-            bndry_id_map = self.hysets._create_boundary_id_map()            
+        # the boundary_id_map is created only once and then reused
+        if self.name in ['USGS']:
+            bndry_id_map = self.hysets.bndry_id_map or self.hysets._create_boundary_id_map()
         else:
-            bndry_id_map = self._create_boundary_id_map()
+            bndry_id_map = self.bndry_id_map or self._create_boundary_id_map()
 
         if self.name in ['HYSETS']:
             catchment_id = self.WatershedID_OfficialID_map[catchment_id]
-        elif self.name == 'Thailand':
-            catchment_id = catchment_id.replace('.', '_')
-        
-        if self.name in ['Thailand', 'Japan', 'Arcticnet', 'Spain']:
-            catchment_id = f"{catchment_id}_{self.agency_name}"
 
         geometry = bndry_id_map[catchment_id]
 
@@ -1149,6 +1436,7 @@ class _RainfallRunoff(Datasets):
             self,
             catchment_id: str,
             show_outlet:bool = False,
+            detail: str = 'full',
             ax: plt_Axes = None,
             show: bool = True,
             **kwargs
@@ -1162,6 +1450,10 @@ class _RainfallRunoff(Datasets):
             name/id of catchment to plot
         show_outlet : bool, optional (default=False)
             if True, then outlet of the catchment will be plotted as a red dot
+        detail : str, optional (default='full')
+            level of detail of the boundary. It can be ``full``, ``medium``
+            or ``low``. Other than ``full``, simplified boundaries from 
+            :meth:`boundary_store` are used which are much faster to plot.
         ax : plt.Axes
             matplotlib axes to draw the plot. If not given, then
             new axes will be created.
@@ -1183,11 +1475,16 @@ class _RainfallRunoff(Datasets):
         >>> plt.show()
         # show the outlet as well
         >>> CAMELS_AUS.plot_catchment('912101A', show_outlet=True)
+        # plot the simplified boundary
+        >>> CAMELS_AUS.plot_catchment('912101A', detail='low')
 
         """
-        geometry = self.get_boundary(catchment_id)
+        if detail == 'full':
+            geometry = self.get_boundary(catchment_id)
 
-        rings:List[np.ndarray] = _make_boundary_2d(geometry)
+            rings:List[np.ndarray] = _make_boundary_2d(geometry)
+        else:
+            rings = self.boundary_store().rings(catchment_id, detail=detail)
 
         _kws = dict(
             ax_kws=dict(xlabel="Longitude", ylabel="Latitude")
@@ -1210,6 +1507,94 @@ class _RainfallRunoff(Datasets):
             plt.show()
         return ax
 
+    def plot_catchments(
+            self,
+            stations: Union[str, List[str]] = 'all',
+            detail: str = 'low',
+            ax: plt_Axes = None,
+            show: bool = True,
+            **kwargs
+    ) -> plt_Axes:
+        """
+        plots boundaries of many catchments at once. All the rings are drawn as
+        a single :obj:`matplotlib.collections.LineCollection` which is much faster
+        than plotting each ring separately.
+
+        Parameters
+        ----------
+        stations : str/list (default='all')
+            names/ids of catchments to plot. By default all catchments are plotted.
+        detail : str, optional (default='low')
+            level of detail of the boundaries. It can be ``full``, ``medium`` or ``low``.
+        ax : plt.Axes
+            matplotlib axes to draw the plot. If not given, then
+            new axes will be created.
+        show : bool
+        **kwargs
+            any keyword arguments for :obj:`matplotlib.collections.LineCollection`
+            such as ``color`` or ``linewidth``
+
+        Returns
+        -------
+        plt.Axes
+
+        Examples
+        --------
+        >>> from aqua_fetch import CAMELS_AUS
+        >>> dataset = CAMELS_AUS()
+        >>> dataset.plot_catchments()
+        >>> dataset.plot_catchments(['912101A', '912105A'], detail='full', color='k')
+        """
+        from matplotlib.collections import LineCollection
+
+        store = self.boundary_store()
+        stations = check_attributes(stations, self.stations(), 'stations')
+
+        segments = []
+        for stn in stations:
+            if stn in store:
+                segments.extend(store.rings(stn, detail=detail))
+
+        if ax is None:
+            _, ax = plt.subplots()
+
+        _kws = dict(linewidth=0.5)
+        _kws.update(kwargs)
+
+        ax.add_collection(LineCollection(segments, **_kws))
+        ax.autoscale_view()
+        ax.set_xlabel("Longitude")
+        ax.set_ylabel("Latitude")
+        ax.set_title(f"{self.name} Catchments (n={len(stations)})")
+
+        if show:
+            plt.show()
+        return ax
+
+
+def _station_query_result(
+        index: StationIndex,
+        positions: List[np.ndarray],
+        distances: Union[List[np.ndarray], None],
+        batch: bool
+) -> pd.DataFrame:
+    """puts the results of :py:class:`StationIndex` queries into a DataFrame"""
+    lengths = [len(pos) for pos in positions]
+    pos = np.concatenate(positions).astype(np.int64) if positions else np.array([], dtype=np.int64)
+
+    data = {'lat': index.lat[pos], 'long': index.lon[pos]}
+    if distances is not None:
+        data['distance_km'] = np.concatenate(distances) if distances else np.array([])
+
+    if batch:
+        df_index = pd.MultiIndex.from_arrays(
+            [np.repeat(np.arange(len(positions)), lengths), index.ids[pos]],
+            names=['query', 'station'])
+    else:
+        df_index = pd.Index(index.ids[pos], name='station')
+
+    return pd.DataFrame(data, index=df_index)
+
 
 def _handle_dynamic(
         dyn, 
@@ -0,0 +1,80 @@
+"""
+compares the conversion of LamaHCE csv files into netcdf files by reading the
+stations once per dynamic feature (previous implementation) with the
+conversion which reads every station only once. Then compares reading all the
+stations from one file per feature followed by xr.concat (previous implementation)
+with reading from the single stacked file.
+
+    python benchmarks/lamah_to_netcdf.py --stations 24 --timestep D
+    python benchmarks/lamah_to_netcdf.py --stations 4 --timestep H
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# add the parent directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, wd_dir)
+
+import xarray as xr
+
+from tests.rr.test_lamah_netcdf import make_lamahce, make_dataset
+
+
+def per_feature(ds, fdir):
+    """previous implementation of LamaHCE._maybe_to_netcdf"""
+    fdir = os.path.join(ds.path, fdir)
+    os.makedirs(fdir, exist_ok=True)
+    for feature in ds.dynamic_features:
+        _, data = ds.fetch(static_features=None, dynamic_features=feature)
+        data.to_netcdf(os.path.join(fdir, f"{feature}.nc"))
+    return
+
+
+def single_pass(ds, fdir):
+    # the stacked file is read from its default location
+    ds._maybe_to_netcdf(fdir=f"{ds.data_type}_{ds.timestep}")
+    return
+
+
+def read_per_feature(ds, fdir):
+    """previous implementation of LamaHCE._make_ds_from_ncs"""
+    dyns = []
+    for f in ds.dynamic_features:
+        dyn = xr.open_dataset(os.path.join(ds.path, fdir, f'{f}.nc'))
+        dyns.append(dyn[ds.stations()].sel(time=slice(None, None)))
+    return xr.concat(dyns, dim='dynamic_features').load()
+
+
+def read_stacked(ds, fdir):
+    return ds._make_ds_from_ncs(ds.dynamic_features, ds.stations(), None, None)
+
+
+def main(num_stations: int, timestep: str, processes: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_lamahce(tmpdir, [str(i) for i in range(1, num_stations + 1)], timestep=timestep)
+
+        for fn in [per_feature, single_pass]:
+            ds = make_dataset(tmpdir, timestep=timestep, processes=processes)
+            start = time.perf_counter()
+            fn(ds, f'{fn.__name__}_{timestep}')
+            print(f"{fn.__name__:<16} {time.perf_counter() - start:8.2f} seconds")
+
+        for fn, fdir in [(read_per_feature, 'per_feature'), (read_stacked, 'single_pass')]:
+            ds = make_dataset(tmpdir, timestep=timestep, processes=processes)
+            start = time.perf_counter()
+            fn(ds, f'{fdir}_{timestep}')
+            print(f"{fn.__name__:<16} {time.perf_counter() - start:8.2f} seconds")
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stations', type=int, default=24)
+    parser.add_argument('--timestep', default='D', choices=['D', 'H'])
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+    main(args.stations, args.timestep, args.processes)
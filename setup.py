@@ -28,6 +28,9 @@ extra_requires = [
 # maybe manually download the wheel file and install
 "fiona<=1.10.1", # processing of shapefiles in mtropics
 
+# spatial index of stations (optional, numpy is used otherwise)
+'scipy',
+
 # for reading data
 'netCDF4',
 'xarray<2025.1.0',  # xarray 2025.1.1 is causing to_netcdf error
@@ -0,0 +1,36 @@
+"""
+helpers to create datasets from the small files which the tests write in a
+temporary directory, so that the tests do not download anything.
+"""
+
+from aqua_fetch.rr.utils import _RainfallRunoff
+
+
+def make_dataset(cls, path, attrs: dict = None, verbosity: int = 0, **kwargs):
+    """
+    creates an instance of ``cls`` whose files are in ``path``. The constructor
+    of :class:`_RainfallRunoff` is called so that the instance has all the
+    attributes of a dataset, but the constructor of ``cls`` is not called because
+    it downloads the files which are missing. The attributes which the constructor
+    of ``cls`` would have set are given as ``attrs``.
+
+    Parameters
+    ----------
+    cls : type
+        the class of dataset e.g. :class:`aqua_fetch.GSHA`
+    path : str
+        directory of the files of the dataset
+    attrs : dict
+        attributes which are set after the construction
+    verbosity : int
+    **kwargs :
+        keyword arguments for the constructor of :class:`_RainfallRunoff`
+        e.g. ``timestep``, ``to_netcdf`` or ``processes``
+    """
+    ds = cls.__new__(cls)
+    _RainfallRunoff.__init__(ds, path=path, verbosity=verbosity, **kwargs)
+    # the path setter appends the name of dataset to path
+    ds._path = path
+    for name, value in (attrs or {}).items():
+        setattr(ds, name, value)
+    return ds
@@ -0,0 +1,136 @@
+
+import os
+import site
+# add the aqua_fetch directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4
+
+from aqua_fetch import CAMELSH
+
+
+def write_nc(fpath, tdim, start, num_t, variables):
+    with netCDF4.Dataset(fpath, 'w') as nc:
+        nc.createDimension(tdim, num_t)
+        t = nc.createVariable(tdim, 'f8', (tdim,))
+        t.units = 'hours since 1980-01-01 00:00:00'
+        t[:] = np.arange(num_t) + (pd.Timestamp(start) - pd.Timestamp('1980-01-01')) // pd.Timedelta('1h')
+        for name, values in variables.items():
+            v = nc.createVariable(name, 'f4', (tdim,), fill_value=-9999.0)
+            v[:] = values
+    return
+
+
+def make_camelsh(path, stations):
+    """writes files with same layout as CAMELSH in path/CAMELSH"""
+    path = os.path.join(path, 'CAMELSH')
+    h2 = os.path.join(path, 'Hourly2', 'Hourly2')
+    nonobs = os.path.join(path, 'timeseries_nonobs', 'Data', 'CAMELSH', 'timeseries_nonobs')
+    obs = os.path.join(path, 'timeseries', 'Data', 'CAMELSH', 'timeseries')
+    for d in [h2, nonobs, obs]:
+        os.makedirs(d)
+
+    # the downloaded files are present and unzipped so that CAMELSH downloads nothing
+    for fname in CAMELSH.url:
+        os.makedirs(os.path.join(path, fname.split('.')[0]), exist_ok=True)
+        open(os.path.join(path, fname), 'wb').close()
+
+    for s, stn in enumerate(stations):
+        num_t = 24 * 60
+        q = np.arange(num_t, dtype=np.float32) + s * 10000
+        q[5] = np.nan
+        # streamflow starts one day later than forcing
+        write_nc(os.path.join(h2, f'{stn}_hourly.nc'), 'time', '1980-01-02', num_t,
+                 {'streamflow': q, 'water_level': q / 10})
+
+        forcing = {name: np.arange(num_t, dtype=np.float32) * k + s for k, name in
+                   enumerate(['Tair', 'Rainf', 'PotEvap', 'SWdown', 'Streamflow'], start=1)}
+        # forcing of third station starts one day earlier than others
+        write_nc(os.path.join(nonobs if s % 2 == 0 else obs, f'{stn}.nc'), 'DateTime',
+                 '1979-12-31' if s == 2 else '1980-01-01', num_t, forcing)
+    return
+
+
+def make_dataset(path, processes=2):
+    return CAMELSH(path=path, to_netcdf=False, processes=processes, verbosity=0)
+
+
+def read_xr(ds, stn):
+    """previous implementation of CAMELSH._read_stn_dyn"""
+    df = xr.merge([ds._read_stn_q(stn), ds._read_stn_forcing(stn)]).to_pandas()
+    return df.rename(columns=ds.dyn_map)
+
+
+class TestBatchedRead(unittest.TestCase):
+
+    stations = ['01010000', '01013500', '02342070', '14316700']
+
+    def test_features(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_camelsh(tmpdir, self.stations)
+            ds = make_dataset(tmpdir)
+            self.assertEqual(sorted(ds.stations()), sorted(self.stations))
+            self.assertEqual(ds.dynamic_features, ['q_cms_obs', 'water_level', 'airtemp_C_mean', 'pcp_mm',
+                                                   'pet_mm', 'SWdown'])
+            # forcing of third station starts on 1979-12-31 and streamflow ends 60 days after 1980-01-02
+            self.assertEqual(ds.start, pd.Timestamp('1979-12-31 00:00'))
+            self.assertEqual(ds.end, pd.Timestamp('1980-03-01 23:00'))
+
+            spans = ds.time_spans()
+            self.assertEqual(spans.index.tolist(), ds.stations())
+            self.assertEqual(spans.loc['01010000', 'start'], pd.Timestamp('1980-01-01 00:00'))
+            self.assertEqual(spans.loc['02342070', 'start'], pd.Timestamp('1979-12-31 00:00'))
+
+            # the spans are read from the saved file once the headers have been read
+            self.assertTrue(os.path.exists(os.path.join(ds.path, 'time_spans.csv')))
+            os.remove(os.path.join(ds.h2_path, '02342070_hourly.nc'))
+            ds._CAMELSH__stations = self.stations[:2] + self.stations[3:]
+            pd.testing.assert_frame_equal(ds.time_spans(), spans.loc[ds.stations()])
+        return
+
+    def test_fetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_camelsh(tmpdir, self.stations)
+            for processes in [1, 3]:
+                ds = make_dataset(tmpdir, processes=processes)
+                _, dyn = ds.fetch_stations_features(self.stations, st='1980-01-01', en='1980-03-31',
+                                                    as_dataframe=True)
+                for stn in self.stations:
+                    exp = read_xr(ds, stn).reindex(dyn[stn].index)[ds.dynamic_features]
+                    pd.testing.assert_frame_equal(dyn[stn], exp, check_dtype=False, check_freq=False,
+                                                  check_names=False)
+                    self.assertTrue(np.isnan(dyn[stn].loc['1980-01-02 05:00', 'q_cms_obs']))
+                    self.assertTrue(dyn[stn].loc['1980-03-02':].isna().all().all())
+        return
+
+    def test_window(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_camelsh(tmpdir, self.stations)
+            ds = make_dataset(tmpdir)
+            features = ['pcp_mm', 'q_cms_obs']
+            _, dyn = ds.fetch_stations_features(['14316700', '01010000'], features, st='1980-01-02 10:00',
+                                                en='1980-01-03')
+            self.assertIsInstance(dyn, xr.Dataset)
+            self.assertEqual(list(dyn.data_vars), ['14316700', '01010000'])
+            da = dyn['14316700']
+            self.assertEqual(da.dims, ('time', 'dynamic_features'))
+            self.assertEqual(da.shape, (15, 2))
+            np.testing.assert_array_equal(da.sel(dynamic_features='q_cms_obs').values, 30000 + np.arange(10, 25))
+            np.testing.assert_array_equal(da.sel(dynamic_features='pcp_mm').values, (np.arange(34, 49) * 2) + 3)
+
+            df = ds.fetch_dynamic_features('01013500', 'q_cms_obs', st='1980-01-02', en='1980-01-02 02:00',
+                                           as_dataframe=True)['01013500']
+            np.testing.assert_array_equal(df.values.ravel(), 10000 + np.arange(3))
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,497 @@
+
+import os
+import site
+# add the aqua_fetch directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import io
+import zipfile
+import tempfile
+import threading
+import warnings
+import tracemalloc
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+import netCDF4
+
+from aqua_fetch import EStreams
+from aqua_fetch import Finland
+from aqua_fetch import Ireland
+from aqua_fetch import Italy
+from aqua_fetch.rr import _estreams
+from aqua_fetch.rr._estreams import _download_epa_stn_data, _download_opw_stn_data
+from aqua_fetch.rr._estreams import parse_waterml_values
+
+from tests.rr.fixtures import make_dataset as _make_dataset
+
+
+COLUMNS = ['p_mean', 't_mean', 't_min', 't_max', 'sp_min', 'rh_mean', 'ws_mean', 'swr_mean', 'pet_mean']
+
+
+def make_estreams(path, stations):
+    """writes meteorological csv files with same layout as EStreams"""
+    met_dir = os.path.join(path, 'EStreams', 'EStreams', 'meteorology')
+    os.makedirs(met_dir)
+
+    time = pd.date_range('1950-01-01', '2023-06-30', freq='D')
+    for s, stn in enumerate(stations):
+        df = pd.DataFrame({col: value(s, np.arange(len(time)), k) for k, col in enumerate(COLUMNS)},
+                          index=pd.Index(time.strftime('%Y-%m-%d'), name='date'))
+        df.iloc[::11, 2] = np.nan
+        # the data of last station starts later
+        df = df.iloc[365:] if s == len(stations) - 1 else df
+        df.to_csv(os.path.join(met_dir, f'estreams_meteorology_{stn}.csv'))
+    return
+
+
+def value(s, t, k):
+    return (s * 100 + k + (t % 50) * 0.5).round(1)
+
+
+def make_dataset(path, stations, to_netcdf=True, processes=2):
+    ds = _make_dataset(EStreams, path, to_netcdf=to_netcdf, processes=processes, attrs={
+        '_stations': stations,
+        'md': pd.DataFrame({'gauge_country': [stn[:2] for stn in stations]}, index=stations)})
+    ds._dynamic_features = ds.meteo_data_station(stations[0]).columns.tolist()
+    return ds
+
+
+class TestMeteoStore(unittest.TestCase):
+
+    stations = ['IE01', 'IE02', 'FI01', 'FI02', 'IT01', 'IT02', 'IT03']
+
+    def _check(self, ds, csv):
+        nc = ds.meteo_data()
+
+        with netCDF4.Dataset(ds.meteo_store_fpath) as f:
+            self.assertEqual(int(f.complete), 1)
+            self.assertEqual(f.variables['data'].shape, (7, 26844, 9))
+
+        for stn in self.stations:
+            pd.testing.assert_frame_equal(
+                nc[stn].to_pandas().reindex(csv[stn].index), csv[stn],
+                check_dtype=False, check_freq=False, check_names=False)
+        self.assertTrue(np.isnan(nc['IT03'].sel(time='1950').values).all())
+        return
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_estreams(tmpdir, self.stations)
+            ds = make_dataset(tmpdir, self.stations, to_netcdf=False)
+            csv = ds.meteo_data()
+
+            ds.to_netcdf = True
+            ds.build_meteo_store(block_size=2)
+            self._check(ds, csv)
+        return
+
+    def test_one_process(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_estreams(tmpdir, self.stations)
+            ds = make_dataset(tmpdir, self.stations, processes=1)
+            csv = ds._meteo_csvs(self.stations)
+            # built at first call
+            self._check(ds, csv)
+        return
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_estreams(tmpdir, self.stations)
+            ds = make_dataset(tmpdir, self.stations, to_netcdf=False)
+            csv = ds.meteo_data()
+
+            ds.to_netcdf = True
+            ds.build_meteo_store(block_size=3)
+            # pretend that the conversion was interrupted after first block
+            with netCDF4.Dataset(ds.meteo_store_fpath, 'a') as nc:
+                nc.variables['data'][3:] = np.nan
+                nc.stations_done = 3
+                nc.complete = 0
+            ds.build_meteo_store(block_size=3)
+            self._check(ds, csv)
+        return
+
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_estreams(tmpdir, self.stations)
+            ds = make_dataset(tmpdir, self.stations)
+
+            features = ['pcp_mm', 'airtemp_C_mean']
+            time, data = ds._read_meteo(['IT02', 'IE01', 'IT02'], features, st='2000-01-01', en='2000-01-10')
+            self.assertEqual(data.shape, (3, 10, 2))
+            self.assertEqual(time[0], pd.Timestamp('2000-01-01'))
+            t = (time - pd.Timestamp('1950-01-01')).days.to_numpy()
+            np.testing.assert_allclose(data[0, :, 0], value(5, t, 0), atol=1e-4)
+            np.testing.assert_allclose(data[1, :, 1], value(0, t, 1), atol=1e-4)
+            np.testing.assert_array_equal(data[2], data[0])
+
+            self.assertEqual(len(ds.meteo_data(countries='IE')), 2)
+        return
+
+
+class TestFetchDynamicFeatures(unittest.TestCase):
+
+    stations = ['FI01', 'FI02', 'FI03', 'IE01']
+
+    def test_estreams(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_estreams(tmpdir, self.stations)
+            features = ['airtemp_C_min', 'pcp_mm']
+            out = {}
+            for to_netcdf in [False, True]:
+                ds = make_dataset(tmpdir, self.stations, to_netcdf=to_netcdf)
+                out[to_netcdf] = ds.fetch_dynamic_features(['IE01', 'FI02'], features, st='1950-01-01',
+                                                           en='1950-12-31', as_dataframe=True)
+                xds = ds.fetch_dynamic_features(countries='FI', dynamic_features=features)
+                self.assertEqual(list(xds.data_vars), ['FI01', 'FI02', 'FI03'])
+                self.assertEqual(xds['FI03'].shape, (26844, 2))
+
+            for stn in ['IE01', 'FI02']:
+                df = out[True][stn]
+                self.assertEqual(df.columns.tolist(), features)
+                self.assertEqual(df.shape, (365, 2))
+                pd.testing.assert_frame_equal(df, out[False][stn], check_freq=False)
+            # the data of last station starts later
+            self.assertTrue(out[True]['IE01'].isna().all().all())
+        return
+
+    def test_country(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_estreams(tmpdir, self.stations)
+
+            ds = _make_dataset(Finland, os.path.join(tmpdir, 'Finland'), attrs={
+                'estreams': make_dataset(tmpdir, self.stations), '_stations': ['FI01', 'FI02', 'FI03']})
+
+            # streamflow of FI02 is not available
+            time = pd.date_range('2000-01-01', '2024-06-30', freq='D')
+            q = pd.DataFrame({'FI03': np.arange(len(time)) * 1.0, 'FI01': 5.0},
+                             index=pd.Index(time, name='index'))
+            os.makedirs(ds.path)
+            q.to_csv(os.path.join(ds.path, 'daily_q.csv'))
+
+            features = ['pcp_mm', 'q_cms_obs']
+            st, en = '1999-12-30', '2000-01-04'
+            _, dfs = ds.fetch_stations_features(['FI03', 'FI02', 'FI01'], features, st=st, en=en,
+                                                as_dataframe=True)
+            df = dfs['FI03']
+            self.assertEqual(df.columns.tolist(), features)
+            self.assertEqual(len(df), 6)
+            np.testing.assert_array_equal(df['q_cms_obs'].values, [np.nan, np.nan, 0, 1, 2, 3])
+            t = (df.index - pd.Timestamp('1950-01-01')).days.to_numpy()
+            np.testing.assert_allclose(df['pcp_mm'].values, value(2, t, 0), atol=1e-4)
+            self.assertTrue(dfs['FI02']['q_cms_obs'].isna().all())
+            self.assertTrue((dfs['FI01'].loc['2000', 'q_cms_obs'] == 5.0).all())
+
+            _, xds = ds.fetch_stations_features(['FI01', 'FI03'], 'q_cms_obs', st=st, en=en)
+            self.assertEqual(xds['FI03'].dims, ('time', 'dynamic_features'))
+            np.testing.assert_array_equal(xds['FI03'].values[:, 0], df['q_cms_obs'].values)
+        return
+
+
+
+class LiveFinland(Finland):
+    """Finland whose web service is replaced by the dataframe ``live``"""
+
+    def _download_q(self, st, en):
+        self.requested.append((st, en))
+        return self.live.loc[st:en]
+
+
+class TestUpdate(unittest.TestCase):
+
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ds = _make_dataset(LiveFinland, tmpdir, name='Finland', attrs={'requested': []})
+
+            time = pd.date_range('2024-12-01', '2025-01-10', freq='D')
+            ds.live = pd.DataFrame({'FI02': np.arange(len(time)) * 1.5, 'FI01': 3.0, 'FI99': 1.0}, index=time)
+            # no data of last day is available yet
+            ds.live.iloc[-1, :2] = np.nan
+            ds.live.loc['2024-12-28', 'FI02'] = np.nan
+
+            ds.live.loc[:'2024-12-25', ['FI01', 'FI02']].to_csv(ds.q_csv_fpath, index_label="index")
+            with open(ds.q_csv_fpath, 'rb') as f:
+                before = f.read()
+
+            entry = ds.update(en='2025-01-10')
+            self.assertEqual(ds.requested, [(pd.Timestamp('2024-12-26'), pd.Timestamp('2025-01-10'))])
+            self.assertEqual((entry['stations'], entry['updated'], entry['rows']), (2, 2, 15 + 14))
+
+            # existing rows are not rewritten
+            with open(ds.q_csv_fpath, 'rb') as f:
+                self.assertTrue(f.read().startswith(before))
+
+            q = ds.get_q()
+            self.assertEqual(q.columns.tolist(), ['FI01', 'FI02'])
+            self.assertEqual(q.index[-1], pd.Timestamp('2025-01-09'))
+            pd.testing.assert_frame_equal(q, ds.live.loc[:'2025-01-09', ['FI01', 'FI02']],
+                                          check_dtype=False, check_names=False, check_freq=False)
+
+            # the day without data is requested again
+            ds.update(en='2025-01-10')
+            self.assertEqual(ds.requested[-1][0], pd.Timestamp('2025-01-10'))
+            self.assertEqual(len(ds.update_history()), 2)
+        return
+
+
+def zipped(text):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('data.csv', text)
+    return buffer.getvalue()
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """serves server.files and responds with 404 for other paths"""
+
+    def do_GET(self):
+        self.server.hits[self.path] += 1
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class TestIreland(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+        self.server.hits = Counter()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.urls = _estreams.EPA_URL, _estreams.OPW_URL
+        _estreams.EPA_URL, _estreams.OPW_URL = f'{url}/epa', f'{url}/opw/0'
+
+        # EPA stations are published under different regional offices
+        epa = "# comment\n2000-01-01 09:00:00;1.5;Good\n2000-01-02 09:00:00;2.5;Unchecked\n2000-01-03 09:00:00;3.5;Good\n"
+        self.server.files = {
+            '/epa/KIK/1001/Q/complete_daymean.zip': zipped(epa),
+            '/epa/DUB/1002/Q/complete_daymean.zip': zipped(epa.replace('1.5', '7.5')),
+            '/opw/0/2001/Q/Discharge_complete.zip': zipped(
+                "# comment\n2000-01-01T00:00:00.000Z;4.0;31\n2000-01-01T12:00:00.000Z;6.0;31\n"
+                "2000-01-02T00:00:00.000Z;9.0;96\n"),
+        }
+        return
+
+    def tearDown(self):
+        _estreams.EPA_URL, _estreams.OPW_URL = self.urls
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def make_dataset(self, path):
+        return _make_dataset(Ireland, path, processes=2)
+
+    def test_download(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ds = self.make_dataset(tmpdir)
+
+            epa = ds._download_stations(_download_epa_stn_data, ['1001', '1002', '1003'], 'EPA')
+            self.assertEqual([val[1] for val in epa], [0, 0, 1])
+            np.testing.assert_array_equal(epa[0][0].values, [1.5, 3.5])
+            np.testing.assert_array_equal(epa[1][0].values, [7.5, 3.5])
+            self.assertEqual(len(epa[2][0]), 0)
+
+            opw = ds._download_stations(_download_opw_stn_data, ['2001'], 'OPW')
+            np.testing.assert_array_equal(opw[0].values, [5.0])
+            self.assertEqual(opw[0].index[0], pd.Timestamp('2000-01-01'))
+
+            # second download requests only the urls found earlier
+            self.server.hits.clear()
+            ds._download_stations(_download_epa_stn_data, ['1001', '1002', '1003'], 'EPA')
+            self.assertEqual(sorted(self.server.hits), ['/epa/DUB/1002/Q/complete_daymean.zip',
+                                                        '/epa/KIK/1001/Q/complete_daymean.zip'])
+        return
+
+
+def waterml_parts(times, values):
+    """yields a WaterML 1.1 document in parts"""
+    yield ('<?xml version="1.0" encoding="utf-8"?>'
+           '<timeSeriesResponse xmlns="http://www.cuahsi.org/waterML/1.1/">'
+           '<queryInfo><creationTime>2024-01-01T00:00:00</creationTime></queryInfo>'
+           '<timeSeries><variable><variableCode>Discharge</variableCode>'
+           '<noDataValue>-9999</noDataValue></variable><values>')
+    for t, v in zip(times, values):
+        yield f'<value censorCode="nc" dateTime="{t}" qualityControlLevelCode="1">{v}</value>'
+    yield '<method methodID="1"/></values></timeSeries></timeSeriesResponse>'
+
+
+class LazyStream(io.RawIOBase):
+    """file-like object which generates the document while it is read"""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.buffer) < len(b):
+            part = next(self.parts, None)
+            if part is None:
+                break
+            self.buffer += part.encode()
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+def parse_waterml_reference(content):
+    """previous implementation of download_ispra_stn"""
+    root = ET.fromstring(content)
+    namespace = {'ns': 'http://www.cuahsi.org/waterML/1.1/'}
+    timeseries = []
+    for value in root.findall('.//ns:value', namespace):
+        timeseries.append({'dateTime': value.attrib['dateTime'], 'value': value.text})
+    df = pd.DataFrame(timeseries)
+    df.index = pd.to_datetime(df.pop('dateTime'))
+    return df['value']
+
+
+class ISPRAHandler(BaseHTTPRequestHandler):
+    """serves the series in server.series between startDate and endDate"""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if query['location'][0] not in self.server.series:
+            self.send_error(404)
+            return
+        ts = self.server.series[query['location'][0]]
+        ts = ts.loc[query['startDate'][0]:query['endDate'][0]]
+        body = ''.join(waterml_parts(ts.index.strftime('%Y-%m-%dT%H:%M:%S'), ts.values)).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class TestItaly(unittest.TestCase):
+
+    def test_parse(self):
+        times = ['2000-01-01T00:00:00', '2000-01-02T00:00:00', '2000-01-03T00:00:00', '2000-01-04T00:00:00']
+        values = ['1.25', '-9999', '', '3.5']
+        content = ''.join(waterml_parts(times, values)).encode()
+
+        t, v = parse_waterml_values(io.BytesIO(content), capacity=2)
+        exp = parse_waterml_reference(content)
+        np.testing.assert_array_equal(t, exp.index.tz_localize(None).to_numpy().astype('datetime64[s]'))
+        np.testing.assert_array_equal(v, [1.25, np.nan, np.nan, 3.5])
+        self.assertEqual(v.dtype, np.float32)
+
+        # offset from UTC is ignored
+        t, _ = parse_waterml_values(io.BytesIO(''.join(waterml_parts(['2000-01-02T00:00:00+01:00'], ['1'])).encode()))
+        self.assertEqual(t[0], np.datetime64('2000-01-02T00:00:00'))
+        return
+
+    def test_memory(self):
+        num = 50_000
+        times = (f'{t}T00:00:00' for t in np.arange('1800-01-01', num, dtype='datetime64[D]'))
+        parts = waterml_parts(times, (f'{i * 0.5}' for i in range(num)))
+
+        tracemalloc.start()
+        t, v = parse_waterml_values(io.BufferedReader(LazyStream(parts)))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertEqual(len(t), num)
+        self.assertEqual(v[-1], (num - 1) * 0.5)
+        # the document is about 4.6 MB and its tree would need about 35 MB
+        self.assertLess(peak, 4 * 2 ** 20)
+        return
+
+    def test_download(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ISPRAHandler)
+        time = pd.date_range('2000-01-01', '2000-03-31', freq='D')
+        server.series = {
+            'hsl-abr:5010': pd.Series(np.arange(len(time)) * 0.5, index=time),
+            'hsl-abr:5020': pd.Series(np.arange(30) + 100.0, index=time[10:40]),
+        }
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = _estreams.ISPRA_URL
+        _estreams.ISPRA_URL = f'http://127.0.0.1:{server.server_address[1]}/italia'
+
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                ds = _make_dataset(Italy, tmpdir, processes=2)
+                ds.md = pd.DataFrame({'gauge_id': ['hsl-abr:5010', 'hsl-abr:5020'],
+                                      'gauge_provider': 'IT_ISPRA'}, index=['ITIS0001', 'ITIS0002'])
+
+                q = ds.get_q()
+                self.assertEqual(q.columns.tolist(), ['ITIS0001', 'ITIS0002'])
+                self.assertEqual(len(q), len(time))
+                np.testing.assert_array_equal(q['ITIS0001'].values, server.series['hsl-abr:5010'].values)
+                np.testing.assert_array_equal(q['ITIS0002'].dropna().values, np.arange(30) + 100.0)
+                self.assertEqual(q['ITIS0002'].first_valid_index(), time[10])
+
+                new = ds._download_q(pd.Timestamp('2000-03-30'), pd.Timestamp('2000-04-10'))
+                self.assertEqual(new.index.tolist(), time[-2:].tolist())
+                self.assertTrue(new['hsl-abr:5020'].isna().all())
+        finally:
+            _estreams.ISPRA_URL = url
+            server.shutdown()
+            server.server_close()
+        return
+
+    def test_failed_station(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ISPRAHandler)
+        time = pd.date_range('2000-01-01', '2000-01-31', freq='D')
+        server.series = {'hsl-abr:5010': pd.Series(np.arange(len(time)) * 0.5, index=time)}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = _estreams.ISPRA_URL
+        _estreams.ISPRA_URL = f'http://127.0.0.1:{server.server_address[1]}/italia'
+
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                ds = _make_dataset(Italy, tmpdir, processes=2)
+                ds.md = pd.DataFrame({'gauge_id': ['hsl-abr:5010', 'hsl-abr:9999'],
+                                      'gauge_provider': 'IT_ISPRA'}, index=['ITIS0001', 'ITIS0002'])
+
+                # a station which can not be downloaded does not stop the others
+                with warnings.catch_warnings(record=True):
+                    warnings.simplefilter('always')
+                    q = ds._download_ispra()
+                self.assertEqual(q.columns.tolist(), ['hsl-abr:5010', 'hsl-abr:9999'])
+                np.testing.assert_array_equal(q['hsl-abr:5010'].values, server.series['hsl-abr:5010'].values)
+                self.assertTrue(q['hsl-abr:9999'].isna().all())
+                self.assertEqual(ds.ispra_failures, ['hsl-abr:9999'])
+
+                # all stations fail
+                server.series = {}
+                with warnings.catch_warnings(record=True):
+                    warnings.simplefilter('always')
+                    q = ds._download_ispra()
+                self.assertEqual(q.shape, (0, 2))
+                self.assertEqual(ds.ispra_failures, ['hsl-abr:5010', 'hsl-abr:9999'])
+        finally:
+            _estreams.ISPRA_URL = url
+            server.shutdown()
+            server.server_close()
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,325 @@
+
+import os
+import site
+# add the aqua_fetch directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+site.addsitedir(wd_dir)
+
+import pickle
+import shutil
+import unittest
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from aqua_fetch import GSHA
+import netCDF4
+
+from aqua_fetch._spatial import BoundaryStore
+from aqua_fetch.rr._gsha import METEO_MAP, _STORES, _GSHA
+
+from tests.rr.fixtures import make_dataset as _make_dataset
+
+
+STATIONS = ['1001_arcticnet', '1002_arcticnet', '7_USGS']
+METEO = ['P_MSWEP', 'T_ERA', 'WINDERA']
+STORAGE = ['SML1', 'SWDE', 'GW']
+
+
+def value(stn: str, col: int, num_days: int) -> np.ndarray:
+    return STATIONS.index(stn) * 1000 + col * 100 + np.arange(num_days, dtype=np.float32)
+
+
+def make_gsha(path):
+    """writes csv files with same layout as GSHA for a few stations"""
+    meteo_time = pd.date_range('1979-01-01', '1979-03-31', name='date')
+    storage_time = pd.date_range('1979-01-01', '1979-02-28', name='date')
+    lai_time = pd.date_range('1979-01-15', '1979-03-31', name='date')
+
+    global_dir = os.path.join(path, 'Global_files', 'Global_files')
+    os.makedirs(global_dir)
+    pd.DataFrame({'watershed_id': STATIONS, 'lat': [60.0, 61.0, 40.0], 'long': [10.0, 11.0, -100.0],
+                  'area': [10.0, 20.0, 30.0], 'agency': ['arcticnet', 'arcticnet', 'USGS']}
+                 ).to_csv(os.path.join(global_dir, 'WatershedsAll.csv'), index=False)
+
+    for stn in STATIONS:
+        meteo_dir = os.path.join(path, METEO_MAP[stn.split('_')[1]])
+        os.makedirs(meteo_dir, exist_ok=True)
+        pd.DataFrame({col: value(stn, i, len(meteo_time)) for i, col in enumerate(METEO)},
+                     index=meteo_time).to_csv(os.path.join(meteo_dir, f'{stn}.csv'))
+
+        storage_dir = os.path.join(path, 'Storage', 'Storage')
+        os.makedirs(storage_dir, exist_ok=True)
+        pd.DataFrame({col: value(stn, 3 + i, len(storage_time)) for i, col in enumerate(STORAGE)},
+                     index=storage_time).to_csv(os.path.join(storage_dir, f'{stn}.csv'))
+
+        lai_dir = os.path.join(path, 'LAI', 'LAI')
+        os.makedirs(lai_dir, exist_ok=True)
+        pd.DataFrame({stn: value(stn, 6, len(lai_time))},
+                     index=lai_time).to_csv(os.path.join(lai_dir, f'{stn}.csv'))
+
+        years = np.arange(1992, 1996)
+        if stn != '7_USGS':  # no landcover file for last station
+            lc_dir = os.path.join(path, 'Landcover', 'Landcover')
+            os.makedirs(lc_dir, exist_ok=True)
+            pd.DataFrame({'year': years, 'urban_fraction(%)': value(stn, 7, 4),
+                          'forest_fraction(%)': value(stn, 8, 4)}
+                         ).to_csv(os.path.join(lc_dir, f'{stn}.csv'))
+
+        res_dir = os.path.join(path, 'Reservoir', 'Reservoir')
+        os.makedirs(res_dir, exist_ok=True)
+        pd.DataFrame({'capacity': value(stn, 9, 4), 'dor': value(stn, 10, 4)},
+                     index=pd.Index(years, name='year')).to_csv(os.path.join(res_dir, f'{stn}.csv'))
+
+        sfi_dir = os.path.join(path, 'StreamflowIndices_yearly', 'StreamflowIndices')
+        os.makedirs(sfi_dir, exist_ok=True)
+        pd.DataFrame({'mean': value(stn, 11, 4), 'AMF occurrence date': '1992-05-01',
+                      'frequency of high-flow days': np.arange(4)},
+                     index=pd.Index(years, name='year')).to_csv(os.path.join(sfi_dir, f'{stn}.csv'))
+    return
+
+
+def make_dataset(path, to_netcdf=False, processes=1):
+    ds = _make_dataset(GSHA, path, to_netcdf=to_netcdf, processes=processes)
+    ws = pd.read_csv(os.path.join(path, 'Global_files', 'Global_files', 'WatershedsAll.csv'))
+    ws.columns = ['station_id', 'lat', 'long', 'area', 'agency']
+    ds.wsAll = ws.set_index('station_id')
+    ds._daily_dynamic_features = ds._GSHA__daily_dynamic_features()
+    return ds
+
+
+class TestDynamicFeatures(unittest.TestCase):
+
+    features = ['pcp_mm_mswep', 'swe_mm_era5', 'lai', 'airtemp_C_mean_era5']
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        make_gsha(self.tmpdir.name)
+        return
+
+    def tearDown(self):
+        for store in _STORES.values():
+            store.close()
+        _STORES.clear()
+        self.tmpdir.cleanup()
+        return
+
+    def _check(self, ds, as_dataframe=False):
+        dyn = ds.fetch_dynamic_features(['7_USGS', '1001_arcticnet'], self.features,
+                                        st='1979-01-10', en='1979-03-20', as_dataframe=as_dataframe)
+        if as_dataframe:
+            self.assertEqual(list(dyn.keys()), ['7_USGS', '1001_arcticnet'])
+            df = dyn['7_USGS']
+        else:
+            self.assertEqual(list(dyn.data_vars), ['7_USGS', '1001_arcticnet'])
+            df = dyn['7_USGS'].to_pandas()
+        self.assertEqual(df.columns.tolist(), self.features)
+        self.assertEqual(len(df), 70)
+
+        np.testing.assert_allclose(df['pcp_mm_mswep'], value('7_USGS', 0, 90)[9:79])
+        np.testing.assert_allclose(df['airtemp_C_mean_era5'], value('7_USGS', 1, 90)[9:79] - 273.15, rtol=1e-5)
+        # storage variables end in February and lai starts from 15th January
+        np.testing.assert_allclose(df.loc[:'1979-02-28', 'swe_mm_era5'], value('7_USGS', 4, 59)[9:] * 1000)
+        self.assertTrue(df.loc['1979-03-01':, 'swe_mm_era5'].isna().all())
+        self.assertTrue(df.loc[:'1979-01-14', 'lai'].isna().all())
+        np.testing.assert_allclose(df.loc['1979-01-15':, 'lai'], value('7_USGS', 6, 76)[:65])
+        return
+
+    def test_csv(self):
+        self._check(make_dataset(self.tmpdir.name))
+        self._check(make_dataset(self.tmpdir.name), as_dataframe=True)
+        return
+
+    def test_parallel(self):
+        ds = make_dataset(self.tmpdir.name, processes=2)
+        self._check(ds)
+        self._check(ds, as_dataframe=True)
+
+        dfs = ds.fetch_dynamic_features(STATIONS, 'pcp_mm_mswep', as_dataframe=True)
+        for stn in STATIONS:
+            np.testing.assert_allclose(dfs[stn]['pcp_mm_mswep'], value(stn, 0, 90))
+        return
+
+    def _remove_csvs(self):
+        for folder in ['Storage', 'LAI', 'Meteorology_PartI_arcticnet_AFD_GRDC_IWRIS_MLIT',
+                       'Meteorology_PartIII_China_CHP_RID_USGS', 'Landcover', 'Reservoir',
+                       'StreamflowIndices_yearly']:
+            shutil.rmtree(os.path.join(self.tmpdir.name, folder))
+        return
+
+    def test_netcdf(self):
+        ds = make_dataset(self.tmpdir.name, to_netcdf=True, processes=2)
+        ds.build_store(batch_size=2)
+        # the data must now be read from the netcdf store
+        self._remove_csvs()
+        self._check(ds)
+        self._check(ds, as_dataframe=True)
+
+        with netCDF4.Dataset(ds.store_fpath) as nc:
+            self.assertEqual(sorted(nc.groups), ['lai', 'landcover', 'meteo', 'reservoir', 'storage',
+                                                 'streamflow_indices'])
+            self.assertEqual(nc.groups['meteo'].variables['data'].dtype, np.float32)
+        return
+
+    def test_accessors(self):
+        csv = make_dataset(self.tmpdir.name)
+        ds = make_dataset(self.tmpdir.name, to_netcdf=True)
+
+        lc = ds.lc_variables(['1002_arcticnet', '7_USGS'], st='1993-01-01')
+        self.assertEqual(lc['1002_arcticnet'].dims, ('years', 'lc_variables'))
+        np.testing.assert_allclose(lc['1002_arcticnet'].sel(lc_variables='forest_fraction(%)'),
+                                   value('1002_arcticnet', 8, 4)[1:])
+        # station without landcover file
+        self.assertTrue(lc['7_USGS'].isnull().all())
+
+        res = csv.reservoir_variables(agency='USGS')
+        self.assertEqual(list(res.keys()), ['7_USGS'])
+        np.testing.assert_allclose(ds.reservoir_variables(agency='USGS')['7_USGS'].values, res['7_USGS'].values)
+
+        sfi = ds.streamflow_indices('1001_arcticnet')['1001_arcticnet']
+        self.assertEqual(sfi['streamflow_indices'].values.tolist(), ['mean', 'frequency of high-flow days'])
+        self.assertIn('AMF occurrence date', csv.streamflow_indices('1001_arcticnet')['1001_arcticnet'])
+
+        lai = ds.fetch_lai(['7_USGS'], en='1979-01-31')['7_USGS']
+        self.assertEqual(lai.dims, ('time',))
+        np.testing.assert_allclose(lai, value('7_USGS', 6, 17))
+        np.testing.assert_allclose(csv.fetch_lai(['7_USGS'], en='1979-01-31')['7_USGS'], value('7_USGS', 6, 17))
+
+        meteo = ds.fetch_meteo_vars(STATIONS, st='1979-03-01')
+        self.assertEqual(meteo['1001_arcticnet'].shape, (31, 3))
+        storage = ds.storage_vars_all_stns()
+        self.assertEqual(list(storage.data_vars), STATIONS)
+        pd.testing.assert_frame_equal(storage['7_USGS'].to_pandas(), csv.fetch_storage_vars('7_USGS')['7_USGS'],
+                                      check_names=False, check_freq=False)
+
+        # the store is only built explicitly
+        self.assertFalse(os.path.exists(ds.store_fpath))
+
+        # without the store, the csv files of stations are read in parallel
+        par = make_dataset(self.tmpdir.name, to_netcdf=True, processes=2)
+        meteo = par.meteo_vars_all_stns()
+        self.assertEqual(list(meteo.data_vars), STATIONS)
+        for stn in STATIONS:
+            np.testing.assert_allclose(meteo[stn].sel(features='pcp_mm_mswep'), value(stn, 0, 90))
+        lc = par.lc_variables(['1002_arcticnet', '7_USGS'], st='1993-01-01')
+        self.assertTrue(lc['7_USGS'].isnull().all())
+        np.testing.assert_allclose(lc['1002_arcticnet'].sel(lc_variables='forest_fraction(%)'),
+                                   value('1002_arcticnet', 8, 4)[1:])
+        ds.build_store()
+        self.assertEqual(ds.fetch_meteo_vars(STATIONS, st='1979-03-01')['1001_arcticnet'].shape, (31, 3))
+        np.testing.assert_allclose(ds.fetch_lai(['7_USGS'], en='1979-01-31')['7_USGS'], value('7_USGS', 6, 17))
+        return
+
+    def test_store_union(self):
+        # last station starts earlier, ends later and has one more variable than others
+        time = pd.date_range('1978-12-01', '1979-04-30', name='date')
+        fpath = os.path.join(self.tmpdir.name, METEO_MAP['USGS'], '7_USGS.csv')
+        df = pd.DataFrame({col: value('7_USGS', i, len(time)) for i, col in enumerate(METEO + ['EXTRA'])},
+                          index=time)
+        df.to_csv(fpath)
+
+        ds = make_dataset(self.tmpdir.name, to_netcdf=True)
+        ds.build_store(batch_size=1)
+        self._remove_csvs()
+
+        store = ds._store()
+        self.assertEqual(store.features['meteo'], ['pcp_mm_mswep', 'airtemp_C_mean_era5',
+                                                   'windspeed_mps_era5', 'EXTRA'])
+        index, data = store.read('meteo', ['7_USGS', '1001_arcticnet'], ['EXTRA', 'pcp_mm_mswep'], None, None)
+        pd.testing.assert_index_equal(index, pd.DatetimeIndex(time, name='time'))
+        np.testing.assert_allclose(data[0, :, 0], value('7_USGS', 3, len(time)))
+        np.testing.assert_allclose(data[0, :, 1], value('7_USGS', 0, len(time)))
+        # other stations have no data before 1979 and after March
+        self.assertTrue(np.isnan(data[1, :31]).all() and np.isnan(data[1, -30:]).all())
+        np.testing.assert_allclose(data[1, 31:-30, 1], value('1001_arcticnet', 0, 90))
+        self.assertTrue(np.isnan(data[1, :, 0]).all())
+
+        index, data = store.read('meteo', ['7_USGS'], ['pcp_mm_mswep'], '1979-04-01', None)
+        self.assertEqual(len(index), 30)
+        np.testing.assert_allclose(data[0, :, 0], value('7_USGS', 0, len(time))[-30:])
+        return
+
+    def test_resume(self):
+        ds = make_dataset(self.tmpdir.name, to_netcdf=True)
+        ds.build_store(batch_size=1)
+        # pretend that the building was interrupted after first station
+        with netCDF4.Dataset(ds.store_fpath, 'a') as nc:
+            nc.groups['meteo'].variables['data'][1:] = np.nan
+            nc.stations_done = 1
+            nc.complete = 0
+        self.assertIsNone(ds._store())
+        ds.build_store(batch_size=1)
+        self._remove_csvs()
+        self._check(ds)
+        return
+
+    def test_only_required_groups(self):
+        ds = make_dataset(self.tmpdir.name)
+        shutil.rmtree(os.path.join(self.tmpdir.name, 'Storage'))
+        shutil.rmtree(os.path.join(self.tmpdir.name, 'LAI'))
+
+        xds = ds.fetch_dynamic_features(STATIONS, ['windspeed_mps_era5', 'pcp_mm_mswep'])
+        self.assertEqual(xds['1002_arcticnet'].shape, (90, 2))
+
+        df = ds.fetch_stn_dynamic_features('1002_arcticnet', 'windspeed_mps_era5')
+        self.assertEqual(df.columns.tolist(), ['windspeed_mps_era5'])
+        np.testing.assert_allclose(df['windspeed_mps_era5'], value('1002_arcticnet', 2, 90))
+        return
+
+
+class TestBoundaryStore(unittest.TestCase):
+
+    def test_missing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_gsha(tmpdir)
+            ds = make_dataset(tmpdir)
+            ds._bndry_store = None
+            # neither the store nor the shapefiles exist
+            self.assertRaises(FileNotFoundError, ds.boundary_store)
+        return
+
+    def test_pickle(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_gsha(tmpdir)
+            ds = make_dataset(tmpdir)
+            ds._bndry_store = BoundaryStore.from_rings(['1001_arcticnet'], [([np.zeros((4, 2))], [True])])
+            # the store is not sent to the workers of a process pool
+            self.assertIsNone(pickle.loads(pickle.dumps(ds))._bndry_store)
+            self.assertIsNotNone(ds._bndry_store)
+        return
+
+
+class Arctic(_GSHA):
+    """an agency whose streamflow is the station number"""
+
+    agency_name = 'arcticnet'
+
+    def get_q(self, as_dataframe: bool = True):
+        time = pd.date_range('1979-01-01', '1979-12-31')
+        return pd.DataFrame({stn: float(stn) for stn in self.stations()}, index=time)
+
+
+class TestAgency(unittest.TestCase):
+
+    def test_fetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_gsha(tmpdir)
+            ds = _make_dataset(Arctic, os.path.join(tmpdir, 'Arctic'),
+                               attrs={'gsha': make_dataset(tmpdir, processes=2)})
+            ds._stations = ds._GSHA__stations()
+            self.assertEqual(ds.stations(), ['1001', '1002'])
+
+            _, dyn = ds.fetch_stations_features(['1002', '1001'], ['pcp_mm_mswep', 'q_cms_obs'],
+                                                st='1979-02-01', en='1979-02-10', as_dataframe=True)
+            self.assertEqual(list(dyn.keys()), ['1002', '1001'])
+            df = dyn['1002']
+            self.assertEqual(df.columns.tolist(), ['pcp_mm_mswep', 'q_cms_obs'])
+            np.testing.assert_allclose(df['pcp_mm_mswep'], value('1002_arcticnet', 0, 90)[31:41])
+            np.testing.assert_allclose(df['q_cms_obs'], 1002.0)
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
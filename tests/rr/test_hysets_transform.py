@@ -0,0 +1,168 @@
+
+import os
+import site
+# add the aqua_fetch directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+import netCDF4
+
+from aqua_fetch import HYSETS
+from aqua_fetch.rr._hysets import _STACKED_FILES
+
+from tests.rr.fixtures import make_dataset as _make_dataset
+
+
+FEATURES = ['discharge', 'total_precipitation', '2m_tasmax']
+
+
+def make_source(fpath, num_ws=37, num_t=50, order='wt'):
+    """writes a file with same layout as HYSETS_2023_update_{src}.nc"""
+    with netCDF4.Dataset(fpath, 'w') as nc:
+        nc.createDimension('watershed', num_ws)
+        nc.createDimension('time', num_t)
+        nc.createDimension('nchar', 5)
+        t = nc.createVariable('time', 'f8', ('time',))
+        t.units = 'days since 1950-01-01'
+        t[:] = np.arange(num_t)
+        nc.createVariable('watershed_name', 'S1', ('watershed', 'nchar'))
+        for k, var in enumerate(FEATURES):
+            dims = ('watershed', 'time') if order == 'wt' else ('time', 'watershed')
+            v = nc.createVariable(var, 'f4', dims, fill_value=-999.0)
+            values = expected(num_ws, num_t, k)
+            values[3, 5] = -999.0
+            v[:] = values if order == 'wt' else values.T
+    return
+
+
+def expected(num_ws, num_t, k):
+    return (np.arange(num_ws)[:, None] * 1000 + np.arange(num_t)[None, :] + k * 0.5).astype(np.float32)
+
+
+def make_dataset(path):
+    return _make_dataset(HYSETS, path, attrs={
+        'sources': {'discharge': 'ERA5', 'total_precipitation': 'ERA5', '2m_tasmax': 'ERA5'}})
+
+
+class TestTransform(unittest.TestCase):
+
+    def _check(self, ds, num_ws=37, num_t=50):
+        fpath = ds._stacked_fpath('ERA5')
+        self.assertTrue(ds._is_transformed(fpath))
+        with netCDF4.Dataset(fpath) as nc:
+            data = nc.variables['data'][:].filled(np.nan)
+            self.assertEqual(data.shape, (num_ws, num_t, 3))
+            self.assertEqual(list(nc.variables['dynamic_features'][:]), FEATURES)
+        for k in range(3):
+            exp = expected(num_ws, num_t, k)
+            exp[3, 5] = np.nan
+            np.testing.assert_allclose(data[:, :, k], exp, atol=1e-3)
+        return
+
+    def test_transform(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_source(os.path.join(tmpdir, 'HYSETS_2023_update_ERA5.nc'))
+            ds = make_dataset(tmpdir)
+            with ds.transform('HYSETS_2023_update_ERA5.nc', block_size=10) as xds:
+                self.assertEqual(xds['data'].dims, ('watershed', 'time', 'dynamic_features'))
+                self.assertEqual(list(xds['dynamic_features'].values), FEATURES)
+            self._check(ds)
+        return
+
+    def test_time_first(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_source(os.path.join(tmpdir, 'HYSETS_2023_update_ERA5.nc'), order='tw')
+            ds = make_dataset(tmpdir)
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=8)
+            self._check(ds)
+        return
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_source(os.path.join(tmpdir, 'HYSETS_2023_update_ERA5.nc'))
+            ds = make_dataset(tmpdir)
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=10)
+            # pretend that the conversion was interrupted after 6 blocks
+            with netCDF4.Dataset(ds._stacked_fpath('ERA5'), 'a') as nc:
+                nc.variables['data'][20:30, :, 1] = np.nan
+                nc.variables['data'][:, :, 2] = np.nan
+                nc.blocks_done = 6
+                nc.complete = 0
+            self.assertFalse(ds._is_transformed(ds._stacked_fpath('ERA5')))
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=10)
+            self._check(ds)
+        return
+
+    def test_fetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_source(os.path.join(tmpdir, 'HYSETS_2023_update_ERA5.nc'))
+            ds = make_dataset(tmpdir)
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=10)
+
+            features = ['pcp_mm', 'q_cms_obs']
+            xds = ds._fetch_dynamic_features([5, 1, 30], features, st='1950-01-03', en='1950-01-10')
+            self.assertEqual(list(xds.data_vars), ['5', '1', '30'])
+            self.assertEqual(xds['5'].dims, ('time', 'dynamic_features'))
+
+            dfs = ds._fetch_dynamic_features([5, 1, 30], features, st='1950-01-03', en='1950-01-10',
+                                             as_dataframe=True)
+            df = dfs['30']
+            self.assertEqual(df.columns.tolist(), features)
+            self.assertEqual(df.index[0], pd.Timestamp('1950-01-03'))
+            self.assertEqual(len(df), 8)
+            np.testing.assert_allclose(df['q_cms_obs'].values, 29 * 1000 + np.arange(2, 10), atol=1e-3)
+            np.testing.assert_allclose(df['pcp_mm'].values, 29 * 1000 + np.arange(2, 10) + 0.5, atol=1e-3)
+            # missing value of 4th watershed on 6th day
+            df = ds._fetch_dynamic_features([4], 'q_cms_obs', as_dataframe=True)['4']
+            self.assertTrue(np.isnan(df.loc['1950-01-06', 'q_cms_obs']))
+            self.assertEqual(int(df['q_cms_obs'].isna().sum()), 1)
+        return
+
+    def test_sparse_stations(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_source(os.path.join(tmpdir, 'HYSETS_2023_update_ERA5.nc'), num_ws=200)
+            ds = make_dataset(tmpdir)
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=64)
+
+            # far apart and repeated stations are read with index based selection
+            stations = [190, 2, 190, 100]
+            dfs = ds._fetch_dynamic_features(stations, ['airtemp_C_2m_max', 'q_cms_obs'], as_dataframe=True)
+            for stn in stations:
+                df = dfs[str(stn)]
+                np.testing.assert_allclose(df['q_cms_obs'].values, expected(200, 50, 0)[stn - 1], atol=1e-3)
+                np.testing.assert_allclose(df['airtemp_C_2m_max'].values, expected(200, 50, 2)[stn - 1], atol=1e-3)
+
+            self.assertRaises(KeyError, ds._fetch_dynamic_features, [5, 201], 'q_cms_obs')
+            _STACKED_FILES.clear()
+        return
+
+    def test_handle_pool(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_source(os.path.join(tmpdir, 'HYSETS_2023_update_ERA5.nc'))
+            ds = make_dataset(tmpdir)
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=10)
+            fpath = ds._stacked_fpath('ERA5')
+
+            ds._fetch_dynamic_features([1], 'q_cms_obs')
+            handle = _STACKED_FILES[fpath]
+            ds._fetch_dynamic_features([2], 'pcp_mm')
+            self.assertIs(_STACKED_FILES[fpath], handle)
+
+            # rewriting the file closes the pooled handle
+            ds.overwrite = True
+            ds.transform('HYSETS_2023_update_ERA5.nc', block_size=10)
+            self.assertNotIn(fpath, _STACKED_FILES)
+            df = ds._fetch_dynamic_features([2], 'pcp_mm', as_dataframe=True)['2']
+            np.testing.assert_allclose(df['pcp_mm'].values, expected(37, 50, 1)[1], atol=1e-3)
+            _STACKED_FILES.clear()
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
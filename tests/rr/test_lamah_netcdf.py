@@ -0,0 +1,175 @@
+
+import os
+import site
+# add the aqua_fetch directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from aqua_fetch import LamaHCE
+from aqua_fetch.rr import _lamah
+
+from tests.rr.fixtures import make_dataset as _make_dataset
+
+
+MET_COLUMNS = ['2m_temp_mean', 'prec', 'surf_press', 'total_et']
+
+
+def make_lamahce(path, stations, timestep='D', columns=None, end=None):
+    """
+    writes csv files with same layout as LamaHCE for ``data_type='total_upstrm'``.
+    The meteorological data of last station ends at ``end`` if given.
+    """
+    freq, folder = {'D': ('D', 'daily'), 'H': ('h', 'hourly')}[timestep]
+    time = pd.date_range('1981-01-01', '2017-12-31 23:00', freq=freq)
+
+    met_dir = os.path.join(path, 'A_basins_total_upstrm', '2_timeseries', folder)
+    q_dir = os.path.join(path, 'D_gauges', '2_timeseries', folder)
+    os.makedirs(met_dir)
+    os.makedirs(q_dir)
+
+    index = {'YYYY': time.year, 'MM': time.month, 'DD': time.day}
+    if timestep == 'H':
+        index.update({'hh': time.hour, 'mm': time.minute})
+
+    rng = np.random.default_rng(0)
+    for stn in stations:
+        met_time = time
+        if end is not None and stn == stations[-1]:
+            met_time = pd.date_range(time[0], end, freq=freq)
+        met = pd.DataFrame({'YYYY': met_time.year, 'MM': met_time.month, 'DD': met_time.day,
+                            'DOY': met_time.dayofyear})
+        if timestep == 'H':
+            met.insert(3, 'hh', met_time.hour)
+            met.insert(4, 'mm', met_time.minute)
+            met['HOD'] = met_time.hour
+        for col in MET_COLUMNS + (columns or []):
+            met[col] = rng.random(len(met_time)).round(3)
+        met.to_csv(os.path.join(met_dir, f'ID_{stn}.csv'), sep=';', index=False)
+
+        q = pd.DataFrame(dict(index, qobs=rng.random(len(time)).round(3)))
+        q.loc[::7, 'qobs'] = np.nan
+        q['checked' if timestep == 'D' else 'ckhs'] = True
+        # the streamflow of last station starts later
+        q = q.iloc[100:] if stn == stations[-1] else q
+        q.to_csv(os.path.join(q_dir, f'ID_{stn}.csv'), sep=';', index=False)
+    return
+
+
+def make_dataset(path, timestep='D', processes=2):
+    ds = _make_dataset(LamaHCE, path, timestep=timestep, to_netcdf=False, processes=processes,
+                       attrs={'data_type': 'total_upstrm'})
+    ds._dynamic_features = ds._LamaHCE__dynamic_features()
+    return ds
+
+
+class TestToNetcdf(unittest.TestCase):
+
+    def test_daily(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stations = ['1', '12', '7']
+            make_lamahce(tmpdir, stations)
+            ds = make_dataset(tmpdir)
+            self.assertFalse(ds.all_ncs_exist)
+
+            # read from csv files
+            _, csv = ds.fetch_stations_features(stations, as_dataframe=True)
+
+            # one station in each batch
+            batch_bytes = _lamah.BATCH_BYTES
+            _lamah.BATCH_BYTES = 1
+            try:
+                ds._maybe_to_netcdf(fdir='total_upstrm_D')
+            finally:
+                _lamah.BATCH_BYTES = batch_bytes
+            self.assertTrue(ds.all_ncs_exist)
+            self.assertEqual(os.listdir(os.path.join(tmpdir, 'total_upstrm_D')), ['dynamic_features.nc'])
+
+            _, nc = ds.fetch_stations_features(stations, as_dataframe=True)
+            for stn in stations:
+                pd.testing.assert_frame_equal(
+                    nc[stn][ds.dynamic_features], csv[stn][ds.dynamic_features],
+                    check_dtype=False, check_freq=False)
+            self.assertTrue(np.isnan(nc['7'].iloc[:100]['q_cms_obs']).all())
+        return
+
+    def test_one_process(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_lamahce(tmpdir, ['3', '4'])
+            ds = make_dataset(tmpdir, processes=1)
+            ds._maybe_to_netcdf(fdir='total_upstrm_D')
+            _, dyn = ds.fetch_stations_features(['4'], dynamic_features=['pcp_mm'], st='2000-01-01',
+                                                en='2000-12-31')
+            self.assertEqual(dyn['4'].shape, (366, 1))
+        return
+
+    def test_float64(self):
+        # a column which is not in the dtypes of LamaHCE is parsed as float64
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stations = ['1', '2']
+            make_lamahce(tmpdir, stations, columns=['snow_depth'])
+            ds = make_dataset(tmpdir)
+            _, csv = ds.fetch_stations_features(stations, as_dataframe=True)
+            self.assertEqual(csv['1']['snow_depth'].dtype, np.float64)
+
+            ds._maybe_to_netcdf(fdir='total_upstrm_D')
+            _, nc = ds.fetch_stations_features(stations, ['snow_depth', 'pcp_mm'], as_dataframe=True)
+            for stn in stations:
+                self.assertEqual(nc[stn]['snow_depth'].dtype, np.float64)
+                pd.testing.assert_series_equal(nc[stn]['snow_depth'], csv[stn]['snow_depth'], check_freq=False)
+        return
+
+    def test_time_steps_outside(self):
+        # the meteorological data of last station, which is in second batch, is longer
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stations = [str(i) for i in range(9)]
+            make_lamahce(tmpdir, stations, end='2018-01-10')
+            ds = make_dataset(tmpdir, processes=1)
+            ds.stations = lambda: stations
+            batch_bytes = _lamah.BATCH_BYTES
+            # two stations in each batch
+            _lamah.BATCH_BYTES = 2 * 14245 * len(ds.dynamic_features) * 8
+            try:
+                self.assertRaises(ValueError, ds._maybe_to_netcdf, fdir='total_upstrm_D')
+            finally:
+                _lamah.BATCH_BYTES = batch_bytes
+            self.assertFalse(ds.all_ncs_exist)
+        return
+
+    def test_per_feature_files(self):
+        # files written by older versions contain one feature each
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stations = ['1', '2', '3']
+            make_lamahce(tmpdir, stations)
+            ds = make_dataset(tmpdir)
+            _, csv = ds.fetch_stations_features(stations, as_dataframe=True)
+
+            fdir = os.path.join(tmpdir, 'total_upstrm_D')
+            os.makedirs(fdir)
+            for feature in ds.dynamic_features:
+                _, data = ds.fetch(static_features=None, dynamic_features=feature)
+                data.to_netcdf(os.path.join(fdir, f"{feature}.nc"))
+            self.assertTrue(ds.all_ncs_exist)
+
+            features = ['q_cms_obs', 'pcp_mm', 'airtemp_C_mean']
+            for processes in [1, 2]:
+                ds.processes = processes
+                _, nc = ds.fetch_stations_features(['3', '1'], features, st='1990-01-01', as_dataframe=True)
+                for stn in ['3', '1']:
+                    pd.testing.assert_frame_equal(nc[stn], csv[stn].loc['1990-01-01':, features],
+                                                  check_dtype=False, check_freq=False)
+
+            xds = ds._make_ds_from_ncs(features, ['2'], None, '1981-01-31')
+            self.assertEqual(xds['2'].shape, (31, 3))
+            self.assertEqual(xds['2'].dims, ('time', 'dynamic_features'))
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
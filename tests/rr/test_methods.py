@@ -63,7 +63,10 @@ from aqua_fetch import LamaHIce
 from utils import test_stations
 from utils import test_boundary
 from utils import test_plot_catchment
+from utils import test_plot_catchments
 from utils import test_q_mm
+from utils import test_spatial_queries
+from utils import test_catchments_containing
 
 
 DATASETS = {
@@ -148,6 +151,17 @@ def test_plot_catchment_method():
     return
 
 
+def test_plot_catchments_method():
+
+    for ds_name, ds in DATASETS.items():
+
+        if ds_name not in ['HYPE', 'WaterBenchIowa', 'RRLuleaSweden', 
+                           'CAMELS_NZ',
+                       ]:
+            test_plot_catchments(ds)
+    return
+
+
 def test_qmm_method():
 
     for ds_name, ds in DATASETS.items():
@@ -157,6 +171,25 @@ def test_qmm_method():
     return
 
 
+def test_spatial_queries_method():
+
+    for ds_name, ds in DATASETS.items():
+
+        if ds_name not in ['RRLuleaSweden']:
+            test_spatial_queries(ds)
+    return
+
+
+def test_catchments_containing_method():
+
+    for ds_name, ds in DATASETS.items():
+
+        if ds_name not in ['HYPE', 'WaterBenchIowa', 'RRLuleaSweden', 'CAMELS_NZ',
+                       ]:
+            test_catchments_containing(ds)
+    return
+
+
 def test_stations_method():
 
     numbers = {
@@ -235,6 +268,12 @@ test_get_boundary()
 
 test_plot_catchment_method()
 
+test_plot_catchments_method()
+
 test_stations_method()
 
 test_qmm_method()
+
+test_spatial_queries_method()
+
+test_catchments_containing_method()
@@ -0,0 +1,408 @@
+
+import os
+import site
+# add the aqua_fetch directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import json
+import tempfile
+import threading
+from io import StringIO
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+import netCDF4
+
+from aqua_fetch import HYSETS, USGS
+from aqua_fetch.rr._usgs import save_daily_q_as_nc, save_daily_q_as_csv, DAILY_START, DAILY_END
+from aqua_fetch.rr._usgs import _read_json
+from aqua_fetch.rr import _usgs
+from aqua_fetch.rr._hysets import _STACKED_FILES
+
+from tests.rr.fixtures import make_dataset as _make_dataset
+
+
+SITES = ['01010000', '01013500', '02342070', '14316700', '12388200']
+
+
+def make_series(site, k):
+    """daily discharge of a site which starts from a different date for each site"""
+    index = pd.date_range(f'{1950 + k}-01-01', '2000-12-31', freq='D')
+    values = (k * 1000 + np.arange(len(index)) % 365) * 0.5
+    ts = pd.Series(values, index=index, name=site)
+    return ts.iloc[::2] if k == 2 else ts
+
+
+def make_legacy(path):
+    """writes daily_q.nc with one variable for each site as done by previous versions"""
+    with netCDF4.Dataset(os.path.join(path, 'daily_q.nc'), mode='w') as nc:
+        nc.createDimension('time', None)
+        time = pd.date_range(start=DAILY_START, end=DAILY_END, freq='D')
+        t = nc.createVariable('time', 'f8', ('time',))
+        t.units = 'days since 1820-01-01 00:00:00'
+        t[:] = np.arange(len(time))
+        for k, site in enumerate(SITES):
+            v = nc.createVariable(site, 'f4', ('time',), complevel=4, compression='zlib', shuffle=True,
+                                  least_significant_digit=4)
+            v[:] = make_series(site, k).reindex(time).values
+    return
+
+
+def make_hysets(path, num_ws=len(SITES) + 1, num_t=50):
+    """writes the files of HYSETS which are used by USGS"""
+    with netCDF4.Dataset(os.path.join(path, 'HYSETS_2023_update_ERA5.nc'), 'w') as nc:
+        nc.createDimension('watershed', num_ws)
+        nc.createDimension('time', num_t)
+        t = nc.createVariable('time', 'f8', ('time',))
+        t.units = 'days since 1950-01-01'
+        t[:] = np.arange(num_t)
+        for k, var in enumerate(['discharge', 'total_precipitation']):
+            v = nc.createVariable(var, 'f4', ('watershed', 'time'))
+            v[:] = np.arange(num_ws)[:, None] * 100 + np.arange(num_t)[None, :] + k * 0.5
+
+    # the last watershed is from Canada
+    pd.DataFrame({'Watershed_ID': np.arange(1, num_ws + 1), 'Official_ID': SITES + ['01AD002']}).to_csv(
+        os.path.join(path, 'HYSETS_watershed_properties.txt'), index=False)
+
+    ds = _make_dataset(HYSETS, path, attrs={'sources': {'discharge': 'ERA5', 'total_precipitation': 'ERA5'}})
+    ds.transform('HYSETS_2023_update_ERA5.nc')
+    return ds
+
+
+def make_dataset(path, hysets=None):
+    ds = _make_dataset(USGS, path, attrs={'hysets': hysets})
+    ds._stations = ds._USGS__stations()
+    return ds
+
+
+class TestDailyQ(unittest.TestCase):
+
+    def _check(self, ds):
+        self.assertEqual(ds.stations(), SITES)
+
+        time, q = ds._read_q(['02342070', '01010000', '02342070'], st='1951-12-30', en='1952-01-02')
+        self.assertEqual(q.shape, (3, 4))
+        self.assertEqual(time[0], pd.Timestamp('1951-12-30'))
+        exp = make_series('02342070', 2).reindex(time).values
+        np.testing.assert_allclose(q[0], exp, atol=1e-3)
+        self.assertTrue(np.isnan(q[0, :2]).all())
+        np.testing.assert_allclose(q[1], make_series('01010000', 0).reindex(time).values, atol=1e-3)
+        np.testing.assert_array_equal(q[2], q[0])
+        return
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            save_daily_q_as_nc(tmpdir, (make_series(site, k) for k, site in enumerate(SITES)))
+            self.assertEqual(os.listdir(tmpdir), ['daily_q_stacked.nc'])
+            self._check(make_dataset(tmpdir))
+        return
+
+    def test_csv(self):
+        # without netCDF4, the discharge is saved in and read from daily_q.csv
+        nc = _usgs.netCDF4
+        _usgs.netCDF4 = None
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                save_daily_q_as_csv(tmpdir, [make_series(site, k) for k, site in enumerate(SITES)])
+                self.assertEqual(os.listdir(tmpdir), ['daily_q.csv'])
+                self._check(make_dataset(tmpdir))
+        finally:
+            _usgs.netCDF4 = nc
+        return
+
+    def test_legacy(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_legacy(tmpdir)
+            ds = make_dataset(tmpdir)
+            self.assertTrue(os.path.exists(ds.q_fpath))
+            self._check(ds)
+
+            with netCDF4.Dataset(ds.q_fpath) as nc:
+                self.assertEqual(nc.variables['q'].chunking(), [1, len(nc.dimensions['time'])])
+        return
+
+    def test_fetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            hysets = make_hysets(tmpdir)
+            usgs_path = os.path.join(tmpdir, 'USGS')
+            os.makedirs(usgs_path)
+            save_daily_q_as_nc(usgs_path, (make_series(site, k) for k, site in enumerate(SITES)))
+            ds = make_dataset(usgs_path, hysets)
+
+            _, dyn = ds.fetch_stations_features(['12388200', '01010000'], ['pcp_mm', 'q_cms_obs'],
+                                                en='1950-01-10', as_dataframe=True)
+            df = dyn['12388200']
+            self.assertEqual(df.columns.tolist(), ['pcp_mm', 'q_cms_obs'])
+            self.assertEqual(len(df), 10)
+            np.testing.assert_allclose(df['pcp_mm'].values, 400 + np.arange(10) + 0.5)
+            # discharge of this site starts from 1954
+            self.assertTrue(df['q_cms_obs'].isna().all())
+            np.testing.assert_allclose(dyn['01010000']['q_cms_obs'].values, np.arange(10) * 0.5)
+
+            _, xds = ds.fetch_stations_features('01010000', 'q_cms_obs', st='2000-12-30', en='2001-01-02')
+            self.assertEqual(xds['01010000'].dims, ('time', 'dynamic_features'))
+            exp = make_series('01010000', 0).iloc[-2:].tolist() + [np.nan, np.nan]
+            np.testing.assert_allclose(xds['01010000'].values[:, 0], exp)
+            _STACKED_FILES.clear()
+        return
+
+
+def read_json_reference(json):
+    """previous implementation of _read_json"""
+    merged_df = pd.DataFrame(columns=["site_no", "datetime"])
+
+    site_list = [ts["sourceInfo"]["siteCode"][0]["value"] for ts in json["value"]["timeSeries"]]
+
+    index_list = [0]
+    index_list.extend([i + 1 for i, (a, b) in enumerate(zip(site_list[:-1], site_list[1:])) if a != b])
+    index_list.append(len(site_list))
+
+    for i in range(len(index_list) - 1):
+        site_block = json["value"]["timeSeries"][index_list[i]:index_list[i + 1]]
+        if not site_block:
+            continue
+
+        site_no = site_block[0]["sourceInfo"]["siteCode"][0]["value"]
+        site_df = pd.DataFrame(columns=["datetime"])
+
+        for timeseries in site_block:
+            param_cd = timeseries["variable"]["variableCode"][0]["value"]
+            option = timeseries["variable"]["options"]["option"][0].get("value")
+
+            for parameter in timeseries["values"]:
+                col_name = param_cd
+                method = parameter["method"][0]["methodDescription"]
+                if method:
+                    method = method.strip("[]()").lower()
+                    col_name = f"{col_name}_{method}"
+                if option:
+                    col_name = f"{col_name}_{option}"
+
+                record_json = parameter["value"]
+                if not record_json:
+                    continue
+                record_json = str(record_json).replace("'", '"')
+
+                record_df = pd.read_json(StringIO(record_json), orient="records",
+                                         dtype={"value": "float64", "qualifiers": "unicode"}, convert_dates=False)
+                record_df["qualifiers"] = record_df["qualifiers"].str.strip("[]").str.replace("'", "")
+                record_df.rename(columns={"value": col_name, "dateTime": "datetime", "qualifiers": col_name + "_cd"},
+                                 inplace=True)
+                site_df = site_df.merge(record_df, how="outer", on="datetime")
+
+        site_df["site_no"] = site_no
+        merged_df = pd.concat([merged_df, site_df])
+
+    if "datetime" in merged_df.columns:
+        merged_df["datetime"] = pd.to_datetime(merged_df["datetime"], utc=True)
+
+    return merged_df
+
+
+class TestReadJson(unittest.TestCase):
+
+    def test_fixture(self):
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'nwis_dv.json')) as f:
+            response = json.load(f)
+
+        df = _read_json(response)
+        exp = read_json_reference(response).reset_index(drop=True)
+
+        self.assertEqual(df.columns.tolist(), exp.columns.tolist())
+        # union of time steps of both parameters of first site
+        self.assertEqual(len(df), len(exp))
+        self.assertEqual(len(df), 59 + 15 + 12)
+        pd.testing.assert_series_equal(df['datetime'], exp['datetime'])
+        pd.testing.assert_series_equal(df['site_no'], exp['site_no'].astype(object))
+        for col in df.columns[2:]:
+            if col.endswith('_cd'):
+                self.assertIsInstance(df[col].dtype, pd.CategoricalDtype)
+                pd.testing.assert_series_equal(df[col].astype(object), exp[col].astype(object))
+            else:
+                pd.testing.assert_series_equal(df[col], exp[col].astype(np.float64))
+
+        self.assertEqual(df['00060_Mean_cd'].iloc[2], 'A, e')
+        return
+
+    def test_duplicate_columns(self):
+        # two series of a site with same parameter, method and option
+        time = pd.date_range('2000-01-01', periods=5, freq='D')
+        first = nwis_json('01013500', pd.Series([1.5, 2.5, 3.5], index=time[:3]))
+        second = nwis_json('01013500', pd.Series([10.25, 20.25, 30.25], index=time[2:]))
+        response = {"value": {"timeSeries": first["value"]["timeSeries"] + second["value"]["timeSeries"]}}
+
+        df = _read_json(response)
+        exp = read_json_reference(response).reset_index(drop=True)
+        self.assertEqual(df.columns.tolist(), exp.columns.tolist())
+        self.assertEqual(df.columns.tolist()[2:],
+                         ['00060_Mean_x', '00060_Mean_cd_x', '00060_Mean_y', '00060_Mean_cd_y'])
+        pd.testing.assert_series_equal(df['00060_Mean_x'], exp['00060_Mean_x'].astype(np.float64))
+        pd.testing.assert_series_equal(df['00060_Mean_y'], exp['00060_Mean_y'].astype(np.float64))
+        return
+
+    def test_empty(self):
+        response = {"value": {"timeSeries": []}}
+        self.assertEqual(_read_json(response).columns.tolist(), ["site_no", "datetime"])
+        return
+
+
+def nwis_json(site, ts):
+    """daily values of a site in the layout of NWIS json response"""
+    values = [{"value": str(v), "qualifiers": ["A"], "dateTime": f"{t:%Y-%m-%dT00:00:00.000}"}
+              for t, v in ts.items()]
+    return {"value": {"timeSeries": [{
+        "sourceInfo": {"siteCode": [{"value": site}]},
+        "variable": {"variableCode": [{"value": "00060"}], "options": {"option": [{"value": "Mean"}]}},
+        "values": [{"value": values, "method": [{"methodDescription": ""}]}],
+    }]}}
+
+
+def nwis_rdb(site, k):
+    """metadata of a site in the layout of NWIS rdb response"""
+    return "\n".join([
+        "# comment",
+        "agency_cd\tsite_no\tdec_lat_va\tdec_long_va\tdrain_area_va",
+        "5s\t15s\t16s\t16s\t8s",
+        f"USGS\t{site}\t{40 + k}\t{-100 - k}\t{10 * (k + 1)}",
+    ])
+
+
+class NWISHandler(BaseHTTPRequestHandler):
+    """serves the discharge in server.series between startDT and endDT. The
+    first request of each site fails."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        site = query['sites'][0]
+        self.server.hits[url.path, site] += 1
+        self.server.queries.append(query)
+
+        if self.server.hits[url.path, site] == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        k = SITES.index(site)
+        if url.path.endswith('/dv'):
+            ts = self.server.series.get(site, pd.Series(dtype=float))
+            ts = ts.loc[query['startDT'][0]:query['endDT'][0]]
+            body = json.dumps(nwis_json(site, ts / 0.028316847))
+        else:
+            body = nwis_rdb(site, k)
+
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), NWISHandler)
+        self.server.hits = Counter()
+        self.server.queries = []
+        self.server.series = {site: make_series(site, k).iloc[:5] for k, site in enumerate(SITES)}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.url, self.rate = _usgs.NWIS_URL, _usgs.NWIS_RATE
+        _usgs.NWIS_URL = f'http://127.0.0.1:{self.server.server_address[1]}/nwis'
+        _usgs.NWIS_RATE = None
+        return
+
+    def tearDown(self):
+        _usgs.NWIS_URL, _usgs.NWIS_RATE = self.url, self.rate
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def test_daily_q(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _usgs.make_daily_q(tmpdir, SITES, workers=3, verbosity=0)
+            self.assertEqual(len(os.listdir(os.path.join(tmpdir, 'daily_files'))), len(SITES))
+            self.assertEqual(self.server.hits[('/nwis/dv', SITES[0])], 2)
+
+            ds = make_dataset(tmpdir)
+            self.assertEqual(ds.stations(), SITES)
+            time, q = ds._read_q(['02342070'], st='1952-01-01', en='1952-01-10')
+            exp = make_series('02342070', 2).iloc[:5].reindex(time).values
+            np.testing.assert_allclose(q[0], exp, rtol=1e-5)
+
+            # rerun reads the sites from daily_files
+            os.remove(ds.q_fpath)
+            self.server.hits.clear()
+            _usgs.make_daily_q(tmpdir, SITES, workers=3, verbosity=0)
+            self.assertEqual(len(self.server.hits), 0)
+            self.assertTrue(os.path.exists(ds.q_fpath))
+        return
+
+    def test_metadata(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            md = _usgs.maybe_make_and_get_metadata(tmpdir, SITES, workers=2, verbosity=0)
+            self.assertEqual(md.index.tolist(), SITES)
+            np.testing.assert_allclose(md['dec_lat_va'].values, 40 + np.arange(len(SITES)))
+            np.testing.assert_allclose(md['drain_area_va'].values, 10 * (np.arange(len(SITES)) + 1) * 2.58999)
+
+            # read from metadata.csv
+            pd.testing.assert_frame_equal(
+                _usgs.maybe_make_and_get_metadata(tmpdir, SITES, verbosity=0), md, check_names=False)
+        return
+
+    def test_update(self):
+        time = pd.date_range('2024-12-01', '2025-01-20', freq='D')
+        series = {site: pd.Series(k * 100 + np.arange(len(time)) * 1.0, index=time) for k, site in enumerate(SITES)}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # the data of last site ends earlier and third site has no data
+            stored = [series[site].loc[:'2024-12-20' if k == 4 else '2024-12-25'] for k, site in enumerate(SITES)]
+            stored[2] = pd.Series(dtype=float, name=SITES[2])
+            for ts, site in zip(stored, SITES):
+                ts.name = site
+            save_daily_q_as_nc(tmpdir, stored, verbosity=0)
+
+            ds = make_dataset(tmpdir)
+            self.assertEqual(ds.end, '20241231')
+            self.server.series = series
+            entry = ds.update(en='2025-01-05', workers=2)
+            # the new days are read by default
+            self.assertEqual(ds.end, '20250105')
+            self.assertEqual(entry['updated'], len(SITES))
+            self.assertEqual(entry['rows'], 11 * 3 + 16 + 36)
+            self.assertEqual(entry['failed'], [])
+
+            # only the days after the last stored day are requested
+            starts = {q['sites'][0]: q['startDT'][0] for q in self.server.queries}
+            self.assertEqual(starts, {SITES[0]: '2024-12-26', SITES[1]: '2024-12-26', SITES[2]: DAILY_START,
+                                      SITES[3]: '2024-12-26', SITES[4]: '2024-12-21'})
+
+            t, q = ds._read_q(SITES, st='2024-11-30')
+            self.assertEqual(t[-1], pd.Timestamp('2025-01-05'))
+            exp = np.stack([series[site].reindex(t).values for site in SITES])
+            np.testing.assert_allclose(q, exp, rtol=1e-5)
+
+            # nothing is requested when the store is up to date
+            self.server.queries.clear()
+            entry = ds.update(en='2025-01-05')
+            self.assertEqual((entry['stations'], entry['rows']), (0, 0))
+            self.assertEqual(self.server.queries, [])
+
+            history = ds.update_history()
+            self.assertEqual(len(history), 2)
+            self.assertEqual(history['end'].tolist(), ['2025-01-05', '2025-01-05'])
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
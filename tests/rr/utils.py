@@ -77,6 +77,24 @@ def test_plot_catchment(dataset):
     assert isinstance(ax, plt.Axes)
     plt.close()
 
+    ax = dataset.plot_catchment(stations[0], detail='low', show=False)
+    assert isinstance(ax, plt.Axes)
+    plt.close()
+
+    return
+
+
+def test_plot_catchments(dataset):
+    logger.info(f"testing plot_catchments for {dataset.name}")
+
+    ax = dataset.plot_catchments(show=False)
+    assert isinstance(ax, plt.Axes)
+    plt.close()
+
+    ax = dataset.plot_catchments(dataset.stations()[0:5], detail='medium', color='k', show=False)
+    assert isinstance(ax, plt.Axes)
+    plt.close()
+
     return
 
 def test_area(dataset):
@@ -123,6 +141,44 @@ def test_boundary(dataset):
     return
 
 
+def test_spatial_queries(dataset):
+    logger.info(f"testing spatial queries for {dataset.name}")
+
+    coords = dataset.stn_coords().dropna()
+    stn = coords.index[0]
+    lat, lon = coords.loc[stn, 'lat'], coords.loc[stn, 'long']
+
+    df = dataset.nearest_stations(lat, lon, k=3)
+    assert isinstance(df, pd.DataFrame)
+    assert len(df) == min(3, len(coords))
+    assert df.index[0] == stn or df['distance_km'].iloc[0] < 1e-3
+    assert df['distance_km'].is_monotonic_increasing
+
+    df = dataset.nearest_stations(coords['lat'].values[:5], coords['long'].values[:5], k=2)
+    assert df.index.names == ['query', 'station']
+
+    df = dataset.stations_within(lat, lon, radius_km=50)
+    assert (df['distance_km'] <= 50).all()
+
+    df = dataset.stations_in_bbox(lat - 1, lat + 1, lon - 1, lon + 1)
+    assert stn in df.index
+    return
+
+
+def test_catchments_containing(dataset):
+    logger.info(f"testing catchments_containing for {dataset.name}")
+
+    coords = dataset.stn_coords().dropna()
+
+    catchments = dataset.catchments_containing(coords['lat'].iloc[0], coords['long'].iloc[0])
+    assert isinstance(catchments, list)
+    assert all(stn in dataset.stations() for stn in catchments)
+
+    catchments = dataset.catchments_containing_points(coords['lat'].values[:5], coords['long'].values[:5])
+    assert len(catchments) == min(5, len(coords))
+    return
+
+
 def test_fetch_static_feature(dataset, station, num_stations, num_static_features):
     logger.info(f"testing fetch_static_features method for {dataset.name}")
     if len(dataset.static_features) > 0:
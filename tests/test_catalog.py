@@ -0,0 +1,267 @@
+
+import os
+import site
+# add the parent directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import tempfile
+import warnings
+import unittest.mock
+
+import numpy as np
+import pandas as pd
+
+import aqua_fetch
+from aqua_fetch import RainfallRunoff
+from aqua_fetch.rr import DATASETS, StationCatalog
+from aqua_fetch.rr import catalog as rr_catalog
+from aqua_fetch.rr._catalog import DEFAULT_CATALOG_DIR, catalog_name, match_gauges
+from aqua_fetch.rr.utils import _RainfallRunoff
+
+
+class FakeDataset(_RainfallRunoff):
+    """a dataset with three stations whose streamflow has gaps"""
+
+    def __init__(self, path, name, lat, long):
+        super().__init__(path=path, verbosity=0)
+        self.name = name
+        self._coords = pd.DataFrame({'lat': lat, 'long': long}, index=['1', '2', '3'])
+        time = pd.date_range('2000-01-01', '2009-12-31', freq='D')
+        q = np.ones((len(time), 3))
+        q[time < '2005-01-01', 1] = np.nan  # 2nd station starts in 2005
+        q[::2, 2] = np.nan  # 3rd station has 50 % missing values
+        self._q = pd.DataFrame(q, index=time, columns=self._coords.index)
+
+    @property
+    def start(self):
+        return pd.Timestamp('2000-01-01')
+
+    @property
+    def end(self):
+        return pd.Timestamp('2009-12-31')
+
+    @property
+    def dynamic_features(self):
+        return ['q_cms_obs', 'pcp_mm'] if self.name == 'FakeA' else ['q_cms_obs']
+
+    def stations(self):
+        return self._coords.index.tolist()
+
+    def stn_coords(self, stations='all'):
+        return self._coords
+
+    def area(self, stations='all'):
+        return pd.Series([10.0, 20.0, 30.0], index=self._coords.index)
+
+    def fetch_stations_features(self, stations, dynamic_features='all', as_dataframe=False, **kwargs):
+        return None, {stn: self._q[[stn]].rename(columns={stn: 'q_cms_obs'}) for stn in stations}
+
+
+class Hourly(FakeDataset):
+    """a dataset which is available at more than one timestep"""
+
+    def __init__(self, path, timestep='D'):
+        super().__init__(path, 'Hourly', [46.5, 47.5, 60.0], [7.0, 8.0, 10.0])
+        self.timestep = timestep
+
+
+class Broken(FakeDataset):
+
+    def __init__(self, path=None, **kwargs):
+        super().__init__(path, 'Broken', [46.5, 47.5, 60.0], [7.0, 8.0, 10.0])
+        self.verbosity = 1
+
+    def stn_coords(self, stations='all'):
+        raise ValueError("cannot reindex on an axis with duplicate labels")
+
+
+class TestStationCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.catalog = StationCatalog(path=self.tmpdir.name)
+        self.catalog.add(FakeDataset(self.tmpdir.name, 'FakeA', [46.5, 47.5, 60.0], [7.0, 8.0, 10.0]))
+        self.catalog.add(FakeDataset(self.tmpdir.name, 'FakeB', [47.0, -30.0, 47.1], [9.0, 140.0, 179.5]))
+        return
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        return
+
+    def test_table(self):
+        self.assertEqual(len(self.catalog), 6)
+        self.assertEqual(self.catalog.datasets, ['FakeA', 'FakeB'])
+        table = self.catalog.table.set_index(['dataset', 'station'])
+        self.assertEqual(table.loc[('FakeA', '2'), 'start'], pd.Timestamp('2005-01-01'))
+        self.assertAlmostEqual(table.loc[('FakeA', '3'), 'availability'], 0.5, places=3)
+        self.assertEqual(table.loc[('FakeB', '1'), 'availability'], 1.0)
+        return
+
+    def test_reload(self):
+        catalog = StationCatalog(path=self.tmpdir.name)
+        pd.testing.assert_frame_equal(catalog.table, self.catalog.table)
+        self.assertEqual(catalog.features('FakeA'), ['q_cms_obs', 'pcp_mm'])
+        return
+
+    def test_replace(self):
+        self.catalog.add(FakeDataset(self.tmpdir.name, 'FakeA', [46.5, 47.5, 60.0], [7.0, 8.0, 10.0]),
+                         availability=False)
+        self.assertEqual(len(self.catalog), 6)
+        table = self.catalog.query(datasets='FakeA')
+        self.assertTrue(table['availability'].isna().all())
+        return
+
+    def test_query(self):
+        df = self.catalog.query(bbox=(46.0, 48.0, 6.0, 10.0))
+        self.assertEqual(list(zip(df['dataset'], df['station'])),
+                         [('FakeA', '1'), ('FakeA', '2'), ('FakeB', '1')])
+
+        df = self.catalog.query(bbox=(46.0, 48.0, 6.0, 10.0), period=('2001-01-01', '2008-12-31'))
+        self.assertEqual(df['station'].tolist(), ['1', '1'])
+
+        df = self.catalog.query(features=['q_cms_obs', 'pcp_mm'])
+        self.assertEqual(df['dataset'].unique().tolist(), ['FakeA'])
+
+        df = self.catalog.query(min_availability=0.9)
+        self.assertEqual(len(df), 4)
+
+        # bounding box across the antimeridian
+        df = self.catalog.query(bbox=(40.0, 50.0, 170.0, -170.0))
+        self.assertEqual(list(zip(df['dataset'], df['station'])), [('FakeB', '3')])
+        return
+
+    def test_variants(self):
+        self.assertEqual(catalog_name(Hourly(self.tmpdir.name)), 'Hourly')
+        self.catalog.add(Hourly(self.tmpdir.name), availability=False)
+        self.catalog.add(Hourly(self.tmpdir.name, timestep='H'), availability=False)
+        self.assertEqual(self.catalog.datasets, ['FakeA', 'FakeB', 'Hourly', 'Hourly_H'])
+        self.assertEqual(len(self.catalog), 12)
+        return
+
+    def test_add_to_catalog(self):
+        # errors while adding to catalog do not break the construction
+        DATASETS['Broken'] = Broken
+        path = rr_catalog.path
+        rr_catalog.path = self.tmpdir.name
+        try:
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                dataset = RainfallRunoff('Broken', path=self.tmpdir.name, add_to_catalog=True)
+            self.assertEqual(dataset.name, 'Broken')
+            self.assertIn('Broken', str(w[0].message))
+            self.assertNotIn('Broken', rr_catalog)
+        finally:
+            rr_catalog.path = path
+            rr_catalog._table = rr_catalog._features = None
+            DATASETS.pop('Broken')
+        return
+
+
+class TestGaugeGroups(unittest.TestCase):
+
+    table = pd.DataFrame({
+        'dataset': ['CAMELS_US', 'CAMELS_US', 'USGS', 'USGS', 'HYSETS', 'HYSETS', 'GRDCCaravan', 'EStreams'],
+        'station': ['01013500', '01022500', '1013500', '01030500', '10', '11', 'GRDC_6335020', 'DE01'],
+        'lat': [47.23, 44.61, 47.30, 45.50, 47.231, 44.61, 50.0, 50.005],
+        'long': [-68.58, -67.93, -68.60, -68.30, -68.581, -67.93, 8.0, 8.003],
+        'area_km2': [2252.0, 573.0, 2253.0, 3676.0, 2260.0, 100.0, 1000.0, 1040.0],
+    })
+
+    def test_match_gauges(self):
+        groups = match_gauges(self.table, radius_km=2.0, area_tol=0.1)
+        # same USGS site (ids differ in leading zero and coordinates differ by ~7 km),
+        # and a HYSETS station with same location and area
+        self.assertEqual(groups[0], groups[2])
+        self.assertEqual(groups[0], groups[4])
+        # same location but very different area
+        self.assertNotEqual(groups[1], groups[5])
+        # GRDCCaravan and EStreams stations ~0.6 km apart with similar areas
+        self.assertEqual(groups[6], groups[7])
+        self.assertEqual(len(set(groups.tolist())), 5)
+        return
+
+    def test_dedupe(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            catalog = StationCatalog(path=tmpdir)
+            table = self.table.assign(
+                start=pd.Timestamp('2000-01-01'), end=pd.Timestamp('2010-12-31'), availability=np.nan)
+            catalog._table = table
+            catalog._features = {ds: ['q_cms_obs'] for ds in table['dataset'].unique()}
+
+            groups = catalog.gauge_groups()
+            self.assertEqual(groups[('USGS', '1013500')], 'CAMELS_US_01013500')
+            self.assertTrue(os.path.exists(catalog.groups_fpath))
+
+            stations = {
+                'USGS': ['1013500', '01030500'],
+                'CAMELS_US': ['01013500', '01022500'],
+                'HYSETS': ['10', '11'],
+            }
+            self.assertEqual(catalog.dedupe(stations), {
+                'USGS': ['1013500', '01030500'],
+                'CAMELS_US': ['01022500'],
+                'HYSETS': ['11'],
+            })
+            self.assertEqual(catalog.dedupe(stations, preference=['HYSETS', 'CAMELS_US']), {
+                'USGS': ['01030500'],
+                'CAMELS_US': ['01022500'],
+                'HYSETS': ['10', '11'],
+            })
+        return
+
+    def test_chain(self):
+        # b1 is within radius of both a1 and a2 but a1 and a2 are different stations of A
+        table = pd.DataFrame({
+            'dataset': ['A', 'B', 'A'],
+            'station': ['a1', 'b1', 'a2'],
+            'lat': [50.0, 50.009, 50.018],
+            'long': [10.0, 10.0, 10.0],
+            'area_km2': [np.nan, np.nan, np.nan],
+            'start': pd.Timestamp('2000-01-01'),
+            'end': pd.Timestamp('2010-12-31'),
+            'availability': np.nan,
+        })
+        groups = match_gauges(table, radius_km=1.5)
+        self.assertNotEqual(groups[0], groups[2])
+        self.assertTrue(groups[1] in (groups[0], groups[2]))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            catalog = StationCatalog(path=tmpdir)
+            catalog._table = table
+            catalog._features = {'A': ['q_cms_obs'], 'B': ['q_cms_obs']}
+            result = catalog.dedupe({'A': ['a1', 'a2'], 'B': ['b1']}, radius_km=1.5)
+            self.assertEqual(result, {'A': ['a1', 'a2'], 'B': []})
+
+            # the saved groups are not used when the coordinates change
+            catalog._table = table.assign(lat=[50.0, 50.5, 50.018])
+            catalog._groups = None
+            result = catalog.dedupe({'A': ['a1', 'a2'], 'B': ['b1']}, radius_km=1.5)
+            self.assertEqual(result, {'A': ['a1', 'a2'], 'B': ['b1']})
+        return
+
+    def test_build(self):
+        class CAMELS_XX(FakeDataset):
+            def __init__(self, path=None, **kwargs):
+                super().__init__(path, 'CAMELS_XX', [46.5, 47.5, 60.0], [7.0, 8.0, 10.0])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            catalog = StationCatalog(path=tmpdir)
+            data_dir = os.path.join(tmpdir, 'data')
+            os.makedirs(os.path.join(data_dir, 'CAMELS_XX'))
+            # Hourly is not available locally so it must neither be constructed nor added
+            with unittest.mock.patch.dict(DATASETS, {'CAMELS_XX': CAMELS_XX, 'Hourly': Hourly}):
+                added = catalog.build(path=data_dir, datasets=['CAMELS_XX', 'Hourly'])
+            self.assertEqual(added, ['CAMELS_XX'])
+            self.assertEqual(catalog.datasets, ['CAMELS_XX'])
+            self.assertEqual(os.listdir(data_dir), ['CAMELS_XX'])
+
+        # the catalog is not saved inside the installed package
+        self.assertFalse(DEFAULT_CATALOG_DIR.startswith(os.path.dirname(aqua_fetch.__file__)))
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
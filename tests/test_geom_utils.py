@@ -5,26 +5,26 @@ import site
 wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 site.addsitedir(wd_dir)
 
-import fiona
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from easy_mpl.utils import despine_axes
-from mpl_toolkits.basemap import Basemap
-
-from pyproj import Transformer
-from shapely.geometry import shape
+import pytest
 
 from aqua_fetch import RainfallRunoff, Quadica
 
 from aqua_fetch._geom_utils import calc_centroid
 from aqua_fetch._geom_utils import utm_to_lat_lon, laea_to_wgs84, lcc_to_wgs84
+from aqua_fetch._geom_utils import transform_geometry
+
+# the projections are checked against pyproj
+Transformer = pytest.importorskip('pyproj').Transformer
 
 
 DATA_PATH = '/mnt/datawaha/hyex/atr/gscad_database/raw'
 
 
 def test_calc_centroid():
+    fiona = pytest.importorskip('fiona')
+    shape = pytest.importorskip('shapely.geometry').shape
 
     stns_file = os.path.join(
         ds.path, 
@@ -102,6 +102,10 @@ def test_laea_to_wgs84():
 
 
 def plot_test_25832_to_4326():
+    plt = pytest.importorskip('matplotlib.pyplot')
+    despine_axes = pytest.importorskip('easy_mpl.utils').despine_axes
+    Basemap = pytest.importorskip('mpl_toolkits.basemap').Basemap
+
     ds = RainfallRunoff(
         "CAMELS_FR", 
         path=os.path.join(DATA_PATH, 'CAMELS'), 
@@ -188,8 +192,78 @@ def test_lcc_to_wgs84():
     return
 
 
-test_25832_to_4326()
+def test_utm_to_lat_lon_vectorized():
+    """all points converted in one call must match pyproj"""
+    rng = np.random.default_rng(313)
+    easting = rng.uniform(440000.0, 900000.0, 100)
+    northing = rng.uniform(6040000.0, 6410000.0, 100)
+
+    lat, lon = utm_to_lat_lon(easting, northing, 32)
+
+    transformer = Transformer.from_crs("EPSG:32632", "EPSG:4326")
+    lat_true, lon_true = transformer.transform(easting, northing)
+
+    assert lat.shape == (100,) and lon.shape == (100,)
+    np.testing.assert_allclose(lat, lat_true, atol=1e-5)
+    np.testing.assert_allclose(lon, lon_true, atol=1e-5)
+    return
+
+
+def test_lcc_to_wgs84_vectorized():
+    """fixed-iteration solve for all points must match pyproj"""
+    rng = np.random.default_rng(313)
+    x = rng.uniform(250000.0, 750000.0, 100)
+    y = rng.uniform(300000.0, 700000.0, 100)
+    # parameters of EPSG:3057
+    params = (-19.0, 65.0, 64.25, 65.75, 500000.0, 500000.0)
+
+    lat, lon = lcc_to_wgs84(x, y, *params)
+
+    transformer = Transformer.from_crs("EPSG:3057", "EPSG:4326")
+    lat_true, lon_true = transformer.transform(x, y)
+
+    np.testing.assert_allclose(lat, lat_true, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(lon, lon_true, rtol=1e-5, atol=1e-5)
+    return
+
+
+def test_transform_geometry():
+    """all rings of a MultiPolygon are reprojected in one call"""
+    fiona = pytest.importorskip('fiona')
+
+    params = (10, 52, 4321000.0, 3210000.0)
+    def _laea(x, y):
+        return laea_to_wgs84(x, y, *params)
+
+    ring1 = [(4500000.0, 2800000.0), (4510000.0, 2800000.0), (4510000.0, 2810000.0), (4500000.0, 2800000.0)]
+    ring2 = [(4600000.0, 2700000.0), (4605000.0, 2700000.0), (4605000.0, 2705000.0), (4600000.0, 2700000.0)]
+    ring3 = [(4601000.0, 2701000.0), (4602000.0, 2701000.0), (4602000.0, 2702000.0), (4601000.0, 2701000.0)]
+
+    geometry = fiona.Geometry(type='MultiPolygon', coordinates=[[ring1], [ring2, ring3]])
+
+    transformed = transform_geometry(geometry, _laea)
+
+    assert transformed.type == 'MultiPolygon'
+    assert [len(polygon) for polygon in transformed.coordinates] == [1, 2]
+
+    for polygon, new_polygon in zip([[ring1], [ring2, ring3]], transformed.coordinates):
+        for ring, new_ring in zip(polygon, new_polygon):
+            for (x, y), (lon, lat) in zip(ring, new_ring):
+                lat_i, lon_i = _laea(x, y)
+                np.testing.assert_allclose([lon, lat], [lon_i, lat_i], rtol=1e-12, atol=1e-12)
+    return
+
+
+if __name__ == "__main__":
+
+    test_25832_to_4326()
+
+    test_laea_to_wgs84()
+
+    test_lcc_to_wgs84()
+
+    test_utm_to_lat_lon_vectorized()
 
-test_laea_to_wgs84()
+    test_lcc_to_wgs84_vectorized()
 
-test_lcc_to_wgs84()
+    test_transform_geometry()
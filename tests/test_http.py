@@ -0,0 +1,204 @@
+
+import os
+import site
+# add the parent directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import time
+import tempfile
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+import requests
+
+from aqua_fetch._http import TokenBucket, RateLimitedSession, download_many
+from aqua_fetch._http import UrlCache, first_available, response_body
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    /value?key=k returns k as text. The first request of a key which starts
+    with 'flaky' fails with 503, the keys which start with 'bad' always fail.
+    /files/name returns the content of name in server.files or 404. The
+    files whose name starts with 'slow' are returned after a delay.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/files/'):
+            self.server.hits[url.path] += 1
+            name = url.path[len('/files/'):]
+            if name.startswith('slow'):
+                time.sleep(0.3)
+            body = self.server.files.get(name)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        key = parse_qs(url.query)['key'][0]
+        self.server.hits[key] += 1
+
+        if key.startswith('bad') or (key.startswith('flaky') and self.server.hits[key] == 1):
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+
+        body = key.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class LocalServer(object):
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.hits = Counter()
+        self.server.files = {}
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/value'
+        self.files_url = f'http://127.0.0.1:{self.server.server_address[1]}/files'
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+
+def fetch_value(server):
+    def fetch(key, session):
+        response = session.get(server.url, params={'key': key})
+        response.raise_for_status()
+        return pd.Series([response.text], name=key)
+    return fetch
+
+
+class TestHttp(unittest.TestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        # first token is available immediately
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        return
+
+    def test_retry(self):
+        with LocalServer() as server, RateLimitedSession(retries=2, backoff=0.0) as session:
+            response = session.get(server.url, params={'key': 'flaky1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.text, 'flaky1')
+            self.assertEqual(server.server.hits['flaky1'], 2)
+
+            # the last response is returned when retries are exhausted
+            self.assertEqual(session.get(server.url, params={'key': 'bad1'}).status_code, 503)
+            self.assertEqual(server.server.hits['bad1'], 3)
+        return
+
+    def test_connection_error(self):
+        with LocalServer() as server:
+            url = server.url
+        with RateLimitedSession(retries=1, backoff=0.0) as session:
+            self.assertRaises(requests.ConnectionError, session.get, url, params={'key': 'a'})
+        return
+
+    def test_download_many(self):
+        keys = ['a', 'flaky1', 'b', 'bad1', 'c/d']
+        with LocalServer() as server, tempfile.TemporaryDirectory() as tmpdir:
+            session = RateLimitedSession(retries=1, backoff=0.0, pool_size=3)
+            results, errors = download_many(keys, fetch_value(server), tmpdir, session=session,
+                                            workers=3, verbosity=0)
+            self.assertEqual(list(results), ['a', 'flaky1', 'b', 'c/d'])
+            self.assertEqual(results['c/d'].iloc[0], 'c/d')
+            self.assertEqual(list(errors), ['bad1'])
+            self.assertIsInstance(errors['bad1'], requests.HTTPError)
+            self.assertEqual(len(os.listdir(tmpdir)), 4)
+
+            # only the failed key is requested again
+            server.server.hits.clear()
+            results, errors = download_many(keys, fetch_value(server), tmpdir, session=session,
+                                            workers=3, verbosity=0)
+            self.assertEqual(set(server.server.hits), {'bad1'})
+            self.assertEqual(results['flaky1'].iloc[0], 'flaky1')
+            session.close()
+        return
+
+
+class TestFirstAvailable(unittest.TestCase):
+
+    def test_race(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as tmpdir:
+            server.server.files['c.csv'] = b'a,b\n1,2\n3,4\n'
+            urls = [f'{server.files_url}/{name}.csv' for name in 'abcd']
+            cache = UrlCache(os.path.join(tmpdir, 'urls.json'))
+
+            with RateLimitedSession(retries=0) as session:
+                url, response = first_available(urls, session, key='stn', cache=cache, workers=4)
+                self.assertEqual(url, urls[2])
+                with response:
+                    body, compression = response_body(response, url)
+                    df = pd.read_csv(body, compression=compression)
+                self.assertEqual(df['b'].tolist(), [2, 4])
+                self.assertEqual(cache.found('stn'), urls[2])
+                self.assertLessEqual(set(cache.missing('stn')), {urls[0], urls[1], urls[3]})
+                cache.save()
+
+                # only the url found earlier is requested
+                server.server.hits.clear()
+                cache = UrlCache(os.path.join(tmpdir, 'urls.json'))
+                url, response = first_available(urls, session, key='stn', cache=cache)
+                response.close()
+                self.assertEqual(url, urls[2])
+                self.assertEqual(list(server.server.hits), ['/files/c.csv'])
+
+                # missing urls are not requested again
+                server.server.hits.clear()
+                cache.record('none', missing=urls[:2])
+                self.assertEqual(first_available(urls[:2], session, key='none', cache=cache), (None, None))
+                self.assertEqual(len(server.server.hits), 0)
+        return
+
+    def test_priority(self):
+        with LocalServer() as server:
+            server.server.files['slow.csv'] = b'a\n1\n'
+            server.server.files['fast.csv'] = b'a\n2\n'
+            urls = [f'{server.files_url}/{name}.csv' for name in ['slow_missing', 'slow', 'fast', 'later']]
+
+            with RateLimitedSession(retries=0) as session:
+                # the earlier url is returned although the later one responds first
+                url, response = first_available(urls, session, workers=3)
+                with response:
+                    self.assertEqual(url, urls[1])
+                    self.assertEqual(response.text, 'a\n1\n')
+                # the url after the ones which were started is cancelled
+                self.assertNotIn('/files/later.csv', server.server.hits)
+
+                url, response = first_available(urls[2:], session)
+                response.close()
+                self.assertEqual(url, urls[2])
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
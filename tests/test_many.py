@@ -0,0 +1,142 @@
+
+import os
+import site
+# add the parent directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from aqua_fetch import RainfallRunoff
+from aqua_fetch.rr import DATASETS, StationCatalog, catalog
+from aqua_fetch.rr.utils import _RainfallRunoff
+
+
+class _Fake(_RainfallRunoff):
+    """a dataset whose streamflow is station number and precipitation is day of year"""
+
+    time = None
+    features = None
+
+    def __init__(self, path=None, **kwargs):
+        super().__init__(path=path, verbosity=0)
+
+    @property
+    def dynamic_features(self):
+        return self.features
+
+    def stations(self):
+        return ['1', '2', '3']
+
+    def stn_coords(self, stations='all'):
+        return pd.DataFrame({'lat': [50.0, 51.0, 52.0], 'long': self.long}, index=self.stations())
+
+    def area(self, stations='all'):
+        return pd.Series([100.0, 200.0, 300.0], index=self.stations())
+
+    def fetch_stations_features(self, stations, dynamic_features='all', static_features=None,
+                                st=None, en=None, as_dataframe=False, **kwargs):
+        dyn = {}
+        for stn in stations:
+            df = pd.DataFrame({'q_cms_obs': float(stn), 'pcp_mm': self.time.dayofyear.astype(float),
+                               'airtemp_C_mean': 10.0}, index=self.time)
+            dyn[stn] = df.loc[st:en, dynamic_features[::-1]]  # columns in different order
+        return None, dyn
+
+
+class FakeA(_Fake):
+    time = pd.date_range('2000-01-01', '2000-12-31', freq='D')
+    features = ['q_cms_obs', 'pcp_mm', 'airtemp_C_mean']
+    long = [10.0, 10.0, 10.0]
+
+
+class FakeB(_Fake):
+    time = pd.date_range('2000-07-01', '2001-06-30', freq='D')
+    features = ['pcp_mm', 'q_cms_obs']
+    # only the first station is at the same location as in FakeA
+    long = [10.0, 11.0, 12.0]
+
+
+class FakeH(FakeA):
+    time = pd.date_range('2000-01-01', '2000-01-31', freq='h')
+
+
+class TestMany(unittest.TestCase):
+
+    def setUp(self):
+        DATASETS['FakeA'] = FakeA
+        DATASETS['FakeB'] = FakeB
+        DATASETS['FakeH'] = FakeH
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.catalog_path = catalog.path
+        catalog.path = self.tmpdir.name
+        catalog._table = catalog._features = None
+        return
+
+    def tearDown(self):
+        for ds in ['FakeA', 'FakeB', 'FakeH']:
+            DATASETS.pop(ds)
+        catalog.path = self.catalog_path
+        catalog._table = catalog._features = None
+        self.tmpdir.cleanup()
+        return
+
+    def test_many(self):
+        data = RainfallRunoff.many(['FakeA', 'FakeB'], path=self.tmpdir.name, dedupe=False,
+                                   processes=3, chunk_size=2, verbosity=0, add_to_catalog=False)
+        self.assertEqual(data.dims, ('station', 'time', 'dynamic_features'))
+        # only the features which are common in both datasets
+        self.assertEqual(data['dynamic_features'].values.tolist(), ['q_cms_obs', 'pcp_mm'])
+        self.assertEqual(data.shape, (6, 547, 2))
+        self.assertEqual(data['dataset'].values.tolist(), ['FakeA'] * 3 + ['FakeB'] * 3)
+        self.assertEqual(data['station_id'].values.tolist(), ['1', '2', '3'] * 2)
+
+        q = data.sel(dynamic_features='q_cms_obs')
+        np.testing.assert_array_equal(q.sel(station='FakeB_3', time='2001-01-01').values, 3.0)
+        self.assertTrue(np.isnan(q.sel(station='FakeA_2', time='2001-01-01').values))
+        pcp = data.sel(station='FakeA_1', dynamic_features='pcp_mm').to_pandas().dropna()
+        self.assertEqual(len(pcp), 366)
+        np.testing.assert_array_equal(pcp.values, FakeA.time.dayofyear)
+        return
+
+    def test_many_period(self):
+        data = RainfallRunoff.many(['FakeA', 'FakeB'], dynamic_features='q_cms_obs',
+                                   stations={'FakeA': ['1'], 'FakeB': ['2', '3']},
+                                   st='2000-06-01', en='2000-07-31', path=self.tmpdir.name,
+                                   dedupe=False, verbosity=0, add_to_catalog=False)
+        self.assertEqual(data.shape, (3, 61, 1))
+        self.assertEqual(int(data.sel(station='FakeB_2').notnull().sum()), 31)
+        return
+
+    def test_many_dedupe(self):
+        data = RainfallRunoff.many(['FakeA', 'FakeB'], dynamic_features='q_cms_obs',
+                                   path=self.tmpdir.name, processes=3, verbosity=0)
+        # first station of FakeB is same as that of FakeA
+        self.assertEqual(data['station'].values.tolist(),
+                         ['FakeA_1', 'FakeA_2', 'FakeA_3', 'FakeB_2', 'FakeB_3'])
+        # the catalog on disk is neither used nor written
+        self.assertEqual(catalog.datasets, [])
+        self.assertFalse(os.path.exists(catalog.fpath))
+        self.assertFalse(os.path.exists(catalog.groups_fpath))
+
+        data = RainfallRunoff.many(['FakeA', 'FakeB'], dynamic_features='q_cms_obs', add_to_catalog=True,
+                                   path=self.tmpdir.name, processes=3, verbosity=0)
+        self.assertEqual(data.sizes['station'], 5)
+        # both datasets are added to the catalog completely
+        self.assertEqual(catalog.datasets, ['FakeA', 'FakeB'])
+        self.assertEqual(len(StationCatalog(self.tmpdir.name)), 6)
+        return
+
+    def test_many_timestep(self):
+        self.assertRaises(ValueError, RainfallRunoff.many, ['FakeA', 'FakeH'],
+                          path=self.tmpdir.name, dedupe=False, verbosity=0)
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
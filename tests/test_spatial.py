@@ -0,0 +1,281 @@
+
+import os
+import site
+# add the parent directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import tempfile
+
+import fiona
+import numpy as np
+
+from aqua_fetch._spatial import StationIndex, EARTH_RADIUS_KM
+from aqua_fetch._spatial import BoundaryStore, BBoxTree, CatchmentIndex
+from aqua_fetch._geom_utils import simplify_rings
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.deg2rad, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def make_index(n=2000, seed=313, use_tree=True):
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(-60, 75, n)
+    lon = rng.uniform(-180, 180, n)
+    ids = [f"stn_{i}" for i in range(n)]
+    index = StationIndex(ids, lat, lon)
+    if not use_tree:
+        index._tree = None
+    return index
+
+
+class TestStationIndex(unittest.TestCase):
+
+    q_lat = np.array([10.0, -33.0, 48.5, 70.0])
+    q_lon = np.array([179.9, 151.0, 7.5, -120.0])
+
+    def _check_nearest(self, index):
+        dist, pos = index.nearest(self.q_lat, self.q_lon, k=5)
+        self.assertEqual(dist.shape, (4, 5))
+        for i in range(len(self.q_lat)):
+            true = haversine(self.q_lat[i], self.q_lon[i], index.lat, index.lon)
+            np.testing.assert_allclose(dist[i], np.sort(true)[:5], rtol=1e-6)
+            np.testing.assert_allclose(true[pos[i]], dist[i], rtol=1e-6)
+        return
+
+    def _check_within(self, index):
+        dist, pos = index.within(self.q_lat, self.q_lon, radius_km=800.0)
+        self.assertEqual(len(pos), 4)
+        for i in range(len(self.q_lat)):
+            true = haversine(self.q_lat[i], self.q_lon[i], index.lat, index.lon)
+            self.assertEqual(set(pos[i].tolist()), set(np.nonzero(true <= 800.0)[0].tolist()))
+            self.assertTrue(np.all(np.diff(dist[i]) >= 0))
+        return
+
+    def test_nearest(self):
+        self._check_nearest(make_index())
+        return
+
+    def test_nearest_without_scipy(self):
+        self._check_nearest(make_index(use_tree=False))
+        return
+
+    def test_within(self):
+        self._check_within(make_index())
+        return
+
+    def test_within_without_scipy(self):
+        self._check_within(make_index(use_tree=False))
+        return
+
+    def test_scalar_query(self):
+        index = make_index()
+        dist, pos = index.nearest(48.5, 7.5, k=3)
+        self.assertEqual(dist.shape, (1, 3))
+        return
+
+    def test_in_bbox(self):
+        index = make_index()
+        pos = index.in_bbox([40.0, -10.0], [50.0, 10.0], [0.0, 170.0], [20.0, -170.0])
+        mask = (index.lat >= 40) & (index.lat <= 50) & (index.lon >= 0) & (index.lon <= 20)
+        np.testing.assert_array_equal(pos[0], np.nonzero(mask)[0])
+        # box crossing the antimeridian
+        mask = (index.lat >= -10) & (index.lat <= 10) & ((index.lon >= 170) | (index.lon <= -170))
+        np.testing.assert_array_equal(pos[1], np.nonzero(mask)[0])
+        return
+
+    def test_nan_coords(self):
+        index = StationIndex(['a', 'b', 'c'], [50.0, np.nan, 52.0], [10.0, 10.5, 11.0])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.ids.tolist(), ['a', 'c'])
+        return
+
+
+def square(x0, y0, size, clockwise=True):
+    ring = [(x0, y0), (x0, y0 + size), (x0 + size, y0 + size), (x0 + size, y0), (x0, y0)]
+    return ring if clockwise else ring[::-1]
+
+
+def make_store():
+    # 'outer' contains 'middle' which contains 'inner'. 'holed' has a hole
+    # and 'multi' consists of two disjoint squares
+    geometries = {
+        'outer': fiona.Geometry(type='Polygon', coordinates=[square(0, 0, 10)]),
+        'middle': fiona.Geometry(type='Polygon', coordinates=[square(2, 2, 5)]),
+        'inner': fiona.Geometry(type='Polygon', coordinates=[square(3, 3, 1)]),
+        'holed': fiona.Geometry(type='Polygon', coordinates=[square(20, 0, 10), square(22, 2, 2, False)]),
+        'multi': fiona.Geometry(type='MultiPolygon', coordinates=[[square(40, 0, 2)], [square(45, 0, 2)]]),
+    }
+    return BoundaryStore.from_geometries(list(geometries.keys()), list(geometries.values()))
+
+
+class TestCatchmentIndex(unittest.TestCase):
+
+    def test_store(self):
+        store = make_store()
+        self.assertEqual(len(store), 5)
+        np.testing.assert_allclose(store.area, [100.0, 25.0, 1.0, 96.0, 8.0])
+        np.testing.assert_allclose(store.bbox[store.position('multi')], [40.0, 0.0, 47.0, 2.0])
+        self.assertEqual(len(store.rings('multi')), 2)
+        return
+
+    def test_save_load(self):
+        store = make_store()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, 'boundaries.npz')
+            store.save(fpath)
+            loaded = BoundaryStore.load(fpath)
+        self.assertEqual(loaded.ids.tolist(), store.ids.tolist())
+        np.testing.assert_array_equal(loaded.xy, store.xy)
+        np.testing.assert_allclose(loaded.area, store.area)
+        return
+
+    def test_bbox_tree(self):
+        rng = np.random.default_rng(313)
+        xy = rng.uniform(0, 100, (500, 2))
+        bbox = np.column_stack([xy, xy + rng.uniform(0.5, 5, (500, 2))])
+        tree = BBoxTree(bbox, node_size=8)
+        px, py = rng.uniform(0, 100, 50), rng.uniform(0, 100, 50)
+        for i, found in enumerate(tree.query(px, py)):
+            true = (bbox[:, 0] <= px[i]) & (bbox[:, 2] >= px[i]) & (bbox[:, 1] <= py[i]) & (bbox[:, 3] >= py[i])
+            self.assertEqual(sorted(found.tolist()), np.nonzero(true)[0].tolist())
+        return
+
+    def test_containing(self):
+        index = CatchmentIndex(make_store())
+        ids = index.store.ids
+        # points are given as lat, lon i.e. y, x
+        lat = np.array([3.5, 5.0, 9.0, 3.0, 5.0, 1.0, 1.0, 1.0, 50.0])
+        lon = np.array([3.5, 5.0, 9.0, 23.0, 25.0, 41.0, 46.0, 43.5, 50.0])
+        result = [ids[pos].tolist() for pos in index.containing(lat, lon)]
+        self.assertEqual(result, [
+            ['inner', 'middle', 'outer'],
+            ['middle', 'outer'],
+            ['outer'],
+            [],  # inside the hole
+            ['holed'],
+            ['multi'],
+            ['multi'],
+            [],  # between two parts of multi
+            [],
+        ])
+        return
+
+
+def write_shapefiles(tmpdir, geometries):
+    schema = {'geometry': 'Polygon', 'properties': {'gauge_id': 'str'}}
+    shp_files = []
+    for name, geometry in geometries.items():
+        fpath = os.path.join(tmpdir, f"{name}.shp")
+        with fiona.open(fpath, 'w', driver='ESRI Shapefile', crs='EPSG:4326', schema=schema) as dst:
+            dst.write({'geometry': geometry, 'properties': {'gauge_id': name}})
+        shp_files.append(fpath)
+    return shp_files
+
+
+class TestBoundaryStoreFromShapefiles(unittest.TestCase):
+
+    geometries = {
+        '1001_agency': fiona.Geometry(type='Polygon', coordinates=[square(0, 0, 10)]),
+        '1002_agency': fiona.Geometry(type='Polygon', coordinates=[square(20, 0, 10), square(22, 2, 2, False)]),
+        '2001_other': fiona.Geometry(type='MultiPolygon', coordinates=[[square(40, 0, 2)], [square(45, 0, 2)]]),
+    }
+
+    def _check_store(self, store):
+        self.assertEqual(store.ids.tolist(), sorted(self.geometries.keys()))
+        np.testing.assert_allclose(store.area, [100.0, 96.0, 8.0])
+        self.assertEqual(store.exterior.tolist(), [True, True, False, True, True])
+        return
+
+    def test_serial(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shp_files = write_shapefiles(tmpdir, self.geometries)
+            store = BoundaryStore.from_shapefiles(sorted(shp_files))
+        self._check_store(store)
+        return
+
+    def test_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shp_files = write_shapefiles(tmpdir, self.geometries)
+            store = BoundaryStore.from_shapefiles(sorted(shp_files), processes=2)
+        self._check_store(store)
+        return
+
+    def test_geometry(self):
+        store = BoundaryStore.from_geometries(list(self.geometries.keys()), list(self.geometries.values()))
+        for name, geometry in self.geometries.items():
+            new = store.geometry(name)
+            self.assertEqual(new.type, geometry.type)
+            self.assertEqual(np.array(new.coordinates, dtype=object).shape,
+                             np.array(geometry.coordinates, dtype=object).shape)
+        return
+
+    def test_subset(self):
+        store = BoundaryStore.from_geometries(list(self.geometries.keys()), list(self.geometries.values()))
+        store.add_detail_levels()
+        sub = store.subset(['2001_other', '1002_agency'], ['2001', '1002'])
+        self.assertEqual(sub.ids.tolist(), ['2001', '1002'])
+        np.testing.assert_allclose(sub.area, [8.0, 96.0])
+        self.assertEqual(sub.exterior.tolist(), [True, True, True, False])
+        for detail in ['full'] + list(store.levels):
+            for a, b in zip(sub.rings('1002', detail), store.rings('1002_agency', detail)):
+                np.testing.assert_array_equal(a, b)
+        self.assertEqual(sub.geometry('1002').type, 'Polygon')
+        return
+
+
+class TestDetailLevels(unittest.TestCase):
+
+    def test_simplify_rings(self):
+        theta = np.linspace(0, 2 * np.pi, 1001)
+        circle = np.column_stack([np.cos(theta), np.sin(theta)])
+        circle[-1] = circle[0]
+        # square with a (nearly) collinear vertex in the middle of one side
+        sq = np.array([[0, 0], [0, 1], [0.5, 1.0001], [1, 1], [1, 0], [0, 0]], dtype=float)
+        xy = np.vstack([circle, sq])
+        offsets = np.array([0, len(circle), len(circle) + len(sq)])
+
+        counts = []
+        for tol in (0.0001, 0.001, 0.01):
+            new_xy, new_offsets = simplify_rings(xy, offsets, tol)
+            self.assertEqual(len(new_offsets), 3)
+            n_circle = new_offsets[1] - new_offsets[0]
+            counts.append(n_circle)
+            # rings remain closed
+            np.testing.assert_array_equal(new_xy[0], new_xy[new_offsets[1] - 1])
+            # simplified vertices are a subset of original vertices
+            self.assertTrue(np.allclose(np.hypot(*new_xy[:new_offsets[1]].T), 1.0))
+            self.assertEqual(new_offsets[2] - new_offsets[1], 5)
+        self.assertTrue(counts[0] > counts[1] > counts[2] >= 4)
+        return
+
+    def test_add_detail_levels(self):
+        store = make_store()
+        store.add_detail_levels({'low': 0.5})
+        self.assertEqual(len(store.rings('multi', detail='low')), 2)
+        np.testing.assert_array_equal(store.rings('outer', detail='low')[0],
+                                      store.rings('outer')[0])
+        self.assertRaises(ValueError, store.rings, 'outer', detail='tiny')
+        return
+
+    def test_save_load_levels(self):
+        store = make_store()
+        store.add_detail_levels()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, 'boundaries.npz')
+            store.save(fpath)
+            loaded = BoundaryStore.load(fpath)
+        self.assertEqual(sorted(loaded.levels), sorted(store.levels))
+        for detail in store.levels:
+            for a, b in zip(loaded.rings('holed', detail), store.rings('holed', detail)):
+                np.testing.assert_array_equal(a, b)
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+
+import os
+import site
+# add the parent directory in the path
+wd_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+site.addsitedir(wd_dir)
+
+import unittest
+
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from aqua_fetch import download_zenodo
+from aqua_fetch.download_zenodo import download_from_zenodo
+
+
+class ZenodoHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for doi.org and the zenodo records api.
+    /records/1 resolves the doi, /api/records/1 returns the metadata of
+    server.files and /files/name returns the content of a file in chunks
+    with server.delay seconds between them. The file 'bad.csv' is served
+    with content which does not match its checksum.
+    """
+
+    def do_GET(self):
+        if self.path.startswith('/records/'):
+            return self._send(b'record')
+
+        if self.path.startswith('/api/records/'):
+            files = [{'key': name,
+                      'size': len(body),
+                      'checksum': 'md5:' + hashlib.md5(body).hexdigest(),
+                      'links': {'self': f'{self.server.url}/files/{name}'}}
+                     for name, body in self.server.files.items()]
+            js = {'files': files,
+                  'metadata': {'title': 'test', 'publication_date': '2024-01-01', 'doi': '10/1'}}
+            return self._send(json.dumps(js).encode())
+
+        name = self.path[len('/files/'):]
+        body = self.server.files[name]
+        if name == 'bad.csv':
+            body = body[::-1]
+
+        with self.server.lock:
+            self.server.hits[name] += 1
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            for i in range(0, len(body), 1024):
+                time.sleep(self.server.delay)
+                self.wfile.write(body[i:i + 1024])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+        return
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class FakeZenodo(object):
+
+    def __init__(self, files, delay=0.0):
+        self.files = files
+        self.delay = delay
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ZenodoHandler)
+        self.server.daemon_threads = True
+        self.server.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.server.files = self.files
+        self.server.delay = self.delay
+        self.server.hits = Counter()
+        self.server.active = self.server.max_active = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.api = download_zenodo.ZENODO_API
+        download_zenodo.ZENODO_API = f'{self.server.url}/api/records/'
+        self.doi = f'{self.server.url}/records/1'
+        return self
+
+    def __exit__(self, *args):
+        download_zenodo.ZENODO_API = self.api
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+
+def make_files(n, size=8 * 1024):
+    return {f'file{i}.csv': bytes([i % 256]) * size for i in range(n)}
+
+
+class TestZenodo(unittest.TestCase):
+
+    def tearDown(self):
+        download_zenodo.abort_signal = False
+        download_zenodo.abort_counter = 0
+        return
+
+    def test_concurrent(self):
+        files = make_files(6)
+        with FakeZenodo(files, delay=0.01) as zenodo, tempfile.TemporaryDirectory() as tmpdir:
+            download_from_zenodo(tmpdir, zenodo.doi, workers=3, verbosity=0)
+            for name, body in files.items():
+                with open(os.path.join(tmpdir, name), 'rb') as f:
+                    self.assertEqual(f.read(), body)
+            self.assertEqual(zenodo.server.max_active, 3)
+            self.assertFalse([f for f in os.listdir(tmpdir) if f.endswith('.part')])
+
+            # correct files are not downloaded again
+            zenodo.server.hits.clear()
+            download_from_zenodo(tmpdir, zenodo.doi, cont=True, workers=3, verbosity=0)
+            self.assertEqual(len(zenodo.server.hits), 0)
+        return
+
+    def test_checksum(self):
+        files = make_files(2)
+        files['bad.csv'] = b'a,b\n1,2\n'
+        with FakeZenodo(files) as zenodo, tempfile.TemporaryDirectory() as tmpdir:
+            download_from_zenodo(tmpdir, zenodo.doi, tolerate_error=True, workers=2, verbosity=0)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, 'file1.csv')))
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, 'bad.csv')))
+
+            self.assertRaises(ValueError, download_from_zenodo, tmpdir, zenodo.doi,
+                              include=['bad.csv'], verbosity=0)
+        return
+
+    def test_max_rate(self):
+        files = make_files(2, size=32 * 1024)
+        with FakeZenodo(files) as zenodo, tempfile.TemporaryDirectory() as tmpdir:
+            start = time.monotonic()
+            # the first 32 KB are within the burst, the next 32 KB take 1 second
+            download_from_zenodo(tmpdir, zenodo.doi, workers=2, max_rate=32 * 1024, verbosity=0)
+            self.assertGreaterEqual(time.monotonic() - start, 0.9)
+            self.assertEqual(len(os.listdir(tmpdir)), 3)
+        return
+
+    def test_abort(self):
+        files = make_files(4, size=256 * 1024)
+        with FakeZenodo(files, delay=0.002) as zenodo, tempfile.TemporaryDirectory() as tmpdir:
+            # same as pressing CTRL+C once
+            timer = threading.Timer(0.1, download_zenodo.handle_ctrl_c)
+            timer.start()
+            start = time.monotonic()
+            download_from_zenodo(tmpdir, zenodo.doi, workers=2, verbosity=0)
+            timer.join()
+
+            # without the abort, downloading the files takes more than a second
+            self.assertLess(time.monotonic() - start, 1.0)
+            self.assertEqual(sorted(zenodo.server.hits), ['file0.csv', 'file1.csv'])
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['md5sums.txt'])
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()